@@ -0,0 +1,166 @@
+"""
+Shared executor for operations that make many requests concurrently.
+
+Requests to GCP APIs spend nearly all their time waiting for the network, so
+a pool of threads is enough to make them concurrently. A single pool is
+shared by all the operations of this library, and created the first time it
+is needed.
+
+Operations that make requests concurrently require thread-safe API clients.
+All the API clients of this library are: the transports of :mod:`.transport`,
+and ``googleapiclient`` discovery resources, whose ``httplib2.Http`` is
+copied for each thread that makes requests with it (see
+:class:`.transport.GoogleApiClientTransport`). Custom transports must be
+thread-safe too.
+
+Operations that stream data through several stages (e.g. encrypting and
+uploading) run each stage in its own thread instead (see
+:func:`iterate_in_background`), since a stage blocks for the whole operation.
+
+"""
+import concurrent.futures
+import contextvars
+import queue
+import threading
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# Max number of threads of the shared executor.
+MAX_WORKERS = 32
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Return the executor shared by the operations of this library.
+
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=MAX_WORKERS,
+                    thread_name_prefix='fd_gcp',
+                )
+    return _executor
+
+
+def map_concurrently(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_concurrency: int = None,
+) -> List[R]:
+    """
+    Return ``[fn(item) for item in items]``, calling ``fn`` concurrently in
+    the shared executor.
+
+    If a call raises an exception, the calls that have not started yet are
+    cancelled and the exception is raised once the running ones finish.
+
+    Calls run in a copy of the caller's context (see :mod:`contextvars`), so
+    e.g. they are recorded in the caller's trace (see :mod:`.tracing`).
+
+    :param max_concurrency: max number of concurrent calls; if ``None``,
+        there is no limit other than the executor's number of threads
+
+    """
+    items = list(items)
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("Value of 'max_concurrency' must be positive.")
+    if len(items) <= 1 or max_concurrency == 1:
+        return [fn(item) for item in items]
+
+    executor = get_executor()
+    limit = max_concurrency or len(items)
+    results: List[R] = [None] * len(items)  # type: ignore
+    pending: Dict[concurrent.futures.Future, int] = {}
+    next_index = 0
+
+    try:
+        while next_index < len(items) or pending:
+            while next_index < len(items) and len(pending) < limit:
+                context = contextvars.copy_context()
+                pending[executor.submit(context.run, fn, items[next_index])] = next_index
+                next_index += 1
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        concurrent.futures.wait(pending)
+
+    return results
+
+
+def iterate_in_background(
+    iterable: Iterable[T],
+    max_buffered: int = 1,
+) -> Generator[T, None, None]:
+    """
+    Return an iterator of the items of ``iterable``, which is iterated in a
+    background thread, ahead of the consumer by up to ``max_buffered`` items.
+
+    Producing the items (e.g. encrypting chunks of data) then overlaps with
+    consuming them (e.g. uploading the chunks), and the memory used stays
+    bounded. An exception raised by ``iterable`` is raised by the returned
+    iterator. If the consumer stops early, the background thread stops after
+    producing (at most) one more item.
+
+    Like calls of :func:`map_concurrently`, ``iterable`` is iterated in a copy
+    of the caller's context.
+
+    """
+    if max_buffered < 1:
+        raise ValueError("Value of 'max_buffered' must be positive.")
+
+    items: queue.Queue = queue.Queue(maxsize=max_buffered)
+    stopped = threading.Event()
+
+    def produce() -> None:
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if stopped.is_set():
+                    return
+                items.put((True, item))
+            items.put((False, None))
+        except BaseException as exc:
+            items.put((False, exc))
+        finally:
+            close: Any = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    context = contextvars.copy_context()
+    thread = threading.Thread(
+        target=context.run, args=(produce,), name='fd_gcp-pipeline', daemon=True)
+    thread.start()
+
+    def consume() -> Generator[T, None, None]:
+        try:
+            while True:
+                has_item, value = items.get()
+                if has_item:
+                    yield value
+                elif value is not None:
+                    raise value
+                else:
+                    return
+        finally:
+            stopped.set()
+            # note: items are discarded so that the producer is not blocked putting one.
+            while thread.is_alive():
+                try:
+                    items.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+
+    return consume()
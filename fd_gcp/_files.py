@@ -0,0 +1,26 @@
+"""
+Helpers for files written by this library (e.g. caches and checkpoints).
+
+"""
+import os
+import tempfile
+
+
+def write_file_atomically(filename: str, data: bytes) -> None:
+    """
+    Write ``data`` to a temporary file and rename it to ``filename``, so that
+    readers (even in other processes) never see a partially written file.
+
+    :raises OSError:
+
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix='.fd-gcp-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
@@ -1,21 +1,224 @@
-import logging
+from __future__ import annotations
 
-import google.auth.exceptions
-import googleapiclient.errors
-import googleapiclient.http
-import httplib2
+import copy
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Optional, Set, TypeVar
 
 from . import exceptions
+from .circuit_breaker import CircuitBreaker
+from .concurrency_limiter import get_current_limiter
+from .deadline import Deadline, Timeout, to_deadline
+from .tracing import Span, start_span
+
+if TYPE_CHECKING:
+    import googleapiclient.http
+    import httplib2
 
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
+RETRY_BACKOFF_INITIAL = 0.5  # seconds
+RETRY_BACKOFF_MAX = 32.0  # seconds
+
 
 def execute_google_api_client_request(
     request: googleapiclient.http.HttpRequest,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> httplib2.Response:
+    """
+    Execute ``request`` and translate errors to :mod:`.exceptions`.
+
+    :param circuit_breaker: if not ``None``, the request is rejected with
+        :class:`.exceptions.CircuitBreakerOpen` when the circuit of its
+        endpoint is open, and its outcome is recorded otherwise
+    :param timeout: seconds or :class:`.deadline.Deadline` that bounds the
+        whole execution, including retries and the backoff between them
+    :param num_retries: max number of times the request is retried when it
+        fails because of the service's (or the network's) health
+    :raises exceptions.DeadlineExceeded:
+
+    """
+    def execute_attempt(deadline: Optional[Deadline]) -> httplib2.Response:
+        return _execute_google_api_client_request(
+            request, None if deadline is None else deadline.remaining())
+
+    return execute_with_policies(
+        get_google_api_client_request_endpoint(request), execute_attempt,
+        circuit_breaker=circuit_breaker,
+        timeout=timeout,
+        num_retries=num_retries,
+    )
+
+
+def execute_with_policies(
+    endpoint: str,
+    execute_attempt: Callable[[Optional[Deadline]], T],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> T:
+    """
+    Call ``execute_attempt(deadline)`` applying the circuit breaker, timeout
+    and retry policies.
+
+    ``execute_attempt`` makes one request to ``endpoint``, bounded by the
+    deadline it receives (if any), and raises :mod:`.exceptions` errors.
+
+    See :func:`execute_google_api_client_request` for the parameters.
+
+    """
+    deadline = to_deadline(timeout)
+
+    with start_span('api_request', endpoint=endpoint):
+        attempt = 0
+        while True:
+            if deadline is not None:
+                deadline.check(endpoint)
+            try:
+                with start_span('attempt', attempt=attempt):
+                    return _execute_attempt(endpoint, execute_attempt, circuit_breaker, deadline)
+            except Exception as exc:
+                if attempt >= num_retries or not is_service_failure(exc):
+                    raise
+                backoff = _compute_retry_backoff(attempt)
+                if deadline is not None and backoff >= deadline.remaining():
+                    raise exceptions.DeadlineExceeded(endpoint) from exc
+                logger.info(
+                    "Request to '%s' failed (%r). Retrying in %.2f seconds.",
+                    endpoint, exc, backoff)
+                with start_span('retry_backoff'):
+                    time.sleep(backoff)
+                attempt += 1
+
+
+def get_google_api_client_request_endpoint(
+    request: googleapiclient.http.HttpRequest,
+) -> str:
+    """
+    Return an identifier of the API endpoint ``request`` is made to.
+
+    E.g. ``cloudkms.projects.locations.keyRings.cryptoKeys.encrypt``.
+
+    """
+    method_id: Optional[str] = getattr(request, 'methodId', None)
+    if method_id:
+        return method_id
+    return '{} {}'.format(request.method, request.uri.split('?', 1)[0])
+
+
+def is_service_failure(exc: BaseException) -> bool:
+    """
+    Return whether ``exc`` means that the service (or the network) is unhealthy.
+
+    Errors that are the consequence of the request itself (e.g. "resource not
+    found" or "permission denied") say nothing about the service's health.
+
+    """
+    if isinstance(exc, exceptions.UnrecognizedApiHttpError):
+        status = getattr(exc.response, 'status', None)
+        return status is None or status == 429 or status >= 500
+    if isinstance(exc, exceptions.UnrecognizedApiError):
+        return True
+    if isinstance(exc, (socket.timeout, ConnectionError)):
+        return True
+    # note: if a package has not been imported then 'exc' can not be one of its errors.
+    httplib2_module = sys.modules.get('httplib2')
+    if httplib2_module is not None and isinstance(exc, httplib2_module.HttpLib2Error):
+        return True
+    requests_module = sys.modules.get('requests')
+    if requests_module is not None and isinstance(
+        exc, (requests_module.ConnectionError, requests_module.Timeout),
+    ):
+        return True
+    return False
+
+
+def _execute_attempt(
+    endpoint: str,
+    execute_attempt: Callable[[Optional[Deadline]], T],
+    circuit_breaker: Optional[CircuitBreaker],
+    deadline: Optional[Deadline],
+) -> T:
+    concurrency_limiter = get_current_limiter()
+    if concurrency_limiter is None:
+        return _execute_attempt_with_circuit_breaker(
+            endpoint, execute_attempt, circuit_breaker, deadline)
+    with concurrency_limiter.slot(deadline):
+        return _execute_attempt_with_circuit_breaker(
+            endpoint, execute_attempt, circuit_breaker, deadline)
+
+
+def _execute_attempt_with_circuit_breaker(
+    endpoint: str,
+    execute_attempt: Callable[[Optional[Deadline]], T],
+    circuit_breaker: Optional[CircuitBreaker],
+    deadline: Optional[Deadline],
+) -> T:
+    if circuit_breaker is not None:
+        circuit_breaker.before_call(endpoint)
+
+    start = time.monotonic()
+    try:
+        response = execute_attempt(deadline)
+    except Exception as exc:
+        # note: the socket timeout is set to the time remaining until the deadline.
+        is_socket_timeout = deadline is not None and isinstance(exc, socket.timeout)
+        if circuit_breaker is not None:
+            if (
+                is_socket_timeout
+                or isinstance(exc, exceptions.DeadlineExceeded)
+                or is_service_failure(exc)
+            ):
+                circuit_breaker.record_failure(endpoint, time.monotonic() - start)
+            else:
+                circuit_breaker.record_ignored(endpoint)
+        if is_socket_timeout:
+            raise exceptions.DeadlineExceeded(endpoint) from exc
+        raise
+    except BaseException:
+        if circuit_breaker is not None:
+            circuit_breaker.record_ignored(endpoint)
+        raise
+
+    if circuit_breaker is not None:
+        circuit_breaker.record_success(endpoint, time.monotonic() - start)
+    return response
+
+
+def _execute_google_api_client_request(
+    request: googleapiclient.http.HttpRequest,
+    timeout: float = None,
 ) -> httplib2.Response:
+    """
+    Execute ``request`` with the current thread's copy of its HTTP object
+    (see :func:`_get_thread_http`), and translate errors to :mod:`.exceptions`.
+
+    :param timeout: socket timeout of the request; if ``None``, the one of
+        the request's HTTP object
+
+    """
+    # note: by now these have been imported, by 'googleapiclient.http'.
+    import google.auth.exceptions
+    import googleapiclient.errors
+
+    http = _get_thread_http(request.http)
+    _set_thread_http_timeout(http, request.http, timeout)
     try:
-        response = request.execute()
+        with start_span('http') as span:
+            if span is None:
+                response = request.execute(http=http)
+            else:
+                response = _execute_traced_google_api_client_request(request, http, span)
     except google.auth.exceptions.GoogleAuthError as exc:
         raise exceptions.AuthError from exc
     except googleapiclient.errors.HttpError as exc:
@@ -25,3 +228,148 @@ def execute_google_api_client_request(
         raise exceptions.UnrecognizedApiError from exc
 
     return response
+
+
+def _execute_traced_google_api_client_request(
+    request: googleapiclient.http.HttpRequest,
+    http: Any,
+    span: Span,
+) -> Any:
+    # note: 'request.execute()' decodes the response by calling 'request.postproc'.
+    postproc = request.postproc
+
+    def traced_postproc(*args: Any, **kwargs: Any) -> Any:
+        with start_span('decode'):
+            return postproc(*args, **kwargs)
+
+    httplib2_http = _unwrap_httplib2_http(http)
+    sockets_before = _get_httplib2_http_sockets(httplib2_http)
+    request.postproc = traced_postproc
+    try:
+        return request.execute(http=http)
+    finally:
+        request.postproc = postproc
+        if httplib2_http is not None:
+            span.set_attribute(
+                'new_connection',
+                bool(_get_httplib2_http_sockets(httplib2_http) - sockets_before))
+
+
+# Per thread: HTTP object (e.g. of a discovery resource) -> the thread's copy of it.
+_thread_local = threading.local()
+
+
+def _get_thread_http(http: Any) -> Any:
+    """
+    Return the current thread's copy of ``http``, creating it if needed.
+
+    An :class:`httplib2.Http` is not thread-safe: it keeps one connection per
+    host, so concurrent requests made with the same one (e.g. with the
+    discovery resource returned by :func:`.gcp_kms.create_api_client`, from
+    the threads of :func:`._concurrency.map_concurrently`) would get their
+    responses mixed up. Instead, each thread makes requests with its own copy,
+    which keeps its own connections (they are not shared with ``http``).
+
+    ``http`` may be an :class:`httplib2.Http` or a
+    ``google_auth_httplib2.AuthorizedHttp`` that wraps one (its copy shares
+    the credentials). Objects of other types (e.g. the ``HttpMock`` of
+    ``googleapiclient``) are returned unchanged.
+
+    """
+    thread_https = getattr(_thread_local, 'https', None)
+    if thread_https is None:
+        thread_https = _thread_local.https = weakref.WeakKeyDictionary()
+    try:
+        return thread_https[http]
+    except (KeyError, TypeError):
+        pass
+
+    thread_http = _copy_http(http)
+    if thread_http is None:
+        return http
+    thread_https[http] = thread_http
+    return thread_http
+
+
+def _copy_http(http: Any) -> Any:
+    # note: if a package has not been imported then 'http' can not be one of its objects.
+    httplib2_module = sys.modules.get('httplib2')
+    if httplib2_module is not None and isinstance(http, httplib2_module.Http):
+        # note: open connections are not copied (see 'httplib2.Http.__getstate__').
+        return copy.copy(http)
+    google_auth_httplib2_module = sys.modules.get('google_auth_httplib2')
+    if google_auth_httplib2_module is not None and isinstance(
+        http, google_auth_httplib2_module.AuthorizedHttp,
+    ):
+        httplib2_http = _copy_http(http.http)
+        if httplib2_http is not None:
+            return google_auth_httplib2_module.AuthorizedHttp(
+                http.credentials, http=httplib2_http)
+    return None
+
+
+def _compute_retry_backoff(attempt: int) -> float:
+    # Exponential backoff with "full jitter".
+    backoff = min(RETRY_BACKOFF_INITIAL * 2 ** attempt, RETRY_BACKOFF_MAX)
+    return random.uniform(backoff / 2, backoff)
+
+
+def _set_thread_http_timeout(thread_http: Any, http: Any, timeout: Optional[float]) -> None:
+    """
+    Set the socket timeout of the next request made with ``thread_http``,
+    the current thread's copy of ``http`` (see :func:`_get_thread_http`).
+
+    Only the copy (and its connections, which no other thread uses) is
+    changed. If ``timeout`` is ``None``, the timeout of ``http`` is set.
+
+    """
+    thread_httplib2_http = _unwrap_httplib2_http(thread_http)
+    httplib2_http = _unwrap_httplib2_http(http)
+    if thread_httplib2_http is None or thread_httplib2_http is httplib2_http:
+        # Not a copy: it is left untouched.
+        return
+
+    if timeout is None:
+        timeout = getattr(httplib2_http, 'timeout', None)
+    else:
+        # note: a timeout of 0 would put sockets in non-blocking mode.
+        timeout = max(timeout, 0.001)
+    # note: the timeout of its connections is always the one of the copy (new ones get it when
+    #   they are opened).
+    if thread_httplib2_http.timeout != timeout:
+        _set_httplib2_http_timeout(thread_httplib2_http, timeout)
+
+
+def _set_httplib2_http_timeout(http: httplib2.Http, timeout: Optional[float]) -> None:
+    http.timeout = timeout
+    for connection in list(http.connections.values()):
+        connection.timeout = timeout
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            sock.settimeout(timeout)
+
+
+def _unwrap_httplib2_http(http: Any) -> Optional[httplib2.Http]:
+    """
+    Return the :class:`httplib2.Http` that ``http`` is or wraps (e.g. a
+    ``google_auth_httplib2.AuthorizedHttp`` wraps one in its attribute
+    ``http``), or ``None``.
+
+    """
+    httplib2_module = sys.modules.get('httplib2')
+    if httplib2_module is None:
+        return None
+
+    while http is not None and not isinstance(http, httplib2_module.Http):
+        http = getattr(http, 'http', None)
+    return http
+
+
+def _get_httplib2_http_sockets(http: Optional[httplib2.Http]) -> Set[int]:
+    # IDs of the sockets of the open connections of 'http'.
+    if http is None:
+        return set()
+    return {
+        id(connection.sock) for connection in list(http.connections.values())
+        if getattr(connection, 'sock', None) is not None
+    }
@@ -0,0 +1,35 @@
+"""
+Helpers for importing heavy dependencies lazily.
+
+"""
+import importlib
+import sys
+from typing import Any, Callable, Dict, Tuple
+
+
+def make_module_getattr(
+    module_name: str,
+    lazy_attributes: Dict[str, Tuple[str, str]],
+) -> Callable[[str], Any]:
+    """
+    Return a module-level ``__getattr__`` (see PEP 562) for lazy attributes.
+
+    Each item of ``lazy_attributes`` maps the name of an attribute of module
+    ``module_name`` to the ``(module, attribute)`` it is imported from the
+    first time it is accessed. The imported value is then set in the module,
+    so that later accesses do not go through ``__getattr__``.
+
+    """
+    def __getattr__(name: str) -> Any:
+        try:
+            source_module_name, source_attribute_name = lazy_attributes[name]
+        except KeyError:
+            raise AttributeError(
+                "module {!r} has no attribute {!r}".format(module_name, name)) from None
+
+        source_module = importlib.import_module(source_module_name)
+        value = getattr(source_module, source_attribute_name)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    return __getattr__
@@ -2,23 +2,17 @@
 Authentication and authorization utilities.
 
 """
-import logging
+from __future__ import annotations
 
-import google.auth.compute_engine
-import google.auth.credentials
-import google.auth.exceptions
+import functools
+import logging
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
 
 from . import exceptions
-from .common import GcpCredentials
+from .tracing import start_span
 
-# Make sure package 'cryptography' is available for 'google.auth', which prefers that lib instead
-#   of falling back (silently) to package 'rsa' (pure Python).
-#   https://github.com/googleapis/google-auth-library-python/blob/v1.5.1/google/auth/crypt/rsa.py#L19
-try:
-    import google.auth.crypt._cryptography_rsa
-except ImportError as exc:  # pragma: no cover
-    msg = "Package 'cryptography' is required for optimum performance of 'google.auth'."
-    raise ImportError(msg) from exc
+if TYPE_CHECKING:
+    from .common import GcpCredentials
 
 
 logger = logging.getLogger(__name__)
@@ -32,6 +26,10 @@ def get_env_default_credentials() -> GcpCredentials:
         the returned value might correspond to something else.
 
     """
+    _import_google_auth()
+    import google.auth
+    import google.auth.exceptions
+
     try:
         credentials, _ = google.auth.default()
     except google.auth.exceptions.DefaultCredentialsError as exc:
@@ -47,6 +45,10 @@ def get_env_project_id() -> str:
         the returned value might correspond to something else.
 
     """
+    _import_google_auth()
+    import google.auth
+    import google.auth.exceptions
+
     try:
         _, project_id = google.auth.default()
     except google.auth.exceptions.DefaultCredentialsError as exc:
@@ -77,10 +79,109 @@ def get_gce_credentials(service_account_email: str = None) -> GcpCredentials:
          https://google-auth.readthedocs.io/en/latest/user-guide.html#compute-engine-container-engine-and-the-app-engine-flexible-environment
 
     """
+    _import_google_auth()
+    import google.auth.compute_engine
+
     service_account_email = service_account_email or 'default'
     return google.auth.compute_engine.Credentials(service_account_email)
 
 
 def load_credentials_from_file(filename: str) -> GcpCredentials:
+    _import_google_auth()
+    import google.auth._default
+
     credentials, _ = google.auth._default._load_credentials_from_file(filename)
     return credentials
+
+
+def trace_credentials_refresh(credentials: GcpCredentials) -> GcpCredentials:
+    """
+    Record a span ``credentials_refresh`` (see :mod:`.tracing`) every time
+    ``credentials`` are refreshed (e.g. an access token is requested from the
+    metadata server), within a trace.
+
+    Refreshes happen as part of requests, and are otherwise indistinguishable
+    from their HTTP phase. ``credentials`` are modified in place and returned.
+
+    """
+    refresh = credentials.refresh
+    if getattr(refresh, '_fd_gcp_traced', False):
+        return credentials
+
+    @functools.wraps(refresh)
+    def traced_refresh(*args: Any, **kwargs: Any) -> Any:
+        with start_span('credentials_refresh', credentials=type(credentials).__name__):
+            return refresh(*args, **kwargs)
+
+    traced_refresh._fd_gcp_traced = True  # type: ignore
+    # note: refreshes are made by 'google-auth' (e.g. by its authorized HTTP objects), so they
+    #   can only be intercepted by replacing the method of the credentials object itself. The
+    #   instance attribute shadows the class' method.
+    setattr(credentials, 'refresh', traced_refresh)
+    return credentials
+
+
+class CredentialsSpec(NamedTuple):
+
+    """
+    Picklable description of how to get credentials.
+
+    Unlike credentials objects, which may hold private keys and HTTP
+    connections, a spec can be sent to other processes (e.g. as an argument
+    of a ``multiprocessing`` pool initializer), where it is loaded.
+
+    """
+
+    # 'env_default', 'gce' or 'file'
+    kind: str
+    # service account email ('gce') or filename ('file')
+    value: Optional[str] = None
+
+    @classmethod
+    def env_default(cls) -> 'CredentialsSpec':
+        return cls('env_default')
+
+    @classmethod
+    def gce(cls, service_account_email: str = None) -> 'CredentialsSpec':
+        return cls('gce', service_account_email)
+
+    @classmethod
+    def from_file(cls, filename: str) -> 'CredentialsSpec':
+        return cls('file', filename)
+
+    def load(self) -> GcpCredentials:
+        """
+        Return the credentials described by the spec.
+
+        """
+        if self.kind == 'env_default':
+            return get_env_default_credentials()
+        if self.kind == 'gce':
+            return get_gce_credentials(self.value)
+        if self.kind == 'file':
+            if self.value is None:
+                raise ValueError("Missing filename of credentials of kind 'file'.")
+            return load_credentials_from_file(self.value)
+        raise ValueError("Unknown kind of credentials {!r}.".format(self.kind))
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _import_google_auth() -> None:
+    """
+    Import package ``google.auth``, after checking its optional dependencies.
+
+    Importing ``google.auth`` is slow, so it is not done when this module is
+    imported but the first time it is needed.
+
+    """
+    # Make sure package 'cryptography' is available for 'google.auth', which prefers that lib
+    #   instead of falling back (silently) to package 'rsa' (pure Python).
+    #   https://github.com/googleapis/google-auth-library-python/blob/v1.5.1/google/auth/crypt/rsa.py#L19
+    try:
+        import google.auth.crypt._cryptography_rsa  # noqa: F401
+    except ImportError as exc:  # pragma: no cover
+        msg = "Package 'cryptography' is required for optimum performance of 'google.auth'."
+        raise ImportError(msg) from exc
@@ -0,0 +1,346 @@
+"""
+Circuit breaker for GCP API requests.
+
+A circuit breaker keeps track of the outcome of the requests made to each API
+endpoint (e.g. ``cloudkms.projects.locations.keyRings.cryptoKeys.encrypt``)
+and, when an endpoint looks unhealthy, makes new requests to it fail fast
+instead of letting them block until the HTTP timeout expires.
+
+The state of each endpoint's circuit is one of:
+
+- *closed*: requests go through normally. Consecutive failures and slow
+  requests are counted and, when either count reaches its threshold, the
+  circuit is opened.
+- *open*: requests are rejected immediately with
+  :class:`.exceptions.CircuitBreakerOpen`. After ``reset_timeout`` seconds
+  the circuit becomes half-open.
+- *half-open*: up to ``half_open_max_calls`` concurrent probe requests are let
+  through. If a probe succeeds the circuit is closed; if it fails the circuit
+  is opened again.
+
+Usage example::
+
+    circuit_breaker = CircuitBreaker(
+        failure_threshold=5,
+        slow_call_duration=2.0,
+        reset_timeout=30.0,
+    )
+    circuit_breaker.add_listener(
+        lambda endpoint, old_state, new_state: print(endpoint, old_state, new_state))
+
+    encrypted_data = gcp_kms.encrypt(
+        kms_api_client, crypto_key_grn, plain_data,
+        circuit_breaker=circuit_breaker)
+
+"""
+import enum
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from . import exceptions
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(enum.Enum):
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+
+StateChangeListener = Callable[[str, CircuitState, CircuitState], None]
+"""
+Callable invoked as ``listener(endpoint, old_state, new_state)`` on every
+state transition of an endpoint's circuit.
+"""
+
+_Transition = Optional[Tuple[str, CircuitState, CircuitState]]
+
+
+class _EndpointCircuit:
+
+    def __init__(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_slow_calls = 0
+        self.opened_at = 0.0
+        self.half_open_calls_in_flight = 0
+
+
+class CircuitBreaker:
+
+    """
+    Per-endpoint circuit breaker.
+
+    Instances are thread-safe and are meant to be shared by all the threads
+    that make requests to the same API.
+
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        slow_call_duration: float = None,
+        slow_call_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Constructor.
+
+        :param failure_threshold: number of consecutive failed requests
+            that opens the circuit
+        :param slow_call_duration: duration (seconds) from which a request
+            is considered slow; if ``None``, latency is not taken into account
+        :param slow_call_threshold: number of consecutive slow requests that
+            opens the circuit
+        :param reset_timeout: time (seconds) a circuit stays open before
+            letting probe requests through
+        :param half_open_max_calls: max number of concurrent probe requests
+            while the circuit is half-open
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        if failure_threshold < 1:
+            raise ValueError("Value of 'failure_threshold' must be positive.")
+        if slow_call_threshold < 1:
+            raise ValueError("Value of 'slow_call_threshold' must be positive.")
+        if half_open_max_calls < 1:
+            raise ValueError("Value of 'half_open_max_calls' must be positive.")
+        if reset_timeout < 0:
+            raise ValueError("Value of 'reset_timeout' must not be negative.")
+
+        self.failure_threshold = failure_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_threshold = slow_call_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._circuits: Dict[str, _EndpointCircuit] = {}
+        self._listeners: List[StateChangeListener] = []
+
+    ###########################################################################
+    # observability
+    ###########################################################################
+
+    def add_listener(self, listener: StateChangeListener) -> None:
+        """
+        Register a callable to be notified of every state transition.
+
+        Listeners are called synchronously, outside of the breaker's lock,
+        and exceptions raised by them are logged and ignored.
+
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: StateChangeListener) -> None:
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def get_state(self, endpoint: str) -> CircuitState:
+        """
+        Return the current state of ``endpoint``'s circuit.
+
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                return CircuitState.CLOSED
+            transition = self._maybe_half_open(endpoint, circuit)
+        self._notify(transition)
+        return circuit.state
+
+    def get_states(self) -> Dict[str, CircuitState]:
+        """
+        Return the current state of every known endpoint's circuit.
+
+        """
+        with self._lock:
+            return {endpoint: circuit.state for endpoint, circuit in self._circuits.items()}
+
+    def reset(self, endpoint: str = None) -> None:
+        """
+        Close ``endpoint``'s circuit (or all of them) and clear its counters.
+
+        """
+        with self._lock:
+            if endpoint is None:
+                endpoints = list(self._circuits)
+            else:
+                endpoints = [endpoint] if endpoint in self._circuits else []
+            transitions = []
+            for endpoint_ in endpoints:
+                old_state = self._circuits.pop(endpoint_).state
+                if old_state is not CircuitState.CLOSED:
+                    transitions.append((endpoint_, old_state, CircuitState.CLOSED))
+        for transition in transitions:
+            self._notify(transition)
+
+    ###########################################################################
+    # request accounting
+    ###########################################################################
+
+    def before_call(self, endpoint: str) -> None:
+        """
+        Check whether a request to ``endpoint`` may be made.
+
+        Every call that does not raise must be followed by exactly one call to
+        :meth:`record_success`, :meth:`record_failure` or :meth:`record_ignored`.
+
+        :raises exceptions.CircuitBreakerOpen: if the request must not be made
+
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                circuit = self._circuits[endpoint] = _EndpointCircuit()
+            transition = self._maybe_half_open(endpoint, circuit)
+
+            rejection = None
+            if circuit.state is CircuitState.OPEN:
+                retry_after = circuit.opened_at + self.reset_timeout - self._clock()
+                rejection = exceptions.CircuitBreakerOpen(endpoint, max(retry_after, 0.0))
+            elif circuit.state is CircuitState.HALF_OPEN:
+                if circuit.half_open_calls_in_flight >= self.half_open_max_calls:
+                    rejection = exceptions.CircuitBreakerOpen(endpoint, 0.0)
+                else:
+                    circuit.half_open_calls_in_flight += 1
+
+        self._notify(transition)
+        if rejection is not None:
+            raise rejection
+
+    def record_success(self, endpoint: str, duration: float) -> None:
+        """
+        Record that a request to ``endpoint`` succeeded after ``duration`` seconds.
+
+        A successful but slow request counts towards ``slow_call_threshold``.
+
+        """
+        is_slow = self.slow_call_duration is not None and duration >= self.slow_call_duration
+
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                return
+            was_probe = self._end_probe(circuit)
+            circuit.consecutive_failures = 0
+            if is_slow:
+                circuit.consecutive_slow_calls += 1
+            else:
+                circuit.consecutive_slow_calls = 0
+
+            if was_probe:
+                new_state = CircuitState.OPEN if is_slow else CircuitState.CLOSED
+            elif circuit.consecutive_slow_calls >= self.slow_call_threshold:
+                new_state = CircuitState.OPEN
+            else:
+                new_state = circuit.state
+            transition = self._set_state(endpoint, circuit, new_state)
+
+        self._notify(transition)
+
+    def record_failure(self, endpoint: str, duration: float) -> None:
+        """
+        Record that a request to ``endpoint`` failed after ``duration`` seconds.
+
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                return
+            was_probe = self._end_probe(circuit)
+            circuit.consecutive_failures += 1
+
+            if was_probe or circuit.consecutive_failures >= self.failure_threshold:
+                new_state = CircuitState.OPEN
+            else:
+                new_state = circuit.state
+            transition = self._set_state(endpoint, circuit, new_state)
+
+        self._notify(transition)
+
+    def record_ignored(self, endpoint: str) -> None:
+        """
+        Record that a request to ``endpoint`` ended with an outcome that says
+        nothing about the endpoint's health (e.g. "resource not found").
+
+        """
+        with self._lock:
+            circuit = self._circuits.get(endpoint)
+            if circuit is None:
+                return
+            was_probe = self._end_probe(circuit)
+            if was_probe:
+                transition = self._set_state(endpoint, circuit, CircuitState.CLOSED)
+            else:
+                transition = None
+
+        self._notify(transition)
+
+    ###########################################################################
+    # internal helpers
+    ###########################################################################
+
+    def _maybe_half_open(self, endpoint: str, circuit: _EndpointCircuit) -> _Transition:
+        # warning: must be called with 'self._lock' acquired.
+        if (
+            circuit.state is CircuitState.OPEN
+            and self._clock() - circuit.opened_at >= self.reset_timeout
+        ):
+            return self._set_state(endpoint, circuit, CircuitState.HALF_OPEN)
+        return None
+
+    def _end_probe(self, circuit: _EndpointCircuit) -> bool:
+        # warning: must be called with 'self._lock' acquired.
+        if circuit.state is CircuitState.HALF_OPEN and circuit.half_open_calls_in_flight > 0:
+            circuit.half_open_calls_in_flight -= 1
+            return True
+        return False
+
+    def _set_state(
+        self,
+        endpoint: str,
+        circuit: _EndpointCircuit,
+        state: CircuitState,
+    ) -> _Transition:
+        # warning: must be called with 'self._lock' acquired.
+        old_state = circuit.state
+        if old_state is state:
+            return None
+
+        circuit.state = state
+        if state is CircuitState.OPEN:
+            circuit.opened_at = self._clock()
+            circuit.half_open_calls_in_flight = 0
+        elif state is CircuitState.CLOSED:
+            circuit.consecutive_failures = 0
+            circuit.consecutive_slow_calls = 0
+            circuit.half_open_calls_in_flight = 0
+
+        return (endpoint, old_state, state)
+
+    def _notify(self, transition: _Transition) -> None:
+        if transition is None:
+            return
+
+        endpoint, old_state, new_state = transition
+        log_level = logging.WARNING if new_state is CircuitState.OPEN else logging.INFO
+        logger.log(
+            log_level, "Circuit of endpoint '%s' changed from %s to %s.",
+            endpoint, old_state.value, new_state.value)
+
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(endpoint, old_state, new_state)
+            except Exception:
+                logger.exception("Circuit breaker state change listener failed.")
@@ -0,0 +1,135 @@
+"""
+Fork-safe API clients.
+
+An API client holds HTTP connections (sockets and, for ``googleapiclient``,
+``httplib2`` state). If a process forks (e.g. ``multiprocessing`` or a
+pre-fork server such as gunicorn) after an API client was created, parent
+and child share those connections and their requests get mixed up.
+
+A :class:`ProcessLocalApiClient` is an API client that, in each process,
+creates its own underlying API client the first time it is used, so it can
+be created before forking::
+
+    kms_api_client = ProcessLocalApiClient(
+        gcp_kms.create_api_client,
+        CredentialsSpec.gce(),
+    )
+
+    # e.g. in a gunicorn worker (i.e. after the fork):
+    encrypted_data = gcp_kms.encrypt(kms_api_client, crypto_key_grn, plain_data)
+
+Instances are picklable if their ``create_api_client`` callable is (e.g. a
+module-level function) and their credentials are given as a
+:class:`.auth.CredentialsSpec`, so they can be passed to pool initializers::
+
+    pool = multiprocessing.Pool(initializer=init_worker, initargs=(kms_api_client,))
+
+Creating the underlying API client in a child process is cheap: credentials
+created in the parent are reused, and so is the discovery document (see
+:func:`.gcp_kms.create_api_client`).
+
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Mapping, Optional, Tuple, Union
+
+from .auth import CredentialsSpec
+from .deadline import Deadline
+from .transport import ApiClient, ApiMethod, Transport, get_transport
+
+if TYPE_CHECKING:
+    from .common import GcpCredentials
+
+
+class ProcessLocalApiClient(Transport):
+
+    """
+    API client that creates its underlying API client once per process.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        create_api_client: Callable[[GcpCredentials], ApiClient],
+        credentials: Union[GcpCredentials, CredentialsSpec],
+    ) -> None:
+        """Constructor.
+
+        :param create_api_client: e.g. :func:`.gcp_kms.create_api_client`
+        :param credentials: credentials, or the spec of the credentials to
+            load the first time they are needed
+
+        """
+        self.create_api_client = create_api_client
+        self.credentials = credentials
+
+        # (PID, underlying API client)
+        self._state: Optional[Tuple[int, ApiClient]] = None
+        # note: credentials do not hold connections, so they are shared with child processes.
+        self._loaded_credentials: Optional[GcpCredentials] = None
+        self._lock = threading.Lock()
+        self._lock_pid = os.getpid()
+
+    def get_api_client(self) -> ApiClient:
+        """
+        Return the underlying API client of the current process.
+
+        """
+        state = self._state
+        pid = os.getpid()
+        if state is not None and state[0] == pid:
+            return state[1]
+
+        with self._get_lock(pid):
+            state = self._state
+            if state is not None and state[0] == pid:
+                return state[1]
+            # note: the API client of the parent process is discarded but not closed, because
+            #   closing its connections would affect the parent.
+            api_client = self.create_api_client(self._get_credentials())
+            self._state = (pid, api_client)
+        return api_client
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        return get_transport(self.get_api_client()).execute(method, params, body, deadline)
+
+    def close(self) -> None:
+        state = self._state
+        if state is not None and state[0] == os.getpid():
+            self._state = None
+            get_transport(state[1]).close()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        if not isinstance(self.credentials, CredentialsSpec):
+            raise TypeError(
+                "Credentials must be a 'CredentialsSpec' for the API client to be picklable.")
+        return {'create_api_client': self.create_api_client, 'credentials': self.credentials}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['create_api_client'], state['credentials'])  # type: ignore
+
+    def _get_credentials(self) -> GcpCredentials:
+        # warning: must be called with 'self._lock' acquired.
+        if not isinstance(self.credentials, CredentialsSpec):
+            return self.credentials
+        if self._loaded_credentials is None:
+            self._loaded_credentials = self.credentials.load()
+        return self._loaded_credentials
+
+    def _get_lock(self, pid: int) -> threading.Lock:
+        # note: the lock might have been held by another thread of the parent process when it
+        #   forked, and it would never be released in the child process.
+        if self._lock_pid != pid:
+            self._lock = threading.Lock()
+            self._lock_pid = pid
+        return self._lock
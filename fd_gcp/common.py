@@ -2,6 +2,19 @@
 Definitions and data useful for many services modules.
 
 """
-# warning: do NOT remove any of these definitions, even though they are not used in this module.
-from google.auth.credentials import Credentials as GcpCredentials  # noqa: F401
-from googleapiclient.discovery import Resource as GcpResource  # noqa: F401
+from typing import TYPE_CHECKING
+
+from ._lazy import make_module_getattr
+
+if TYPE_CHECKING:
+    # warning: do NOT remove any of these definitions, even though they are not used in this module.
+    from google.auth.credentials import Credentials as GcpCredentials  # noqa: F401
+    from googleapiclient.discovery import Resource as GcpResource  # noqa: F401
+
+
+# Importing 'google.auth' and (specially) 'googleapiclient.discovery' is slow, so these are
+#   imported the first time they are accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('google.auth.credentials', 'Credentials'),
+    'GcpResource': ('googleapiclient.discovery', 'Resource'),
+})
@@ -0,0 +1,172 @@
+"""
+Compression of data before it is encrypted.
+
+Data such as JSON documents compresses well, and compressing it before it is
+encrypted (ciphertext does not compress at all) makes requests smaller and
+lets larger data fit into the size limit of operations such as
+:func:`.gcp_kms.encrypt`.
+
+Compressed data is framed with a small header that records the codec, so
+:func:`decompress` needs no other information. If compressing does not make
+the data smaller, it is framed uncompressed (codec ``none``).
+
+Header (5 bytes): the magic bytes ``b'\\xfdZC'``, the format version (``1``)
+and the codec ID.
+
+Available codecs:
+
+- ``zlib``: standard library.
+- ``zstd``: Zstandard; requires package ``zstandard`` (extra ``zstd`` of
+  this library).
+
+"""
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+from . import exceptions
+from .exceptions import DecompressionError  # noqa: F401
+
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+
+# Default max size of decompressed data (guards against "decompression bombs").
+DECOMPRESSED_DATA_MAX_SIZE = 64 * 1024 * 1024  # 64 MiB
+
+_MAGIC = b'\xfdZC'
+_FORMAT_VERSION = 1
+_HEADER_SIZE = len(_MAGIC) + 2
+
+_CODEC_IDS = {CODEC_NONE: 0, CODEC_ZLIB: 1, CODEC_ZSTD: 2}
+_CODECS_BY_ID = {codec_id: codec for codec, codec_id in _CODEC_IDS.items()}
+
+
+def compress(data: bytes, codec: str = CODEC_ZLIB, level: int = None) -> bytes:
+    """
+    Compress ``data`` with ``codec`` and frame it.
+
+    :param level: compression level; if ``None``, the codec's default
+
+    """
+    if not isinstance(data, bytes):
+        raise TypeError("Type of 'data' is not bytes.")
+    try:
+        compress_fn = _get_codec_functions(codec)[0]
+    except KeyError:
+        raise ValueError("Unsupported codec {!r}.".format(codec)) from None
+
+    compressed_data = compress_fn(data, level)
+    # note: data that does not compress (e.g. random data) would grow.
+    if len(compressed_data) >= len(data):
+        codec, compressed_data = CODEC_NONE, data
+
+    header = _MAGIC + bytes((_FORMAT_VERSION, _CODEC_IDS[codec]))
+    return header + compressed_data
+
+
+def decompress(data: bytes, max_size: int = DECOMPRESSED_DATA_MAX_SIZE) -> bytes:
+    """
+    Decompress ``data`` framed by :func:`compress`.
+
+    :param max_size: max size of the decompressed data
+    :raises exceptions.DecompressionError:
+
+    """
+    if not is_compressed(data):
+        raise exceptions.DecompressionError("data is not framed")
+    codec_id = data[len(_MAGIC) + 1]
+    try:
+        codec = _CODECS_BY_ID[codec_id]
+    except KeyError:
+        raise exceptions.DecompressionError("unknown codec ID {}".format(codec_id)) from None
+
+    payload = data[_HEADER_SIZE:]
+    decompress_fn = _get_codec_functions(codec)[1]
+    return decompress_fn(payload, max_size)
+
+
+def is_compressed(data: bytes) -> bool:
+    """
+    Return whether ``data`` looks like it was framed by :func:`compress`.
+
+    """
+    return (
+        len(data) >= _HEADER_SIZE
+        and data.startswith(_MAGIC)
+        and data[len(_MAGIC)] == _FORMAT_VERSION
+    )
+
+
+###############################################################################
+# codecs
+###############################################################################
+
+def _get_codec_functions(codec: str) -> Tuple[Callable[..., bytes], Callable[..., bytes]]:
+    return _CODEC_FUNCTIONS[codec]
+
+
+def _none_compress(data: bytes, level: int = None) -> bytes:
+    return data
+
+
+def _none_decompress(data: bytes, max_size: int) -> bytes:
+    if len(data) > max_size:
+        raise exceptions.DecompressionError("data exceeds max size")
+    return data
+
+
+def _zlib_compress(data: bytes, level: int = None) -> bytes:
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def _zlib_decompress(data: bytes, max_size: int) -> bytes:
+    decompressor = zlib.decompressobj()
+    try:
+        # note: at most 'max_size + 1' bytes are decompressed.
+        decompressed_data = decompressor.decompress(data, max_size + 1)
+    except zlib.error as exc:
+        raise exceptions.DecompressionError(str(exc)) from exc
+    if len(decompressed_data) > max_size:
+        raise exceptions.DecompressionError("data exceeds max size")
+    if not decompressor.eof:
+        raise exceptions.DecompressionError("data is truncated")
+    return decompressed_data
+
+
+def _zstd_compress(data: bytes, level: int = None) -> bytes:
+    zstandard = _import_zstandard()
+    compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+    compressed_data: bytes = compressor.compress(data)
+    return compressed_data
+
+
+def _zstd_decompress(data: bytes, max_size: int) -> bytes:
+    zstandard = _import_zstandard()
+    decompressor = zstandard.ZstdDecompressor()
+    try:
+        if zstandard.frame_content_size(data) > max_size:
+            raise exceptions.DecompressionError("data exceeds max size")
+        # note: 'max_output_size' is only used if the frame does not include the content size.
+        decompressed_data: bytes = decompressor.decompress(data, max_output_size=max_size + 1)
+    except zstandard.ZstdError as exc:
+        raise exceptions.DecompressionError(str(exc)) from exc
+    if len(decompressed_data) > max_size:
+        raise exceptions.DecompressionError("data exceeds max size")
+    return decompressed_data
+
+
+def _import_zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError as exc:
+        msg = "Package 'zstandard' is required for codec 'zstd' (extra 'zstd')."
+        raise ImportError(msg) from exc
+    return zstandard
+
+
+_CODEC_FUNCTIONS: Dict[str, Tuple[Callable[..., bytes], Callable[..., bytes]]] = {
+    CODEC_NONE: (_none_compress, _none_decompress),
+    CODEC_ZLIB: (_zlib_compress, _zlib_decompress),
+    CODEC_ZSTD: (_zstd_compress, _zstd_decompress),
+}
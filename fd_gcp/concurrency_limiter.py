@@ -0,0 +1,377 @@
+"""
+Adaptive concurrency limiter for GCP API requests.
+
+The number of concurrent requests a bulk job can make to an API (e.g. KMS)
+without being throttled depends on the quota, the service's load and the
+network, so a fixed number is either too low (quota is wasted) or too high
+(requests fail with HTTP 429 and are retried). A :class:`ConcurrencyLimiter`
+instead adjusts its limit from the outcome of the requests it lets through:
+
+- While the latency of requests stays close to the usual (long-term
+  average) latency, the limit grows (by about the square root of the limit
+  per request). When latency increases, i.e. requests start queueing on the
+  service's side, the limit shrinks proportionally (gradient).
+- When a request is throttled (HTTP 429) or fails because the service is
+  unhealthy (see :func:`._http.is_service_failure`), or times out, the limit
+  is decreased multiplicatively (AIMD), at most once per (average) request
+  latency.
+
+Within an :meth:`ConcurrencyLimiter.apply` context, every request attempt
+made by the operations of this library waits for a free slot of the limiter,
+including those made in the shared executor (e.g. by
+:func:`.gcp_kms.mac_sign_batch` or :func:`.gcp_kms_reencryption.reencrypt`)::
+
+    concurrency_limiter = ConcurrencyLimiter(initial_limit=8, max_limit=32)
+
+    with concurrency_limiter.apply():
+        gcp_kms_reencryption.reencrypt(
+            kms_api_client, crypto_key_grn, records, sink, max_concurrency=32)
+
+Code that runs operations in an ``asyncio`` event loop (in a thread pool)
+takes a slot around each operation instead::
+
+    async with concurrency_limiter.slot_async():
+        await loop.run_in_executor(None, gcp_kms.encrypt, kms_api_client, ...)
+
+The same limiter may be shared by threads and ``asyncio`` tasks, which get
+free slots in FIFO order.
+
+"""
+from __future__ import annotations
+
+import collections
+import contextlib
+import contextvars
+import logging
+import math
+import threading
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Deque, Iterator, Optional
+
+from . import exceptions
+from .deadline import Deadline
+
+if TYPE_CHECKING:
+    import asyncio
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimiter:
+
+    """
+    Limiter of the number of concurrent requests, whose limit adapts to the
+    latency and failures of the requests.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 256,
+        tolerance: float = 2.0,
+        backoff_ratio: float = 0.7,
+        smoothing: float = 0.2,
+        latency_window: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Constructor.
+
+        :param tolerance: ratio of a request's latency to the average latency
+            from which the limit is decreased
+        :param backoff_ratio: ratio the limit is multiplied by when a request
+            is throttled or fails
+        :param smoothing: weight of each latency-based adjustment of the limit
+        :param latency_window: number of requests the average latency
+            (roughly) covers
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        if min_limit < 1:
+            raise ValueError("Value of 'min_limit' must be positive.")
+        if not min_limit <= initial_limit <= max_limit:
+            raise ValueError(
+                "Value of 'initial_limit' must be between 'min_limit' and 'max_limit'.")
+        if tolerance < 1:
+            raise ValueError("Value of 'tolerance' must not be less than 1.")
+        if not 0 < backoff_ratio < 1:
+            raise ValueError("Value of 'backoff_ratio' must be between 0 and 1.")
+        if not 0 < smoothing <= 1:
+            raise ValueError("Value of 'smoothing' must be between 0 and 1.")
+        if latency_window < 1:
+            raise ValueError("Value of 'latency_window' must be positive.")
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff_ratio = backoff_ratio
+        self.smoothing = smoothing
+        self.latency_window = latency_window
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = collections.deque()
+        # Exponential moving average of the latency of successful requests.
+        self._average_latency: Optional[float] = None
+        self._decreased_at: Optional[float] = None
+
+    @property
+    def limit(self) -> int:
+        """
+        Current max number of concurrent requests.
+
+        """
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of slots currently taken.
+
+        """
+        return self._in_flight
+
+    @property
+    def average_latency(self) -> Optional[float]:
+        return self._average_latency
+
+    @contextlib.contextmanager
+    def slot(self, deadline: Deadline = None) -> Iterator[None]:
+        """
+        Context manager that takes a slot, waiting until one is free, for
+        the duration of a request.
+
+        The latency of the request, and the exception raised (if any),
+        adjust the limit.
+
+        :param deadline: if not ``None``, the wait must not go beyond it
+        :raises exceptions.DeadlineExceeded: if no slot became free before
+            ``deadline``
+
+        """
+        self._acquire(deadline)
+        start, in_flight = self._clock(), self._in_flight
+        try:
+            yield
+        except BaseException as exc:
+            self._release(start, in_flight, exc)
+            raise
+        self._release(start, in_flight, None)
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self, deadline: Deadline = None) -> AsyncIterator[None]:
+        """
+        Like :meth:`slot` but waits for a free slot without blocking the
+        event loop.
+
+        """
+        await self._acquire_async(deadline)
+        start, in_flight = self._clock(), self._in_flight
+        try:
+            yield
+        except BaseException as exc:
+            self._release(start, in_flight, exc)
+            raise
+        self._release(start, in_flight, None)
+
+    @contextlib.contextmanager
+    def apply(self) -> Iterator['ConcurrencyLimiter']:
+        """
+        Context manager within which every request attempt made by the
+        operations of this library takes a slot of this limiter.
+
+        The limiter is stored in a context variable (like the current span
+        of :mod:`.tracing`), so it applies to the calling thread (or
+        ``asyncio`` task) and to the calls these operations make in the
+        shared executor. Requests made within :meth:`slot` must not be made
+        within :meth:`apply` of the same limiter too.
+
+        """
+        token = _current_limiter.set(self)
+        try:
+            yield self
+        finally:
+            _current_limiter.reset(token)
+
+    def _acquire(self, deadline: Optional[Deadline]) -> None:
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+            waiter = _Waiter(None)
+            self._waiters.append(waiter)
+
+        assert waiter.event is not None
+        timeout = None if deadline is None else max(deadline.remaining(), 0.0)
+        if waiter.event.wait(timeout):
+            return
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+        raise exceptions.DeadlineExceeded('concurrency limiter')
+
+    async def _acquire_async(self, deadline: Optional[Deadline]) -> None:
+        # note: 'asyncio' is slow to import, and not needed by code that uses threads.
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+
+        assert waiter.future is not None
+        timeout = None if deadline is None else max(deadline.remaining(), 0.0)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except BaseException as exc:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+            if waiter.granted:
+                if isinstance(exc, asyncio.TimeoutError):
+                    # The slot was given just before the timeout expired.
+                    return
+                self._release(None, 0, None)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise exceptions.DeadlineExceeded('concurrency limiter') from None
+            raise
+
+    def _release(
+        self,
+        start: Optional[float],
+        in_flight: int,
+        exc: Optional[BaseException],
+    ) -> None:
+        """
+        Free a slot taken at ``start`` (when there were ``in_flight`` slots
+        taken), and adjust the limit from the outcome of its request.
+
+        """
+        now = self._clock()
+        outcome = _classify_outcome(exc)
+
+        with self._lock:
+            self._in_flight -= 1
+            old_limit = self.limit
+            if start is None or outcome is None:
+                pass
+            elif outcome == _OVERLOAD:
+                self._decrease(now)
+            else:
+                self._adjust(now - start, in_flight)
+            if self.limit != old_limit:
+                logger.debug("Concurrency limit changed from %d to %d.", old_limit, self.limit)
+            self._notify_waiters()
+
+    def _decrease(self, now: float) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        # note: the requests in flight when the service got overloaded are likely to fail too, but
+        #   that must not collapse the limit.
+        if (
+            self._decreased_at is not None
+            and now - self._decreased_at < (self._average_latency or 0.0)
+        ):
+            return
+        self._limit = max(self._limit * self.backoff_ratio, float(self.min_limit))
+        self._decreased_at = now
+
+    def _adjust(self, latency: float, in_flight: int) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        if self._average_latency is None:
+            self._average_latency = latency
+        else:
+            self._average_latency += (latency - self._average_latency) / self.latency_window
+
+        gradient = 1.0
+        if latency > 0:
+            gradient = max(0.5, min(1.0, self.tolerance * self._average_latency / latency))
+        new_limit = self._limit * gradient + math.sqrt(self._limit)
+        # Do not grow the limit if the caller does not use it (e.g. when it makes few requests).
+        if new_limit > self._limit and in_flight < self._limit / 2:
+            return
+        new_limit = self._limit + (new_limit - self._limit) * self.smoothing
+        self._limit = min(max(new_limit, float(self.min_limit)), float(self.max_limit))
+
+    def _notify_waiters(self) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        while self._waiters and self._in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            self._in_flight += 1
+            waiter.grant()
+
+
+def get_current_limiter() -> Optional[ConcurrencyLimiter]:
+    """
+    Return the limiter of the current :meth:`ConcurrencyLimiter.apply`
+    context, if any.
+
+    """
+    return _current_limiter.get()
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+_current_limiter: 'contextvars.ContextVar[Optional[ConcurrencyLimiter]]' = (
+    contextvars.ContextVar('fd_gcp_current_concurrency_limiter', default=None))
+
+_SUCCESS = 'success'
+_OVERLOAD = 'overload'
+
+
+class _Waiter:
+
+    """
+    A thread (if ``loop`` is ``None``) or ``asyncio`` task waiting for a slot.
+
+    """
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self.loop = loop
+        self.event: Optional[threading.Event] = threading.Event() if loop is None else None
+        self.future: Optional[asyncio.Future] = None if loop is None else loop.create_future()
+        self.granted = False
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.loop is None:
+            assert self.event is not None
+            self.event.set()
+        else:
+            assert self.future is not None
+            self.loop.call_soon_threadsafe(_set_future_result, self.future)
+
+
+def _set_future_result(future: asyncio.Future[Any]) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _classify_outcome(exc: Optional[BaseException]) -> Optional[str]:
+    """
+    Return whether the request succeeded (:data:`_SUCCESS`), failed because
+    the service is overloaded or unhealthy (:data:`_OVERLOAD`), or neither
+    (``None``; e.g. the resource was not found).
+
+    """
+    # note: imported here because module '_http' uses this one.
+    from ._http import is_service_failure
+
+    if exc is None:
+        return _SUCCESS
+    if isinstance(exc, exceptions.DeadlineExceeded):
+        return _OVERLOAD
+    if isinstance(exc, Exception) and is_service_failure(exc):
+        return _OVERLOAD
+    return None
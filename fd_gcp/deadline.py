@@ -0,0 +1,96 @@
+"""
+Deadlines for GCP API operations.
+
+Operations that make requests to GCP accept a ``timeout`` argument, which may
+be either a number of seconds or a :class:`Deadline`. A timeout is converted
+to a deadline when the operation starts, and every step of the operation
+(waiting for a connection, making a request, backing off before a retry) is
+bounded by the time remaining until that deadline. When it is reached,
+:class:`.exceptions.DeadlineExceeded` is raised.
+
+A :class:`Deadline` is useful for sharing a single time budget among many
+operations, e.g. all those made while handling a request::
+
+    deadline = Deadline.from_timeout(0.5)
+    plain_data_1 = gcp_kms.decrypt(kms_api_client, crypto_key_grn, data_1, timeout=deadline)
+    plain_data_2 = gcp_kms.decrypt(kms_api_client, crypto_key_grn, data_2, timeout=deadline)
+
+"""
+import time
+from typing import Callable, Optional, Union
+
+from . import exceptions
+
+
+class Deadline:
+
+    """
+    Point in time (of a monotonic clock) by which something must be done.
+
+    """
+
+    def __init__(self, expires_at: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """Constructor.
+
+        :param expires_at: time, as returned by ``clock``, of the deadline
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        self.expires_at = expires_at
+        self._clock = clock
+
+    @classmethod
+    def from_timeout(
+        cls,
+        timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> 'Deadline':
+        """
+        Create a deadline ``timeout`` seconds from now.
+
+        """
+        if timeout < 0:
+            raise ValueError("Value of 'timeout' must not be negative.")
+        return cls(clock() + timeout, clock=clock)
+
+    def remaining(self) -> float:
+        """
+        Return the time (seconds) remaining until the deadline, or 0 if expired.
+
+        """
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+    def check(self, operation: str = None) -> None:
+        """
+        Raise :class:`.exceptions.DeadlineExceeded` if the deadline has expired.
+
+        :param operation: description of what was being done, for the error
+
+        """
+        if self.expired():
+            raise exceptions.DeadlineExceeded(operation)
+
+    def __repr__(self) -> str:
+        return 'Deadline(remaining={:.3f})'.format(self.remaining())
+
+
+Timeout = Union[None, float, Deadline]
+"""
+Type of the ``timeout`` argument of operations: ``None`` (no timeout), a
+number of seconds, or a :class:`Deadline`.
+"""
+
+
+def to_deadline(timeout: Timeout) -> Optional[Deadline]:
+    """
+    Return the deadline corresponding to ``timeout``, starting now.
+
+    """
+    if timeout is None or isinstance(timeout, Deadline):
+        return timeout
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        raise TypeError("Type of 'timeout' is not a number or 'Deadline'.")
+    return Deadline.from_timeout(float(timeout))
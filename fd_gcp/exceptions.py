@@ -2,12 +2,17 @@
 Exceptions that may be exposed to the users of this library.
 
 """
+from __future__ import annotations
+
+import json
 import logging
 import re
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-import googleapiclient.errors
-import httplib2
+if TYPE_CHECKING:
+    # note: these are not imported at runtime because importing them is slow.
+    import googleapiclient.errors
+    import httplib2
 
 
 logger = logging.getLogger(__name__)
@@ -69,6 +74,8 @@ class ResourceNotFound(Error):
 
     For ``HttpError`` exception with "reason":
         "<resource_type> <resource> not found."
+        "<resource_type> [<resource>] not found[ or has no versions]."
+        "No such object: <resource>"
 
     .. warning::
         It might happen that the resource does exist but with the request's
@@ -104,6 +111,98 @@ class AlreadyExists(Error):
         return "{what} already exists.".format(what=self.what)
 
 
+class ConcurrentModification(Error):
+
+    """
+    A request was aborted because of a concurrent modification of a
+    resource, e.g. a read-modify-write of an IAM policy whose ``etag`` no
+    longer matches.
+
+    The whole read-modify-write should be retried.
+
+    """
+
+    def __init__(self, resource: str = None) -> None:
+        """Constructor.
+
+        :param resource: a resource's ID, GRN or some other identifier
+
+        """
+        self.resource = resource
+
+    def __str__(self) -> str:
+        resource_str = self.resource or 'unkwnown'
+
+        return "Resource '{resource}' was modified concurrently.".format(resource=resource_str)
+
+
+class DecryptionError(Error):
+
+    """
+    Data encrypted locally (e.g. with a data key, see
+    :mod:`.gcp_kms_data_keys`) is not valid: it is corrupted, truncated or it
+    was not encrypted by this library.
+
+    """
+
+
+class DecompressionError(Error):
+
+    """
+    Compressed data (see :mod:`.compression`) is invalid or too large.
+
+    """
+
+    def __str__(self) -> str:
+        return "Decompression failed: {}.".format(self.args[0] if self.args else 'unknown error')
+
+
+class CircuitBreakerOpen(Error):
+
+    """
+    A request was not made because the circuit of its endpoint is open.
+
+    See :mod:`.circuit_breaker`.
+
+    """
+
+    def __init__(self, endpoint: str, retry_after: float = None) -> None:
+        """Constructor.
+
+        :param endpoint: the endpoint whose circuit is open
+        :param retry_after: time (seconds) until probe requests are let through
+
+        """
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+    def __str__(self) -> str:
+        return "Circuit of endpoint '{endpoint}' is open.".format(endpoint=self.endpoint)
+
+
+class DeadlineExceeded(Error):
+
+    """
+    The deadline of an operation expired before it could be completed.
+
+    See :mod:`.deadline`.
+
+    """
+
+    def __init__(self, operation: str = None) -> None:
+        """Constructor.
+
+        :param operation: description of what was being done
+
+        """
+        self.operation = operation
+
+    def __str__(self) -> str:
+        if self.operation:
+            return "Deadline exceeded: {operation}.".format(operation=self.operation)
+        return "Deadline exceeded."
+
+
 class UnrecognizedApiError(Error):
 
     """
@@ -146,6 +245,7 @@ def process_googleapiclient_http_error(
     new_exc = new_exc or _detect_resource_permission_denied(exc)
     new_exc = new_exc or _detect_resource_not_found(exc)
     new_exc = new_exc or _detect_already_exists(exc)
+    new_exc = new_exc or _detect_concurrent_modification(exc)
 
     # TODO: add more cases as they are detected.
     # new_exc = new_exc or _detect_xyz(exc)
@@ -155,6 +255,58 @@ def process_googleapiclient_http_error(
     return new_exc
 
 
+def process_api_http_error(
+    status: int,
+    content: bytes,
+    uri: str,
+    reason: str = '',
+) -> Exception:
+    """
+    Like :func:`process_googleapiclient_http_error` but for an HTTP error
+    response not obtained through ``googleapiclient``.
+
+    :param status: HTTP status code
+    :param content: response body, usually a JSON-encoded Google API error
+    :param uri: request URI
+    :param reason: HTTP reason phrase
+
+    """
+    http_error = _ApiHttpError(status, content, uri, reason)
+    return process_googleapiclient_http_error(http_error)  # type: ignore
+
+
+class _ApiHttpErrorResponse:
+
+    def __init__(self, status: int, reason: str) -> None:
+        self.status = status
+        self.reason = reason
+
+
+class _ApiHttpError:
+
+    """
+    Duck-typed equivalent of ``googleapiclient.errors.HttpError``.
+
+    """
+
+    def __init__(self, status: int, content: bytes, uri: str, reason: str) -> None:
+        self.resp = _ApiHttpErrorResponse(status, reason)
+        self.content = content
+        self.uri = uri
+
+    def _get_reason(self) -> str:
+        # Based on 'googleapiclient.errors.HttpError._get_reason'.
+        reason: str = self.resp.reason
+        try:
+            data = json.loads(self.content.decode('utf-8'))
+            if isinstance(data, list):
+                data = data[0]
+            reason = data['error']['message']
+        except (ValueError, KeyError, TypeError, IndexError):
+            pass
+        return reason or ''
+
+
 def _detect_resource_permission_denied(
     exc: googleapiclient.errors.HttpError,
 ) -> Optional[Exception]:
@@ -192,8 +344,20 @@ def _detect_resource_not_found(
 
     try:
         exc_reason = exc._get_reason().strip()
-        re_pattern = re.compile(r"^(?P<resource_type>[a-zA-Z0-9_]+) (?P<resource>.+) not found\.")
+        # note: Secret Manager encloses the resource in brackets, e.g.
+        #   "Secret Version [projects/123/secrets/foo/versions/3] not found."
+        #   "Secret [projects/123/secrets/foo] not found or has no versions."
+        re_pattern = re.compile(
+            r"^(?P<resource_type>[a-zA-Z ]+) \[(?P<resource>[^\]]+)\] not found\b")
         re_match = re_pattern.match(exc_reason)
+        if not re_match:
+            # note: Cloud Storage's message is e.g. "No such object: my-bucket/a/b.txt".
+            re_pattern = re.compile(r"^No such (?P<resource_type>object): (?P<resource>.+)$")
+            re_match = re_pattern.match(exc_reason)
+        if not re_match:
+            re_pattern = re.compile(
+                r"^(?P<resource_type>[a-zA-Z0-9_]+) (?P<resource>.+) not found\.")
+            re_match = re_pattern.match(exc_reason)
 
         if re_match:
             try:
@@ -227,3 +391,34 @@ def _detect_already_exists(
         pass
 
     return new_exc
+
+
+def _detect_concurrent_modification(
+    exc: googleapiclient.errors.HttpError,
+) -> Optional[Exception]:
+    # note: GCP APIs respond '409 Conflict' either for 'ALREADY_EXISTS' (see
+    #   '_detect_already_exists') or for 'ABORTED' e.g. on an etag mismatch.
+    new_exc = None
+
+    try:
+        if exc.resp.status == 409:
+            exc_reason = exc._get_reason().strip()
+            re_pattern = re.compile(r"^There were concurrent policy changes\.")
+            if _get_error_status(exc) == 'ABORTED' or re_pattern.match(exc_reason):
+                new_exc = ConcurrentModification(exc.uri)
+    except Exception:
+        pass
+
+    return new_exc
+
+
+def _get_error_status(exc: googleapiclient.errors.HttpError) -> Optional[str]:
+    # e.g. 'ABORTED' for '{"error": {"code": 409, "message": "...", "status": "ABORTED"}}'.
+    try:
+        data = json.loads(exc.content.decode('utf-8'))
+        if isinstance(data, list):
+            data = data[0]
+        status = data['error']['status']
+    except (ValueError, KeyError, TypeError, IndexError, AttributeError):
+        return None
+    return status if isinstance(status, str) else None
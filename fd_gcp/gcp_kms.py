@@ -41,6 +41,25 @@ Usage example, in a GCE environment::
 
     assert plain_str == decrypted_str
 
+The ``api_client`` argument of operations may be either the discovery
+resource returned by :func:`create_api_client` or any :class:`.transport.Transport`
+(e.g. ``create_api_client(credentials, transport='requests')``).
+
+All the operations that make requests to KMS accept these optional arguments:
+
+- ``circuit_breaker``: see :mod:`.circuit_breaker`.
+- ``timeout``: seconds or :class:`.deadline.Deadline` that bounds the whole
+  operation; :class:`.exceptions.DeadlineExceeded` is raised when exceeded.
+- ``num_retries``: max number of retries of requests that fail because of the
+  service's (or the network's) health.
+
+Batch operations (e.g. :func:`mac_sign_batch`) make requests concurrently,
+from several threads, with the same API client. Requests made with a
+discovery resource from different threads do not share connections (see
+:class:`.transport.GoogleApiClientTransport`): only
+``create_api_client(credentials, transport='requests')`` keeps a pool of
+connections shared by all threads.
+
 
 .. seealso:
 
@@ -49,20 +68,47 @@ Usage example, in a GCE environment::
     https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.html
 
 """
+from __future__ import annotations
+
 import base64
+import hashlib
 import logging
 import re
+import threading
+import time
+import urllib.parse
 import uuid
-from typing import List
+from typing import (
+    TYPE_CHECKING, Any, BinaryIO, Callable, Dict, FrozenSet, Iterable, List, Mapping, NamedTuple,
+    Optional, Set, Tuple, Union,
+)
+
+from . import exceptions
+from ._concurrency import map_concurrently
+from ._http import _compute_retry_backoff
+from ._lazy import make_module_getattr
+from .compression import compress, decompress as _decompress, is_compressed
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, Timeout, to_deadline
+from .resource_cache import ResourceCache, resolve_resource_cache
+from .tracing import start_span
+from .transport import ApiClient, ApiMethod, RequestsTransport, execute_api_request
 
-import googleapiclient.discovery
+if TYPE_CHECKING:
+    import requests
 
-from .common import GcpCredentials, GcpResource
-from ._http import execute_google_api_client_request
+    from .common import GcpCredentials, GcpResource
 
 
 logger = logging.getLogger(__name__)
 
+# note: 'GcpCredentials' and 'GcpResource' are available as attributes of this module but,
+#   because importing them is slow, they are imported the first time they are accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('fd_gcp.common', 'GcpCredentials'),
+    'GcpResource': ('fd_gcp.common', 'GcpResource'),
+})
+
 
 ###############################################################################
 # constants
@@ -102,6 +148,163 @@ KMS_CRYPTO_KEY_ID_REGEX = re.compile(r'^[a-zA-Z0-9_-]{1,63}$')
 # https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#encrypt
 KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE = 64 * 1024  # 64 KiB
 
+# Purposes of crypto keys.
+# https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys#CryptoKeyPurpose
+KMS_CRYPTO_KEY_PURPOSE_ENCRYPT_DECRYPT = 'ENCRYPT_DECRYPT'
+KMS_CRYPTO_KEY_PURPOSE_ASYMMETRIC_SIGN = 'ASYMMETRIC_SIGN'
+KMS_CRYPTO_KEY_PURPOSE_ASYMMETRIC_DECRYPT = 'ASYMMETRIC_DECRYPT'
+KMS_CRYPTO_KEY_PURPOSE_MAC = 'MAC'
+
+# Max size of the data to MAC-sign/verify with a KMS crypto key version.
+# https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/macSign
+KMS_MAC_DATA_MAX_SIZE = 64 * 1024  # 64 KiB
+
+# Size of the chunks in which streams are read to compute their digest.
+DIGEST_STREAM_CHUNK_SIZE = 64 * 1024  # 64 KiB
+
+# Root URL of the KMS REST API.
+# https://cloud.google.com/kms/docs/reference/rest
+KMS_API_BASE_URL = 'https://cloudkms.googleapis.com/'
+
+
+###############################################################################
+# KMS API methods
+###############################################################################
+
+# Values taken from the discovery document of the KMS API (v1).
+#   https://cloudkms.googleapis.com/$discovery/rest?version=v1
+
+_KEY_RINGS_CREATE = ApiMethod(
+    'cloudkms.projects.locations.keyRings.create',
+    'POST', 'v1/{+parent}/keyRings')
+_KEY_RINGS_GET = ApiMethod(
+    'cloudkms.projects.locations.keyRings.get',
+    'GET', 'v1/{+name}')
+_KEY_RINGS_GET_IAM_POLICY = ApiMethod(
+    'cloudkms.projects.locations.keyRings.getIamPolicy',
+    'GET', 'v1/{+resource}:getIamPolicy')
+_CRYPTO_KEYS_CREATE = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.create',
+    'POST', 'v1/{+parent}/cryptoKeys')
+_CRYPTO_KEYS_GET = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.get',
+    'GET', 'v1/{+name}')
+_CRYPTO_KEYS_ENCRYPT = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt',
+    'POST', 'v1/{+name}:encrypt')
+_CRYPTO_KEYS_DECRYPT = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.decrypt',
+    'POST', 'v1/{+name}:decrypt')
+_CRYPTO_KEYS_UPDATE_PRIMARY_VERSION = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.updatePrimaryVersion',
+    'POST', 'v1/{+name}:updatePrimaryVersion')
+_CRYPTO_KEYS_GET_IAM_POLICY = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.getIamPolicy',
+    'GET', 'v1/{+resource}:getIamPolicy')
+_CRYPTO_KEYS_SET_IAM_POLICY = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.setIamPolicy',
+    'POST', 'v1/{+resource}:setIamPolicy')
+_CRYPTO_KEY_VERSIONS_CREATE = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.create',
+    'POST', 'v1/{+parent}/cryptoKeyVersions')
+_CRYPTO_KEY_VERSIONS_ASYMMETRIC_SIGN = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.asymmetricSign',
+    'POST', 'v1/{+name}:asymmetricSign')
+_CRYPTO_KEY_VERSIONS_ASYMMETRIC_DECRYPT = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.asymmetricDecrypt',
+    'POST', 'v1/{+name}:asymmetricDecrypt')
+_CRYPTO_KEY_VERSIONS_GET_PUBLIC_KEY = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.getPublicKey',
+    'GET', 'v1/{+name}/publicKey')
+_CRYPTO_KEY_VERSIONS_MAC_SIGN = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.macSign',
+    'POST', 'v1/{+name}:macSign')
+_CRYPTO_KEY_VERSIONS_MAC_VERIFY = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.cryptoKeyVersions.macVerify',
+    'POST', 'v1/{+name}:macVerify')
+
+
+###############################################################################
+# KMS REST API client
+###############################################################################
+
+class KmsRestApiClient(RequestsTransport):
+
+    """
+    KMS API client that makes requests directly to the KMS REST API.
+
+    Unlike the discovery resource of ``googleapiclient``, requests are not
+    built by chaining resource objects nor by expanding URI templates and
+    validating params against the discovery document: the URL of each
+    request of the operations of this module is built by concatenation,
+    bodies are JSON-encoded compactly and connections are reused.
+
+    Instances are thread-safe.
+
+    .. seealso:: :class:`.transport.RequestsTransport`
+
+    """
+
+    def __init__(
+        self,
+        credentials: GcpCredentials = None,
+        session: requests.Session = None,
+        pool_maxsize: int = 10,
+        base_url: str = KMS_API_BASE_URL,
+    ) -> None:
+        super().__init__(
+            base_url=base_url,
+            credentials=credentials,
+            session=session,
+            pool_maxsize=pool_maxsize,
+        )
+
+    def build_url(self, method: ApiMethod, params: Mapping[str, Any]) -> str:
+        build_url = _KMS_REST_API_URL_BUILDERS.get(method.id)
+        if build_url is None:
+            return super().build_url(method, params)
+        return build_url(self.base_url, params)
+
+
+# note: IDs are URL-quoted, but GRNs are not since their components (see the regexes of IDs
+#   above) do not contain any characters that would need to be.
+_KMS_REST_API_URL_BUILDERS: Dict[str, Callable[[str, Mapping[str, Any]], str]] = {
+    _KEY_RINGS_CREATE.id: lambda base_url, params: (
+        base_url + 'v1/' + params['parent'] + '/keyRings?keyRingId='
+        + urllib.parse.quote(params['keyRingId'], safe='')),
+    _KEY_RINGS_GET.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name']),
+    _KEY_RINGS_GET_IAM_POLICY.id: lambda base_url, params: (
+        base_url + 'v1/' + params['resource'] + ':getIamPolicy'),
+    _CRYPTO_KEYS_CREATE.id: lambda base_url, params: (
+        base_url + 'v1/' + params['parent'] + '/cryptoKeys?cryptoKeyId='
+        + urllib.parse.quote(params['cryptoKeyId'], safe='')),
+    _CRYPTO_KEYS_GET.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name']),
+    _CRYPTO_KEYS_ENCRYPT.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':encrypt'),
+    _CRYPTO_KEYS_DECRYPT.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':decrypt'),
+    _CRYPTO_KEYS_UPDATE_PRIMARY_VERSION.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':updatePrimaryVersion'),
+    _CRYPTO_KEYS_GET_IAM_POLICY.id: lambda base_url, params: (
+        base_url + 'v1/' + params['resource'] + ':getIamPolicy'),
+    _CRYPTO_KEYS_SET_IAM_POLICY.id: lambda base_url, params: (
+        base_url + 'v1/' + params['resource'] + ':setIamPolicy'),
+    _CRYPTO_KEY_VERSIONS_CREATE.id: lambda base_url, params: (
+        base_url + 'v1/' + params['parent'] + '/cryptoKeyVersions'),
+    _CRYPTO_KEY_VERSIONS_ASYMMETRIC_SIGN.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':asymmetricSign'),
+    _CRYPTO_KEY_VERSIONS_ASYMMETRIC_DECRYPT.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':asymmetricDecrypt'),
+    _CRYPTO_KEY_VERSIONS_GET_PUBLIC_KEY.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + '/publicKey'),
+    _CRYPTO_KEY_VERSIONS_MAC_SIGN.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':macSign'),
+    _CRYPTO_KEY_VERSIONS_MAC_VERIFY.id: lambda base_url, params: (
+        base_url + 'v1/' + params['name'] + ':macVerify'),
+}
+
 
 ###############################################################################
 # resource GRN functions
@@ -179,28 +382,63 @@ def compose_crypto_key_version_grn(
 # KMS API operations
 ###############################################################################
 
-def create_api_client(credentials: GcpCredentials) -> GcpResource:
+def create_api_client(
+    credentials: GcpCredentials,
+    transport: str = 'googleapiclient',
+) -> ApiClient:
     """Create a KMS API client.
 
     .. warning:: Auth checks do not happen here.
 
+    :param transport: how requests are made (see :mod:`.transport`):
+        ``googleapiclient`` (a discovery resource is returned) or
+        ``requests`` (a :class:`KmsRestApiClient` is returned)
+
     """
-    api_client = googleapiclient.discovery.build(
-        serviceName='cloudkms',
-        version='v1',
-        credentials=credentials,
-    )
+    if transport == 'requests':
+        return KmsRestApiClient(credentials=credentials)
+    if transport != 'googleapiclient':
+        raise ValueError("Unknown transport {!r}.".format(transport))
+
+    global _discovery_document
+
+    import googleapiclient.discovery
+
+    # note: the discovery document is fetched (or loaded) only once per process, and it is
+    #   inherited by child processes. Building a discovery resource from it is cheap.
+    if _discovery_document is not None:
+        with start_span('create_api_client', discovery_document_cached=True):
+            api_client: GcpResource = googleapiclient.discovery.build_from_document(
+                _discovery_document,
+                credentials=credentials,
+            )
+        return api_client
+
+    with start_span('create_api_client', discovery_document_cached=False):
+        api_client = googleapiclient.discovery.build(
+            serviceName='cloudkms',
+            version='v1',
+            credentials=credentials,
+        )
+    _discovery_document = getattr(api_client, '_rootDesc', None)
     return api_client
 
 
+# Discovery document of the KMS API, as used by 'googleapiclient' (see 'create_api_client').
+_discovery_document: Optional[dict] = None
+
+
 ###############################################################################
 # KMS API operations - key ring
 ###############################################################################
 
 def create_key_ring(
-    api_client: GcpResource,
+    api_client: ApiClient,
     location_grn: str,
     key_ring_id: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
 ) -> str:
     """
     Create a key ring in the given location.
@@ -216,29 +454,77 @@ def create_key_ring(
     """
     # TODO: validate param 'key_ring_id'
 
-    request = api_client.projects().locations().keyRings().create(
-        parent=location_grn,
+    response = execute_api_request(
+        api_client, _KEY_RINGS_CREATE,
+        params={'parent': location_grn, 'keyRingId': key_ring_id},
         body={},
-        keyRingId=key_ring_id,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
     )
-    response = execute_google_api_client_request(request)
     key_ring_grn: str = response['name']
 
     return key_ring_grn
 
 
+def ensure_key_ring(
+    api_client: ApiClient,
+    location_grn: str,
+    key_ring_id: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    resource_cache: ResourceCache = None,
+) -> str:
+    """
+    Create a key ring in the given location, unless it already exists.
+
+    If the key ring is in ``resource_cache`` (by default, the process-wide
+    cache), no request is made. Otherwise it is looked up (a read request)
+    before trying to create it, and a concurrent creation is not an error.
+
+    .. seealso:: :mod:`.resource_cache`
+
+    :return: key ring GRN
+
+    """
+    key_ring_grn = '{}/keyRings/{}'.format(location_grn, key_ring_id)
+    _ensure_resource(
+        key_ring_grn, resource_cache, timeout,
+        get=lambda deadline: execute_api_request(
+            api_client, _KEY_RINGS_GET,
+            params={'name': key_ring_grn},
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        ),
+        create=lambda deadline: create_key_ring(
+            api_client, location_grn, key_ring_id,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        ),
+    )
+
+    return key_ring_grn
+
+
 ###############################################################################
 # KMS API operations - crypto key
 ###############################################################################
 
 def create_crypto_key(
-    api_client: GcpResource,
+    api_client: ApiClient,
     key_ring_grn: str,
     crypto_key_id: str = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    purpose: str = KMS_CRYPTO_KEY_PURPOSE_ENCRYPT_DECRYPT,
+    algorithm: str = None,
 ) -> str:
     """
     Create a crypto key within a key ring.
 
+    Asymmetric and MAC keys (i.e. with purpose ``ASYMMETRIC_SIGN``,
+    ``ASYMMETRIC_DECRYPT`` or ``MAC``) require an ``algorithm`` e.g.
+    ``EC_SIGN_P256_SHA256``, ``RSA_DECRYPT_OAEP_3072_SHA256`` or ``HMAC_SHA256``.
+    See https://cloud.google.com/kms/docs/algorithms
+
     .. seealso::
         https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#create
 
@@ -252,25 +538,108 @@ def create_crypto_key(
 
     crypto_key_id = crypto_key_id or uuid.uuid4().hex
 
-    request = api_client.projects().locations().keyRings().cryptoKeys().create(
-        parent=key_ring_grn,
-        body={'purpose': 'ENCRYPT_DECRYPT'},
-        cryptoKeyId=crypto_key_id,
+    body: Dict[str, Any] = {'purpose': purpose}
+    if algorithm is not None:
+        body['versionTemplate'] = {'algorithm': algorithm}
+    elif purpose in (
+        KMS_CRYPTO_KEY_PURPOSE_ASYMMETRIC_SIGN,
+        KMS_CRYPTO_KEY_PURPOSE_ASYMMETRIC_DECRYPT,
+        KMS_CRYPTO_KEY_PURPOSE_MAC,
+    ):
+        raise ValueError("An 'algorithm' is required for purpose {!r}.".format(purpose))
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEYS_CREATE,
+        params={'parent': key_ring_grn, 'cryptoKeyId': crypto_key_id},
+        body=body,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
     )
-    response = execute_google_api_client_request(request)
     crypto_key_grn: str = response['name']
 
     return crypto_key_grn
 
 
+def ensure_crypto_key(
+    api_client: ApiClient,
+    key_ring_grn: str,
+    crypto_key_id: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    purpose: str = KMS_CRYPTO_KEY_PURPOSE_ENCRYPT_DECRYPT,
+    algorithm: str = None,
+    resource_cache: ResourceCache = None,
+) -> str:
+    """
+    Create a crypto key within a key ring, unless it already exists.
+
+    See :func:`ensure_key_ring` and :func:`create_crypto_key`.
+
+    .. warning:: the ``purpose`` and ``algorithm`` of an existing crypto key
+        are not compared to the given ones.
+
+    :return: crypto key GRN
+
+    """
+    crypto_key_grn = '{}/cryptoKeys/{}'.format(key_ring_grn, crypto_key_id)
+    _ensure_resource(
+        crypto_key_grn, resource_cache, timeout,
+        get=lambda deadline: get_crypto_key(
+            api_client, crypto_key_grn,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        ),
+        create=lambda deadline: create_crypto_key(
+            api_client, key_ring_grn, crypto_key_id,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+            purpose=purpose, algorithm=algorithm,
+        ),
+    )
+
+    return crypto_key_grn
+
+
+def get_crypto_key(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> dict:
+    """
+    Return a crypto key.
+
+    .. seealso::
+        https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#get
+
+    :return: the crypto key resource (e.g. with its ``purpose`` and its
+        ``primary`` version)
+    :raises exceptions.ResourceNotFound: if the crypto key does not exist
+
+    """
+    return execute_api_request(
+        api_client, _CRYPTO_KEYS_GET,
+        params={'name': crypto_key_grn},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+
+
 def encrypt(
-    api_client: GcpResource,
+    api_client: ApiClient,
     crypto_key_grn: str,
     plain_data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    compression: str = None,
 ) -> bytes:
     """
     Encrypt binary ``plain_data``.
 
+    If ``compression`` is not ``None``, ``plain_data`` is compressed with
+    that codec (e.g. ``zlib``) before it is encrypted (see
+    :mod:`.compression`), and the size limit applies to the compressed
+    data. Such encrypted data must be decrypted with ``decompress=True``.
+
     .. seealso::
         https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#encrypt
 
@@ -282,16 +651,19 @@ def encrypt(
 
     if not isinstance(plain_data, bytes):
         raise TypeError("Type of 'plain_data' is not bytes.")
+    if compression is not None:
+        plain_data = compress(plain_data, compression)
     if len(plain_data) > KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE:
         raise ValueError("Size of 'plain_data' exceeds max size.")
 
     plain_data_b64_str = base64.b64encode(plain_data).decode('ascii', errors='strict')
 
-    request = api_client.projects().locations().keyRings().cryptoKeys().encrypt(
-        name=crypto_key_grn,
+    response = execute_api_request(
+        api_client, _CRYPTO_KEYS_ENCRYPT,
+        params={'name': crypto_key_grn},
         body={'plaintext': plain_data_b64_str},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
     )
-    response = execute_google_api_client_request(request)
     encrypted_data_b64_str = response['ciphertext']
 
     encrypted_data = base64.b64decode(encrypted_data_b64_str.encode('ascii', errors='strict'))
@@ -300,13 +672,20 @@ def encrypt(
 
 
 def decrypt(
-    api_client: GcpResource,
+    api_client: ApiClient,
     crypto_key_grn: str,
     encrypted_data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    decompress: bool = False,
 ) -> bytes:
     """
     Decrypt binary ``encrypted_data``.
 
+    If ``decompress`` is true, decrypted data that was compressed by
+    :func:`encrypt` is decompressed; other decrypted data is returned as is.
+
     .. seealso::
         https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#decrypt
 
@@ -319,14 +698,17 @@ def decrypt(
 
     encrypted_data_b64_str = base64.b64encode(encrypted_data).decode('ascii', errors='strict')
 
-    request = api_client.projects().locations().keyRings().cryptoKeys().decrypt(
-        name=crypto_key_grn,
+    response = execute_api_request(
+        api_client, _CRYPTO_KEYS_DECRYPT,
+        params={'name': crypto_key_grn},
         body={'ciphertext': encrypted_data_b64_str},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
     )
-    response = execute_google_api_client_request(request)
     plain_data_b64_str = response['plaintext']
 
     plain_data = base64.b64decode(plain_data_b64_str.encode('ascii', errors='strict'))
+    if decompress and is_compressed(plain_data):
+        plain_data = _decompress(plain_data)
 
     return plain_data
 
@@ -335,21 +717,506 @@ def decrypt(
 # KMS API operations - crypto key version
 ###############################################################################
 
-# TODO
+def create_crypto_key_version(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Create a new version of a crypto key.
+
+    The new version is not made primary; see :func:`rotate_crypto_key`.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/create
+
+    :return: crypto key version GRN
+
+    """
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_CREATE,
+        params={'parent': crypto_key_grn},
+        body={},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    crypto_key_version_grn: str = response['name']
+
+    return crypto_key_version_grn
+
+
+def update_crypto_key_primary_version(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    crypto_key_version_id: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> None:
+    """
+    Make a version of a ``ENCRYPT_DECRYPT`` crypto key its primary version,
+    i.e. the one used by :func:`encrypt`.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys/updatePrimaryVersion
+
+    """
+    execute_api_request(
+        api_client, _CRYPTO_KEYS_UPDATE_PRIMARY_VERSION,
+        params={'name': crypto_key_grn},
+        body={'cryptoKeyVersionId': crypto_key_version_id},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+
+
+def rotate_crypto_key(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Create a new version of a ``ENCRYPT_DECRYPT`` crypto key and make it primary.
+
+    Data encrypted with previous versions can still be decrypted, as long
+    as they are enabled. To re-encrypt it with the new primary version, see
+    :mod:`.gcp_kms_reencryption`.
+
+    :return: GRN of the new primary crypto key version
+
+    """
+    # Both requests share the same time budget.
+    deadline = to_deadline(timeout)
+
+    crypto_key_version_grn = create_crypto_key_version(
+        api_client, crypto_key_grn,
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+    update_crypto_key_primary_version(
+        api_client, crypto_key_grn, crypto_key_version_grn.rsplit('/', 1)[-1],
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+
+    return crypto_key_version_grn
+
+
+class PublicKey(NamedTuple):
+
+    """
+    Public key of an asymmetric crypto key version.
+
+    """
+
+    crypto_key_version_grn: str
+    # e.g. 'EC_SIGN_P256_SHA256'
+    algorithm: str
+    pem: str
+    # e.g. 'cryptography.hazmat.primitives.asymmetric.ec.EllipticCurvePublicKey'
+    key: Any
+
+
+# Public keys of crypto key versions never change, so they are kept for the life of the process.
+_public_keys: Dict[str, PublicKey] = {}
+_public_keys_lock = threading.Lock()
+
+
+def get_public_key(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> PublicKey:
+    """
+    Return the public key of an asymmetric crypto key version.
+
+    Only the first call for each crypto key version makes a request to KMS;
+    the parsed public key is cached in-process.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/getPublicKey
+
+    """
+    try:
+        return _public_keys[crypto_key_version_grn]
+    except KeyError:
+        pass
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_GET_PUBLIC_KEY,
+        params={'name': crypto_key_version_grn},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+
+    import cryptography.hazmat.primitives.serialization
+
+    pem: str = response['pem']
+    key = cryptography.hazmat.primitives.serialization.load_pem_public_key(
+        pem.encode('ascii'))
+    public_key = PublicKey(crypto_key_version_grn, response['algorithm'], pem, key)
+
+    with _public_keys_lock:
+        return _public_keys.setdefault(crypto_key_version_grn, public_key)
+
+
+def clear_public_key_cache() -> None:
+    """
+    Remove all the public keys cached by :func:`get_public_key`.
+
+    """
+    with _public_keys_lock:
+        _public_keys.clear()
+
+
+def asymmetric_sign(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    digest: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Sign ``digest`` with the private key of an ``ASYMMETRIC_SIGN`` crypto key version.
+
+    ``digest`` must be computed locally with the hash algorithm of the key
+    version's algorithm (e.g. SHA-256 for ``EC_SIGN_P256_SHA256``)::
+
+        digest = hashlib.sha256(data).digest()
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/asymmetricSign
+
+    :return: signature
+
+    """
+    if not isinstance(digest, bytes):
+        raise TypeError("Type of 'digest' is not bytes.")
+    try:
+        digest_field_name = _DIGEST_FIELD_NAMES_BY_SIZE[len(digest)]
+    except KeyError:
+        raise ValueError("Size of 'digest' does not match any supported hash algorithm.") from None
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_ASYMMETRIC_SIGN,
+        params={'name': crypto_key_version_grn},
+        body={'digest': {digest_field_name: base64.b64encode(digest).decode('ascii')}},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    signature = base64.b64decode(response['signature'].encode('ascii'))
+
+    return signature
+
+
+def asymmetric_decrypt(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    encrypted_data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Decrypt ``encrypted_data`` with the private key of an
+    ``ASYMMETRIC_DECRYPT`` crypto key version.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/asymmetricDecrypt
+
+    """
+    if not isinstance(encrypted_data, bytes):
+        raise TypeError("Type of 'encrypted_data' is not bytes.")
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_ASYMMETRIC_DECRYPT,
+        params={'name': crypto_key_version_grn},
+        body={'ciphertext': base64.b64encode(encrypted_data).decode('ascii')},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    plain_data = base64.b64decode(response['plaintext'].encode('ascii'))
+
+    return plain_data
+
+
+def verify(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    signature: bytes,
+    data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bool:
+    """
+    Return whether ``signature`` is a valid signature of ``data`` made with an
+    ``ASYMMETRIC_SIGN`` crypto key version.
+
+    Verification is done locally, with the public key returned by
+    :func:`get_public_key` (no request is made to KMS once it is cached).
+
+    """
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    public_key = get_public_key(
+        api_client, crypto_key_version_grn,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+    hash_algorithm, padding = _get_signature_parameters(public_key.algorithm)
+
+    try:
+        if padding is None:
+            public_key.key.verify(signature, data, ec.ECDSA(hash_algorithm))
+        else:
+            public_key.key.verify(signature, data, padding, hash_algorithm)
+    except cryptography.exceptions.InvalidSignature:
+        return False
+    return True
+
+
+def encrypt_to_public_key(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    plain_data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Encrypt ``plain_data`` so that it can be decrypted with
+    :func:`asymmetric_decrypt` and the same ``ASYMMETRIC_DECRYPT`` crypto key version.
+
+    Encryption is done locally, with the public key returned by
+    :func:`get_public_key` (no request is made to KMS once it is cached).
+
+    """
+    if not isinstance(plain_data, bytes):
+        raise TypeError("Type of 'plain_data' is not bytes.")
+
+    public_key = get_public_key(
+        api_client, crypto_key_version_grn,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+    padding = _get_oaep_padding(public_key.algorithm)
+
+    encrypted_data: bytes = public_key.key.encrypt(plain_data, padding)
+    return encrypted_data
+
+
+###############################################################################
+# KMS API operations - MAC
+###############################################################################
+
+def mac_sign(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Return the MAC (e.g. HMAC-SHA256) of ``data`` made with a ``MAC`` crypto key version.
+
+    The size of ``data`` is limited (see :data:`KMS_MAC_DATA_MAX_SIZE`); for
+    larger data, see :func:`mac_sign_stream`.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/macSign
+
+    :return: MAC
+
+    """
+    _check_mac_data(data)
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_MAC_SIGN,
+        params={'name': crypto_key_version_grn},
+        body={'data': base64.b64encode(data).decode('ascii')},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    mac = base64.b64decode(response['mac'].encode('ascii'))
+
+    return mac
+
+
+def mac_verify(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    data: bytes,
+    mac: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bool:
+    """
+    Return whether ``mac`` is the MAC of ``data`` made with a ``MAC`` crypto key version.
+
+    .. seealso::
+        https://cloud.google.com/kms/docs/reference/rest/v1/projects.locations.keyRings.cryptoKeys.cryptoKeyVersions/macVerify
+
+    """
+    _check_mac_data(data)
+    if not isinstance(mac, bytes):
+        raise TypeError("Type of 'mac' is not bytes.")
+
+    response = execute_api_request(
+        api_client, _CRYPTO_KEY_VERSIONS_MAC_VERIFY,
+        params={'name': crypto_key_version_grn},
+        body={
+            'data': base64.b64encode(data).decode('ascii'),
+            'mac': base64.b64encode(mac).decode('ascii'),
+        },
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    success: bool = response.get('success', False)
+
+    return success
+
+
+def mac_sign_batch(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    data_items: Iterable[bytes],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    max_concurrency: int = None,
+) -> List[bytes]:
+    """
+    Like :func:`mac_sign` but for many data items, whose requests are made
+    concurrently.
+
+    KMS has no batch API method, so there is one request per item. All of
+    them share the time budget of ``timeout``. If any request fails, its
+    error is raised (the outcome of the others is discarded).
+
+    :param max_concurrency: max number of concurrent requests
+    :return: the MACs, in the order of ``data_items``
+
+    """
+    data_items = list(data_items)
+    for data in data_items:
+        _check_mac_data(data)
+    deadline = to_deadline(timeout)
+
+    def sign(data: bytes) -> bytes:
+        return mac_sign(
+            api_client, crypto_key_version_grn, data,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+
+    return map_concurrently(sign, data_items, max_concurrency=max_concurrency)
+
+
+def mac_verify_batch(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    items: Iterable[Tuple[bytes, bytes]],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    max_concurrency: int = None,
+) -> List[bool]:
+    """
+    Like :func:`mac_verify` but for many ``(data, mac)`` items, whose
+    requests are made concurrently.
+
+    See :func:`mac_sign_batch`.
+
+    :return: the verification results, in the order of ``items``
+
+    """
+    items = list(items)
+    for data, mac in items:
+        _check_mac_data(data)
+        if not isinstance(mac, bytes):
+            raise TypeError("Type of 'mac' is not bytes.")
+    deadline = to_deadline(timeout)
+
+    def verify_item(item: Tuple[bytes, bytes]) -> bool:
+        return mac_verify(
+            api_client, crypto_key_version_grn, item[0], item[1],
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+
+    return map_concurrently(verify_item, items, max_concurrency=max_concurrency)
+
+
+def compute_digest(
+    data: Union[bytes, BinaryIO, Iterable[bytes]],
+    hash_name: str = 'sha256',
+) -> bytes:
+    """
+    Return the digest of ``data``, which may be bytes, a binary file-like
+    object or an iterable of chunks (e.g. a streamed HTTP request body).
+
+    Streams are read in chunks, so they are never fully loaded into memory.
+
+    :param hash_name: name of a :mod:`hashlib` hash algorithm
+
+    """
+    hash_obj = hashlib.new(hash_name)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        hash_obj.update(data)
+        return hash_obj.digest()
+
+    read = getattr(data, 'read', None)
+    chunks: Iterable[bytes]
+    if read is not None:
+        chunks = iter(lambda: read(DIGEST_STREAM_CHUNK_SIZE), b'')
+    else:
+        chunks = data  # type: ignore
+    for chunk in chunks:
+        hash_obj.update(chunk)
+    return hash_obj.digest()
+
+
+def mac_sign_stream(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    data: Union[bytes, BinaryIO, Iterable[bytes]],
+    hash_name: str = 'sha256',
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Return the MAC of the digest of ``data``, of any size.
+
+    The digest is computed locally (see :func:`compute_digest`) and only it
+    is sent to KMS, so the MAC is that of the digest, not of ``data``: it
+    must be verified with :func:`mac_verify_stream` (and the same ``hash_name``).
+
+    """
+    return mac_sign(
+        api_client, crypto_key_version_grn, compute_digest(data, hash_name),
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+
+
+def mac_verify_stream(
+    api_client: ApiClient,
+    crypto_key_version_grn: str,
+    data: Union[bytes, BinaryIO, Iterable[bytes]],
+    mac: bytes,
+    hash_name: str = 'sha256',
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bool:
+    """
+    Return whether ``mac`` was returned by :func:`mac_sign_stream` for ``data``.
+
+    """
+    return mac_verify(
+        api_client, crypto_key_version_grn, compute_digest(data, hash_name), mac,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
 
 
 ###############################################################################
 # KMS API operations - IAM policy
 ###############################################################################
 
-def add_member_to_crypto_key_iam_policy(
-    api_client: GcpResource,
-    crypto_key_grn: str,
-    member: str,
-    role: str,
-) -> None:
+class IamPolicyChange(NamedTuple):
+
     """
-    Add ``member`` with ``role`` to the IAM policy for a crypto key.
+    Addition (or removal) of a member to (from) a role of an IAM policy.
 
     Examples of ``member``:
     - ``user:mike@example.com``
@@ -361,6 +1228,32 @@ def add_member_to_crypto_key_iam_policy(
     - ``roles/owner``
     - ``roles/viewer``
 
+    """
+
+    member: str
+    role: str
+    remove: bool = False
+
+
+# Max number of times the read-modify-write of an IAM policy is retried on concurrent changes.
+IAM_POLICY_MAX_CONFLICT_RETRIES = 5
+
+
+def add_member_to_crypto_key_iam_policy(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    member: str,
+    role: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> None:
+    """
+    Add ``member`` with ``role`` to the IAM policy for a crypto key.
+
+    See :class:`IamPolicyChange` for examples of ``member`` and ``role``,
+    and :func:`update_crypto_key_iam_policies`.
+
     .. seealso::
         https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#getIamPolicy
         https://developers.google.com/resources/api-libraries/documentation/cloudkms/v1/python/latest/cloudkms_v1.projects.locations.keyRings.cryptoKeys.html#setIamPolicy
@@ -371,36 +1264,109 @@ def add_member_to_crypto_key_iam_policy(
     """
     # TODO: validate params 'member', 'role'
 
-    # Get the current IAM policy and add the new member to it.
-    policy_request = api_client.projects().locations().keyRings().cryptoKeys().getIamPolicy(
-        resource=crypto_key_grn,
-    )
-    policy_response = execute_google_api_client_request(policy_request)
-
-    bindings: List[dict] = []
-    if 'bindings' in policy_response.keys():
-        bindings = policy_response['bindings']
-
-    new_binding = {
-        'role': role,
-        'members': [
-            member
-        ],
-    }
-    bindings.append(new_binding)
-    policy_response['bindings'] = bindings
-
-    # Set the new IAM Policy.
-    request = api_client.projects().locations().keyRings().cryptoKeys().setIamPolicy(
-        resource=crypto_key_grn,
-        body={'policy': policy_response},
+    _update_iam_policy(
+        api_client, crypto_key_grn, [IamPolicyChange(member, role)],
+        circuit_breaker=circuit_breaker,
+        deadline=to_deadline(timeout),
+        num_retries=num_retries,
     )
-    execute_google_api_client_request(request)
+
+
+def update_crypto_key_iam_policies(
+    api_client: ApiClient,
+    changes_by_crypto_key_grn: Mapping[str, Iterable[IamPolicyChange]],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    max_concurrency: int = None,
+) -> Dict[str, dict]:
+    """
+    Apply many changes to the IAM policies of many crypto keys.
+
+    The changes to each crypto key's policy are applied with a single
+    read-modify-write: members are merged into the binding of their role
+    (which is created, or removed when it is left without members), and the
+    policy is only written if it changed. The write carries the ``etag`` of
+    the read, so a concurrent change of the policy is not overwritten: the
+    read-modify-write is retried instead (up to
+    :data:`IAM_POLICY_MAX_CONFLICT_RETRIES` times, with backoff).
+
+    The crypto keys are processed concurrently, and all of them share the
+    time budget of ``timeout``.
+
+    Usage example::
+
+        update_crypto_key_iam_policies(kms_api_client, {
+            crypto_key_grn: [
+                IamPolicyChange(
+                    'group:team-1@example.com', 'roles/cloudkms.cryptoKeyEncrypterDecrypter'),
+                IamPolicyChange('user:mike@example.com', 'roles/viewer', remove=True),
+            ]
+            for crypto_key_grn in crypto_key_grns
+        })
+
+    :param max_concurrency: max number of crypto keys processed concurrently
+    :return: mapping of crypto key GRN to its (new) IAM policy
+    :raises exceptions.ConcurrentModification: if retries were exhausted
+
+    """
+    deadline = to_deadline(timeout)
+    items = [(grn, list(changes)) for grn, changes in changes_by_crypto_key_grn.items()]
+
+    def update(item: Tuple[str, List[IamPolicyChange]]) -> dict:
+        return _update_iam_policy(
+            api_client, item[0], item[1],
+            circuit_breaker=circuit_breaker, deadline=deadline, num_retries=num_retries)
+
+    policies = map_concurrently(update, items, max_concurrency=max_concurrency)
+    return {grn: policy for (grn, _), policy in zip(items, policies)}
+
+
+def apply_iam_policy_changes(policy: dict, changes: Iterable[IamPolicyChange]) -> bool:
+    """
+    Apply ``changes`` to the bindings of ``policy`` (in place), merging them by role.
+
+    :return: whether ``policy`` changed
+
+    """
+    bindings: List[dict] = policy.setdefault('bindings', [])
+    bindings_by_role: Dict[str, dict] = {}
+    binding: Optional[dict]
+    for binding in bindings:
+        # note: bindings with a condition are never merged into.
+        if 'condition' not in binding:
+            bindings_by_role.setdefault(binding['role'], binding)
+
+    changed = False
+    for change in changes:
+        binding = bindings_by_role.get(change.role)
+        if change.remove:
+            if binding is not None and change.member in binding['members']:
+                binding['members'].remove(change.member)
+                changed = True
+        elif binding is None:
+            binding = bindings_by_role[change.role] = {
+                'role': change.role,
+                'members': [change.member],
+            }
+            bindings.append(binding)
+            changed = True
+        elif change.member not in binding['members']:
+            binding['members'].append(change.member)
+            changed = True
+
+    policy['bindings'] = [binding for binding in bindings if binding.get('members')]
+    if not policy['bindings']:
+        del policy['bindings']
+    return changed
 
 
 def get_key_ring_iam_policy(
-    api_client: GcpResource,
+    api_client: ApiClient,
     key_ring_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
 ) -> List[dict]:
     """
     Return the IAM policy for a key ring.
@@ -414,13 +1380,342 @@ def get_key_ring_iam_policy(
     :return: the list of bindings of the IAM policy for a key ring
 
     """
-    request = api_client.projects().locations().keyRings().getIamPolicy(
-        resource=key_ring_grn,
+    response = execute_api_request(
+        api_client, _KEY_RINGS_GET_IAM_POLICY,
+        params={'resource': key_ring_grn},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
     )
-    response = execute_google_api_client_request(request)
 
     try:
         bindings = response['bindings']  # type: List[dict]
     except KeyError:
         bindings = []
     return bindings
+
+
+class IamPolicy(NamedTuple):
+
+    """
+    IAM policy of a resource, indexed for fast lookups.
+
+    """
+
+    resource_grn: str
+    etag: str
+    bindings: List[dict]
+    # member -> roles (of bindings without a condition)
+    roles_by_member: Dict[str, FrozenSet[str]]
+
+    @classmethod
+    def from_response(cls, resource_grn: str, response: dict) -> 'IamPolicy':
+        roles_by_member: Dict[str, Set[str]] = {}
+        bindings: List[dict] = response.get('bindings', [])
+        for binding in bindings:
+            # note: whether a conditional binding applies can not be known in advance.
+            if 'condition' in binding:
+                continue
+            for member in binding.get('members', []):
+                roles_by_member.setdefault(member, set()).add(binding['role'])
+
+        return cls(
+            resource_grn=resource_grn,
+            etag=response.get('etag', ''),
+            bindings=bindings,
+            roles_by_member={
+                member: frozenset(roles) for member, roles in roles_by_member.items()},
+        )
+
+    def get_roles(self, member: str) -> FrozenSet[str]:
+        return self.roles_by_member.get(member, frozenset())
+
+    def has_role(self, member: str, role: str) -> bool:
+        return role in self.roles_by_member.get(member, ())
+
+
+IamPolicyChangeListener = Callable[[Optional[IamPolicy], IamPolicy], None]
+"""
+Callable invoked as ``listener(old_policy, new_policy)`` when the fetched IAM
+policy of a resource is not the one that was cached (``old_policy`` is
+``None`` the first time it is fetched).
+"""
+
+
+class IamPolicyCache:
+
+    """
+    Cache of the IAM policies of key rings and crypto keys.
+
+    A cached policy is used for ``ttl`` seconds. Then it is fetched again
+    and, if its ``etag`` did not change, the cached (indexed) policy is kept
+    and listeners are not notified.
+
+    Instances are thread-safe.
+
+    Usage example::
+
+        iam_policy_cache = IamPolicyCache(kms_api_client, ttl=60.0)
+        iam_policy_cache.prefetch(key_ring_grns)
+
+        # e.g. in the request path:
+        if not iam_policy_cache.has_role(key_ring_grn, member, 'roles/viewer'):
+            raise PermissionDenied
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        ttl: float = 60.0,
+        circuit_breaker: CircuitBreaker = None,
+        num_retries: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Constructor.
+
+        :param ttl: time (seconds) a cached policy is used before fetching it again
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        if ttl < 0:
+            raise ValueError("Value of 'ttl' must not be negative.")
+
+        self.api_client = api_client
+        self.ttl = ttl
+        self.circuit_breaker = circuit_breaker
+        self.num_retries = num_retries
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # resource GRN -> (policy, expiration time)
+        self._entries: Dict[str, Tuple[IamPolicy, float]] = {}
+        self._listeners: List[IamPolicyChangeListener] = []
+
+    def add_listener(self, listener: IamPolicyChangeListener) -> None:
+        """
+        Register a callable to be notified of every change of a policy.
+
+        Listeners are called synchronously, and exceptions raised by them are
+        logged and ignored.
+
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def get(self, resource_grn: str, timeout: Timeout = None) -> IamPolicy:
+        """
+        Return the IAM policy of a key ring or crypto key.
+
+        """
+        with self._lock:
+            entry = self._entries.get(resource_grn)
+        if entry is not None and self._clock() < entry[1]:
+            return entry[0]
+        return self._fetch(resource_grn, timeout)
+
+    def has_role(
+        self,
+        resource_grn: str,
+        member: str,
+        role: str,
+        timeout: Timeout = None,
+    ) -> bool:
+        """
+        Return whether ``member`` has ``role`` in the IAM policy of a resource.
+
+        Conditional bindings are not taken into account.
+
+        """
+        return self.get(resource_grn, timeout).has_role(member, role)
+
+    def prefetch(
+        self,
+        resource_grns: Iterable[str],
+        timeout: Timeout = None,
+        max_concurrency: int = None,
+    ) -> None:
+        """
+        Fetch (concurrently) the IAM policies of many resources.
+
+        """
+        deadline = to_deadline(timeout)
+        map_concurrently(
+            lambda resource_grn: self._fetch(resource_grn, deadline),
+            resource_grns,
+            max_concurrency=max_concurrency,
+        )
+
+    def invalidate(self, resource_grn: str = None) -> None:
+        """
+        Forget the cached IAM policy of ``resource_grn`` (or all of them).
+
+        """
+        with self._lock:
+            if resource_grn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(resource_grn, None)
+
+    def _fetch(self, resource_grn: str, timeout: Timeout) -> IamPolicy:
+        method = (
+            _CRYPTO_KEYS_GET_IAM_POLICY if '/cryptoKeys/' in resource_grn
+            else _KEY_RINGS_GET_IAM_POLICY
+        )
+        response = execute_api_request(
+            self.api_client, method,
+            params={'resource': resource_grn},
+            circuit_breaker=self.circuit_breaker, timeout=timeout, num_retries=self.num_retries,
+        )
+        expires_at = self._clock() + self.ttl
+
+        with self._lock:
+            entry = self._entries.get(resource_grn)
+            old_policy = None if entry is None else entry[0]
+            if old_policy is not None and old_policy.etag and (
+                old_policy.etag == response.get('etag')
+            ):
+                # Revalidated: the policy did not change.
+                self._entries[resource_grn] = (old_policy, expires_at)
+                return old_policy
+
+            policy = IamPolicy.from_response(resource_grn, response)
+            self._entries[resource_grn] = (policy, expires_at)
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            try:
+                listener(old_policy, policy)
+            except Exception:
+                logger.exception("IAM policy change listener %r failed.", listener)
+        return policy
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+# Name of the field of a KMS 'Digest' object, by digest size (bytes).
+_DIGEST_FIELD_NAMES_BY_SIZE = {32: 'sha256', 48: 'sha384', 64: 'sha512'}
+
+
+def _ensure_resource(
+    resource_grn: str,
+    resource_cache: Optional[ResourceCache],
+    timeout: Timeout,
+    get: Callable[[Optional[Deadline]], Any],
+    create: Callable[[Optional[Deadline]], Any],
+) -> None:
+    resource_cache = resolve_resource_cache(resource_cache)
+    if resource_grn in resource_cache:
+        return
+
+    # Both requests share the same time budget.
+    deadline = to_deadline(timeout)
+    try:
+        get(deadline)
+    except exceptions.ResourceNotFound:
+        try:
+            create(deadline)
+        except exceptions.AlreadyExists:
+            # It was created concurrently (e.g. by another process).
+            logger.debug("Resource '%s' was created concurrently.", resource_grn)
+    resource_cache.add(resource_grn)
+
+
+def _update_iam_policy(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    changes: List[IamPolicyChange],
+    circuit_breaker: Optional[CircuitBreaker],
+    deadline: Optional[Deadline],
+    num_retries: int,
+) -> dict:
+    """
+    Read-modify-write the IAM policy of a crypto key, retrying on concurrent changes.
+
+    """
+    attempt = 0
+    while True:
+        policy = execute_api_request(
+            api_client, _CRYPTO_KEYS_GET_IAM_POLICY,
+            params={'resource': crypto_key_grn},
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        )
+        if not apply_iam_policy_changes(policy, changes):
+            return policy
+
+        try:
+            # note: the policy includes the 'etag' of the read, so the write fails if the policy
+            #   was changed in the meantime.
+            new_policy: dict = execute_api_request(
+                api_client, _CRYPTO_KEYS_SET_IAM_POLICY,
+                params={'resource': crypto_key_grn},
+                body={'policy': policy},
+                circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+            )
+            return new_policy
+        except exceptions.ConcurrentModification as exc:
+            if attempt >= IAM_POLICY_MAX_CONFLICT_RETRIES:
+                raise
+            backoff = _compute_retry_backoff(attempt)
+            if deadline is not None and backoff >= deadline.remaining():
+                raise exceptions.DeadlineExceeded(_CRYPTO_KEYS_SET_IAM_POLICY.id) from exc
+            logger.info(
+                "IAM policy of '%s' was changed concurrently. Retrying in %.2f seconds.",
+                crypto_key_grn, backoff)
+            time.sleep(backoff)
+            attempt += 1
+
+
+def _check_mac_data(data: bytes) -> None:
+    if not isinstance(data, bytes):
+        raise TypeError("Type of 'data' is not bytes.")
+    if len(data) > KMS_MAC_DATA_MAX_SIZE:
+        raise ValueError("Size of 'data' exceeds max size.")
+
+
+def _get_hash_algorithm(algorithm: str) -> Any:
+    # e.g. 'RSA_SIGN_PSS_2048_SHA256' -> 'SHA256()'
+    from cryptography.hazmat.primitives import hashes
+
+    hash_algorithm_name = algorithm.rsplit('_', 1)[-1]
+    if hash_algorithm_name not in ('SHA1', 'SHA256', 'SHA384', 'SHA512'):
+        raise ValueError("Unsupported crypto key version algorithm {!r}.".format(algorithm))
+    return getattr(hashes, hash_algorithm_name)()
+
+
+def _get_signature_parameters(algorithm: str) -> Tuple[Any, Any]:
+    """
+    Return the hash algorithm and padding (``None`` for EC keys) of signatures
+    made with a crypto key version of ``algorithm``.
+
+    .. seealso:: https://cloud.google.com/kms/docs/algorithms#asymmetric_signing_algorithms
+
+    """
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    hash_algorithm = _get_hash_algorithm(algorithm)
+    if algorithm.startswith('EC_SIGN_'):
+        return hash_algorithm, None
+    if algorithm.startswith('RSA_SIGN_PSS_'):
+        # note: KMS uses a salt as long as the digest.
+        return hash_algorithm, padding.PSS(
+            mgf=padding.MGF1(hash_algorithm), salt_length=hash_algorithm.digest_size)
+    if algorithm.startswith('RSA_SIGN_PKCS1_'):
+        return hash_algorithm, padding.PKCS1v15()
+    raise ValueError("Unsupported crypto key version algorithm {!r}.".format(algorithm))
+
+
+def _get_oaep_padding(algorithm: str) -> Any:
+    """
+    Return the padding of data encrypted for a crypto key version of ``algorithm``.
+
+    .. seealso:: https://cloud.google.com/kms/docs/algorithms#asymmetric_encryption_algorithms
+
+    """
+    from cryptography.hazmat.primitives.asymmetric import padding
+
+    if not algorithm.startswith('RSA_DECRYPT_OAEP_'):
+        raise ValueError("Unsupported crypto key version algorithm {!r}.".format(algorithm))
+    hash_algorithm = _get_hash_algorithm(algorithm)
+    return padding.OAEP(
+        mgf=padding.MGF1(hash_algorithm), algorithm=hash_algorithm, label=None)
@@ -0,0 +1,224 @@
+"""
+Blind indexes of data encrypted with KMS.
+
+Data encrypted with :func:`.gcp_kms.encrypt` can not be looked up by value
+(e.g. a row of a table by its encrypted email) without decrypting all of it,
+since encryption is not deterministic. A *blind index* is a keyed hash
+(HMAC) of the plain value, stored next to the encrypted data: looking up by
+value becomes looking up by the index of the value.
+
+- The HMAC key (the *index key*) is random and it is stored encrypted with a
+  KMS crypto key, i.e. *wrapped* (see :func:`generate_index_key`). It is
+  unwrapped with KMS the first time it is needed, and kept in memory.
+- Values are normalized before they are hashed (by default with
+  :func:`normalize_text`), so that e.g. emails that differ only in case have
+  the same index.
+- The key used for each ``context`` (e.g. a table column) is derived from
+  the index key, so the indexes of the same value in different contexts are
+  unrelated.
+- Indexes may be truncated to ``size`` bytes: shorter indexes match more
+  values (lookups return false positives that must be filtered out after
+  decryption), which makes them leak less about the values.
+
+.. warning:: anyone with the index key can test guesses of values against
+    indexes; and equal values have equal indexes, which reveals how often
+    each value occurs. Do not index values with few possible values.
+
+Usage example::
+
+    # Once; store 'wrapped_index_key' e.g. in the app's configuration.
+    wrapped_index_key = generate_index_key(kms_api_client, crypto_key_grn)
+
+    email_index = BlindIndex(
+        kms_api_client, crypto_key_grn, wrapped_index_key, context='users.email')
+
+    db.execute(
+        'INSERT INTO users (email_encrypted, email_index) VALUES (?, ?)',
+        gcp_kms.encrypt(kms_api_client, crypto_key_grn, email.encode('utf-8')),
+        email_index.compute(email),
+    )
+    rows = db.execute(
+        'SELECT * FROM users WHERE email_index = ?', email_index.compute('Foo@Example.com'))
+
+"""
+import hashlib
+import hmac
+import os
+import threading
+import unicodedata
+from typing import Callable, Iterable, List, Optional, Union
+
+from . import gcp_kms
+from .circuit_breaker import CircuitBreaker
+from .deadline import Timeout
+from .transport import ApiClient
+
+
+INDEX_KEY_SIZE = 32  # bytes
+
+Value = Union[str, bytes]
+"""
+Type of the values to index.
+"""
+
+Normalizer = Callable[[Value], bytes]
+"""
+Callable that returns the bytes that are hashed for a value.
+"""
+
+
+def generate_index_key(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Generate a random index key and return it wrapped (encrypted) with the
+    crypto key ``crypto_key_grn``.
+
+    """
+    return gcp_kms.encrypt(
+        api_client, crypto_key_grn, os.urandom(INDEX_KEY_SIZE),
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+
+
+def normalize_text(value: Value) -> bytes:
+    """
+    Return ``value`` normalized for case- and whitespace-insensitive
+    equality, encoded as UTF-8.
+
+    Text is Unicode-normalized (NFKC), case-folded, stripped, and its runs
+    of whitespace are replaced by a single space. Bytes are returned as is.
+
+    >>> normalize_text('  Jürgen\\tMÜLLER ')
+    b'j\\xc3\\xbcrgen m\\xc3\\xbcller'
+
+    """
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        raise TypeError("Type of 'value' is neither str nor bytes.")
+    value = unicodedata.normalize('NFKC', value).casefold()
+    return ' '.join(value.split()).encode('utf-8')
+
+
+class BlindIndex:
+
+    """
+    Computes the blind indexes of values in a context.
+
+    The index key is unwrapped (decrypted with KMS) the first time an index
+    is computed, and it is kept in memory, so instances should be long-lived.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        crypto_key_grn: str,
+        wrapped_index_key: bytes,
+        context: str = '',
+        size: int = None,
+        normalizer: Normalizer = normalize_text,
+        circuit_breaker: CircuitBreaker = None,
+        timeout: Timeout = None,
+        num_retries: int = 0,
+    ) -> None:
+        """Constructor.
+
+        :param crypto_key_grn: crypto key the index key is wrapped with
+        :param wrapped_index_key: see :func:`generate_index_key`
+        :param context: e.g. the table and column of the indexed values
+        :param size: size (bytes) of indexes, between 4 and 32; if ``None``, 32
+        :param normalizer: see :func:`normalize_text`
+        :param circuit_breaker: used (as well as ``timeout`` and
+            ``num_retries``) for unwrapping the index key
+
+        """
+        if size is not None and not 4 <= size <= hashlib.sha256().digest_size:
+            raise ValueError("Value of 'size' must be between 4 and 32.")
+
+        self.api_client = api_client
+        self.crypto_key_grn = crypto_key_grn
+        self.wrapped_index_key = wrapped_index_key
+        self.context = context
+        self.size = size
+        self.normalizer = normalizer
+        self.circuit_breaker = circuit_breaker
+        self.timeout = timeout
+        self.num_retries = num_retries
+
+        # HMAC keyed with the context's key, copied to compute each index.
+        self._hmac: Optional[hmac.HMAC] = None
+        self._lock = threading.Lock()
+
+    def compute(self, value: Value) -> bytes:
+        """
+        Return the index of ``value``.
+
+        :raises exceptions.Error: if the index key could not be unwrapped
+
+        """
+        return self._compute(self._get_hmac(), value)
+
+    def compute_batch(self, values: Iterable[Value]) -> List[bytes]:
+        """
+        Return the indexes of ``values`` (e.g. for a bulk load).
+
+        """
+        keyed_hmac = self._get_hmac()
+        return [self._compute(keyed_hmac, value) for value in values]
+
+    def matches(self, value: Value, index: bytes) -> bool:
+        """
+        Return whether ``index`` is the index of ``value``.
+
+        """
+        return hmac.compare_digest(self.compute(value), index)
+
+    def unwrap_index_key(self) -> None:
+        """
+        Unwrap the index key now, instead of when the first index is computed
+        (e.g. at startup, so that failures are detected early).
+
+        """
+        self._get_hmac()
+
+    def _compute(self, keyed_hmac: hmac.HMAC, value: Value) -> bytes:
+        # note: copying a keyed HMAC is cheaper than keying a new one.
+        value_hmac = keyed_hmac.copy()
+        value_hmac.update(self.normalizer(value))
+        index = value_hmac.digest()
+        return index if self.size is None else index[:self.size]
+
+    def _get_hmac(self) -> hmac.HMAC:
+        keyed_hmac = self._hmac
+        if keyed_hmac is not None:
+            return keyed_hmac
+
+        with self._lock:
+            if self._hmac is None:
+                index_key = gcp_kms.decrypt(
+                    self.api_client, self.crypto_key_grn, self.wrapped_index_key,
+                    circuit_breaker=self.circuit_breaker,
+                    timeout=self.timeout,
+                    num_retries=self.num_retries,
+                )
+                context_key = _derive_context_key(index_key, self.context)
+                self._hmac = hmac.new(context_key, digestmod=hashlib.sha256)
+            return self._hmac
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _derive_context_key(index_key: bytes, context: str) -> bytes:
+    if len(index_key) != INDEX_KEY_SIZE:
+        raise ValueError("Unwrapped index key has an invalid size.")
+    message = b'fd_gcp.blind_index:' + context.encode('utf-8')
+    return hmac.new(index_key, message, hashlib.sha256).digest()
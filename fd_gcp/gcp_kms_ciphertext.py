@@ -0,0 +1,392 @@
+"""
+Compact, self-describing, format of stored encrypted data.
+
+Data encrypted with :func:`.gcp_kms.encrypt` has to be decrypted with the
+same crypto key, but the KMS ciphertext does not say which one it is, so the
+crypto key's GRN (about 100 bytes) usually has to be stored next to every
+encrypted value. Instead, a *ciphertext container* starts with a header of
+(usually) 2 bytes:
+
+- 1 byte: the format version (4 bits), the algorithm (3 bits) and whether
+  the data was compressed before it was encrypted (1 bit).
+- The ID of the crypto key, an unsigned LEB128 varint (1 byte for IDs below
+  128). IDs are assigned by a :class:`KeyRegistry`, whose table of IDs and
+  crypto key GRNs must be stored once (e.g. in the app's configuration).
+
+and then the *payload*, which depends on the algorithm:
+
+- :data:`ALGORITHM_KMS`: the KMS ciphertext.
+- :data:`ALGORITHM_AES_GCM`: data encrypted locally with a data key (see
+  :mod:`.gcp_kms_data_keys`): the size of the wrapped data key (varint), the
+  wrapped data key, a 12-byte nonce, and the AES-GCM ciphertext (with the
+  header as associated data).
+
+:func:`parse_ciphertext` does not copy the data, and a
+:class:`CiphertextRouter` decrypts containers with the right crypto key::
+
+    key_registry = KeyRegistry({1: users_crypto_key_grn, 2: payments_crypto_key_grn})
+    router = CiphertextRouter(kms_api_client, key_registry)
+
+    encrypted_data = router.encrypt(users_crypto_key_grn, plain_data, compression='zlib')
+    plain_data = router.decrypt(encrypted_data)
+
+"""
+import os
+import threading
+from typing import Dict, Mapping, NamedTuple, Tuple, Union
+
+from . import exceptions
+from . import gcp_kms
+from .circuit_breaker import CircuitBreaker
+from .compression import compress, decompress
+from .deadline import Timeout
+from .gcp_kms_data_keys import DataKey, DataKeyCache
+from .transport import ApiClient
+
+
+FORMAT_VERSION = 1
+
+ALGORITHM_KMS = 0
+ALGORITHM_AES_GCM = 1
+
+_ALGORITHMS = frozenset({ALGORITHM_KMS, ALGORITHM_AES_GCM})
+_NONCE_SIZE = 12  # bytes
+# Max size of a varint (enough for 64-bit integers).
+_VARINT_MAX_SIZE = 10
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class Ciphertext(NamedTuple):
+
+    """
+    A parsed ciphertext container. ``header`` and ``payload`` are views of
+    the parsed data (not copies).
+
+    """
+
+    algorithm: int
+    key_id: int
+    compressed: bool
+    header: memoryview
+    payload: memoryview
+
+
+class KeyRegistry:
+
+    """
+    Table of the IDs of crypto keys, by which ciphertext containers refer
+    to them.
+
+    IDs must never be reused for another crypto key, since data encrypted
+    with it could not be decrypted any more.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(self, crypto_key_grns: Mapping[int, str] = None) -> None:
+        """Constructor.
+
+        :param crypto_key_grns: mapping of ID to crypto key GRN
+
+        """
+        self._lock = threading.Lock()
+        self._crypto_key_grns: Dict[int, str] = {}
+        self._key_ids: Dict[str, int] = {}
+        for key_id, crypto_key_grn in (crypto_key_grns or {}).items():
+            self.add(crypto_key_grn, key_id)
+
+    def __len__(self) -> int:
+        return len(self._crypto_key_grns)
+
+    def add(self, crypto_key_grn: str, key_id: int = None) -> int:
+        """
+        Assign an ID to ``crypto_key_grn`` (if it has none) and return it.
+
+        :param key_id: if ``None``, the lowest unused ID
+
+        """
+        with self._lock:
+            existing_key_id = self._key_ids.get(crypto_key_grn)
+            if existing_key_id is not None:
+                if key_id is not None and key_id != existing_key_id:
+                    raise ValueError(
+                        "Crypto key {!r} already has ID {}.".format(
+                            crypto_key_grn, existing_key_id))
+                return existing_key_id
+
+            if key_id is None:
+                key_id = 0
+                while key_id in self._crypto_key_grns:
+                    key_id += 1
+            elif key_id < 0:
+                raise ValueError("Value of 'key_id' must not be negative.")
+            elif key_id in self._crypto_key_grns:
+                raise ValueError("ID {} is already assigned.".format(key_id))
+
+            self._crypto_key_grns[key_id] = crypto_key_grn
+            self._key_ids[crypto_key_grn] = key_id
+            return key_id
+
+    def get_key_id(self, crypto_key_grn: str) -> int:
+        """
+        :raises KeyError: if ``crypto_key_grn`` has no ID
+
+        """
+        return self._key_ids[crypto_key_grn]
+
+    def get_crypto_key_grn(self, key_id: int) -> str:
+        """
+        :raises KeyError: if no crypto key has ID ``key_id``
+
+        """
+        return self._crypto_key_grns[key_id]
+
+    def to_dict(self) -> Dict[int, str]:
+        """
+        Return the table of IDs and crypto key GRNs, e.g. to store it.
+
+        """
+        with self._lock:
+            return dict(self._crypto_key_grns)
+
+
+class CiphertextRouter:
+
+    """
+    Encrypt data into ciphertext containers, and decrypt them with the
+    crypto key their ID refers to.
+
+    Data keys of containers of algorithm :data:`ALGORITHM_AES_GCM` are
+    unwrapped through ``data_key_cache``.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        key_registry: KeyRegistry,
+        data_key_cache: DataKeyCache = None,
+        circuit_breaker: CircuitBreaker = None,
+        num_retries: int = 0,
+    ) -> None:
+        """Constructor.
+
+        :param data_key_cache: if ``None``, a new one (with the default size)
+
+        """
+        self.api_client = api_client
+        self.key_registry = key_registry
+        self.data_key_cache = (
+            DataKeyCache(api_client, circuit_breaker=circuit_breaker, num_retries=num_retries)
+            if data_key_cache is None else data_key_cache)
+        self.circuit_breaker = circuit_breaker
+        self.num_retries = num_retries
+
+    def encrypt(
+        self,
+        crypto_key_grn: str,
+        plain_data: bytes,
+        compression: str = None,
+        timeout: Timeout = None,
+    ) -> bytes:
+        """
+        Encrypt ``plain_data`` with KMS (algorithm :data:`ALGORITHM_KMS`).
+
+        :param compression: if not ``None``, codec ``plain_data`` is
+            compressed with before it is encrypted (see :mod:`.compression`)
+        :raises KeyError: if ``crypto_key_grn`` has no ID in the registry
+
+        """
+        key_id = self.key_registry.get_key_id(crypto_key_grn)
+        encrypted_data = gcp_kms.encrypt(
+            self.api_client, crypto_key_grn, plain_data,
+            circuit_breaker=self.circuit_breaker,
+            timeout=timeout,
+            num_retries=self.num_retries,
+            compression=compression,
+        )
+        return encode_header(ALGORITHM_KMS, key_id, compression is not None) + encrypted_data
+
+    def encrypt_with_data_key(
+        self,
+        data_key: DataKey,
+        plain_data: bytes,
+        compression: str = None,
+    ) -> bytes:
+        """
+        Encrypt ``plain_data`` locally with ``data_key`` (algorithm
+        :data:`ALGORITHM_AES_GCM`); no request is made.
+
+        :raises KeyError: if the data key's crypto key has no ID in the registry
+
+        """
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        if not isinstance(plain_data, bytes):
+            raise TypeError("Type of 'plain_data' is not bytes.")
+        key_id = self.key_registry.get_key_id(data_key.crypto_key_grn)
+        if compression is not None:
+            plain_data = compress(plain_data, compression)
+
+        header = encode_header(ALGORITHM_AES_GCM, key_id, compression is not None)
+        nonce = os.urandom(_NONCE_SIZE)
+        return b''.join([
+            header,
+            encode_varint(len(data_key.wrapped_key)),
+            data_key.wrapped_key,
+            nonce,
+            AESGCM(data_key.key).encrypt(nonce, plain_data, header),
+        ])
+
+    def decrypt(self, data: BytesLike, timeout: Timeout = None) -> bytes:
+        """
+        Decrypt the ciphertext container ``data``.
+
+        :raises exceptions.DecryptionError: if ``data`` is not a valid
+            container (or, for algorithm :data:`ALGORITHM_AES_GCM`, it was
+            altered)
+        :raises KeyError: if the container's key ID is not in the registry
+
+        """
+        ciphertext = parse_ciphertext(data)
+        crypto_key_grn = self.key_registry.get_crypto_key_grn(ciphertext.key_id)
+
+        if ciphertext.algorithm == ALGORITHM_KMS:
+            return gcp_kms.decrypt(
+                self.api_client, crypto_key_grn, bytes(ciphertext.payload),
+                circuit_breaker=self.circuit_breaker,
+                timeout=timeout,
+                num_retries=self.num_retries,
+                decompress=ciphertext.compressed,
+            )
+
+        wrapped_key, nonce, encrypted_data = parse_aes_gcm_payload(ciphertext.payload)
+        key = self.data_key_cache.unwrap(crypto_key_grn, bytes(wrapped_key), timeout=timeout)
+        plain_data = decrypt_aes_gcm(key, nonce, encrypted_data, ciphertext.header)
+        if ciphertext.compressed:
+            plain_data = decompress(plain_data)
+        return plain_data
+
+
+###############################################################################
+# format
+###############################################################################
+
+def encode_header(algorithm: int, key_id: int, compressed: bool = False) -> bytes:
+    if algorithm not in _ALGORITHMS:
+        raise ValueError("Invalid value of 'algorithm'.")
+    return bytes([FORMAT_VERSION << 4 | algorithm << 1 | int(compressed)]) + encode_varint(key_id)
+
+
+def parse_ciphertext(data: BytesLike) -> Ciphertext:
+    """
+    Parse the ciphertext container ``data``, without copying it.
+
+    :raises exceptions.DecryptionError: if ``data`` is not a valid container
+
+    """
+    view = memoryview(data)
+    if not view:
+        raise exceptions.DecryptionError("Empty ciphertext.")
+    first_byte = view[0]
+    if first_byte >> 4 != FORMAT_VERSION:
+        raise exceptions.DecryptionError("Unsupported ciphertext format version.")
+    algorithm = first_byte >> 1 & 0b111
+    if algorithm not in _ALGORITHMS:
+        raise exceptions.DecryptionError("Unsupported ciphertext algorithm.")
+
+    key_id, offset = decode_varint(view, 1)
+    return Ciphertext(
+        algorithm=algorithm,
+        key_id=key_id,
+        compressed=bool(first_byte & 1),
+        header=view[:offset],
+        payload=view[offset:],
+    )
+
+
+def parse_aes_gcm_payload(payload: memoryview) -> Tuple[memoryview, memoryview, memoryview]:
+    """
+    Return the wrapped data key, the nonce and the encrypted data of the
+    ``payload`` of a container of algorithm :data:`ALGORITHM_AES_GCM`.
+
+    :raises exceptions.DecryptionError: if ``payload`` is not valid
+
+    """
+    wrapped_key_size, offset = decode_varint(payload, 0)
+    nonce_offset = offset + wrapped_key_size
+    data_offset = nonce_offset + _NONCE_SIZE
+    if data_offset > len(payload):
+        raise exceptions.DecryptionError("Truncated ciphertext.")
+    return (
+        payload[offset:nonce_offset],
+        payload[nonce_offset:data_offset],
+        payload[data_offset:],
+    )
+
+
+def decrypt_aes_gcm(
+    key: bytes,
+    nonce: BytesLike,
+    encrypted_data: BytesLike,
+    associated_data: BytesLike,
+) -> bytes:
+    """
+    :raises exceptions.DecryptionError: if the data was altered (or the key is wrong)
+
+    """
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    try:
+        # note: old versions of 'cryptography' (e.g. 3.3) only accept 'bytes', not memoryviews.
+        plain_data: bytes = AESGCM(key).decrypt(
+            bytes(nonce), bytes(encrypted_data), bytes(associated_data))
+    except (cryptography.exceptions.InvalidTag, ValueError) as exc:
+        raise exceptions.DecryptionError("Invalid ciphertext.") from exc
+    return plain_data
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode non-negative ``value`` as an unsigned LEB128 varint.
+
+    >>> encode_varint(300)
+    b'\\xac\\x02'
+
+    """
+    if value < 0:
+        raise ValueError("Value must not be negative.")
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(data: BytesLike, offset: int) -> Tuple[int, int]:
+    """
+    Decode the unsigned LEB128 varint of ``data`` at ``offset``.
+
+    :return: the value, and the offset of the data that follows it
+    :raises exceptions.DecryptionError: if it is truncated or too long
+
+    """
+    value = 0
+    shift = 0
+    end = min(len(data), offset + _VARINT_MAX_SIZE)
+    for index in range(offset, end):
+        byte = data[index]
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, index + 1
+        shift += 7
+    raise exceptions.DecryptionError("Invalid varint.")
@@ -0,0 +1,192 @@
+"""
+Bulk decryption of columns of encrypted values.
+
+Analytics jobs store encrypted values in columns, e.g. Arrow binary arrays,
+whose values are laid out as a data buffer and an offsets buffer (value
+``i`` is ``data[offsets[i]:offsets[i + 1]]``). Decrypting such a column
+value by value is slow; :func:`decrypt_column` instead:
+
+- parses the ciphertext containers (see :mod:`.gcp_kms_ciphertext`, algorithm
+  :data:`.gcp_kms_ciphertext.ALGORITHM_AES_GCM`) without copying them,
+- groups the values by data key, and unwraps each distinct data key once
+  (concurrently, through the router's :class:`.gcp_kms_data_keys.DataKeyCache`),
+- decrypts the values locally, in chunks processed concurrently in the
+  shared executor, into a single preallocated buffer.
+
+The result is a column in the same layout, so it can be wrapped without
+copying (e.g. with ``pyarrow.Array.from_buffers``)::
+
+    offsets_buffer, data_buffer = encrypted_array.buffers()[1:]
+    decrypted_column = decrypt_column(
+        router,
+        memoryview(offsets_buffer).cast('i')[:len(encrypted_array) + 1],
+        memoryview(data_buffer),
+        offsets_typecode='i',
+    )
+    decrypted_array = pyarrow.Array.from_buffers(
+        pyarrow.binary(), len(encrypted_array),
+        [None, pyarrow.py_buffer(decrypted_column.offsets),
+         pyarrow.py_buffer(decrypted_column.data)])
+
+Empty values (e.g. nulls) are left empty. Values encrypted with compression
+are not supported, since their decrypted size is not known in advance.
+
+"""
+import array
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from . import exceptions
+from ._concurrency import MAX_WORKERS, map_concurrently
+from .deadline import Timeout
+from .gcp_kms_ciphertext import (
+    ALGORITHM_AES_GCM, BytesLike, CiphertextRouter, parse_aes_gcm_payload, parse_ciphertext,
+)
+
+
+# Size of the authentication tag appended to AES-GCM ciphertexts.
+_TAG_SIZE = 16  # bytes
+# Min number of values decrypted by each concurrent task.
+_MIN_CHUNK_SIZE = 1024
+
+
+class DecryptedColumn(NamedTuple):
+
+    # offsets of the decrypted values in 'data' (one more than the number of values)
+    offsets: array.array
+    data: bytearray
+
+
+class _Cell(NamedTuple):
+
+    # index of the value in the column
+    position: int
+    nonce: memoryview
+    encrypted_data: memoryview
+    associated_data: memoryview
+
+
+def decrypt_column(
+    router: CiphertextRouter,
+    offsets: Sequence[int],
+    data: BytesLike,
+    timeout: Timeout = None,
+    max_concurrency: int = None,
+    offsets_typecode: str = 'q',
+) -> DecryptedColumn:
+    """
+    Decrypt the values of a column of ciphertext containers.
+
+    See the module's docs.
+
+    :param offsets: offsets of the values in ``data`` (e.g. a ``memoryview``
+        or ``array.array`` of integers)
+    :param data: the encrypted values, concatenated
+    :param timeout: timeout of the unwrapping of the data keys
+    :param max_concurrency: max number of concurrent requests (to unwrap
+        data keys) and of concurrent decryption tasks
+    :param offsets_typecode: ``array`` typecode of the returned offsets
+        (e.g. ``'i'`` for the 32-bit offsets of Arrow ``binary`` arrays)
+    :raises exceptions.DecryptionError: if a value is not a valid container
+        of algorithm :data:`.gcp_kms_ciphertext.ALGORITHM_AES_GCM`, or was
+        altered
+    :raises KeyError: if a value's key ID is not in the router's registry
+
+    """
+    offsets = _to_list(offsets)
+    if not offsets:
+        raise ValueError("Value of 'offsets' must not be empty.")
+    view = memoryview(data).cast('B')
+
+    # Parse the values and group them by data key.
+    cells_by_data_key: Dict[Tuple[str, bytes], List[_Cell]] = {}
+    output_offsets = array.array(offsets_typecode, [0])
+    output_size = 0
+    for index in range(len(offsets) - 1):
+        start, end = offsets[index], offsets[index + 1]
+        if end > start:
+            data_key_id, cell = _parse_cell(router, index, view[start:end])
+            cells_by_data_key.setdefault(data_key_id, []).append(cell)
+            output_size += len(cell.encrypted_data) - _TAG_SIZE
+        output_offsets.append(output_size)
+
+    data_key_ids = list(cells_by_data_key)
+    keys = router.data_key_cache.unwrap_batch(
+        data_key_ids, timeout=timeout, max_concurrency=max_concurrency)
+
+    # Decrypt the values into the output buffer.
+    output = bytearray(output_size)
+    output_view = memoryview(output)
+    tasks: List[Tuple[bytes, List[_Cell]]] = []
+    num_cells = len(offsets) - 1
+    chunk_size = max(_MIN_CHUNK_SIZE, -(-num_cells // (max_concurrency or MAX_WORKERS)))
+    for key, cells in zip(keys, cells_by_data_key.values()):
+        for chunk_start in range(0, len(cells), chunk_size):
+            tasks.append((key, cells[chunk_start:chunk_start + chunk_size]))
+
+    def decrypt_cells(task: Tuple[bytes, List[_Cell]]) -> None:
+        key, cells = task
+        _decrypt_cells(key, cells, output_offsets, output_view)
+
+    map_concurrently(decrypt_cells, tasks, max_concurrency=max_concurrency)
+    return DecryptedColumn(output_offsets, output)
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _to_list(offsets: Sequence[int]) -> List[int]:
+    # note: much faster than 'list(offsets)' for buffers (e.g. 'array.array' or NumPy arrays).
+    try:
+        return memoryview(offsets).tolist()  # type: ignore
+    except TypeError:
+        return list(offsets)
+
+
+def _parse_cell(
+    router: CiphertextRouter,
+    index: int,
+    value: memoryview,
+) -> Tuple[Tuple[str, bytes], _Cell]:
+    try:
+        ciphertext = parse_ciphertext(value)
+        if ciphertext.algorithm != ALGORITHM_AES_GCM:
+            raise exceptions.DecryptionError("Unsupported ciphertext algorithm.")
+        if ciphertext.compressed:
+            raise exceptions.DecryptionError("Compressed ciphertexts are not supported.")
+        wrapped_key, nonce, encrypted_data = parse_aes_gcm_payload(ciphertext.payload)
+        if len(encrypted_data) < _TAG_SIZE:
+            raise exceptions.DecryptionError("Truncated ciphertext.")
+    except exceptions.DecryptionError as exc:
+        raise exceptions.DecryptionError(
+            "Invalid value at index {}: {}".format(index, exc)) from exc
+
+    crypto_key_grn = router.key_registry.get_crypto_key_grn(ciphertext.key_id)
+    data_key_id = (crypto_key_grn, bytes(wrapped_key))
+    return data_key_id, _Cell(index, nonce, encrypted_data, ciphertext.header)
+
+
+def _decrypt_cells(
+    key: bytes,
+    cells: List[_Cell],
+    output_offsets: array.array,
+    output: memoryview,
+) -> None:
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    aesgcm = AESGCM(key)
+    # note: 'decrypt_into' (which avoids a copy) is only available in recent versions.
+    decrypt_into: Any = getattr(aesgcm, 'decrypt_into', None)
+    for cell in cells:
+        start, end = output_offsets[cell.position], output_offsets[cell.position + 1]
+        try:
+            if decrypt_into is not None:
+                decrypt_into(
+                    cell.nonce, cell.encrypted_data, cell.associated_data, output[start:end])
+            else:
+                output[start:end] = aesgcm.decrypt(
+                    cell.nonce, bytes(cell.encrypted_data), bytes(cell.associated_data))
+        except (cryptography.exceptions.InvalidTag, ValueError) as exc:
+            raise exceptions.DecryptionError(
+                "Invalid value at index {}: Invalid ciphertext.".format(cell.position)) from exc
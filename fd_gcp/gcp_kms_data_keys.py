@@ -0,0 +1,549 @@
+"""
+Data keys for envelope encryption with KMS.
+
+With *envelope encryption*, data is encrypted locally with a random *data
+key*, and the data key is encrypted (*wrapped*) with a KMS crypto key and
+stored next to the encrypted data. KMS is then called once per data key
+instead of once per encrypted value.
+
+Decrypting values that share a data key should not unwrap it every time, so
+unwrapped data keys are kept in a :class:`DataKeyCache`.
+
+Usage example::
+
+    data_key = generate_data_key(kms_api_client, crypto_key_grn)
+    # ... encrypt many values locally with 'data_key.key', and store 'data_key.wrapped_key'.
+
+    data_key_cache = DataKeyCache(kms_api_client)
+    key = data_key_cache.unwrap(crypto_key_grn, wrapped_key)
+
+The cached data keys may be persisted in a :class:`DataKeyCacheFile`, so that
+a restarted process does not unwrap them all again::
+
+    data_key_cache_file = DataKeyCacheFile(
+        '/var/cache/my-app/data-keys.bin', kms_api_client, host_crypto_key_grn)
+    data_key_cache_file.load(data_key_cache)
+    # ... and, periodically or before exiting:
+    data_key_cache_file.save(data_key_cache)
+
+"""
+import collections
+import concurrent.futures
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import exceptions
+from . import gcp_kms
+from ._concurrency import map_concurrently
+from ._files import write_file_atomically
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, Timeout, to_deadline
+from .transport import ApiClient
+
+
+logger = logging.getLogger(__name__)
+
+DATA_KEY_SIZE = 32  # bytes (AES-256)
+
+# Format of the files of 'DataKeyCacheFile':
+#   header: magic, version, crypto key GRN and wrapped host key (each preceded by its length), and
+#     the nonce of the body;
+#   body: the entries, encrypted (AES-GCM) with the host key, with the header as associated data.
+#   Each entry is its expiration time (UNIX time), the lengths of its crypto key GRN, wrapped key
+#   and key, and those.
+_CACHE_FILE_MAGIC = b'FDDK'
+_CACHE_FILE_VERSION = 1
+_CACHE_FILE_NONCE_SIZE = 12  # bytes
+_CACHE_FILE_ENTRY_STRUCT = struct.Struct('>dHHH')
+
+
+class DataKey(NamedTuple):
+
+    # plain key, to be kept only in memory
+    key: bytes
+    # key encrypted with the crypto key, to be stored next to the encrypted data
+    wrapped_key: bytes
+    crypto_key_grn: str
+
+
+def generate_data_key(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> DataKey:
+    """
+    Generate a random data key and wrap it with the crypto key ``crypto_key_grn``.
+
+    """
+    key = os.urandom(DATA_KEY_SIZE)
+    wrapped_key = gcp_kms.encrypt(
+        api_client, crypto_key_grn, key,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+    return DataKey(key, wrapped_key, crypto_key_grn)
+
+
+class DataKeyCache:
+
+    """
+    Cache of unwrapped (decrypted) data keys.
+
+    A data key is unwrapped with KMS the first time it is needed, and then
+    kept in memory: the ``max_size`` most recently used ones, each for at
+    most ``ttl`` seconds. Concurrent unwraps of the same data key are
+    coalesced into one request.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        max_size: int = 1024,
+        ttl: float = None,
+        circuit_breaker: CircuitBreaker = None,
+        num_retries: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Constructor.
+
+        :param max_size: max number of data keys kept
+        :param ttl: max time (seconds) a data key is kept; if ``None``, no limit
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        if max_size < 1:
+            raise ValueError("Value of 'max_size' must be positive.")
+        if ttl is not None and ttl < 0:
+            raise ValueError("Value of 'ttl' must not be negative.")
+
+        self.api_client = api_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.circuit_breaker = circuit_breaker
+        self.num_retries = num_retries
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # (crypto key GRN, wrapped key) -> (key, expiration time), least recently used first
+        self._entries: collections.OrderedDict[
+            Tuple[str, bytes], Tuple[bytes, Optional[float]]] = collections.OrderedDict()
+        # (crypto key GRN, wrapped key) -> future of the unwrap in progress
+        self._unwraps: Dict[Tuple[str, bytes], concurrent.futures.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def unwrap(self, crypto_key_grn: str, wrapped_key: bytes, timeout: Timeout = None) -> bytes:
+        """
+        Return the data key ``wrapped_key`` wrapped with ``crypto_key_grn``, unwrapped.
+
+        :raises exceptions.Error: if it could not be unwrapped
+
+        """
+        cache_key = (crypto_key_grn, wrapped_key)
+        key = self.get_cached(crypto_key_grn, wrapped_key)
+        if key is not None:
+            return key
+        return self._unwrap(cache_key, to_deadline(timeout))
+
+    def unwrap_batch(
+        self,
+        wrapped_keys: Iterable[Tuple[str, bytes]],
+        timeout: Timeout = None,
+        max_concurrency: int = None,
+    ) -> List[bytes]:
+        """
+        Like :meth:`unwrap` but for many ``(crypto key GRN, wrapped key)``
+        pairs; the distinct data keys that are not cached are unwrapped
+        concurrently.
+
+        :return: the unwrapped data keys, in the order of ``wrapped_keys``
+
+        """
+        wrapped_keys = list(wrapped_keys)
+        missing = [
+            cache_key for cache_key in dict.fromkeys(wrapped_keys)
+            if self.get_cached(*cache_key) is None
+        ]
+        deadline = to_deadline(timeout)
+        unwrapped = dict(zip(missing, map_concurrently(
+            lambda cache_key: self._unwrap(cache_key, deadline),
+            missing,
+            max_concurrency=max_concurrency,
+        )))
+        return [
+            unwrapped.get(cache_key) or self.unwrap(*cache_key, timeout=deadline)
+            for cache_key in wrapped_keys
+        ]
+
+    def get_cached(self, crypto_key_grn: str, wrapped_key: bytes) -> Optional[bytes]:
+        """
+        Return the unwrapped data key if it is cached, otherwise ``None``.
+
+        """
+        cache_key = (crypto_key_grn, wrapped_key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and (entry[1] is None or self._clock() < entry[1]):
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return None
+
+    def put(
+        self,
+        crypto_key_grn: str,
+        wrapped_key: bytes,
+        key: bytes,
+        ttl: float = None,
+    ) -> None:
+        """
+        Cache an unwrapped data key, e.g. one just generated with
+        :func:`generate_data_key`.
+
+        :param ttl: if not ``None``, max time (seconds) the data key is kept,
+            if less than the cache's ``ttl``
+
+        """
+        if ttl is not None and self.ttl is not None:
+            ttl = min(ttl, self.ttl)
+        elif ttl is None:
+            ttl = self.ttl
+        expires_at = None if ttl is None else self._clock() + ttl
+        with self._lock:
+            self._entries[(crypto_key_grn, wrapped_key)] = (key, expires_at)
+            self._entries.move_to_end((crypto_key_grn, wrapped_key))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> List[Tuple[str, bytes, bytes, Optional[float]]]:
+        """
+        Return the cached data keys that have not expired, as
+        ``(crypto key GRN, wrapped key, key, remaining TTL)`` tuples (the
+        remaining TTL is ``None`` if there is no limit), least recently used
+        first.
+
+        """
+        now = self._clock()
+        with self._lock:
+            entries = list(self._entries.items())
+        return [
+            (crypto_key_grn, wrapped_key, key, None if expires_at is None else expires_at - now)
+            for (crypto_key_grn, wrapped_key), (key, expires_at) in entries
+            if expires_at is None or now < expires_at
+        ]
+
+    def invalidate(self) -> None:
+        """
+        Forget all the cached data keys.
+
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _unwrap(self, cache_key: Tuple[str, bytes], deadline: Optional[Deadline]) -> bytes:
+        with self._lock:
+            future = self._unwraps.get(cache_key)
+            is_owner = future is None
+            if future is None:
+                future = self._unwraps[cache_key] = concurrent.futures.Future()
+
+        if not is_owner:
+            # Another thread is unwrapping it.
+            try:
+                key: bytes = future.result(None if deadline is None else deadline.remaining())
+            except concurrent.futures.TimeoutError:
+                raise exceptions.DeadlineExceeded('unwrap data key') from None
+            return key
+
+        try:
+            key = gcp_kms.decrypt(
+                self.api_client, cache_key[0], cache_key[1],
+                circuit_breaker=self.circuit_breaker,
+                timeout=deadline,
+                num_retries=self.num_retries,
+            )
+        except BaseException as exc:
+            with self._lock:
+                del self._unwraps[cache_key]
+            future.set_exception(exc)
+            raise
+
+        self.put(cache_key[0], cache_key[1], key)
+        with self._lock:
+            del self._unwraps[cache_key]
+        future.set_result(key)
+        return key
+
+
+class DataKeyCacheFile:
+
+    """
+    File where the data keys of a :class:`DataKeyCache` are persisted, so that
+    a restarted process starts with a warm cache.
+
+    The data keys are encrypted with a *host key*, a data key of the crypto
+    key ``crypto_key_grn`` that is stored, wrapped, in the file: loading the
+    file makes a single request to KMS, to unwrap the host key, instead of
+    one per data key. The host key is then kept in memory and reused by
+    :meth:`save`.
+
+    Data keys are persisted for at most ``ttl`` seconds (or less if they
+    expire earlier in the cache). A file that was altered, or whose data keys
+    were not encrypted with ``crypto_key_grn``, is ignored.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        api_client: ApiClient,
+        crypto_key_grn: str,
+        ttl: float = 24 * 60 * 60,
+        circuit_breaker: CircuitBreaker = None,
+        num_retries: int = 0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Constructor.
+
+        :param ttl: max time (seconds) a data key is persisted
+        :param clock: wall clock (useful for testing); expiration times must
+            be comparable across processes
+
+        """
+        if ttl <= 0:
+            raise ValueError("Value of 'ttl' must be positive.")
+
+        self.filename = filename
+        self.api_client = api_client
+        self.crypto_key_grn = crypto_key_grn
+        self.ttl = ttl
+        self.circuit_breaker = circuit_breaker
+        self.num_retries = num_retries
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._host_key: Optional[DataKey] = None
+
+    def load(self, data_key_cache: DataKeyCache, timeout: Timeout = None) -> int:
+        """
+        Put the data keys of the file that have not expired in ``data_key_cache``.
+
+        If the file is invalid or was altered, or its host key can not be
+        unwrapped, a warning is logged and no data key is loaded. A missing
+        file is not an error.
+
+        :return: number of data keys loaded
+
+        """
+        try:
+            with open(self.filename, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    logger.warning("Invalid data key cache file '%s'.", self.filename)
+                    return 0
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    with memoryview(mapped_file) as data:
+                        entries = self._read(data, to_deadline(timeout))
+        except FileNotFoundError:
+            return 0
+        except OSError:
+            logger.warning(
+                "Could not read data key cache file '%s'.", self.filename, exc_info=True)
+            return 0
+
+        now = self._clock()
+        num_loaded = 0
+        for expires_at, crypto_key_grn, wrapped_key, key in entries:
+            if expires_at > now:
+                data_key_cache.put(crypto_key_grn, wrapped_key, key, ttl=expires_at - now)
+                num_loaded += 1
+        return num_loaded
+
+    def save(self, data_key_cache: DataKeyCache, timeout: Timeout = None) -> int:
+        """
+        Write the data keys of ``data_key_cache`` that have not expired to
+        the file, replacing its contents.
+
+        The first time, if no file was loaded, a host key is generated (with
+        a request to KMS).
+
+        :return: number of data keys saved
+        :raises exceptions.Error: if the host key could not be generated
+        :raises OSError:
+
+        """
+        host_key = self._get_host_key(to_deadline(timeout))
+        now = self._clock()
+
+        body = bytearray()
+        num_saved = 0
+        for crypto_key_grn, wrapped_key, key, ttl in data_key_cache.snapshot():
+            encoded_crypto_key_grn = crypto_key_grn.encode('utf-8')
+            expires_at = now + (self.ttl if ttl is None else min(ttl, self.ttl))
+            body += _CACHE_FILE_ENTRY_STRUCT.pack(
+                expires_at, len(encoded_crypto_key_grn), len(wrapped_key), len(key))
+            body += encoded_crypto_key_grn + wrapped_key + key
+            num_saved += 1
+
+        write_file_atomically(self.filename, _encrypt_cache_file(host_key, bytes(body)))
+        return num_saved
+
+    def _read(
+        self,
+        data: memoryview,
+        deadline: Optional[Deadline],
+    ) -> List[Tuple[float, str, bytes, bytes]]:
+        """
+        Return the entries of the file's ``data``, as ``(expiration time,
+        crypto key GRN, wrapped key, key)`` tuples.
+
+        """
+        try:
+            crypto_key_grn, wrapped_host_key, body_offset = _read_cache_file_header(data)
+        except ValueError:
+            logger.warning("Invalid data key cache file '%s'.", self.filename)
+            return []
+        if crypto_key_grn != self.crypto_key_grn:
+            logger.warning(
+                "Data key cache file '%s' was not encrypted with crypto key '%s'.",
+                self.filename, self.crypto_key_grn)
+            return []
+
+        with self._lock:
+            host_key = self._host_key
+        if host_key is None or host_key.wrapped_key != wrapped_host_key:
+            try:
+                key = gcp_kms.decrypt(
+                    self.api_client, crypto_key_grn, bytes(wrapped_host_key),
+                    circuit_breaker=self.circuit_breaker,
+                    timeout=deadline,
+                    num_retries=self.num_retries,
+                )
+            except exceptions.Error:
+                logger.warning(
+                    "Could not unwrap the host key of data key cache file '%s'.",
+                    self.filename, exc_info=True)
+                return []
+            host_key = DataKey(key, bytes(wrapped_host_key), crypto_key_grn)
+
+        try:
+            body = _decrypt_cache_file(host_key.key, data, body_offset)
+            entries = _parse_cache_file_body(body)
+        except (exceptions.DecryptionError, ValueError):
+            logger.warning(
+                "Invalid data key cache file '%s' (it may have been altered).", self.filename)
+            return []
+
+        with self._lock:
+            self._host_key = host_key
+        return entries
+
+    def _get_host_key(self, deadline: Optional[Deadline]) -> DataKey:
+        with self._lock:
+            if self._host_key is None:
+                self._host_key = generate_data_key(
+                    self.api_client, self.crypto_key_grn,
+                    circuit_breaker=self.circuit_breaker,
+                    timeout=deadline,
+                    num_retries=self.num_retries,
+                )
+            return self._host_key
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _encrypt_cache_file(host_key: DataKey, body: bytes) -> bytes:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    encoded_crypto_key_grn = host_key.crypto_key_grn.encode('utf-8')
+    header = b''.join([
+        _CACHE_FILE_MAGIC,
+        bytes([_CACHE_FILE_VERSION]),
+        struct.pack('>H', len(encoded_crypto_key_grn)),
+        encoded_crypto_key_grn,
+        struct.pack('>H', len(host_key.wrapped_key)),
+        host_key.wrapped_key,
+        os.urandom(_CACHE_FILE_NONCE_SIZE),
+    ])
+    nonce = header[-_CACHE_FILE_NONCE_SIZE:]
+    return header + AESGCM(host_key.key).encrypt(nonce, body, header)
+
+
+def _read_cache_file_header(data: memoryview) -> Tuple[str, memoryview, int]:
+    """
+    Return the crypto key GRN, the wrapped host key, and the offset of the
+    body, of the cache file's ``data``.
+
+    :raises ValueError: if ``data`` is not a valid cache file
+
+    """
+    try:
+        if data[:len(_CACHE_FILE_MAGIC)] != _CACHE_FILE_MAGIC:
+            raise ValueError("Invalid magic.")
+        offset = len(_CACHE_FILE_MAGIC)
+        if data[offset] != _CACHE_FILE_VERSION:
+            raise ValueError("Unsupported version.")
+        offset += 1
+        fields = []
+        for _ in range(2):
+            (size,) = struct.unpack_from('>H', data, offset)
+            offset += 2
+            if offset + size > len(data):
+                raise ValueError("Truncated header.")
+            fields.append(data[offset:offset + size])
+            offset += size
+    except (IndexError, struct.error) as exc:
+        raise ValueError("Truncated header.") from exc
+
+    offset += _CACHE_FILE_NONCE_SIZE
+    if offset > len(data):
+        raise ValueError("Truncated header.")
+    return bytes(fields[0]).decode('utf-8'), fields[1], offset
+
+
+def _decrypt_cache_file(key: bytes, data: memoryview, body_offset: int) -> bytes:
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    # note: old versions of 'cryptography' (e.g. 3.3) only accept 'bytes', not memoryviews.
+    nonce = bytes(data[body_offset - _CACHE_FILE_NONCE_SIZE:body_offset])
+    try:
+        body: bytes = AESGCM(key).decrypt(
+            nonce, bytes(data[body_offset:]), bytes(data[:body_offset]))
+    except (cryptography.exceptions.InvalidTag, ValueError) as exc:
+        raise exceptions.DecryptionError("Invalid data key cache file.") from exc
+    return body
+
+
+def _parse_cache_file_body(body: bytes) -> List[Tuple[float, str, bytes, bytes]]:
+    entries = []
+    offset = 0
+    try:
+        while offset < len(body):
+            expires_at, *sizes = _CACHE_FILE_ENTRY_STRUCT.unpack_from(body, offset)
+            offset += _CACHE_FILE_ENTRY_STRUCT.size
+            fields = []
+            for size in sizes:
+                if offset + size > len(body):
+                    raise ValueError("Truncated entry.")
+                fields.append(body[offset:offset + size])
+                offset += size
+            entries.append((expires_at, fields[0].decode('utf-8'), fields[1], fields[2]))
+    except struct.error as exc:
+        raise ValueError("Truncated entry.") from exc
+    return entries
@@ -3,13 +3,29 @@ A mock version of module :mod:`.gcp_kms`.
 
 The code in this module does not make any external requests.
 
+Besides mocks of its functions, there is an in-memory emulation of the KMS
+service (see :func:`create_in_memory_api_client`), which may also be served
+over HTTP by a :class:`KmsHttpServer`, as a local stand-in of the KMS REST
+API e.g. to benchmark clients offline.
+
 """
 import base64
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import os
+import re
+import threading
+import urllib.parse
 import uuid
+from typing import Any, Dict, List, Optional, Pattern, Tuple, cast
 
-import cryptography.fernet
-
-from .gcp_kms import GcpCredentials, GcpResource  # noqa: F401
+from . import exceptions
+from . import gcp_kms
+from ._lazy import make_module_getattr
+from .transport import _PATH_TEMPLATE_VARIABLE_REGEX, ApiMethod, Handler, InMemoryTransport
 from .gcp_kms import (  # noqa: F401
     compose_crypto_key_grn,
     compose_crypto_key_version_grn,
@@ -17,6 +33,7 @@ from .gcp_kms import (  # noqa: F401
     compose_location_grn,
     compose_project_grn,
 )
+from .gcp_kms import _get_oaep_padding, _get_signature_parameters
 from .gcp_kms import (  # noqa: F401
     KMS_LOCATION_ID_MAX_LENGTH_ESTIMATION,
     KMS_KEY_RING_ID_MAX_LENGTH,
@@ -27,6 +44,15 @@ from .gcp_kms import (  # noqa: F401
 )
 
 
+logger = logging.getLogger(__name__)
+
+# note: like in module '.gcp_kms', these are imported the first time they are accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('fd_gcp.common', 'GcpCredentials'),
+    'GcpResource': ('fd_gcp.common', 'GcpResource'),
+})
+
+
 ###############################################################################
 # KMS API operations - crypto key
 ###############################################################################
@@ -35,6 +61,9 @@ def create_crypto_key(
     api_client: object,
     key_ring_grn: str,
     crypto_key_id: str = None,
+    circuit_breaker: object = None,
+    timeout: object = None,
+    num_retries: int = 0,
 ) -> str:
     """
     Create a crypto key (mock) within a key ring.
@@ -59,6 +88,9 @@ def encrypt(
     api_client: object,
     crypto_key_grn: str,
     plain_data: bytes,
+    circuit_breaker: object = None,
+    timeout: object = None,
+    num_retries: int = 0,
 ) -> bytes:
     """
     Encrypt binary ``plain_data`` locally, without using GCP KMS.
@@ -71,6 +103,9 @@ def encrypt(
     if len(plain_data) > KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE:
         raise ValueError("Size of 'plain_data' exceeds max size.")
 
+    # note: imported here because importing it is (relatively) slow.
+    import cryptography.fernet
+
     fernet_key_input = crypto_key_grn[-32:].encode(encoding='ascii')
     fernet_key = _generate_fernet_key(fernet_key_input)
 
@@ -84,6 +119,9 @@ def decrypt(
     api_client: object,
     crypto_key_grn: str,
     encrypted_data: bytes,
+    circuit_breaker: object = None,
+    timeout: object = None,
+    num_retries: int = 0,
 ) -> bytes:
     """
     Decrypt binary ``encrypted_data``locally, without using GCP KMS.
@@ -91,19 +129,524 @@ def decrypt(
     Useful for mocking :func:`.gcp_kms.decrypt`.
 
     """
+    # note: imported here because importing it is (relatively) slow.
+    import cryptography.fernet
+
     fernet_key_input = crypto_key_grn[-32:].encode(encoding='ascii')
     fernet_key = _generate_fernet_key(fernet_key_input)
 
+    # note: see the crypto key version prefix in 'create_in_memory_api_client'.
+    if b':' in encrypted_data:
+        encrypted_data = encrypted_data.partition(b':')[2]
+
     f = cryptography.fernet.Fernet(fernet_key)
     plain_data: bytes = f.decrypt(encrypted_data)
 
     return plain_data
 
 
+###############################################################################
+# in-memory KMS API
+###############################################################################
+
+def create_in_memory_api_client() -> InMemoryTransport:
+    """
+    Create a KMS API client whose requests are handled by an in-memory,
+    per-client, emulation of the KMS service.
+
+    Unlike the other functions of this module, the returned API client is
+    meant to be used with the operations of module :mod:`.gcp_kms`, e.g.::
+
+        kms_api_client = create_in_memory_api_client()
+        key_ring_grn = gcp_kms.create_key_ring(kms_api_client, location_grn, 'test-1')
+
+    Encryption is done like in :func:`encrypt` but, after a crypto key is
+    rotated, the ciphertext is prefixed with the ID of the crypto key
+    version that was primary (e.g. ``b'2:'``).
+
+    """
+    return _InMemoryKms().create_transport()
+
+
+class _InMemoryKms:
+
+    """
+    State and request handlers of an in-memory emulation of the KMS service.
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.key_rings: Dict[str, dict] = {}
+        self.crypto_keys: Dict[str, dict] = {}
+        self.iam_policies: Dict[str, dict] = {}
+        # crypto key GRN -> number of versions
+        self.num_crypto_key_versions: Dict[str, int] = {}
+        # crypto key version GRN -> (algorithm, private key or MAC secret key)
+        self.private_keys: Dict[str, Tuple[str, Any]] = {}
+
+    def create_transport(self) -> InMemoryTransport:
+        prefix = 'cloudkms.projects.locations.keyRings.'
+        return InMemoryTransport({
+            prefix + 'create': self.create_key_ring,
+            prefix + 'get': self.get_key_ring,
+            prefix + 'getIamPolicy': self.get_iam_policy,
+            prefix + 'setIamPolicy': self.set_iam_policy,
+            prefix + 'cryptoKeys.create': self.create_crypto_key,
+            prefix + 'cryptoKeys.get': self.get_crypto_key,
+            prefix + 'cryptoKeys.updatePrimaryVersion': self.update_primary_version,
+            prefix + 'cryptoKeys.cryptoKeyVersions.create': self.create_crypto_key_version,
+            prefix + 'cryptoKeys.encrypt': self.encrypt,
+            prefix + 'cryptoKeys.decrypt': self.decrypt,
+            prefix + 'cryptoKeys.getIamPolicy': self.get_iam_policy,
+            prefix + 'cryptoKeys.setIamPolicy': self.set_iam_policy,
+            prefix + 'cryptoKeys.cryptoKeyVersions.getPublicKey': self.get_public_key,
+            prefix + 'cryptoKeys.cryptoKeyVersions.asymmetricSign': self.asymmetric_sign,
+            prefix + 'cryptoKeys.cryptoKeyVersions.asymmetricDecrypt': self.asymmetric_decrypt,
+            prefix + 'cryptoKeys.cryptoKeyVersions.macSign': self.mac_sign,
+            prefix + 'cryptoKeys.cryptoKeyVersions.macVerify': self.mac_verify,
+        })
+
+    def create_key_ring(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        key_ring_grn = '{}/keyRings/{}'.format(params['parent'], params['keyRingId'])
+        with self._lock:
+            if key_ring_grn in self.key_rings:
+                raise exceptions.AlreadyExists('KeyRing {}'.format(key_ring_grn))
+            key_ring = self.key_rings[key_ring_grn] = {'name': key_ring_grn}
+        return key_ring
+
+    def get_key_ring(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        with self._lock:
+            try:
+                return self.key_rings[params['name']]
+            except KeyError:
+                raise exceptions.ResourceNotFound(params['name']) from None
+
+    def create_crypto_key(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        key_ring_grn = params['parent']
+        crypto_key_grn = '{}/cryptoKeys/{}'.format(key_ring_grn, params['cryptoKeyId'])
+        with self._lock:
+            if key_ring_grn not in self.key_rings:
+                raise exceptions.ResourceNotFound(key_ring_grn)
+            if crypto_key_grn in self.crypto_keys:
+                raise exceptions.AlreadyExists('CryptoKey {}'.format(crypto_key_grn))
+            crypto_key = dict(body or {})
+            crypto_key['name'] = crypto_key_grn
+            crypto_key['primary'] = {'name': crypto_key_grn + '/cryptoKeyVersions/1'}
+            self.crypto_keys[crypto_key_grn] = crypto_key
+            self.num_crypto_key_versions[crypto_key_grn] = 1
+
+        if crypto_key['purpose'] in ('ASYMMETRIC_SIGN', 'ASYMMETRIC_DECRYPT', 'MAC'):
+            algorithm = crypto_key['versionTemplate']['algorithm']
+            private_key = _generate_private_key(algorithm)
+            with self._lock:
+                self.private_keys[crypto_key['primary']['name']] = (algorithm, private_key)
+        return crypto_key
+
+    def get_crypto_key(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        return self._get_crypto_key(params['name'])
+
+    def encrypt(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        crypto_key = self._get_crypto_key(params['name'])
+        plain_data = base64.b64decode(_get_body_field(body, 'plaintext'))
+        if len(plain_data) > KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE:
+            raise _create_http_error(400, "The request payload is too large.")
+
+        crypto_key_version_grn = crypto_key['primary']['name']
+        crypto_key_version_id = crypto_key_version_grn.rsplit('/', 1)[-1]
+        encrypted_data = encrypt(None, crypto_key['name'], plain_data)
+        if crypto_key_version_id != '1':
+            # e.g. b'2:gAAAAABe..'
+            encrypted_data = crypto_key_version_id.encode('ascii') + b':' + encrypted_data
+        return {
+            'name': crypto_key_version_grn,
+            'ciphertext': base64.b64encode(encrypted_data).decode('ascii'),
+        }
+
+    def decrypt(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        import cryptography.fernet
+
+        crypto_key = self._get_crypto_key(params['name'])
+        encrypted_data = base64.b64decode(_get_body_field(body, 'ciphertext'))
+        crypto_key_version_id = b'1'
+        if b':' in encrypted_data:
+            crypto_key_version_id, _, encrypted_data = encrypted_data.partition(b':')
+        try:
+            plain_data = decrypt(None, crypto_key['name'], encrypted_data)
+        except cryptography.fernet.InvalidToken:
+            raise _create_http_error(
+                400,
+                "Decryption failed: verify that 'name' refers to the correct CryptoKey.",
+            ) from None
+        used_primary = crypto_key['primary']['name'].rsplit('/', 1)[-1].encode('ascii') == (
+            crypto_key_version_id)
+        return {
+            'plaintext': base64.b64encode(plain_data).decode('ascii'),
+            'usedPrimary': used_primary,
+        }
+
+    def create_crypto_key_version(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        crypto_key_grn = params['parent']
+        self._get_crypto_key(crypto_key_grn)
+        with self._lock:
+            self.num_crypto_key_versions[crypto_key_grn] += 1
+            crypto_key_version_grn = '{}/cryptoKeyVersions/{}'.format(
+                crypto_key_grn, self.num_crypto_key_versions[crypto_key_grn])
+        return {'name': crypto_key_version_grn, 'state': 'ENABLED'}
+
+    def update_primary_version(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        crypto_key = self._get_crypto_key(params['name'])
+        crypto_key_version_id = _get_body_field(body, 'cryptoKeyVersionId')
+        with self._lock:
+            if not 1 <= int(crypto_key_version_id) <= self.num_crypto_key_versions[
+                crypto_key['name']
+            ]:
+                raise exceptions.ResourceNotFound(
+                    '{}/cryptoKeyVersions/{}'.format(crypto_key['name'], crypto_key_version_id))
+            crypto_key['primary'] = {
+                'name': '{}/cryptoKeyVersions/{}'.format(
+                    crypto_key['name'], crypto_key_version_id),
+            }
+        return crypto_key
+
+    def get_public_key(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        from cryptography.hazmat.primitives import serialization
+
+        algorithm, private_key = self._get_private_key(params['name'])
+        pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        return {'name': params['name'], 'algorithm': algorithm, 'pem': pem.decode('ascii')}
+
+    def asymmetric_sign(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        from cryptography.hazmat.primitives.asymmetric import ec, utils
+
+        algorithm, private_key = self._get_private_key(params['name'])
+        digest = base64.b64decode(next(iter(_get_body_field(body, 'digest').values())))
+        hash_algorithm, padding = _get_signature_parameters(algorithm)
+
+        if padding is None:
+            signature = private_key.sign(digest, ec.ECDSA(utils.Prehashed(hash_algorithm)))
+        else:
+            signature = private_key.sign(digest, padding, utils.Prehashed(hash_algorithm))
+        return {'name': params['name'], 'signature': base64.b64encode(signature).decode('ascii')}
+
+    def asymmetric_decrypt(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        algorithm, private_key = self._get_private_key(params['name'])
+        encrypted_data = base64.b64decode(_get_body_field(body, 'ciphertext'))
+        try:
+            plain_data = private_key.decrypt(encrypted_data, _get_oaep_padding(algorithm))
+        except ValueError:
+            raise _create_http_error(400, "Decryption failed.") from None
+        return {'plaintext': base64.b64encode(plain_data).decode('ascii')}
+
+    def mac_sign(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        algorithm, secret_key = self._get_private_key(params['name'])
+        data = base64.b64decode(_get_body_field(body, 'data'))
+        mac = _compute_hmac(algorithm, secret_key, data)
+        return {'name': params['name'], 'mac': base64.b64encode(mac).decode('ascii')}
+
+    def mac_verify(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        algorithm, secret_key = self._get_private_key(params['name'])
+        data = base64.b64decode(_get_body_field(body, 'data'))
+        mac = base64.b64decode(_get_body_field(body, 'mac'))
+        success = hmac.compare_digest(_compute_hmac(algorithm, secret_key, data), mac)
+        return {'name': params['name'], 'success': success}
+
+    def get_iam_policy(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        resource_grn = params['resource']
+        with self._lock:
+            self._check_resource_exists(resource_grn)
+            return self.iam_policies.get(resource_grn) or {'version': 1, 'etag': 'ACAB'}
+
+    def set_iam_policy(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        resource_grn = params['resource']
+        policy = dict(_get_body_field(body, 'policy'))
+        with self._lock:
+            self._check_resource_exists(resource_grn)
+            current_etag = (self.iam_policies.get(resource_grn) or {}).get('etag', 'ACAB')
+            if 'etag' in policy and policy['etag'] != current_etag:
+                raise _create_http_error(
+                    409,
+                    "There were concurrent policy changes. Please retry the whole "
+                    "read-modify-write with exponential backoff.",
+                    error_status='ABORTED',
+                )
+            policy['etag'] = base64.b64encode(uuid.uuid4().bytes[:8]).decode('ascii')
+            self.iam_policies[resource_grn] = policy
+        return policy
+
+    def _get_crypto_key(self, crypto_key_grn: str) -> dict:
+        with self._lock:
+            try:
+                return self.crypto_keys[crypto_key_grn]
+            except KeyError:
+                raise exceptions.ResourceNotFound(crypto_key_grn) from None
+
+    def _get_private_key(self, crypto_key_version_grn: str) -> Tuple[str, Any]:
+        with self._lock:
+            try:
+                return self.private_keys[crypto_key_version_grn]
+            except KeyError:
+                raise exceptions.ResourceNotFound(crypto_key_version_grn) from None
+
+    def _check_resource_exists(self, resource_grn: str) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        if resource_grn not in self.key_rings and resource_grn not in self.crypto_keys:
+            raise exceptions.ResourceNotFound(resource_grn)
+
+
+###############################################################################
+# KMS REST API emulator
+###############################################################################
+
+class KmsHttpServer(http.server.ThreadingHTTPServer):
+
+    """
+    HTTP server of the KMS REST API, whose requests are handled by an
+    in-memory emulation of the KMS service (see :func:`create_in_memory_api_client`).
+
+    Usage example::
+
+        server = KmsHttpServer(('127.0.0.1', 0))
+        server.start()
+        kms_api_client = gcp_kms.KmsRestApiClient(
+            session=requests.Session(), base_url=server.base_url)
+        ...
+        server.stop()
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: Tuple[str, int] = ('127.0.0.1', 0)) -> None:
+        """Constructor.
+
+        :param server_address: host and port; if the port is 0, a free one is chosen
+
+        """
+        self.kms = _InMemoryKms()
+        self._routes = _create_routes(self.kms.create_transport().handlers)
+        self._thread: Optional[threading.Thread] = None
+        super().__init__(server_address, _KmsHttpRequestHandler)
+
+    @property
+    def base_url(self) -> str:
+        """
+        Base URL of the API e.g. ``http://127.0.0.1:8085/``.
+
+        """
+        # note: the address is of an 'AF_INET' socket.
+        host, port = cast(Tuple[str, int], self.server_address[:2])
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self) -> None:
+        """
+        Serve requests in a background (daemon) thread.
+
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name='fd_gcp-kms-http-server', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def handle_api_request(
+        self,
+        http_method: str,
+        url: str,
+        content: bytes,
+    ) -> Tuple[int, bytes]:
+        """
+        Handle a request to the API and return the status and content of the response.
+
+        """
+        split_url = urllib.parse.urlsplit(url)
+        path = urllib.parse.unquote(split_url.path.lstrip('/'))
+        try:
+            handler, params = self._route(http_method, path)
+            for name, values in urllib.parse.parse_qs(split_url.query).items():
+                params[name] = values[-1]
+            body = json.loads(content) if content else None
+            response = handler(params, body)
+        except Exception as exc:
+            status, error_content = _encode_http_error(exc)
+            return status, error_content
+        return 200, json.dumps(response).encode('utf-8')
+
+    def _route(self, http_method: str, path: str) -> Tuple[Handler, Dict[str, Any]]:
+        for route_http_method, path_regex, method, handler in self._routes:
+            if route_http_method != http_method:
+                continue
+            match = path_regex.match(path)
+            if match is not None and _method_matches_params(method, match.groupdict()):
+                return handler, match.groupdict()
+        raise _create_http_error(
+            404, "Method {} {} is not supported by the emulator.".format(http_method, path))
+
+
+class _KmsHttpRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    # note: HTTP/1.1 keeps connections open (like the actual API).
+    protocol_version = 'HTTP/1.1'
+    # note: the headers and the content of responses are buffered and sent at once, otherwise
+    #   the interaction of Nagle's algorithm and delayed ACKs adds ~40 ms to every request.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: KmsHttpServer
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def do_PATCH(self) -> None:
+        self._handle()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format, *args)
+
+    def _handle(self) -> None:
+        content_length = int(self.headers.get('Content-Length') or 0)
+        content = self.rfile.read(content_length) if content_length else b''
+        status, response_content = self.server.handle_api_request(
+            self.command, self.path, content)
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(response_content)))
+        self.end_headers()
+        self.wfile.write(response_content)
+
+
+# (HTTP method, path regex, API method, handler)
+_Route = Tuple[str, Pattern, ApiMethod, Handler]
+
+
+def _create_routes(handlers: Dict[str, Handler]) -> List[_Route]:
+    # note: the API methods are the constants of module '.gcp_kms'.
+    methods = [
+        value for value in vars(gcp_kms).values()
+        if isinstance(value, ApiMethod) and value.id in handlers
+    ]
+    # e.g. 'v1/{+resource}:getIamPolicy' must be tried before 'v1/{+name}'.
+    methods.sort(
+        key=lambda method: len(_PATH_TEMPLATE_VARIABLE_REGEX.sub('', method.path)), reverse=True)
+
+    routes = []
+    for method in methods:
+        path_regex = _compile_path_template(method.path)
+        routes.append((method.http_method, path_regex, method, handlers[method.id]))
+    return routes
+
+
+def _compile_path_template(template: str) -> Pattern:
+    # e.g. 'v1/{+name}:encrypt' -> '^v1/(?P<name>.+?):encrypt$'
+    pattern = ''
+    position = 0
+    for match in _PATH_TEMPLATE_VARIABLE_REGEX.finditer(template):
+        pattern += re.escape(template[position:match.start()])
+        pattern += '(?P<{}>{})'.format(
+            match.group('name'), '.+?' if match.group('reserved') else '[^/]+')
+        position = match.end()
+    pattern += re.escape(template[position:])
+    return re.compile('^{}$'.format(pattern))
+
+
+def _method_matches_params(method: ApiMethod, path_params: Dict[str, str]) -> bool:
+    """
+    Return whether the GRNs in ``path_params`` are of the resources of ``method``.
+
+    E.g. ``cloudkms.projects.locations.keyRings.get`` and
+    ``cloudkms.projects.locations.keyRings.cryptoKeys.get`` have the same
+    path template, but take the GRN of a key ring and of a crypto key.
+
+    """
+    # e.g. ['projects', 'locations', 'keyRings']
+    method_collections = method.id.split('.')[1:-1]
+    for name, value in path_params.items():
+        grn_collections = value.split('/')[0::2]
+        if name == 'parent':
+            grn_collections.append(method_collections[-1])
+        if grn_collections != method_collections:
+            return False
+    return True
+
+
+def _encode_http_error(exc: Exception) -> Tuple[int, bytes]:
+    if isinstance(exc, exceptions.UnrecognizedApiHttpError):
+        return exc.response.status, exc.response_content
+
+    error_status = None
+    if isinstance(exc, exceptions.ResourcePermissionDenied):
+        status, message = 403, str(exc)
+    elif isinstance(exc, exceptions.ResourceNotFound):
+        status, message = 404, "Resource {} not found.".format(exc.resource)
+    elif isinstance(exc, exceptions.AlreadyExists):
+        status, message, error_status = 409, str(exc), 'ALREADY_EXISTS'
+    elif isinstance(exc, exceptions.ConcurrentModification):
+        status, message, error_status = 409, str(exc), 'ABORTED'
+    elif isinstance(exc, (KeyError, TypeError, ValueError)):
+        status, message = 400, "Invalid request: {!r}.".format(exc)
+    else:
+        logger.exception("Emulated KMS request failed.")
+        status, message = 500, "Internal error."
+    return status, _encode_error_content(status, message, error_status)
+
+
 ###############################################################################
 # internal helpers
 ###############################################################################
 
+def _generate_private_key(algorithm: str) -> Any:
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if algorithm.startswith('EC_SIGN_P256_'):
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm.startswith('EC_SIGN_P384_'):
+        return ec.generate_private_key(ec.SECP384R1())
+    if algorithm.startswith('RSA_'):
+        # e.g. 'RSA_SIGN_PSS_2048_SHA256'
+        key_size = int(algorithm.split('_')[-2])
+        return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    if algorithm.startswith('HMAC_'):
+        return os.urandom(32)
+    raise _create_http_error(400, "Unsupported algorithm {}.".format(algorithm))
+
+
+def _compute_hmac(algorithm: str, secret_key: bytes, data: bytes) -> bytes:
+    # e.g. 'HMAC_SHA256' -> 'sha256'
+    hash_name = algorithm[len('HMAC_'):].lower()
+    return hmac.new(secret_key, data, getattr(hashlib, hash_name)).digest()
+
+
+def _get_body_field(body: Optional[dict], field_name: str) -> Any:
+    try:
+        return (body or {})[field_name]
+    except KeyError:
+        raise _create_http_error(
+            400, "Invalid value at '{}', missing field.".format(field_name)) from None
+
+
+def _create_http_error(status: int, message: str, error_status: str = None) -> Exception:
+    content = _encode_error_content(status, message, error_status)
+    return exceptions.process_api_http_error(status, content, 'in-memory://cloudkms')
+
+
+def _encode_error_content(status: int, message: str, error_status: str = None) -> bytes:
+    error: Dict[str, Any] = {'code': status, 'message': message}
+    if error_status is not None:
+        error['status'] = error_status
+    return json.dumps({'error': error}).encode('utf-8')
+
+
 def _generate_fernet_key(value: bytes) -> bytes:
     # Based on 'cryptography.fernet.Fernet.generate_key'.
     if not isinstance(value, bytes):
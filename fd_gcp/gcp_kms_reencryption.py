@@ -0,0 +1,232 @@
+"""
+Re-encryption of stored data with the primary version of a KMS crypto key.
+
+After a crypto key is rotated (see :func:`.gcp_kms.rotate_crypto_key`), data
+encrypted with previous versions of the key can still be decrypted, but it
+must be re-encrypted with the new primary version before the previous ones
+can be disabled or destroyed.
+
+:func:`reencrypt` takes records ``(record_id, encrypted_data)``, e.g. read
+from a database table, and passes the re-encrypted data of each one to a
+``sink`` callable, e.g. one that writes it back to the table.
+
+- Records are processed in batches; the records of a batch are processed
+  concurrently in the executor shared by this library.
+- Records already encrypted with the primary version are skipped: KMS
+  reports it in the decryption response, so they are not encrypted again.
+- Requests may be rate-limited (see :mod:`.rate_limiter`) to stay below the
+  KMS quota.
+- A :class:`ReencryptionCheckpoint` records how many records have been
+  processed so that, after a crash, processing is resumed where it was
+  left. This requires records to be iterated in the same (stable) order.
+
+Usage example::
+
+    def read_records() -> Iterator[Tuple[str, bytes]]:
+        for row in db.execute('SELECT id, secret FROM accounts ORDER BY id'):
+            yield row.id, row.secret
+
+    def write_record(record_id: str, encrypted_data: bytes) -> None:
+        db.execute('UPDATE accounts SET secret = ? WHERE id = ?', encrypted_data, record_id)
+
+    gcp_kms.rotate_crypto_key(kms_api_client, crypto_key_grn)
+    result = reencrypt(
+        kms_api_client, crypto_key_grn, read_records(), write_record,
+        checkpoint=ReencryptionCheckpoint('/var/lib/my-app/reencryption-checkpoint.json'),
+        max_concurrency=32,
+        rate_limiter=RateLimiter(rate=1000.0, burst=100),
+    )
+
+"""
+import base64
+import itertools
+import json
+import logging
+import os
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from ._concurrency import map_concurrently
+from ._files import write_file_atomically
+from .circuit_breaker import CircuitBreaker
+from .deadline import Timeout, to_deadline
+from .gcp_kms import _CRYPTO_KEYS_DECRYPT, encrypt
+from .rate_limiter import RateLimiter
+from .transport import ApiClient, execute_api_request
+
+
+logger = logging.getLogger(__name__)
+
+Record = Tuple[str, bytes]
+"""
+A record to re-encrypt: ``(record_id, encrypted_data)``.
+"""
+
+Sink = Callable[[str, bytes], None]
+"""
+Callable invoked as ``sink(record_id, encrypted_data)`` with the
+re-encrypted data of each record.
+"""
+
+
+class ReencryptionResult(NamedTuple):
+
+    # number of records processed in this run
+    num_records: int
+    # number of records that were re-encrypted (and passed to the sink)
+    num_reencrypted: int
+    # number of records that were already encrypted with the primary version
+    num_skipped: int
+    # number of records processed in this and previous runs (see 'ReencryptionCheckpoint')
+    position: int
+
+
+class ReencryptionCheckpoint:
+
+    """
+    File where the number of records processed by :func:`reencrypt` is saved.
+
+    """
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+
+    def load(self) -> int:
+        """
+        Return the number of records already processed (0 if none).
+
+        :raises ValueError: if the file is not valid
+
+        """
+        try:
+            with open(self.filename, 'rb') as file:
+                position = json.loads(file.read().decode('utf-8'))['position']
+            if not isinstance(position, int) or position < 0:
+                raise ValueError("Invalid position.")
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ValueError(
+                "Invalid re-encryption checkpoint file '{}'.".format(self.filename)) from exc
+        return position
+
+    def save(self, position: int) -> None:
+        write_file_atomically(self.filename, json.dumps({'position': position}).encode('utf-8'))
+
+    def clear(self) -> None:
+        """
+        Delete the checkpoint file, so that processing starts from the first record.
+
+        """
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+
+def reencrypt(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    records: Iterable[Record],
+    sink: Sink,
+    checkpoint: ReencryptionCheckpoint = None,
+    batch_size: int = 1000,
+    max_concurrency: int = 16,
+    rate_limiter: RateLimiter = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> ReencryptionResult:
+    """
+    Re-encrypt the data of ``records`` with the primary version of a crypto key.
+
+    See the module's docs.
+
+    ``sink`` is called from the calling thread, in the order of ``records``,
+    after all the records of a batch have been processed; then the
+    checkpoint (if any) is saved. If processing a record fails, its error is
+    raised and the records of its batch are not passed to ``sink``.
+
+    :param batch_size: number of records read, processed and checkpointed at once
+    :param max_concurrency: max number of records processed concurrently
+    :param rate_limiter: if not ``None``, a token is acquired for every request
+    :param timeout: timeout of the processing of each record (i.e. of its
+        decryption and encryption), not of the whole re-encryption
+
+    """
+    if batch_size < 1:
+        raise ValueError("Value of 'batch_size' must be positive.")
+
+    start_position = position = 0 if checkpoint is None else checkpoint.load()
+    if start_position:
+        logger.info("Resuming re-encryption after %d records.", start_position)
+
+    def process(record: Record) -> Optional[bytes]:
+        return _reencrypt_record(
+            api_client, crypto_key_grn, record[1], rate_limiter,
+            circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+
+    num_reencrypted = num_skipped = 0
+    records_iter = itertools.islice(records, start_position, None)
+    while True:
+        batch: List[Record] = list(itertools.islice(records_iter, batch_size))
+        if not batch:
+            break
+
+        results = map_concurrently(process, batch, max_concurrency=max_concurrency)
+        for (record_id, _), encrypted_data in zip(batch, results):
+            if encrypted_data is None:
+                num_skipped += 1
+            else:
+                sink(record_id, encrypted_data)
+                num_reencrypted += 1
+
+        position += len(batch)
+        if checkpoint is not None:
+            checkpoint.save(position)
+        logger.info(
+            "Re-encryption progress: %d records (%d re-encrypted, %d skipped).",
+            position, num_reencrypted, num_skipped)
+
+    return ReencryptionResult(
+        num_records=position - start_position,
+        num_reencrypted=num_reencrypted,
+        num_skipped=num_skipped,
+        position=position,
+    )
+
+
+def _reencrypt_record(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    encrypted_data: bytes,
+    rate_limiter: Optional[RateLimiter],
+    circuit_breaker: Optional[CircuitBreaker],
+    timeout: Timeout,
+    num_retries: int,
+) -> Optional[bytes]:
+    """
+    Return ``encrypted_data`` re-encrypted with the primary crypto key
+    version, or ``None`` if it was already encrypted with it.
+
+    """
+    # Both requests share the same time budget.
+    deadline = to_deadline(timeout)
+
+    if rate_limiter is not None:
+        rate_limiter.acquire(deadline=deadline)
+    # note: unlike 'gcp_kms.decrypt', this needs the response's 'usedPrimary'.
+    response = execute_api_request(
+        api_client, _CRYPTO_KEYS_DECRYPT,
+        params={'name': crypto_key_grn},
+        body={'ciphertext': base64.b64encode(encrypted_data).decode('ascii')},
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+    )
+    if response.get('usedPrimary'):
+        return None
+    plain_data = base64.b64decode(response['plaintext'].encode('ascii'))
+
+    if rate_limiter is not None:
+        rate_limiter.acquire(deadline=deadline)
+    return encrypt(
+        api_client, crypto_key_grn, plain_data,
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
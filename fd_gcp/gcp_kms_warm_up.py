@@ -0,0 +1,224 @@
+"""
+Warm-up and health checks of KMS API clients.
+
+The first requests made with a new API client are much slower than the
+following ones: they pay for building the client (e.g. fetching the
+discovery document, see :func:`.gcp_kms.create_api_client`), fetching an
+access token, and opening connections (DNS resolution, TCP and TLS
+handshakes). :func:`warm_up` pays for all of that upfront, e.g. before a
+server reports it is ready to take traffic, and reports how long each step
+took::
+
+    kms_api_client = ProcessLocalApiClient(
+        gcp_kms.create_api_client, CredentialsSpec.gce())
+    report = warm_up(kms_api_client, [crypto_key_grn], num_connections=10)
+    logger.info("KMS client warmed up in %.3f seconds.", report.duration)
+
+    # e.g. in the readiness probe:
+    health_status = check_health(kms_api_client, crypto_key_grn)
+
+Opening several connections requires an API client with a connection pool,
+i.e. created with ``transport='requests'`` (see
+:func:`.gcp_kms.create_api_client`): a ``googleapiclient`` discovery
+resource keeps a single connection per host and per thread (its
+``httplib2`` object), so the concurrent requests of :func:`warm_up` open
+connections that later requests (made by other threads) do not reuse.
+
+:func:`check_health` makes a single cheap request with the (warmed) API
+client, so it measures what the next operation would experience.
+
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from . import exceptions
+from ._concurrency import map_concurrently
+from ._http import is_service_failure
+from .circuit_breaker import CircuitBreaker
+from .client_factory import ProcessLocalApiClient
+from .deadline import Timeout, to_deadline
+from .gcp_kms import get_crypto_key
+from .transport import ApiClient, GoogleApiClientTransport, RequestsTransport, Transport
+
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUpReport(NamedTuple):
+
+    """
+    Durations (seconds) of the steps of :func:`warm_up`.
+
+    """
+
+    # building the underlying API client (e.g. of a 'ProcessLocalApiClient')
+    client_duration: float
+    # fetching an access token (if the credentials had no valid one)
+    credentials_duration: float
+    credentials_refreshed: bool
+    # crypto key GRN -> duration of its (first) 'cryptoKeys.get' request
+    crypto_key_durations: Dict[str, float]
+    duration: float
+
+
+class HealthStatus(NamedTuple):
+
+    healthy: bool
+    # duration (seconds) of the check
+    duration: float
+    # error that made the check fail, if any
+    error: Optional[Exception]
+
+
+def warm_up(
+    api_client: ApiClient,
+    crypto_key_grns: Sequence[str] = (),
+    num_connections: int = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    clock: Callable[[], float] = time.perf_counter,
+) -> WarmUpReport:
+    """
+    Prepare ``api_client`` so that its first operations are as fast as the
+    following ones.
+
+    Steps:
+
+    - the underlying API client of a :class:`.client_factory.ProcessLocalApiClient`
+      is created (in the current process),
+    - the credentials of the API client are refreshed, unless they have a
+      valid access token,
+    - if ``crypto_key_grns`` is not empty, ``num_connections`` concurrent
+      ``cryptoKeys.get`` requests are made (cycling through the crypto keys),
+      which opens as many pooled connections (see the module's docs) and
+      checks that the crypto keys exist and are accessible.
+
+    :param num_connections: number of concurrent requests; if ``None``, one
+        per crypto key
+    :param clock: monotonic clock (useful for testing)
+    :raises exceptions.AuthError: if the credentials could not be refreshed
+    :raises exceptions.ResourceNotFound: if a crypto key does not exist
+
+    """
+    if num_connections is None:
+        num_connections = len(crypto_key_grns)
+    if num_connections < 0:
+        raise ValueError("Value of 'num_connections' must not be negative.")
+
+    deadline = to_deadline(timeout)
+    start = clock()
+
+    if isinstance(api_client, ProcessLocalApiClient):
+        api_client.get_api_client()
+    client_end = clock()
+
+    if num_connections > 1 and _is_discovery_resource(_get_api_client(api_client)):
+        logger.warning(
+            "A discovery resource does not pool connections; create the KMS API client "
+            "with transport='requests' to warm up %d connections.", num_connections)
+
+    credentials_refreshed = _refresh_credentials(api_client)
+    credentials_end = clock()
+
+    crypto_key_durations: Dict[str, float] = {}
+    if crypto_key_grns and num_connections:
+        grns: List[str] = [
+            crypto_key_grns[index % len(crypto_key_grns)] for index in range(num_connections)
+        ]
+
+        def time_get_crypto_key(crypto_key_grn: str) -> float:
+            request_start = clock()
+            get_crypto_key(
+                api_client, crypto_key_grn,
+                circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+            )
+            return clock() - request_start
+
+        durations = map_concurrently(
+            time_get_crypto_key, grns, max_concurrency=num_connections)
+        for crypto_key_grn, duration in zip(grns, durations):
+            crypto_key_durations.setdefault(crypto_key_grn, duration)
+
+    end = clock()
+    return WarmUpReport(
+        client_duration=client_end - start,
+        credentials_duration=credentials_end - client_end,
+        credentials_refreshed=credentials_refreshed,
+        crypto_key_durations=crypto_key_durations,
+        duration=end - start,
+    )
+
+
+def check_health(
+    api_client: ApiClient,
+    crypto_key_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = 1.0,
+    clock: Callable[[], float] = time.perf_counter,
+) -> HealthStatus:
+    """
+    Check that KMS can be reached with ``api_client`` (e.g. one prepared
+    by :func:`warm_up`), with a ``cryptoKeys.get`` request.
+
+    Requests are not retried, and nothing is built or refreshed beyond what
+    an operation would do. Errors of the service (or the network), of auth
+    and of the crypto key make the check fail instead of being raised.
+
+    :param circuit_breaker: if its circuit is open, the check fails without
+        making a request
+
+    """
+    start = clock()
+    error: Optional[Exception] = None
+    try:
+        get_crypto_key(api_client, crypto_key_grn, circuit_breaker=circuit_breaker, timeout=timeout)
+    except Exception as exc:
+        if not isinstance(exc, exceptions.Error) and not is_service_failure(exc):
+            raise
+        error = exc
+    return HealthStatus(healthy=error is None, duration=clock() - start, error=error)
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _refresh_credentials(api_client: ApiClient) -> bool:
+    credentials = _get_credentials(api_client)
+    if credentials is None or credentials.valid:
+        return False
+
+    import google.auth.exceptions
+    import google.auth.transport.requests
+
+    try:
+        credentials.refresh(google.auth.transport.requests.Request())
+    except google.auth.exceptions.GoogleAuthError as exc:
+        raise exceptions.AuthError from exc
+    return True
+
+
+def _get_api_client(api_client: ApiClient) -> ApiClient:
+    if isinstance(api_client, ProcessLocalApiClient):
+        return api_client.get_api_client()
+    return api_client
+
+
+def _is_discovery_resource(api_client: ApiClient) -> bool:
+    return (
+        isinstance(api_client, GoogleApiClientTransport)
+        or not isinstance(api_client, Transport)
+    )
+
+
+def _get_credentials(api_client: ApiClient) -> Optional[Any]:
+    # note: the credentials are found where 'google-auth' keeps them, when it authorizes requests.
+    api_client = _get_api_client(api_client)
+    if isinstance(api_client, RequestsTransport):
+        return getattr(api_client.session, 'credentials', None)
+    if isinstance(api_client, Transport):
+        return None
+    # A 'googleapiclient' discovery resource, whose 'httplib2' object is authorized.
+    return getattr(getattr(api_client, '_http', None), 'credentials', None)
@@ -0,0 +1,560 @@
+"""
+GCP Pub/Sub helpers for messages encrypted client-side with KMS.
+
+To learn more about Pub/Sub, see https://cloud.google.com/pubsub/docs/
+
+Encrypting every message with :func:`.gcp_kms.encrypt` would make publishing
+as slow as KMS (and bounded by its quota). Instead, the messages of each
+published batch are encrypted locally (AES-256-GCM) with one data key, which
+is wrapped with the KMS crypto key once per batch (see
+:mod:`.gcp_kms_data_keys`). The wrapped data key travels in an attribute of
+each message, and subscribers unwrap each data key once, through a
+:class:`.gcp_kms_data_keys.DataKeyCache`.
+
+The custom attributes of messages are not encrypted, but they are
+authenticated: a message whose attributes were altered is not decrypted.
+
+Usage example, in a GCE environment::
+
+    from fd_gcp.auth import get_gce_credentials
+
+    credentials = get_gce_credentials()
+    pubsub_api_client = create_api_client(credentials)
+    kms_api_client = gcp_kms.create_api_client(credentials)
+
+    topic_grn = compose_topic_grn('[PROJECT_ID]', 'events')
+    publish_encrypted(
+        pubsub_api_client, kms_api_client, crypto_key_grn, topic_grn,
+        [Message(b'{"event": "signup"}', {'type': 'signup'})])
+
+    data_key_cache = DataKeyCache(kms_api_client)
+    subscription_grn = compose_subscription_grn('[PROJECT_ID]', 'events-worker')
+    received_messages = pull_decrypted(
+        pubsub_api_client, data_key_cache, subscription_grn, crypto_key_grn)
+    ...
+    acknowledge(pubsub_api_client, subscription_grn, [m.ack_id for m in received_messages])
+
+To use the Pub/Sub emulator, make requests to it with a
+:class:`PubsubRestApiClient`::
+
+    pubsub_api_client = PubsubRestApiClient(
+        session=requests.Session(), base_url='http://localhost:8085/')
+
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+from typing import (
+    TYPE_CHECKING, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union,
+)
+
+from . import exceptions
+from ._concurrency import map_concurrently
+from ._lazy import make_module_getattr
+from .circuit_breaker import CircuitBreaker
+from .deadline import Timeout, to_deadline
+from .gcp_kms_data_keys import DataKey, DataKeyCache, generate_data_key
+from .transport import ApiClient, ApiMethod, RequestsTransport, execute_api_request
+
+if TYPE_CHECKING:
+    import requests
+
+    from .common import GcpCredentials, GcpResource
+
+
+# note: 'GcpCredentials' and 'GcpResource' are available as attributes of this module but,
+#   because importing them is slow, they are imported the first time they are accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('fd_gcp.common', 'GcpCredentials'),
+    'GcpResource': ('fd_gcp.common', 'GcpResource'),
+})
+
+
+###############################################################################
+# constants
+###############################################################################
+
+# Root URL of the Pub/Sub REST API.
+# https://cloud.google.com/pubsub/docs/reference/rest
+PUBSUB_API_BASE_URL = 'https://pubsub.googleapis.com/'
+
+# Max number of messages, and max size (bytes) of their data, of a publish request.
+# https://cloud.google.com/pubsub/quotas#resource_limits
+PUBSUB_PUBLISH_MAX_MESSAGES = 1000
+PUBSUB_PUBLISH_MAX_SIZE = 10 * 1000 * 1000
+
+# Names of the attributes of encrypted messages.
+ENCRYPTION_CRYPTO_KEY_ATTRIBUTE = 'fd_gcp_crypto_key'
+ENCRYPTION_WRAPPED_KEY_ATTRIBUTE = 'fd_gcp_wrapped_key'
+
+_ENCRYPTION_VERSION = b'\x01'
+_NONCE_SIZE = 12  # bytes
+
+
+###############################################################################
+# Pub/Sub API methods
+###############################################################################
+
+# Values taken from the discovery document of the Pub/Sub API (v1).
+#   https://pubsub.googleapis.com/$discovery/rest?version=v1
+
+_TOPICS_CREATE = ApiMethod(
+    'pubsub.projects.topics.create',
+    'PUT', 'v1/{+name}')
+_TOPICS_PUBLISH = ApiMethod(
+    'pubsub.projects.topics.publish',
+    'POST', 'v1/{+topic}:publish')
+_SUBSCRIPTIONS_CREATE = ApiMethod(
+    'pubsub.projects.subscriptions.create',
+    'PUT', 'v1/{+name}')
+_SUBSCRIPTIONS_PULL = ApiMethod(
+    'pubsub.projects.subscriptions.pull',
+    'POST', 'v1/{+subscription}:pull')
+_SUBSCRIPTIONS_ACKNOWLEDGE = ApiMethod(
+    'pubsub.projects.subscriptions.acknowledge',
+    'POST', 'v1/{+subscription}:acknowledge')
+
+
+class PubsubRestApiClient(RequestsTransport):
+
+    """
+    Pub/Sub API client that makes requests directly to the REST API.
+
+    Instances are thread-safe.
+
+    .. seealso:: :class:`.transport.RequestsTransport`
+
+    """
+
+    def __init__(
+        self,
+        credentials: GcpCredentials = None,
+        session: requests.Session = None,
+        pool_maxsize: int = 10,
+        base_url: str = PUBSUB_API_BASE_URL,
+    ) -> None:
+        super().__init__(
+            base_url=base_url,
+            credentials=credentials,
+            session=session,
+            pool_maxsize=pool_maxsize,
+        )
+
+
+class Message(NamedTuple):
+
+    data: bytes
+    attributes: Mapping[str, str] = {}
+
+
+class ReceivedMessage(NamedTuple):
+
+    ack_id: str
+    message_id: str
+    # decrypted data; 'None' if the message could not be decrypted
+    data: Optional[bytes]
+    # custom attributes (i.e. without those of the encryption)
+    attributes: Dict[str, str]
+    publish_time: str
+    # why the message could not be decrypted, if it could not
+    error: Optional[exceptions.Error] = None
+
+
+###############################################################################
+# resource GRN functions
+###############################################################################
+
+def compose_topic_grn(
+    project_id: str,
+    topic_id: str,
+) -> str:
+    return 'projects/{}/topics/{}'.format(
+        project_id,
+        topic_id,
+    )
+
+
+def compose_subscription_grn(
+    project_id: str,
+    subscription_id: str,
+) -> str:
+    return 'projects/{}/subscriptions/{}'.format(
+        project_id,
+        subscription_id,
+    )
+
+
+###############################################################################
+# Pub/Sub API operations
+###############################################################################
+
+def create_api_client(
+    credentials: GcpCredentials,
+    transport: str = 'googleapiclient',
+) -> ApiClient:
+    """Create a Pub/Sub API client.
+
+    .. warning:: Auth checks do not happen here.
+
+    :param transport: how requests are made (see :mod:`.transport`):
+        ``googleapiclient`` (a discovery resource is returned) or
+        ``requests`` (a :class:`PubsubRestApiClient` is returned)
+
+    """
+    if transport == 'requests':
+        return PubsubRestApiClient(credentials=credentials)
+    if transport != 'googleapiclient':
+        raise ValueError("Unknown transport {!r}.".format(transport))
+
+    global _discovery_document
+
+    import googleapiclient.discovery
+
+    # note: see 'gcp_kms.create_api_client'.
+    if _discovery_document is not None:
+        api_client: GcpResource = googleapiclient.discovery.build_from_document(
+            _discovery_document,
+            credentials=credentials,
+        )
+        return api_client
+
+    api_client = googleapiclient.discovery.build(
+        serviceName='pubsub',
+        version='v1',
+        credentials=credentials,
+    )
+    _discovery_document = getattr(api_client, '_rootDesc', None)
+    return api_client
+
+
+# Discovery document of the Pub/Sub API, as used by 'googleapiclient'.
+_discovery_document: Optional[dict] = None
+
+
+def create_topic(
+    api_client: ApiClient,
+    topic_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Create a topic.
+
+    :raises exceptions.AlreadyExists:
+
+    """
+    response = execute_api_request(
+        api_client, _TOPICS_CREATE,
+        params={'name': topic_grn},
+        body={},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    created_topic_grn: str = response['name']
+    return created_topic_grn
+
+
+def create_subscription(
+    api_client: ApiClient,
+    subscription_grn: str,
+    topic_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Create a pull subscription to a topic.
+
+    :raises exceptions.AlreadyExists:
+
+    """
+    response = execute_api_request(
+        api_client, _SUBSCRIPTIONS_CREATE,
+        params={'name': subscription_grn},
+        body={'topic': topic_grn},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    created_subscription_grn: str = response['name']
+    return created_subscription_grn
+
+
+def publish_encrypted(
+    api_client: ApiClient,
+    kms_api_client: ApiClient,
+    crypto_key_grn: str,
+    topic_grn: str,
+    messages: Iterable[Message],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    max_concurrency: int = None,
+) -> List[str]:
+    """
+    Encrypt messages and publish them to a topic.
+
+    Messages are split in batches that fit in a publish request. The
+    messages of each batch are encrypted with a new data key, so there is
+    one request to KMS (and one to Pub/Sub) per batch. Batches are published
+    concurrently.
+
+    ``circuit_breaker`` and ``num_retries`` apply to the requests to both
+    services.
+
+    :return: IDs of the published messages, in the order of ``messages``
+
+    """
+    deadline = to_deadline(timeout)
+
+    def publish_batch(batch: List[Message]) -> List[str]:
+        data_key = generate_data_key(
+            kms_api_client, crypto_key_grn,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+        response = execute_api_request(
+            api_client, _TOPICS_PUBLISH,
+            params={'topic': topic_grn},
+            body={'messages': encrypt_messages(data_key, batch)},
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        )
+        message_ids: List[str] = response['messageIds']
+        return message_ids
+
+    batches_message_ids = map_concurrently(
+        publish_batch, _split_in_batches(messages), max_concurrency=max_concurrency)
+    return [
+        message_id
+        for batch_message_ids in batches_message_ids
+        for message_id in batch_message_ids
+    ]
+
+
+def pull_decrypted(
+    api_client: ApiClient,
+    data_key_cache: DataKeyCache,
+    subscription_grn: str,
+    crypto_key_grn: str,
+    max_messages: int = 100,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> List[ReceivedMessage]:
+    """
+    Pull messages from a subscription and decrypt them.
+
+    Each distinct data key is unwrapped once (and only if it is not cached
+    in ``data_key_cache``), concurrently.
+
+    A message that can not be decrypted is returned with ``data`` ``None``
+    and the reason in ``error`` (e.g. to be acknowledged and discarded, or
+    sent to a dead-letter topic), so that it does not prevent the others
+    from being processed.
+
+    :param crypto_key_grn: the crypto key the data keys of the messages must
+        be wrapped with; since anyone who can publish to the topic chooses
+        the attributes of the messages, data keys that claim another crypto
+        key are not unwrapped (their messages fail with
+        :class:`.exceptions.DecryptionError`)
+
+    :return: the pulled messages, which must be acknowledged (see
+        :func:`acknowledge`); possibly none
+
+    """
+    deadline = to_deadline(timeout)
+    response = execute_api_request(
+        api_client, _SUBSCRIPTIONS_PULL,
+        params={'subscription': subscription_grn},
+        body={'maxMessages': max_messages},
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+    )
+    received_messages = response.get('receivedMessages', [])
+
+    # Unwrap the distinct data keys concurrently, once each (even if it fails).
+    wrapped_keys: List[Tuple[str, bytes]] = []
+    for received_message in received_messages:
+        try:
+            wrapped_keys.append(_get_wrapped_key(received_message['message'], crypto_key_grn))
+        except exceptions.DecryptionError:
+            pass
+    wrapped_keys = list(dict.fromkeys(wrapped_keys))
+
+    def unwrap(wrapped_key: Tuple[str, bytes]) -> Union[bytes, exceptions.Error]:
+        try:
+            return data_key_cache.unwrap(*wrapped_key, timeout=deadline)
+        except exceptions.Error as exc:
+            # note: the error is reported for each message of the data key.
+            return exc
+
+    keys = dict(zip(wrapped_keys, map_concurrently(unwrap, wrapped_keys)))
+    return [
+        _decrypt_received_message(keys, crypto_key_grn, received_message)
+        for received_message in received_messages
+    ]
+
+
+def acknowledge(
+    api_client: ApiClient,
+    subscription_grn: str,
+    ack_ids: Iterable[str],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> None:
+    """
+    Acknowledge pulled messages, so that they are not delivered again.
+
+    """
+    ack_ids = list(ack_ids)
+    if not ack_ids:
+        return
+    execute_api_request(
+        api_client, _SUBSCRIPTIONS_ACKNOWLEDGE,
+        params={'subscription': subscription_grn},
+        body={'ackIds': ack_ids},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+
+
+###############################################################################
+# message encryption
+###############################################################################
+
+def encrypt_messages(data_key: DataKey, messages: Iterable[Message]) -> List[dict]:
+    """
+    Encrypt messages with a data key (see :func:`.gcp_kms_data_keys.generate_data_key`).
+
+    :return: ``PubsubMessage`` objects of the Pub/Sub API
+
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    aesgcm = AESGCM(data_key.key)
+    encryption_attributes = {
+        ENCRYPTION_CRYPTO_KEY_ATTRIBUTE: data_key.crypto_key_grn,
+        ENCRYPTION_WRAPPED_KEY_ATTRIBUTE: base64.b64encode(data_key.wrapped_key).decode('ascii'),
+    }
+
+    encrypted_messages = []
+    for message in messages:
+        if not isinstance(message.data, bytes):
+            raise TypeError("Type of 'data' of messages is not bytes.")
+        for name in encryption_attributes:
+            if name in message.attributes:
+                raise ValueError("Attribute {!r} of messages is reserved.".format(name))
+
+        nonce = os.urandom(_NONCE_SIZE)
+        encrypted_data = b''.join((
+            _ENCRYPTION_VERSION,
+            nonce,
+            aesgcm.encrypt(nonce, message.data, _encode_attributes(message.attributes)),
+        ))
+        attributes = dict(message.attributes)
+        attributes.update(encryption_attributes)
+        encrypted_messages.append({
+            'data': base64.b64encode(encrypted_data).decode('ascii'),
+            'attributes': attributes,
+        })
+    return encrypted_messages
+
+
+def decrypt_message(key: bytes, message: dict) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Decrypt a message encrypted by :func:`encrypt_messages`, given its
+    unwrapped data key.
+
+    :param message: ``PubsubMessage`` object of the Pub/Sub API
+    :return: the data and the custom attributes of the message
+    :raises exceptions.DecryptionError:
+
+    """
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    attributes = {
+        name: value for name, value in message.get('attributes', {}).items()
+        if name not in (ENCRYPTION_CRYPTO_KEY_ATTRIBUTE, ENCRYPTION_WRAPPED_KEY_ATTRIBUTE)
+    }
+    encrypted_data = base64.b64decode(message.get('data', ''))
+    if encrypted_data[:1] != _ENCRYPTION_VERSION or len(encrypted_data) < 1 + _NONCE_SIZE:
+        raise exceptions.DecryptionError("Message was not encrypted by this module.")
+
+    nonce = encrypted_data[1:1 + _NONCE_SIZE]
+    try:
+        data = AESGCM(key).decrypt(
+            nonce, encrypted_data[1 + _NONCE_SIZE:], _encode_attributes(attributes))
+    except cryptography.exceptions.InvalidTag:
+        raise exceptions.DecryptionError("Message is not valid.") from None
+    return data, attributes
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+def _split_in_batches(messages: Iterable[Message]) -> List[List[Message]]:
+    batches: List[List[Message]] = []
+    batch: List[Message] = []
+    batch_size = 0
+    for message in messages:
+        # note: an estimation of the size of the encrypted message (and its attributes).
+        message_size = (len(message.data) + 256) * 4 // 3 + sum(
+            len(name) + len(value) for name, value in message.attributes.items())
+        if batch and (
+            len(batch) >= PUBSUB_PUBLISH_MAX_MESSAGES
+            or batch_size + message_size > PUBSUB_PUBLISH_MAX_SIZE
+        ):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(message)
+        batch_size += message_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _get_wrapped_key(message: dict, crypto_key_grn: str) -> Tuple[str, bytes]:
+    # Return the crypto key GRN and the wrapped data key of an encrypted message.
+    attributes = message.get('attributes', {})
+    try:
+        wrapped_key = (
+            attributes[ENCRYPTION_CRYPTO_KEY_ATTRIBUTE],
+            base64.b64decode(attributes[ENCRYPTION_WRAPPED_KEY_ATTRIBUTE]),
+        )
+    except (KeyError, ValueError):
+        raise exceptions.DecryptionError("Message was not encrypted by this module.") from None
+    if wrapped_key[0] != crypto_key_grn:
+        raise exceptions.DecryptionError("Data key is not wrapped with the expected crypto key.")
+    return wrapped_key
+
+
+def _decrypt_received_message(
+    keys: Mapping[Tuple[str, bytes], Union[bytes, exceptions.Error]],
+    crypto_key_grn: str,
+    received_message: dict,
+) -> ReceivedMessage:
+    message = received_message['message']
+    data: Optional[bytes] = None
+    attributes = dict(message.get('attributes', {}))
+    error: Optional[exceptions.Error] = None
+    try:
+        key = keys[_get_wrapped_key(message, crypto_key_grn)]
+        if isinstance(key, exceptions.Error):
+            error = key
+        else:
+            data, attributes = decrypt_message(key, message)
+    except exceptions.Error as exc:
+        error = exc
+
+    return ReceivedMessage(
+        ack_id=received_message['ackId'],
+        message_id=message.get('messageId', ''),
+        data=data,
+        attributes=attributes,
+        publish_time=message.get('publishTime', ''),
+        error=error,
+    )
+
+
+def _encode_attributes(attributes: Mapping[str, str]) -> bytes:
+    # note: custom attributes are authenticated (as associated data) in a canonical encoding.
+    return json.dumps(attributes, sort_keys=True, separators=(',', ':')).encode('utf-8')
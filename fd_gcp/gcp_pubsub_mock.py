@@ -0,0 +1,116 @@
+"""
+A mock version of module :mod:`.gcp_pubsub`.
+
+The code in this module does not make any external requests.
+
+"""
+import itertools
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+from . import exceptions
+from .gcp_pubsub import compose_subscription_grn, compose_topic_grn  # noqa: F401
+from .transport import InMemoryTransport
+
+
+###############################################################################
+# in-memory Pub/Sub service
+###############################################################################
+
+def create_in_memory_api_client() -> InMemoryTransport:
+    """
+    Create a Pub/Sub API client whose requests are handled by an in-memory,
+    per-client, emulation of the Pub/Sub service.
+
+    The returned API client is meant to be used with the operations of
+    module :mod:`.gcp_pubsub`. Only pull subscriptions are emulated, and
+    messages are delivered once (there are no ack deadlines).
+
+    """
+    return _InMemoryPubsub().create_transport()
+
+
+class _InMemoryPubsub:
+
+    """
+    State and request handlers of an in-memory emulation of the Pub/Sub service.
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # topic GRN -> GRNs of its subscriptions
+        self.topics: Dict[str, List[str]] = {}
+        # subscription GRN -> messages not pulled yet
+        self.subscriptions: Dict[str, List[dict]] = {}
+        # ack ID -> (subscription GRN, message), of pulled messages not acknowledged yet
+        self.unacked_messages: Dict[str, Any] = {}
+        self._message_ids = itertools.count(1)
+
+    def create_transport(self) -> InMemoryTransport:
+        prefix = 'pubsub.projects.'
+        return InMemoryTransport({
+            prefix + 'topics.create': self.create_topic,
+            prefix + 'topics.publish': self.publish,
+            prefix + 'subscriptions.create': self.create_subscription,
+            prefix + 'subscriptions.pull': self.pull,
+            prefix + 'subscriptions.acknowledge': self.acknowledge,
+        })
+
+    def create_topic(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        with self._lock:
+            if params['name'] in self.topics:
+                raise exceptions.AlreadyExists('Topic {}'.format(params['name']))
+            self.topics[params['name']] = []
+        return {'name': params['name']}
+
+    def create_subscription(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        topic_grn = (body or {})['topic']
+        with self._lock:
+            if topic_grn not in self.topics:
+                raise exceptions.ResourceNotFound(topic_grn)
+            if params['name'] in self.subscriptions:
+                raise exceptions.AlreadyExists('Subscription {}'.format(params['name']))
+            self.topics[topic_grn].append(params['name'])
+            self.subscriptions[params['name']] = []
+        return {'name': params['name'], 'topic': topic_grn}
+
+    def publish(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        messages = (body or {})['messages']
+        with self._lock:
+            try:
+                subscription_grns = self.topics[params['topic']]
+            except KeyError:
+                raise exceptions.ResourceNotFound(params['topic']) from None
+            message_ids = []
+            for message in messages:
+                message = dict(message, messageId=str(next(self._message_ids)))
+                message_ids.append(message['messageId'])
+                for subscription_grn in subscription_grns:
+                    self.subscriptions[subscription_grn].append(message)
+        return {'messageIds': message_ids}
+
+    def pull(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        max_messages = (body or {}).get('maxMessages', 100)
+        subscription_grn = params['subscription']
+        with self._lock:
+            try:
+                messages = self.subscriptions[subscription_grn]
+            except KeyError:
+                raise exceptions.ResourceNotFound(subscription_grn) from None
+            pulled_messages = messages[:max_messages]
+            del messages[:max_messages]
+
+            received_messages = []
+            for message in pulled_messages:
+                ack_id = uuid.uuid4().hex
+                self.unacked_messages[ack_id] = (subscription_grn, message)
+                received_messages.append({'ackId': ack_id, 'message': message})
+        return {'receivedMessages': received_messages} if received_messages else {}
+
+    def acknowledge(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        with self._lock:
+            for ack_id in (body or {})['ackIds']:
+                self.unacked_messages.pop(ack_id, None)
+        return {}
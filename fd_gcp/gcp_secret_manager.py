@@ -0,0 +1,584 @@
+"""
+GCP Secret Manager helpers.
+
+To learn more about Secret Manager, see https://cloud.google.com/secret-manager/docs/
+
+Usage example, in a GCE environment::
+
+    from fd_gcp.auth import get_gce_credentials
+
+    credentials = get_gce_credentials()
+    secret_manager_api_client = create_api_client(credentials)
+
+    secret_version_grn = compose_secret_version_grn(
+        project_id='[PROJECT_ID]',
+        secret_id='db-password',
+    )
+    db_password = access_secret_version(secret_manager_api_client, secret_version_grn)
+
+Services that read secrets often (e.g. on every request) should read them
+through a :class:`SecretCache`, so that reading a secret is a memory read::
+
+    secret_cache = SecretCache(secret_manager_api_client, ttl=300.0)
+    secret_cache.prefetch([secret_version_grn])
+
+    # e.g. in the request path:
+    db_password = secret_cache.get(secret_version_grn)
+
+Like those of :mod:`.gcp_kms`, the operations accept a ``googleapiclient``
+discovery resource or a :class:`.transport.Transport` as ``api_client``, and
+the optional arguments ``circuit_breaker``, ``timeout`` and ``num_retries``.
+
+"""
+from __future__ import annotations
+
+import base64
+import concurrent.futures
+import logging
+import re
+import threading
+import time
+from typing import (
+    TYPE_CHECKING, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple,
+)
+
+from . import exceptions
+from ._concurrency import get_executor, map_concurrently
+from ._lazy import make_module_getattr
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, Timeout, to_deadline
+from .transport import ApiClient, ApiMethod, RequestsTransport, execute_api_request
+
+if TYPE_CHECKING:
+    import requests
+
+    from .common import GcpCredentials, GcpResource
+
+
+logger = logging.getLogger(__name__)
+
+# note: 'GcpCredentials' and 'GcpResource' are available as attributes of this module but,
+#   because importing them is slow, they are imported the first time they are accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('fd_gcp.common', 'GcpCredentials'),
+    'GcpResource': ('fd_gcp.common', 'GcpResource'),
+})
+
+
+###############################################################################
+# constants
+###############################################################################
+
+# > [..] can contain uppercase and lowercase letters, numerals, and the hyphen (-) and underscore
+# > (_) characters. The maximum length for a secret name is 255 characters.
+# https://cloud.google.com/secret-manager/docs/reference/rest/v1/projects.secrets/create
+SECRET_MANAGER_SECRET_ID_MAX_LENGTH = 255
+SECRET_MANAGER_SECRET_ID_REGEX = re.compile(r'^[a-zA-Z0-9_-]{1,255}$')
+
+# Alias of the most recently created (enabled) version of a secret.
+SECRET_MANAGER_LATEST_SECRET_VERSION_ID = 'latest'
+
+# Max size of the data of a secret version.
+# https://cloud.google.com/secret-manager/quotas
+SECRET_MANAGER_SECRET_DATA_MAX_SIZE = 64 * 1024  # 64 KiB
+
+# Root URL of the Secret Manager REST API.
+# https://cloud.google.com/secret-manager/docs/reference/rest
+SECRET_MANAGER_API_BASE_URL = 'https://secretmanager.googleapis.com/'
+
+
+###############################################################################
+# Secret Manager API methods
+###############################################################################
+
+# Values taken from the discovery document of the Secret Manager API (v1).
+#   https://secretmanager.googleapis.com/$discovery/rest?version=v1
+
+_SECRETS_CREATE = ApiMethod(
+    'secretmanager.projects.secrets.create',
+    'POST', 'v1/{+parent}/secrets')
+_SECRETS_ADD_VERSION = ApiMethod(
+    'secretmanager.projects.secrets.addVersion',
+    'POST', 'v1/{+parent}:addVersion')
+_SECRET_VERSIONS_ACCESS = ApiMethod(
+    'secretmanager.projects.secrets.versions.access',
+    'GET', 'v1/{+name}:access')
+
+
+class SecretManagerRestApiClient(RequestsTransport):
+
+    """
+    Secret Manager API client that makes requests directly to the REST API.
+
+    Instances are thread-safe.
+
+    .. seealso:: :class:`.transport.RequestsTransport`
+
+    """
+
+    def __init__(
+        self,
+        credentials: GcpCredentials = None,
+        session: requests.Session = None,
+        pool_maxsize: int = 10,
+        base_url: str = SECRET_MANAGER_API_BASE_URL,
+    ) -> None:
+        super().__init__(
+            base_url=base_url,
+            credentials=credentials,
+            session=session,
+            pool_maxsize=pool_maxsize,
+        )
+
+
+###############################################################################
+# resource GRN functions
+###############################################################################
+
+# The object hierarchy is:
+#   'projects/[PROJECT_ID]/secrets/[SECRET]/versions/[VERSION]'
+
+def compose_project_grn(
+    project_id: str,
+) -> str:
+    return 'projects/{}'.format(
+        project_id,
+    )
+
+
+def compose_secret_grn(
+    project_id: str,
+    secret_id: str,
+) -> str:
+    return 'projects/{}/secrets/{}'.format(
+        project_id,
+        secret_id,
+    )
+
+
+def compose_secret_version_grn(
+    project_id: str,
+    secret_id: str,
+    secret_version_id: str = SECRET_MANAGER_LATEST_SECRET_VERSION_ID,
+) -> str:
+    return 'projects/{}/secrets/{}/versions/{}'.format(
+        project_id,
+        secret_id,
+        secret_version_id,
+    )
+
+
+def is_pinned_secret_version_grn(secret_version_grn: str) -> bool:
+    """
+    Return whether ``secret_version_grn`` refers to a specific version (e.g.
+    ``.../versions/3``), whose data never changes, rather than to an alias
+    such as ``latest``.
+
+    """
+    return secret_version_grn.rsplit('/', 1)[-1].isdigit()
+
+
+###############################################################################
+# Secret Manager API operations
+###############################################################################
+
+def create_api_client(
+    credentials: GcpCredentials,
+    transport: str = 'googleapiclient',
+) -> ApiClient:
+    """Create a Secret Manager API client.
+
+    .. warning:: Auth checks do not happen here.
+
+    :param transport: how requests are made (see :mod:`.transport`):
+        ``googleapiclient`` (a discovery resource is returned) or
+        ``requests`` (a :class:`SecretManagerRestApiClient` is returned)
+
+    """
+    if transport == 'requests':
+        return SecretManagerRestApiClient(credentials=credentials)
+    if transport != 'googleapiclient':
+        raise ValueError("Unknown transport {!r}.".format(transport))
+
+    global _discovery_document
+
+    import googleapiclient.discovery
+
+    # note: see 'gcp_kms.create_api_client'.
+    if _discovery_document is not None:
+        api_client: GcpResource = googleapiclient.discovery.build_from_document(
+            _discovery_document,
+            credentials=credentials,
+        )
+        return api_client
+
+    api_client = googleapiclient.discovery.build(
+        serviceName='secretmanager',
+        version='v1',
+        credentials=credentials,
+    )
+    _discovery_document = getattr(api_client, '_rootDesc', None)
+    return api_client
+
+
+# Discovery document of the Secret Manager API, as used by 'googleapiclient'.
+_discovery_document: Optional[dict] = None
+
+
+def create_secret(
+    api_client: ApiClient,
+    project_grn: str,
+    secret_id: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Create a secret, with automatic replication and no versions.
+
+    :return: secret GRN
+    :raises exceptions.AlreadyExists:
+
+    """
+    if not SECRET_MANAGER_SECRET_ID_REGEX.match(secret_id):
+        raise ValueError("Value of 'secret_id' is invalid.")
+
+    response = execute_api_request(
+        api_client, _SECRETS_CREATE,
+        params={'parent': project_grn, 'secretId': secret_id},
+        body={'replication': {'automatic': {}}},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    secret_grn: str = response['name']
+    return secret_grn
+
+
+def add_secret_version(
+    api_client: ApiClient,
+    secret_grn: str,
+    data: bytes,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> str:
+    """
+    Add a version, with ``data``, to a secret.
+
+    :return: secret version GRN
+
+    """
+    if not isinstance(data, bytes):
+        raise TypeError("Type of 'data' is not bytes.")
+    if len(data) > SECRET_MANAGER_SECRET_DATA_MAX_SIZE:
+        raise ValueError("Size of 'data' exceeds max size.")
+
+    response = execute_api_request(
+        api_client, _SECRETS_ADD_VERSION,
+        params={'parent': secret_grn},
+        body={'payload': {'data': base64.b64encode(data).decode('ascii')}},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    secret_version_grn: str = response['name']
+    return secret_version_grn
+
+
+def access_secret_version(
+    api_client: ApiClient,
+    secret_version_grn: str,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> bytes:
+    """
+    Return the data of a secret version.
+
+    :param secret_version_grn: e.g. ``projects/p/secrets/s/versions/latest``
+    :raises exceptions.ResourceNotFound:
+
+    """
+    response = execute_api_request(
+        api_client, _SECRET_VERSIONS_ACCESS,
+        params={'name': secret_version_grn},
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries,
+    )
+    return base64.b64decode(response['payload']['data'].encode('ascii'))
+
+
+def access_secret_versions(
+    api_client: ApiClient,
+    secret_version_grns: Iterable[str],
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+    max_concurrency: int = None,
+) -> List[bytes]:
+    """
+    Like :func:`access_secret_version` but for many secret versions, whose
+    requests are made concurrently.
+
+    Secret Manager has no batch API method, so there is one request per
+    secret version. All of them share the time budget of ``timeout``. If any
+    request fails, its error is raised (the outcome of the others is
+    discarded).
+
+    :param max_concurrency: max number of concurrent requests
+    :return: the data of the secret versions, in the order of ``secret_version_grns``
+
+    """
+    deadline = to_deadline(timeout)
+
+    def access(secret_version_grn: str) -> bytes:
+        return access_secret_version(
+            api_client, secret_version_grn,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+
+    return map_concurrently(access, secret_version_grns, max_concurrency=max_concurrency)
+
+
+###############################################################################
+# secret cache
+###############################################################################
+
+class SecretCache:
+
+    """
+    In-process cache of the data of secret versions.
+
+    The data of a secret version is fetched the first time it is read and
+    then read from memory. Data of aliases (e.g. ``latest``) goes through
+    these stages, by age:
+
+    - Fresh (younger than ``refresh_ahead * ttl``): it is returned.
+    - Fresh but about to expire (younger than ``ttl``): it is returned, and
+      it is refreshed in the background, so frequently read secrets are not
+      read stale.
+    - Stale (younger than ``ttl + max_stale``): it is returned, and it is
+      refreshed in the background (i.e. stale-while-revalidate). This also
+      keeps secrets readable while Secret Manager is unavailable.
+    - Expired: it is fetched (i.e. the read blocks).
+
+    Data of specific (pinned) versions, e.g. ``.../versions/3``, never
+    changes, so it is cached indefinitely.
+
+    Concurrent fetches of the same secret version are coalesced into one
+    request. Background refreshes run in the executor shared by this
+    library; their failures are logged.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        ttl: float = 300.0,
+        refresh_ahead: float = 0.8,
+        max_stale: float = 3600.0,
+        circuit_breaker: CircuitBreaker = None,
+        num_retries: int = 0,
+        refresh_timeout: Timeout = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Constructor.
+
+        :param ttl: time (seconds) data of aliases is fresh
+        :param refresh_ahead: fraction of ``ttl`` after which reading data
+            triggers a background refresh
+        :param max_stale: time (seconds) after ``ttl`` during which stale
+            data is returned while it is refreshed
+        :param refresh_timeout: timeout of background refreshes
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        if ttl < 0 or max_stale < 0:
+            raise ValueError("Values of 'ttl' and 'max_stale' must not be negative.")
+        if not 0 <= refresh_ahead <= 1:
+            raise ValueError("Value of 'refresh_ahead' must be between 0 and 1.")
+
+        self.api_client = api_client
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.circuit_breaker = circuit_breaker
+        self.num_retries = num_retries
+        self.refresh_timeout = refresh_timeout
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _SecretCacheEntry] = {}
+        # secret version GRN -> future of the fetch in progress
+        self._fetches: Dict[str, concurrent.futures.Future] = {}
+
+    def get(self, secret_version_grn: str, timeout: Timeout = None) -> bytes:
+        """
+        Return the data of a secret version.
+
+        :param timeout: timeout of the fetch, if the data must be fetched
+        :raises exceptions.ResourceNotFound:
+
+        """
+        data = self._get_cached(secret_version_grn)
+        if data is not None:
+            return data
+        return self._fetch(secret_version_grn, to_deadline(timeout))
+
+    def get_batch(
+        self,
+        secret_version_grns: Iterable[str],
+        timeout: Timeout = None,
+        max_concurrency: int = None,
+    ) -> Dict[str, bytes]:
+        """
+        Return the data of many secret versions; those that must be fetched
+        are fetched concurrently.
+
+        :return: mapping of secret version GRN to data
+
+        """
+        result: Dict[str, bytes] = {}
+        missing_grns: List[str] = []
+        for secret_version_grn in secret_version_grns:
+            data = self._get_cached(secret_version_grn)
+            if data is None:
+                missing_grns.append(secret_version_grn)
+            else:
+                result[secret_version_grn] = data
+
+        deadline = to_deadline(timeout)
+        fetched_data = map_concurrently(
+            lambda secret_version_grn: self._fetch(secret_version_grn, deadline),
+            missing_grns,
+            max_concurrency=max_concurrency,
+        )
+        result.update(zip(missing_grns, fetched_data))
+        return result
+
+    def prefetch(
+        self,
+        secret_version_grns: Iterable[str],
+        timeout: Timeout = None,
+        max_concurrency: int = None,
+    ) -> None:
+        """
+        Fetch (concurrently) the data of many secret versions, e.g. at startup.
+
+        """
+        deadline = to_deadline(timeout)
+        map_concurrently(
+            lambda secret_version_grn: self._fetch(secret_version_grn, deadline),
+            secret_version_grns,
+            max_concurrency=max_concurrency,
+        )
+
+    def invalidate(self, secret_version_grn: str = None) -> None:
+        """
+        Forget the cached data of ``secret_version_grn`` (or of all of them).
+
+        """
+        with self._lock:
+            if secret_version_grn is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(secret_version_grn, None)
+
+    def _get_cached(self, secret_version_grn: str) -> Optional[bytes]:
+        # Return the cached data, if it may be returned, or 'None'.
+        entry = self._entries.get(secret_version_grn)
+        if entry is None:
+            return None
+        if entry.pinned:
+            return entry.data
+
+        age = self._clock() - entry.fetched_at
+        if age < self.ttl * self.refresh_ahead:
+            return entry.data
+        if age < self.ttl + self.max_stale:
+            self._refresh_in_background(secret_version_grn)
+            return entry.data
+        return None
+
+    def _fetch(self, secret_version_grn: str, deadline: Optional[Deadline]) -> bytes:
+        future, is_owner = self._start_fetch(secret_version_grn)
+        if is_owner:
+            return self._run_fetch(secret_version_grn, future, deadline)
+
+        # Another thread is fetching it.
+        try:
+            data: bytes = future.result(None if deadline is None else deadline.remaining())
+        except concurrent.futures.TimeoutError:
+            raise exceptions.DeadlineExceeded(secret_version_grn) from None
+        return data
+
+    def _refresh_in_background(self, secret_version_grn: str) -> None:
+        future, is_owner = self._start_fetch(secret_version_grn)
+        if not is_owner:
+            return
+
+        def refresh() -> None:
+            try:
+                self._run_fetch(secret_version_grn, future, to_deadline(self.refresh_timeout))
+            except Exception:
+                logger.warning(
+                    "Background refresh of secret version '%s' failed.",
+                    secret_version_grn, exc_info=True)
+
+        try:
+            get_executor().submit(refresh)
+        except RuntimeError:
+            # e.g. the executor was shut down (at exit).
+            self._finish_fetch(secret_version_grn)
+
+    def _start_fetch(self, secret_version_grn: str) -> Tuple[concurrent.futures.Future, bool]:
+        # Return the future of the fetch in progress, and whether the caller must make it.
+        with self._lock:
+            future = self._fetches.get(secret_version_grn)
+            if future is not None:
+                return future, False
+            future = self._fetches[secret_version_grn] = concurrent.futures.Future()
+            return future, True
+
+    def _run_fetch(
+        self,
+        secret_version_grn: str,
+        future: concurrent.futures.Future,
+        deadline: Optional[Deadline],
+    ) -> bytes:
+        try:
+            data = access_secret_version(
+                self.api_client, secret_version_grn,
+                circuit_breaker=self.circuit_breaker,
+                timeout=deadline,
+                num_retries=self.num_retries,
+            )
+        except BaseException as exc:
+            self._finish_fetch(secret_version_grn)
+            future.set_exception(exc)
+            raise
+
+        entry = _SecretCacheEntry(
+            data=data,
+            fetched_at=self._clock(),
+            pinned=is_pinned_secret_version_grn(secret_version_grn),
+        )
+        self._finish_fetch(secret_version_grn, entry)
+        future.set_result(data)
+        return data
+
+    def _finish_fetch(
+        self,
+        secret_version_grn: str,
+        entry: _SecretCacheEntry = None,
+    ) -> None:
+        with self._lock:
+            if entry is not None:
+                self._entries[secret_version_grn] = entry
+            self._fetches.pop(secret_version_grn, None)
+
+
+class _SecretCacheEntry(NamedTuple):
+
+    data: bytes
+    # time ('SecretCache._clock') at which the data was fetched
+    fetched_at: float
+    # whether the secret version is a specific version (not an alias such as 'latest')
+    pinned: bool
@@ -0,0 +1,103 @@
+"""
+A mock version of module :mod:`.gcp_secret_manager`.
+
+The code in this module does not make any external requests.
+
+"""
+import base64
+import threading
+from typing import Any, Dict, List, Optional
+
+from . import exceptions
+from .gcp_secret_manager import (  # noqa: F401
+    compose_project_grn,
+    compose_secret_grn,
+    compose_secret_version_grn,
+)
+from .gcp_secret_manager import (  # noqa: F401
+    SECRET_MANAGER_LATEST_SECRET_VERSION_ID,
+    SECRET_MANAGER_SECRET_DATA_MAX_SIZE,
+    SECRET_MANAGER_SECRET_ID_REGEX,
+)
+from .transport import InMemoryTransport
+
+
+###############################################################################
+# in-memory Secret Manager service
+###############################################################################
+
+def create_in_memory_api_client() -> InMemoryTransport:
+    """
+    Create a Secret Manager API client whose requests are handled by an
+    in-memory, per-client, emulation of the Secret Manager service.
+
+    The returned API client is meant to be used with the operations of
+    module :mod:`.gcp_secret_manager`, e.g.::
+
+        api_client = create_in_memory_api_client()
+        secret_grn = gcp_secret_manager.create_secret(api_client, project_grn, 'db-password')
+
+    """
+    return _InMemorySecretManager().create_transport()
+
+
+class _InMemorySecretManager:
+
+    """
+    State and request handlers of an in-memory emulation of the Secret
+    Manager service.
+
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # secret GRN -> data of its versions (version N is at index N - 1)
+        self.secrets: Dict[str, List[bytes]] = {}
+
+    def create_transport(self) -> InMemoryTransport:
+        prefix = 'secretmanager.projects.secrets.'
+        return InMemoryTransport({
+            prefix + 'create': self.create_secret,
+            prefix + 'addVersion': self.add_secret_version,
+            prefix + 'versions.access': self.access_secret_version,
+        })
+
+    def create_secret(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        secret_grn = '{}/secrets/{}'.format(params['parent'], params['secretId'])
+        with self._lock:
+            if secret_grn in self.secrets:
+                raise exceptions.AlreadyExists('Secret [{}]'.format(secret_grn))
+            self.secrets[secret_grn] = []
+        return {'name': secret_grn, 'replication': (body or {}).get('replication')}
+
+    def add_secret_version(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        secret_grn = params['parent']
+        data = base64.b64decode((body or {})['payload']['data'])
+        with self._lock:
+            try:
+                versions = self.secrets[secret_grn]
+            except KeyError:
+                raise exceptions.ResourceNotFound(secret_grn) from None
+            versions.append(data)
+            secret_version_grn = '{}/versions/{}'.format(secret_grn, len(versions))
+        return {'name': secret_version_grn, 'state': 'ENABLED'}
+
+    def access_secret_version(self, params: Dict[str, Any], body: Optional[dict]) -> dict:
+        secret_version_grn = params['name']
+        secret_grn, _, version_id = secret_version_grn.rpartition('/versions/')
+        with self._lock:
+            versions = self.secrets.get(secret_grn)
+            if not versions:
+                raise exceptions.ResourceNotFound(secret_grn)
+            if version_id == SECRET_MANAGER_LATEST_SECRET_VERSION_ID:
+                version_number = len(versions)
+            elif version_id.isdigit() and 1 <= int(version_id) <= len(versions):
+                version_number = int(version_id)
+            else:
+                raise exceptions.ResourceNotFound(secret_version_grn)
+            data = versions[version_number - 1]
+
+        return {
+            'name': '{}/versions/{}'.format(secret_grn, version_number),
+            'payload': {'data': base64.b64encode(data).decode('ascii')},
+        }
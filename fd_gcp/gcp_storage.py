@@ -0,0 +1,715 @@
+"""
+GCP Cloud Storage (GCS) helpers for objects encrypted client-side with KMS.
+
+To learn more about GCS, see https://cloud.google.com/storage/docs/
+
+Objects are encrypted with *envelope encryption*: the data is encrypted with
+a random data key (AES-256-GCM), and the data key is encrypted (*wrapped*)
+with a KMS crypto key, once per object. Encryption and decryption are
+streamed, in segments of :data:`ENCRYPTION_SEGMENT_SIZE` bytes, so objects of
+any size are uploaded and downloaded with bounded memory:
+
+- Uploads are resumable uploads made in chunks. Data is read and encrypted
+  in a background thread while the previous chunks are being uploaded.
+- Downloads are read from the network in a background thread while the
+  previous segments are being decrypted. If the connection breaks, the
+  download is resumed where it stopped.
+
+Usage example, in a GCE environment::
+
+    from fd_gcp.auth import get_gce_credentials
+
+    credentials = get_gce_credentials()
+    storage_api_client = create_api_client(credentials)
+    kms_api_client = gcp_kms.create_api_client(credentials)
+
+    with open('report.csv', 'rb') as source:
+        upload_encrypted_object(
+            storage_api_client, kms_api_client, crypto_key_grn,
+            'my-bucket', 'reports/report.csv', source)
+
+    with open('report.csv', 'wb') as destination:
+        download_decrypted_object(
+            storage_api_client, kms_api_client,
+            'my-bucket', 'reports/report.csv', destination)
+
+Format of encrypted objects (integers are big-endian)::
+
+    header:
+        magic                       4 bytes: b'FDGE'
+        version                     1 byte: 1
+        segment size                4 bytes
+        nonce prefix                7 bytes
+        crypto key GRN length       2 bytes
+        crypto key GRN              UTF-8
+        wrapped data key length     2 bytes
+        wrapped data key
+    segments:
+        encrypted segment           segment size + 16 bytes (the last one may be shorter)
+
+Each segment is encrypted with the header as associated data, and a nonce
+made of the nonce prefix, the index of the segment (4 bytes) and whether it
+is the last one (1 byte), so segments can not be reordered, removed or
+truncated without detection.
+
+All the operations that make requests accept the optional arguments
+``circuit_breaker``, ``timeout`` and ``num_retries`` (see :mod:`.gcp_kms`);
+``timeout`` bounds the whole transfer.
+
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import struct
+from typing import (
+    TYPE_CHECKING, Any, BinaryIO, Dict, Iterable, Iterator, Mapping, NamedTuple, Optional, Tuple,
+)
+
+from . import exceptions
+from . import gcp_kms
+from ._concurrency import iterate_in_background
+from ._http import execute_with_policies
+from ._lazy import make_module_getattr
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, Timeout, to_deadline
+from .exceptions import DecryptionError
+from .gcp_kms_data_keys import generate_data_key
+from .transport import ApiClient, RequestsTransport, expand_path_template
+
+if TYPE_CHECKING:
+    import requests
+
+    from .common import GcpCredentials
+
+
+logger = logging.getLogger(__name__)
+
+# note: 'GcpCredentials' is available as an attribute of this module but, because importing it
+#   is slow, it is imported the first time it is accessed.
+__getattr__ = make_module_getattr(__name__, {
+    'GcpCredentials': ('fd_gcp.common', 'GcpCredentials'),
+})
+
+
+###############################################################################
+# constants
+###############################################################################
+
+# Root URL of the GCS JSON API.
+# https://cloud.google.com/storage/docs/json_api
+STORAGE_API_BASE_URL = 'https://storage.googleapis.com/'
+
+# > The chunk size should be a multiple of 256 KiB (256 x 1024 bytes), unless it's the last chunk
+# > that completes the upload.
+# https://cloud.google.com/storage/docs/performing-resumable-uploads#chunked-upload
+UPLOAD_CHUNK_SIZE_MULTIPLE = 256 * 1024
+
+# Size of the chunks in which objects are uploaded by default.
+UPLOAD_CHUNK_SIZE = 32 * UPLOAD_CHUNK_SIZE_MULTIPLE  # 8 MiB
+
+# Size of the pieces in which objects are read from the network when downloaded.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+# Size of the segments in which data is encrypted (before encryption).
+ENCRYPTION_SEGMENT_SIZE = 64 * 1024  # 64 KiB
+
+# Content type of encrypted objects.
+ENCRYPTED_OBJECT_CONTENT_TYPE = 'application/octet-stream'
+
+_ENCRYPTION_MAGIC = b'FDGE'
+_ENCRYPTION_VERSION = 1
+_ENCRYPTION_HEADER_STRUCT = struct.Struct('>4sBI7s')
+_NONCE_PREFIX_SIZE = 7  # bytes
+_TAG_SIZE = 16  # bytes
+# Max number of segments, bounded by the size of the segment index in the nonce.
+_MAX_NUM_SEGMENTS = 2 ** 32
+
+_UPLOAD_PATH_TEMPLATE = 'upload/storage/v1/b/{bucket}/o'
+_MEDIA_PATH_TEMPLATE = 'storage/v1/b/{bucket}/o/{object}'
+# note: these are the IDs of the API methods in the discovery document.
+_OBJECTS_INSERT_ENDPOINT = 'storage.objects.insert'
+_OBJECTS_GET_ENDPOINT = 'storage.objects.get'
+
+
+class StorageRestApiClient(RequestsTransport):
+
+    """
+    GCS API client that makes requests directly to the JSON API.
+
+    Unlike the API clients of other modules, it must be a
+    :class:`.transport.RequestsTransport`, because uploads and downloads are
+    streamed (which ``googleapiclient`` does not support).
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        credentials: GcpCredentials = None,
+        session: requests.Session = None,
+        pool_maxsize: int = 10,
+        base_url: str = STORAGE_API_BASE_URL,
+    ) -> None:
+        super().__init__(
+            base_url=base_url,
+            credentials=credentials,
+            session=session,
+            pool_maxsize=pool_maxsize,
+        )
+
+
+###############################################################################
+# GCS API operations
+###############################################################################
+
+def create_api_client(credentials: GcpCredentials) -> StorageRestApiClient:
+    """Create a GCS API client.
+
+    .. warning:: Auth checks do not happen here.
+
+    """
+    return StorageRestApiClient(credentials=credentials)
+
+
+def upload_encrypted_object(
+    api_client: StorageRestApiClient,
+    kms_api_client: ApiClient,
+    crypto_key_grn: str,
+    bucket_name: str,
+    object_name: str,
+    source: BinaryIO,
+    metadata: Mapping[str, str] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    max_pending_chunks: int = 2,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> dict:
+    """
+    Encrypt the data read from ``source`` and upload it as an object.
+
+    The object is uploaded with a resumable upload, in chunks. At most
+    ``max_pending_chunks`` chunks are encrypted ahead of the upload, so the
+    memory used is about ``(max_pending_chunks + 2) * chunk_size``. A chunk
+    that fails to be uploaded is retried (up to ``num_retries`` times) from
+    the last byte GCS received.
+
+    :param crypto_key_grn: KMS crypto key the data key is wrapped with
+    :param source: binary file-like object, read until EOF
+    :param metadata: custom metadata of the object
+    :param chunk_size: size of the chunks of the upload; a multiple of
+        :data:`UPLOAD_CHUNK_SIZE_MULTIPLE`
+    :return: the object resource
+    :raises exceptions.ResourceNotFound: e.g. if the bucket does not exist
+
+    """
+    if chunk_size <= 0 or chunk_size % UPLOAD_CHUNK_SIZE_MULTIPLE:
+        raise ValueError("Value of 'chunk_size' must be a positive multiple of 256 KiB.")
+
+    deadline = to_deadline(timeout)
+    # note: the data key is wrapped (in the background thread) while the upload is started.
+    encrypted_data = encrypt_stream(
+        kms_api_client, crypto_key_grn, source,
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+    chunks = iterate_in_background(
+        _iter_chunks(encrypted_data, chunk_size), max_buffered=max_pending_chunks)
+
+    try:
+        upload = _ResumableUpload(
+            api_client,
+            _start_resumable_upload(
+                api_client, bucket_name, object_name, metadata,
+                circuit_breaker, deadline, num_retries),
+        )
+        for chunk, is_last in chunks:
+            execute_with_policies(
+                _OBJECTS_INSERT_ENDPOINT,
+                lambda attempt_deadline: upload.send_chunk(chunk, is_last, attempt_deadline),
+                circuit_breaker=circuit_breaker,
+                timeout=deadline,
+                num_retries=num_retries,
+            )
+    finally:
+        chunks.close()
+
+    assert upload.resource is not None
+    return upload.resource
+
+
+def iter_decrypted_object(
+    api_client: StorageRestApiClient,
+    kms_api_client: ApiClient,
+    bucket_name: str,
+    object_name: str,
+    crypto_key_grn: str = None,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    max_pending_chunks: int = 2,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> Iterator[bytes]:
+    """
+    Download an object uploaded with :func:`upload_encrypted_object` and
+    return an iterator of its decrypted data, in pieces.
+
+    The object is read from the network in a background thread, up to
+    ``max_pending_chunks`` chunks (of ``chunk_size`` bytes) ahead of the
+    decryption. If the connection breaks, the download is resumed (up to
+    ``num_retries`` times) from the last byte received.
+
+    .. warning:: data is returned as soon as it is decrypted, i.e. before
+        the whole object has been verified; if it is not valid,
+        :class:`.exceptions.DecryptionError` is raised by the iterator after some data
+        may have been returned.
+
+    :param crypto_key_grn: if not ``None``, the crypto key the data key must
+        be wrapped with
+    :raises exceptions.ResourceNotFound: if the object does not exist
+    :raises exceptions.DecryptionError:
+
+    """
+    deadline = to_deadline(timeout)
+    encrypted_chunks = iterate_in_background(
+        _iter_object_media(
+            api_client, bucket_name, object_name, chunk_size,
+            circuit_breaker, deadline, num_retries),
+        max_buffered=max_pending_chunks,
+    )
+    try:
+        yield from decrypt_stream(
+            kms_api_client, encrypted_chunks, crypto_key_grn=crypto_key_grn,
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+    finally:
+        encrypted_chunks.close()
+
+
+def download_decrypted_object(
+    api_client: StorageRestApiClient,
+    kms_api_client: ApiClient,
+    bucket_name: str,
+    object_name: str,
+    destination: BinaryIO,
+    crypto_key_grn: str = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> int:
+    """
+    Like :func:`iter_decrypted_object` but write the decrypted data to
+    ``destination``.
+
+    :return: size of the decrypted data
+
+    """
+    size = 0
+    for data in iter_decrypted_object(
+        api_client, kms_api_client, bucket_name, object_name,
+        crypto_key_grn=crypto_key_grn,
+        circuit_breaker=circuit_breaker,
+        timeout=timeout,
+        num_retries=num_retries,
+    ):
+        destination.write(data)
+        size += len(data)
+    return size
+
+
+###############################################################################
+# envelope encryption
+###############################################################################
+
+def encrypt_stream(
+    kms_api_client: ApiClient,
+    crypto_key_grn: str,
+    source: BinaryIO,
+    segment_size: int = ENCRYPTION_SEGMENT_SIZE,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> Iterator[bytes]:
+    """
+    Return an iterator of the encrypted data of the data read from ``source``
+    (see the format in the module's docstring).
+
+    A random data key is generated and wrapped with the crypto key
+    ``crypto_key_grn`` (the only request to KMS).
+
+    """
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    if not 0 < segment_size < 2 ** 32:
+        raise ValueError("Value of 'segment_size' is invalid.")
+
+    data_key = generate_data_key(
+        kms_api_client, crypto_key_grn,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+    header = _EncryptionHeader(
+        segment_size=segment_size,
+        nonce_prefix=os.urandom(_NONCE_PREFIX_SIZE),
+        crypto_key_grn=crypto_key_grn,
+        wrapped_data_key=data_key.wrapped_key,
+    )
+    header_bytes = header.to_bytes()
+    aesgcm = AESGCM(data_key.key)
+    yield header_bytes
+
+    # note: a segment is the last one if there is no data after it, so reading is one segment ahead.
+    segment = _read_fully(source, segment_size)
+    index = 0
+    while True:
+        next_segment = _read_fully(source, segment_size) if len(segment) == segment_size else b''
+        is_last = not next_segment
+        if index >= _MAX_NUM_SEGMENTS:
+            raise ValueError("Data is too large to be encrypted.")
+        yield aesgcm.encrypt(header.compute_nonce(index, is_last), segment, header_bytes)
+        if is_last:
+            return
+        segment = next_segment
+        index += 1
+
+
+def decrypt_stream(
+    kms_api_client: ApiClient,
+    encrypted_chunks: Iterable[bytes],
+    crypto_key_grn: str = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> Iterator[bytes]:
+    """
+    Return an iterator of the decrypted data of the data encrypted by
+    :func:`encrypt_stream`, given in chunks of any size.
+
+    :param crypto_key_grn: if not ``None``, the crypto key the data key must
+        be wrapped with
+    :raises exceptions.DecryptionError:
+
+    """
+    import cryptography.exceptions
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+    buffer = bytearray()
+    chunks = iter(encrypted_chunks)
+    header = None
+    for chunk in chunks:
+        buffer += chunk
+        header, header_size = _EncryptionHeader.from_bytes(buffer)
+        if header is not None:
+            break
+    if header is None:
+        raise DecryptionError("Encrypted data is truncated (incomplete header).")
+    if crypto_key_grn is not None and header.crypto_key_grn != crypto_key_grn:
+        raise DecryptionError("Data key is not wrapped with the expected crypto key.")
+
+    header_bytes = bytes(buffer[:header_size])
+    del buffer[:header_size]
+    data_key = gcp_kms.decrypt(
+        kms_api_client, header.crypto_key_grn, header.wrapped_data_key,
+        circuit_breaker=circuit_breaker, timeout=timeout, num_retries=num_retries)
+    aesgcm = AESGCM(data_key)
+
+    def decrypt(encrypted_segment: bytes, index: int, is_last: bool) -> bytes:
+        try:
+            return aesgcm.decrypt(
+                header.compute_nonce(index, is_last), encrypted_segment, header_bytes)
+        except cryptography.exceptions.InvalidTag:
+            raise DecryptionError(
+                "Segment {} of the encrypted data is not valid.".format(index)) from None
+
+    # note: a segment is the last one if there is no data after it, so the buffer holds (at least)
+    #   one byte more than a segment before decrypting it.
+    encrypted_segment_size = header.segment_size + _TAG_SIZE
+    index = 0
+    while True:
+        while len(buffer) > encrypted_segment_size:
+            yield decrypt(bytes(buffer[:encrypted_segment_size]), index, False)
+            del buffer[:encrypted_segment_size]
+            index += 1
+        next_chunk = next(chunks, None)
+        if next_chunk is None:
+            break
+        buffer += next_chunk
+
+    if len(buffer) < _TAG_SIZE:
+        raise DecryptionError("Encrypted data is truncated.")
+    yield decrypt(bytes(buffer), index, True)
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+class _EncryptionHeader(NamedTuple):
+
+    segment_size: int
+    nonce_prefix: bytes
+    crypto_key_grn: str
+    wrapped_data_key: bytes
+
+    def to_bytes(self) -> bytes:
+        crypto_key_grn = self.crypto_key_grn.encode('utf-8')
+        return b''.join((
+            _ENCRYPTION_HEADER_STRUCT.pack(
+                _ENCRYPTION_MAGIC, _ENCRYPTION_VERSION, self.segment_size, self.nonce_prefix),
+            struct.pack('>H', len(crypto_key_grn)), crypto_key_grn,
+            struct.pack('>H', len(self.wrapped_data_key)), self.wrapped_data_key,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data: bytearray) -> Tuple[Optional[_EncryptionHeader], int]:
+        # Return the header at the start of 'data' and its size, or 'None' if it is incomplete.
+        offset = _ENCRYPTION_HEADER_STRUCT.size
+        if len(data) < offset:
+            return None, 0
+        magic, version, segment_size, nonce_prefix = _ENCRYPTION_HEADER_STRUCT.unpack_from(data)
+        if magic != _ENCRYPTION_MAGIC:
+            raise DecryptionError("Data was not encrypted by this module.")
+        if version != _ENCRYPTION_VERSION:
+            raise DecryptionError("Encryption version {} is not supported.".format(version))
+        if segment_size == 0:
+            raise DecryptionError("Encryption header is not valid.")
+
+        fields = []
+        for _ in range(2):
+            if len(data) < offset + 2:
+                return None, 0
+            (size,) = struct.unpack_from('>H', data, offset)
+            if len(data) < offset + 2 + size:
+                return None, 0
+            fields.append(bytes(data[offset + 2:offset + 2 + size]))
+            offset += 2 + size
+
+        try:
+            crypto_key_grn = fields[0].decode('utf-8')
+        except UnicodeDecodeError:
+            raise DecryptionError("Encryption header is not valid.") from None
+        return cls(segment_size, nonce_prefix, crypto_key_grn, fields[1]), offset
+
+    def compute_nonce(self, index: int, is_last: bool) -> bytes:
+        return self.nonce_prefix + struct.pack('>I?', index, is_last)
+
+
+class _ResumableUpload:
+
+    """
+    State of a resumable upload, whose chunks are sent in order.
+
+    """
+
+    def __init__(self, api_client: StorageRestApiClient, session_url: str) -> None:
+        self.api_client = api_client
+        self.session_url = session_url
+        # Number of bytes GCS has received (and of the chunks sent before the current one).
+        self.offset = 0
+        self.chunk_start = 0
+        # Whether the offset must be queried, i.e. the last request failed.
+        self.offset_unknown = False
+        self.resource: Optional[dict] = None
+
+    def send_chunk(self, chunk: bytes, is_last: bool, deadline: Optional[Deadline]) -> None:
+        """
+        Send (what GCS has not received of) ``chunk``.
+
+        """
+        if self.offset_unknown:
+            self._send(None, 'bytes */*', deadline)
+        if self.offset < self.chunk_start:
+            # note: GCS lost data it had confirmed; the upload can not be resumed.
+            raise exceptions.UnrecognizedApiError(
+                "Resumable upload lost data it had received.")
+
+        chunk_end = self.chunk_start + len(chunk)
+        total = str(chunk_end) if is_last else '*'
+        while self.resource is None and self.offset < chunk_end:
+            data = chunk[self.offset - self.chunk_start:]
+            content_range = 'bytes {}-{}/{}'.format(self.offset, chunk_end - 1, total)
+            self._send(data, content_range, deadline)
+        if is_last and self.resource is None:
+            # note: e.g. GCS had received the whole chunk before the previous attempt failed.
+            self._send(None, 'bytes */{}'.format(chunk_end), deadline)
+        self.chunk_start = chunk_end
+
+    def _send(
+        self,
+        data: Optional[bytes],
+        content_range: str,
+        deadline: Optional[Deadline],
+    ) -> None:
+        self.offset_unknown = True
+        response = _request(
+            self.api_client, 'PUT', self.session_url, _OBJECTS_INSERT_ENDPOINT, deadline,
+            data=data or b'', headers={'Content-Range': content_range}, allow_redirects=False)
+
+        if response.status_code == 308:
+            # 'Range: bytes=0-<last byte received>', absent if no bytes were received.
+            range_header = response.headers.get('Range')
+            self.offset = int(range_header.rsplit('-', 1)[1]) + 1 if range_header else 0
+        elif response.status_code in (200, 201):
+            self.resource = response.json()
+        else:
+            raise exceptions.UnrecognizedApiError(
+                "Unexpected response status {}.".format(response.status_code))
+        self.offset_unknown = False
+
+
+def _start_resumable_upload(
+    api_client: StorageRestApiClient,
+    bucket_name: str,
+    object_name: str,
+    metadata: Optional[Mapping[str, str]],
+    circuit_breaker: Optional[CircuitBreaker],
+    deadline: Optional[Deadline],
+    num_retries: int,
+) -> str:
+    # Return the URL of the upload session.
+    path, _ = expand_path_template(_UPLOAD_PATH_TEMPLATE, {'bucket': bucket_name})
+    url = api_client.base_url + path + '?uploadType=resumable'
+    resource: Dict[str, Any] = {
+        'name': object_name,
+        'contentType': ENCRYPTED_OBJECT_CONTENT_TYPE,
+    }
+    if metadata:
+        resource['metadata'] = dict(metadata)
+
+    def execute_attempt(attempt_deadline: Optional[Deadline]) -> str:
+        response = _request(
+            api_client, 'POST', url, _OBJECTS_INSERT_ENDPOINT, attempt_deadline,
+            data=json.dumps(resource).encode('utf-8'),
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+                'X-Upload-Content-Type': ENCRYPTED_OBJECT_CONTENT_TYPE,
+            },
+        )
+        try:
+            session_url: str = response.headers['Location']
+        except KeyError:
+            raise exceptions.UnrecognizedApiError(
+                "Response to start a resumable upload has no 'Location'.") from None
+        return session_url
+
+    return execute_with_policies(
+        _OBJECTS_INSERT_ENDPOINT, execute_attempt,
+        circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries)
+
+
+def _iter_object_media(
+    api_client: StorageRestApiClient,
+    bucket_name: str,
+    object_name: str,
+    chunk_size: int,
+    circuit_breaker: Optional[CircuitBreaker],
+    deadline: Optional[Deadline],
+    num_retries: int,
+) -> Iterator[bytes]:
+    # Yield the data of an object, resuming the download if the connection breaks.
+    import requests
+
+    path, _ = expand_path_template(
+        _MEDIA_PATH_TEMPLATE, {'bucket': bucket_name, 'object': object_name})
+    url = api_client.base_url + path + '?alt=media'
+    offset = 0
+    generation = None
+    num_failures = 0
+
+    while True:
+        resumed_url = url
+        headers: Dict[str, str] = {}
+        if generation is not None:
+            # note: the same generation must be read, in case the object was overwritten.
+            resumed_url += '&ifGenerationMatch={}'.format(generation)
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+        response = execute_with_policies(
+            _OBJECTS_GET_ENDPOINT,
+            lambda attempt_deadline: _request(
+                api_client, 'GET', resumed_url, _OBJECTS_GET_ENDPOINT, attempt_deadline,
+                headers=headers, stream=True),
+            circuit_breaker=circuit_breaker, timeout=deadline, num_retries=num_retries,
+        )
+        generation = response.headers.get('x-goog-generation')
+        expected_size = offset + int(response.headers.get('Content-Length', 0))
+
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                # note: 'requests' only bounds each read from the socket, so a download that
+                #   trickles in would not be stopped at the deadline otherwise.
+                if deadline is not None:
+                    deadline.check(_OBJECTS_GET_ENDPOINT)
+                offset += len(chunk)
+                yield chunk
+            if offset >= expected_size:
+                return
+            error: Exception = ConnectionError("Download ended before the end of the object.")
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as exc:
+            error = exc
+        finally:
+            response.close()
+
+        if num_failures >= num_retries or generation is None:
+            raise exceptions.UnrecognizedApiError(
+                "Download of object failed: {!r}.".format(error)) from error
+        num_failures += 1
+        logger.info(
+            "Download of object '%s' failed (%r). Resuming at byte %d.",
+            object_name, error, offset)
+
+
+def _request(
+    api_client: StorageRestApiClient,
+    http_method: str,
+    url: str,
+    endpoint: str,
+    deadline: Optional[Deadline],
+    **kwargs: Any,
+) -> requests.Response:
+    import google.auth.exceptions
+    import requests
+
+    timeout = None if deadline is None else max(deadline.remaining(), 0.001)
+    try:
+        response = api_client.session.request(http_method, url, timeout=timeout, **kwargs)
+    except google.auth.exceptions.GoogleAuthError as exc:
+        raise exceptions.AuthError from exc
+    except requests.Timeout as exc:
+        if deadline is not None:
+            raise exceptions.DeadlineExceeded(endpoint) from exc
+        raise
+
+    if response.status_code >= 400:
+        content = response.content
+        response.close()
+        raise exceptions.process_api_http_error(
+            response.status_code, content, url, response.reason or '')
+    return response
+
+
+def _iter_chunks(data: Iterable[bytes], chunk_size: int) -> Iterator[Tuple[bytes, bool]]:
+    # Regroup 'data' into chunks of 'chunk_size' bytes (except the last one), and whether each
+    #   chunk is the last one.
+    buffer = bytearray()
+    for piece in data:
+        buffer += piece
+        # note: a chunk is the last one if there is no data after it.
+        while len(buffer) > chunk_size:
+            yield bytes(buffer[:chunk_size]), False
+            del buffer[:chunk_size]
+    yield bytes(buffer), True
+
+
+def _read_fully(source: BinaryIO, size: int) -> bytes:
+    # Read 'size' bytes, or fewer only at EOF (unlike a single 'read' of e.g. a pipe or socket).
+    data = source.read(size)
+    if len(data) == size or not data:
+        return data
+    pieces = [data]
+    remaining = size - len(data)
+    while remaining:
+        piece = source.read(remaining)
+        if not piece:
+            break
+        pieces.append(piece)
+        remaining -= len(piece)
+    return b''.join(pieces)
@@ -0,0 +1,298 @@
+"""
+A local stand-in of the GCS JSON API, for testing module :mod:`.gcp_storage`.
+
+The code in this module does not make any external requests.
+
+Only what :mod:`.gcp_storage` uses is emulated: resumable uploads (in
+chunks) and downloads of objects' data (including ranges).
+
+Usage example::
+
+    server = StorageHttpServer()
+    server.start()
+    storage_api_client = gcp_storage.StorageRestApiClient(
+        session=requests.Session(), base_url=server.base_url)
+    ...
+    server.stop()
+
+"""
+import http.server
+import json
+import logging
+import re
+import threading
+import urllib.parse
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, cast
+
+from .gcp_storage import UPLOAD_CHUNK_SIZE_MULTIPLE
+
+
+logger = logging.getLogger(__name__)
+
+_UPLOAD_PATH_REGEX = re.compile(r'^/upload/storage/v1/b/(?P<bucket>[^/]+)/o$')
+_OBJECT_PATH_REGEX = re.compile(r'^/storage/v1/b/(?P<bucket>[^/]+)/o/(?P<object>[^/]+)$')
+_CONTENT_RANGE_REGEX = re.compile(
+    r'^bytes (?:(?P<first>\d+)-(?P<last>\d+)|\*)/(?P<total>\d+|\*)$')
+_RANGE_REGEX = re.compile(r'^bytes=(?P<first>\d+)-$')
+
+# Size of the pieces in which the data of objects is sent.
+_WRITE_SIZE = 64 * 1024
+
+
+class StoredObject(NamedTuple):
+
+    data: bytes
+    resource: dict
+
+
+class _Upload(NamedTuple):
+
+    bucket_name: str
+    resource: dict
+    data: bytearray
+
+
+class StorageHttpServer(http.server.ThreadingHTTPServer):
+
+    """
+    HTTP server of (part of) the GCS JSON API, whose objects are kept in
+    memory, in :attr:`objects`.
+
+    To test how failures are handled, :attr:`error_statuses` and
+    :attr:`download_truncations` alter the responses to the next requests.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, server_address: Tuple[str, int] = ('127.0.0.1', 0)) -> None:
+        """Constructor.
+
+        :param server_address: host and port; if the port is 0, a free one is chosen
+
+        """
+        self._lock = threading.Lock()
+        # (bucket name, object name) -> object
+        self.objects: Dict[Tuple[str, str], StoredObject] = {}
+        self.buckets: Set[str] = set()
+        # Statuses of error responses to the next requests, by HTTP method (e.g. '{'PUT': [503]}').
+        self.error_statuses: Dict[str, List[int]] = {}
+        # Sizes the data of the responses to the next downloads are truncated to (the connection
+        #   is closed).
+        self.download_truncations: List[int] = []
+        # (HTTP method, path) of every request.
+        self.requests: List[Tuple[str, str]] = []
+        self._uploads: Dict[str, _Upload] = {}
+        self._next_generation = 1
+        self._thread: Optional[threading.Thread] = None
+        super().__init__(server_address, _StorageHttpRequestHandler)
+
+    @property
+    def base_url(self) -> str:
+        # note: the address is of an 'AF_INET' socket.
+        host, port = cast(Tuple[str, int], self.server_address[:2])
+        return 'http://{}:{}/'.format(host, port)
+
+    def create_bucket(self, bucket_name: str) -> None:
+        with self._lock:
+            self.buckets.add(bucket_name)
+
+    def start(self) -> None:
+        """
+        Serve requests in a background (daemon) thread.
+
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name='fd_gcp-storage-http-server', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def start_upload(self, bucket_name: str, resource: dict) -> Tuple[int, dict, bytes]:
+        with self._lock:
+            if bucket_name not in self.buckets:
+                return _encode_error(404, 'The specified bucket does not exist.')
+            upload_id = uuid.uuid4().hex
+            self._uploads[upload_id] = _Upload(bucket_name, resource, bytearray())
+        location = '{}upload/storage/v1/b/{}/o?uploadType=resumable&upload_id={}'.format(
+            self.base_url, bucket_name, upload_id)
+        return 200, {'Location': location}, b''
+
+    def continue_upload(
+        self,
+        upload_id: str,
+        content_range: str,
+        content: bytes,
+    ) -> Tuple[int, dict, bytes]:
+        match = _CONTENT_RANGE_REGEX.match(content_range)
+        if match is None:
+            return _encode_error(400, 'Invalid Content-Range.')
+
+        with self._lock:
+            try:
+                upload = self._uploads[upload_id]
+            except KeyError:
+                return _encode_error(404, 'No such upload.')
+
+            received = len(upload.data)
+            if match.group('first') is not None:
+                first, last = int(match.group('first')), int(match.group('last'))
+                if first > received or last - first + 1 != len(content):
+                    return _encode_error(400, 'Invalid Content-Range.')
+                if match.group('total') == '*' and (last + 1) % UPLOAD_CHUNK_SIZE_MULTIPLE:
+                    return _encode_error(400, 'Chunk size is not a multiple of 256 KiB.')
+                # note: data GCS has already received is ignored.
+                upload.data.extend(content[received - first:])
+
+            if match.group('total') != '*' and int(match.group('total')) == len(upload.data):
+                del self._uploads[upload_id]
+                return 200, {}, json.dumps(self._store(upload)).encode('utf-8')
+
+        headers = {'Range': 'bytes=0-{}'.format(len(upload.data) - 1)} if upload.data else {}
+        return 308, headers, b''
+
+    def get_object(
+        self,
+        bucket_name: str,
+        object_name: str,
+        query: Dict[str, str],
+    ) -> Optional[StoredObject]:
+        with self._lock:
+            stored_object = self.objects.get((bucket_name, object_name))
+        if stored_object is None:
+            return None
+        generation = query.get('ifGenerationMatch')
+        if generation is not None and generation != stored_object.resource['generation']:
+            return None
+        return stored_object
+
+    def _store(self, upload: _Upload) -> dict:
+        resource = dict(upload.resource)
+        resource.update(
+            bucket=upload.bucket_name,
+            generation=str(self._next_generation),
+            size=str(len(upload.data)),
+        )
+        self._next_generation += 1
+        self.objects[(upload.bucket_name, resource['name'])] = StoredObject(
+            bytes(upload.data), resource)
+        return resource
+
+
+class _StorageHttpRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    # note: see 'gcp_kms_mock._KmsHttpRequestHandler'.
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: StorageHttpServer
+
+    def do_POST(self) -> None:
+        path, query = self._parse_url()
+        content = self._read_content()
+        if self._respond_injected_error():
+            return
+        match = _UPLOAD_PATH_REGEX.match(path)
+        if match is None or query.get('uploadType') != 'resumable':
+            self._respond(*_encode_error(404, 'Not Found'))
+            return
+        self._respond(*self.server.start_upload(
+            urllib.parse.unquote(match.group('bucket')), json.loads(content)))
+
+    def do_PUT(self) -> None:
+        path, query = self._parse_url()
+        content = self._read_content()
+        if self._respond_injected_error():
+            return
+        if _UPLOAD_PATH_REGEX.match(path) is None or 'upload_id' not in query:
+            self._respond(*_encode_error(404, 'Not Found'))
+            return
+        self._respond(*self.server.continue_upload(
+            query['upload_id'], self.headers.get('Content-Range', ''), content))
+
+    def do_GET(self) -> None:
+        path, query = self._parse_url()
+        if self._respond_injected_error():
+            return
+        match = _OBJECT_PATH_REGEX.match(path)
+        if match is None or query.get('alt') != 'media':
+            self._respond(*_encode_error(404, 'Not Found'))
+            return
+
+        bucket_name = urllib.parse.unquote(match.group('bucket'))
+        object_name = urllib.parse.unquote(match.group('object'))
+        stored_object = self.server.get_object(bucket_name, object_name, query)
+        if stored_object is None:
+            if 'ifGenerationMatch' in query:
+                self._respond(*_encode_error(
+                    412, 'At least one of the pre-conditions you specified did not hold.'))
+            else:
+                self._respond(*_encode_error(
+                    404, 'No such object: {}/{}'.format(bucket_name, object_name)))
+            return
+
+        status, first = 200, 0
+        range_match = _RANGE_REGEX.match(self.headers.get('Range', ''))
+        if range_match is not None:
+            status, first = 206, int(range_match.group('first'))
+        data = stored_object.data[first:]
+
+        with self.server._lock:
+            truncation = (
+                self.server.download_truncations.pop(0)
+                if self.server.download_truncations else None)
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Content-Type', stored_object.resource.get('contentType', ''))
+        self.send_header('x-goog-generation', stored_object.resource['generation'])
+        self.end_headers()
+        if truncation is not None:
+            data = data[:truncation]
+            self.close_connection = True
+        for offset in range(0, len(data), _WRITE_SIZE):
+            self.wfile.write(data[offset:offset + _WRITE_SIZE])
+
+    def log_message(self, format: str, *args: object) -> None:
+        logger.debug(format, *args)
+
+    def _parse_url(self) -> Tuple[str, Dict[str, str]]:
+        split_url = urllib.parse.urlsplit(self.path)
+        with self.server._lock:
+            self.server.requests.append((self.command, split_url.path))
+        query = {
+            name: values[-1]
+            for name, values in urllib.parse.parse_qs(split_url.query).items()
+        }
+        return split_url.path, query
+
+    def _read_content(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def _respond_injected_error(self) -> bool:
+        with self.server._lock:
+            statuses = self.server.error_statuses.get(self.command)
+            if not statuses:
+                return False
+            status = statuses.pop(0)
+        self._respond(*_encode_error(status, 'Injected error.'))
+        return True
+
+    def _respond(self, status: int, headers: Dict[str, str], content: bytes) -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _encode_error(status: int, message: str) -> Tuple[int, dict, bytes]:
+    content = json.dumps({'error': {'code': status, 'message': message}}).encode('utf-8')
+    return status, {'Content-Type': 'application/json; charset=UTF-8'}, content
@@ -0,0 +1,899 @@
+"""
+Load generator of KMS encrypt/decrypt operations, for capacity planning.
+
+Runs the operations :func:`.gcp_kms.encrypt` and :func:`.gcp_kms.decrypt`
+with a crypto key for a period of time and reports the throughput and the
+latency percentiles of each operation.
+
+- Operations, and the sizes of their payloads, are chosen randomly with the
+  given weights (e.g. 3 encryptions per decryption).
+- Closed-loop mode (the default): each worker makes its requests back to
+  back. Target-rate mode (``rate``): requests are scheduled at a fixed rate,
+  regardless of how long previous ones take. In this mode latencies are
+  measured from the time each request was scheduled, so the delay of
+  requests that were late because all the workers were busy is accounted
+  for (i.e. "coordinated omission" is corrected).
+- Concurrency models: ``threads``; ``asyncio``, where workers are tasks of
+  an event loop that run operations in a thread pool (like an ``asyncio``
+  application would); and ``processes``, where workers are split among
+  processes (each with its own API clients), to drive more load than a
+  single interpreter can.
+- Latencies are recorded in a :class:`LatencyHistogram`, in the manner of
+  HdrHistogram.
+
+Requests are made to the KMS API or to a local stand-in of it (see
+:class:`.gcp_kms_mock.KmsHttpServer`), so that the client itself can be
+benchmarked offline.
+
+Command-line usage (console script ``fd-gcp-loadgen``)::
+
+    # Against a stand-in of the KMS API, started in-process.
+    fd-gcp-loadgen run --emulator --duration 30 --concurrency 16 \\
+        --mix encrypt=3,decrypt=1 --payload-sizes 64,1024,16384=0.5
+
+    # Against the KMS API, at a target rate.
+    fd-gcp-loadgen run --rate 500 --concurrency 64 --duration 60 \\
+        --crypto-key-grn projects/p/locations/global/keyRings/r/cryptoKeys/k
+
+    # A stand-in of the KMS API, for load generators in other processes or hosts
+    #   (run with '--base-url http://127.0.0.1:8085/').
+    fd-gcp-loadgen emulator --port 8085
+
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Counter, Dict, List, NamedTuple, Optional
+
+from . import gcp_kms
+from .auth import CredentialsSpec
+from .resource_cache import ResourceCache
+
+if TYPE_CHECKING:
+    import requests
+
+    from .transport import ApiClient
+
+
+OPERATION_ENCRYPT = 'encrypt'
+OPERATION_DECRYPT = 'decrypt'
+OPERATIONS = (OPERATION_ENCRYPT, OPERATION_DECRYPT)
+
+MODEL_THREADS = 'threads'
+MODEL_ASYNCIO = 'asyncio'
+MODEL_PROCESSES = 'processes'
+MODELS = (MODEL_THREADS, MODEL_ASYNCIO, MODEL_PROCESSES)
+
+# Crypto key created in the stand-in of the KMS API when none is given.
+DEFAULT_EMULATOR_CRYPTO_KEY_GRN = (
+    'projects/loadgen/locations/global/keyRings/loadgen/cryptoKeys/loadgen')
+
+REPORT_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+###############################################################################
+# latency histogram
+###############################################################################
+
+class LatencyHistogram:
+
+    """
+    Histogram of latencies, with buckets of bounded relative width (like
+    HdrHistogram).
+
+    Latencies are recorded with a resolution of 1 microsecond and a relative
+    error below ``2 ** (1 - sub_bucket_bits)`` (i.e. below 1 % by default),
+    in memory that grows with the logarithm of the range of the values.
+
+    Instances are not thread-safe: workers record latencies in histograms
+    of their own, which are merged afterwards.
+
+    """
+
+    def __init__(self, sub_bucket_bits: int = 8) -> None:
+        self.sub_bucket_bits = sub_bucket_bits
+        # bucket index -> count
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, latency: float) -> None:
+        """
+        Record a latency (seconds).
+
+        """
+        index = self._get_bucket_index(max(int(latency * 1_000_000), 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += latency
+        if self.min is None or latency < self.min:
+            self.min = latency
+        if self.max is None or latency > self.max:
+            self.max = latency
+
+    def merge(self, other: LatencyHistogram) -> None:
+        """
+        Add the latencies recorded in ``other``.
+
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("Histograms have different resolutions.")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Return the latency (seconds) below or at which ``percentile`` percent
+        of the recorded latencies are, or ``None`` if there are none.
+
+        Like HdrHistogram, the highest value of the bucket is returned, so the
+        returned value is never below the actual one.
+
+        """
+        if not 0 <= percentile <= 100:
+            raise ValueError("Value of 'percentile' must be between 0 and 100.")
+        if not self.count:
+            return None
+        assert self.max is not None
+
+        rank = max(math.ceil(percentile / 100 * self.count), 1)
+        cumulative_count = 0
+        for index in sorted(self.counts):
+            cumulative_count += self.counts[index]
+            if cumulative_count >= rank:
+                return min(self._get_bucket_highest_value(index) / 1_000_000, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'percentiles': {
+                str(percentile): self.percentile(percentile) for percentile in REPORT_PERCENTILES
+            },
+        }
+
+    def _get_bucket_index(self, value: int) -> int:
+        # Values (microseconds) below '2 ** sub_bucket_bits' have buckets of their own; above,
+        #   values share a bucket with those that have the same bit length and top bits.
+        shift = max(value.bit_length() - self.sub_bucket_bits, 0)
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def _get_bucket_highest_value(self, index: int) -> int:
+        shift = index >> self.sub_bucket_bits
+        top = index & ((1 << self.sub_bucket_bits) - 1)
+        return ((top + 1) << shift) - 1
+
+
+###############################################################################
+# load generation
+###############################################################################
+
+class LoadgenTarget(NamedTuple):
+
+    """
+    The crypto key to make requests with, and how to make them.
+
+    """
+
+    crypto_key_grn: str
+    # base URL of a stand-in of the KMS API; if 'None', requests are made to the KMS API
+    base_url: Optional[str] = None
+    # 'requests' or 'googleapiclient' (see 'gcp_kms.create_api_client')
+    transport: str = 'requests'
+    # if 'None', the environment's default credentials
+    credentials: Optional[CredentialsSpec] = None
+
+    def create_api_client(self, pool_maxsize: int = 10) -> ApiClient:
+        if self.base_url is not None:
+            if self.transport != 'requests':
+                raise ValueError("A stand-in of the KMS API requires transport 'requests'.")
+            return gcp_kms.KmsRestApiClient(
+                session=_create_unauthorized_session(pool_maxsize), base_url=self.base_url)
+
+        credentials = (self.credentials or CredentialsSpec.env_default()).load()
+        if self.transport == 'requests':
+            return gcp_kms.KmsRestApiClient(credentials=credentials, pool_maxsize=pool_maxsize)
+        return gcp_kms.create_api_client(credentials, transport=self.transport)
+
+
+class LoadgenConfig(NamedTuple):
+
+    # operation -> weight
+    operations: Dict[str, float] = {OPERATION_ENCRYPT: 1.0, OPERATION_DECRYPT: 1.0}
+    # payload size (bytes) -> weight
+    payload_sizes: Dict[int, float] = {1024: 1.0}
+    # seconds during which latencies are recorded
+    duration: float = 10.0
+    # seconds before 'duration' during which latencies are not recorded (e.g. while
+    #   connections are opened)
+    warmup: float = 0.0
+    # number of workers (in all processes)
+    concurrency: int = 8
+    # if not 'None', target rate (operations per second, in all processes)
+    rate: Optional[float] = None
+    # 'threads', 'asyncio' or 'processes'
+    model: str = MODEL_THREADS
+    # number of processes of model 'processes'; if 'None', the number of CPUs
+    processes: Optional[int] = None
+    # timeout and number of retries of each operation
+    timeout: Optional[float] = None
+    num_retries: int = 0
+    seed: Optional[int] = None
+
+
+class LoadgenReport(NamedTuple):
+
+    # seconds during which latencies were recorded
+    duration: float
+    # operation -> latencies of successful operations
+    histograms: Dict[str, LatencyHistogram]
+    # '<operation>: <error type>' -> count
+    errors: Dict[str, int]
+
+    @property
+    def num_operations(self) -> int:
+        return sum(histogram.count for histogram in self.histograms.values())
+
+    @property
+    def throughput(self) -> float:
+        """
+        Successful operations per second.
+
+        """
+        return self.num_operations / self.duration if self.duration > 0 else 0.0
+
+    def get_total_histogram(self) -> LatencyHistogram:
+        total_histogram = LatencyHistogram()
+        for histogram in self.histograms.values():
+            total_histogram.merge(histogram)
+        return total_histogram
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'duration': self.duration,
+            'num_operations': self.num_operations,
+            'throughput': self.throughput,
+            'latencies': {
+                operation: histogram.to_dict()
+                for operation, histogram in sorted(self.histograms.items())
+            },
+            'total_latencies': self.get_total_histogram().to_dict(),
+            'errors': dict(self.errors),
+        }
+
+    def format(self) -> str:
+        """
+        Return the report as a text table (latencies in milliseconds).
+
+        """
+        lines = [
+            "Operations: {} in {:.2f} s ({:.1f} ops/s), errors: {}.".format(
+                self.num_operations, self.duration, self.throughput, sum(self.errors.values())),
+            '{:<10} {:>8} {:>9} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'.format(
+                'operation', 'count', 'ops/s', 'mean', 'p50', 'p90', 'p99', 'p99.9', 'max'),
+        ]
+        rows = sorted(self.histograms.items()) + [('all', self.get_total_histogram())]
+        for operation, histogram in rows:
+            values = [histogram.mean] + [
+                histogram.percentile(percentile) for percentile in REPORT_PERCENTILES
+            ] + [histogram.max]
+            lines.append('{:<10} {:>8} {:>9.1f} {}'.format(
+                operation, histogram.count,
+                histogram.count / self.duration if self.duration > 0 else 0.0,
+                ' '.join(
+                    '{:>8}'.format('-' if value is None else '{:.2f}'.format(value * 1000))
+                    for value in values),
+            ))
+        if self.errors:
+            lines.append('Errors:')
+            lines.extend(
+                '  {}: {}'.format(error, count) for error, count in sorted(self.errors.items()))
+        return '\n'.join(lines)
+
+
+def run_load(target: LoadgenTarget, config: LoadgenConfig) -> LoadgenReport:
+    """
+    Generate load as configured and return the report.
+
+    The payloads to decrypt are encrypted before the load starts.
+
+    """
+    _check_config(config)
+
+    api_client = target.create_api_client(pool_maxsize=config.concurrency)
+    payloads = _create_payloads(api_client, target, config)
+
+    if config.model == MODEL_PROCESSES:
+        recorder = _run_processes(target, config, payloads)
+    else:
+        recorder = _run_workers(target, config, payloads, api_client, config.concurrency, 0)
+    return LoadgenReport(
+        duration=config.duration,
+        histograms=recorder.histograms,
+        errors=dict(recorder.errors),
+    )
+
+
+def ensure_crypto_key(api_client: ApiClient, crypto_key_grn: str) -> None:
+    """
+    Create the crypto key ``crypto_key_grn`` (and its key ring), unless it
+    already exists.
+
+    """
+    key_ring_grn, _, crypto_key_id = crypto_key_grn.rpartition('/cryptoKeys/')
+    location_grn, _, key_ring_id = key_ring_grn.rpartition('/keyRings/')
+    # note: the state of a stand-in of the KMS API does not outlive it, so the process-wide
+    #   resource cache does not apply.
+    resource_cache = ResourceCache()
+    gcp_kms.ensure_key_ring(
+        api_client, location_grn, key_ring_id, resource_cache=resource_cache)
+    gcp_kms.ensure_crypto_key(
+        api_client, key_ring_grn, crypto_key_id, resource_cache=resource_cache)
+
+
+###############################################################################
+# command-line interface
+###############################################################################
+
+def main(argv: List[str] = None) -> int:
+    """
+    Entry point of the console script ``fd-gcp-loadgen``.
+
+    """
+    args = _create_arg_parser().parse_args(argv)
+    if args.command == 'emulator':
+        return _main_emulator(args)
+    return _main_run(args)
+
+
+def _create_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='fd-gcp-loadgen',
+        description="Load generator of KMS encrypt/decrypt operations.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="generate load and report the results")
+    target_group = run_parser.add_argument_group('target')
+    target_group.add_argument(
+        '--crypto-key-grn',
+        help="crypto key (default with '--emulator': {})".format(
+            DEFAULT_EMULATOR_CRYPTO_KEY_GRN))
+    target_group.add_argument(
+        '--emulator', action='store_true',
+        help="start a stand-in of the KMS API in this process and make requests to it")
+    target_group.add_argument(
+        '--base-url', help="base URL of a stand-in of the KMS API (e.g. 'fd-gcp-loadgen emulator')")
+    target_group.add_argument(
+        '--transport', choices=('requests', 'googleapiclient'), default='requests')
+    target_group.add_argument(
+        '--credentials-file', help="default: the environment's default credentials")
+    target_group.add_argument(
+        '--ensure-crypto-key', action='store_true',
+        help="create the crypto key (and its key ring) if it does not exist")
+
+    load_group = run_parser.add_argument_group('load')
+    load_group.add_argument(
+        '--mix', type=_parse_operations, default={OPERATION_ENCRYPT: 1.0, OPERATION_DECRYPT: 1.0},
+        help="weights of the operations e.g. 'encrypt=3,decrypt=1' (default: equal weights)")
+    load_group.add_argument(
+        '--payload-sizes', type=_parse_payload_sizes, default={1024: 1.0},
+        help="payload sizes (bytes), optionally weighted, e.g. '64,1024=2' (default: 1024)")
+    load_group.add_argument('--duration', type=float, default=10.0, help="seconds")
+    load_group.add_argument(
+        '--warmup', type=float, default=0.0, help="seconds before measuring (default: 0)")
+    load_group.add_argument('--concurrency', type=int, default=8, help="number of workers")
+    load_group.add_argument(
+        '--rate', type=float,
+        help="target rate (operations per second); if not given, closed-loop mode")
+    load_group.add_argument('--model', choices=MODELS, default=MODEL_THREADS)
+    load_group.add_argument(
+        '--processes', type=int, help="number of processes of model 'processes' (default: CPUs)")
+    load_group.add_argument('--timeout', type=float, help="timeout of each operation (seconds)")
+    load_group.add_argument('--num-retries', type=int, default=0)
+    load_group.add_argument('--seed', type=int)
+
+    run_parser.add_argument('--json', action='store_true', help="print the report as JSON")
+
+    emulator_parser = subparsers.add_parser('emulator', help="serve a stand-in of the KMS API")
+    emulator_parser.add_argument('--host', default='127.0.0.1')
+    emulator_parser.add_argument('--port', type=int, default=8085)
+    emulator_parser.add_argument(
+        '--crypto-key-grn', action='append',
+        help="crypto key to create (may be repeated; default: {})".format(
+            DEFAULT_EMULATOR_CRYPTO_KEY_GRN))
+    return parser
+
+
+def _main_run(args: argparse.Namespace) -> int:
+    from .gcp_kms_mock import KmsHttpServer
+
+    if args.emulator and args.base_url:
+        print("Options '--emulator' and '--base-url' are mutually exclusive.", file=sys.stderr)
+        return 2
+    crypto_key_grn = args.crypto_key_grn
+    if crypto_key_grn is None:
+        if not (args.emulator or args.base_url):
+            print("Option '--crypto-key-grn' is required.", file=sys.stderr)
+            return 2
+        crypto_key_grn = DEFAULT_EMULATOR_CRYPTO_KEY_GRN
+
+    server = None
+    base_url = args.base_url
+    if args.emulator:
+        server = KmsHttpServer()
+        server.start()
+        base_url = server.base_url
+
+    try:
+        target = LoadgenTarget(
+            crypto_key_grn=crypto_key_grn,
+            base_url=base_url,
+            transport=args.transport,
+            credentials=(
+                None if args.credentials_file is None
+                else CredentialsSpec.from_file(args.credentials_file)),
+        )
+        if args.emulator or args.ensure_crypto_key:
+            ensure_crypto_key(target.create_api_client(), crypto_key_grn)
+
+        config = LoadgenConfig(
+            operations=args.mix,
+            payload_sizes=args.payload_sizes,
+            duration=args.duration,
+            warmup=args.warmup,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            model=args.model,
+            processes=args.processes,
+            timeout=args.timeout,
+            num_retries=args.num_retries,
+            seed=args.seed,
+        )
+        try:
+            report = run_load(target, config)
+        except ValueError as exc:
+            print(str(exc), file=sys.stderr)
+            return 2
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2, sort_keys=True))
+    else:
+        print(report.format())
+    return 0
+
+
+def _main_emulator(args: argparse.Namespace) -> int:
+    from .gcp_kms_mock import KmsHttpServer
+
+    server = KmsHttpServer((args.host, args.port))
+    api_client = gcp_kms.KmsRestApiClient(
+        session=_create_unauthorized_session(1), base_url=server.base_url)
+    server.start()
+    try:
+        for crypto_key_grn in args.crypto_key_grn or [DEFAULT_EMULATOR_CRYPTO_KEY_GRN]:
+            ensure_crypto_key(api_client, crypto_key_grn)
+        print("Serving a stand-in of the KMS API at {}".format(server.base_url), flush=True)
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+class _Payload(NamedTuple):
+
+    plain_data: bytes
+    encrypted_data: bytes
+
+
+class _Recorder:
+
+    """
+    Latencies and errors recorded by workers (one per worker, merged afterwards).
+
+    """
+
+    def __init__(self, measure_start: float = 0.0) -> None:
+        self.measure_start = measure_start
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.errors: Counter[str] = collections.Counter()
+
+    def record(
+        self,
+        operation: str,
+        start: float,
+        latency: float,
+        exc: Optional[BaseException],
+    ) -> None:
+        if start < self.measure_start:
+            return
+        if exc is not None:
+            self.errors['{}: {}'.format(operation, type(exc).__name__)] += 1
+            return
+        histogram = self.histograms.get(operation)
+        if histogram is None:
+            histogram = self.histograms[operation] = LatencyHistogram()
+        histogram.record(latency)
+
+    def merge(self, other: _Recorder) -> None:
+        for operation, histogram in other.histograms.items():
+            if operation not in self.histograms:
+                self.histograms[operation] = LatencyHistogram()
+            self.histograms[operation].merge(histogram)
+        self.errors.update(other.errors)
+
+
+class _Schedule:
+
+    """
+    Start times of the operations of the workers of a process.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(self, start: float, end: float, rate: float = None, offset: float = 0.0):
+        """Constructor.
+
+        :param rate: operations per second; if ``None``, operations start as
+            soon as a worker is available (closed loop)
+        :param offset: seconds by which the start times are shifted
+
+        """
+        self.start = start
+        self.end = end
+        self.rate = rate
+        self.offset = offset
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> Optional[float]:
+        """
+        Return the (``time.monotonic``) time at which the next operation is
+        to start, or ``None`` if there are no more operations.
+
+        """
+        if self.rate is None:
+            now = time.monotonic()
+            return now if now < self.end else None
+        with self._lock:
+            index = self._next_index
+            self._next_index += 1
+        start_time = self.start + self.offset + index / self.rate
+        return start_time if start_time < self.end else None
+
+
+def _check_config(config: LoadgenConfig) -> None:
+    unknown_operations = set(config.operations) - set(OPERATIONS)
+    if unknown_operations:
+        raise ValueError("Unknown operations: {}.".format(', '.join(sorted(unknown_operations))))
+    if not config.operations or not config.payload_sizes:
+        raise ValueError("There must be at least one operation and payload size.")
+    if any(weight <= 0 for weight in config.operations.values()) or any(
+        weight <= 0 for weight in config.payload_sizes.values()
+    ):
+        raise ValueError("Weights must be positive.")
+    if any(size < 0 or size > gcp_kms.KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE
+           for size in config.payload_sizes):
+        raise ValueError("Payload sizes must be between 0 and {} bytes.".format(
+            gcp_kms.KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE))
+    if config.model not in MODELS:
+        raise ValueError("Unknown concurrency model {!r}.".format(config.model))
+    if config.concurrency < 1 or (config.processes is not None and config.processes < 1):
+        raise ValueError("Values of 'concurrency' and 'processes' must be positive.")
+    if config.duration <= 0 or config.warmup < 0:
+        raise ValueError("Value of 'duration' must be positive, and 'warmup' not negative.")
+    if config.rate is not None and config.rate <= 0:
+        raise ValueError("Value of 'rate' must be positive.")
+
+
+def _create_payloads(
+    api_client: ApiClient,
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+) -> Dict[int, _Payload]:
+    payloads = {}
+    for size in config.payload_sizes:
+        plain_data = os.urandom(size)
+        encrypted_data = b''
+        if OPERATION_DECRYPT in config.operations:
+            encrypted_data = gcp_kms.encrypt(
+                api_client, target.crypto_key_grn, plain_data,
+                timeout=config.timeout, num_retries=config.num_retries)
+        payloads[size] = _Payload(plain_data, encrypted_data)
+    return payloads
+
+
+def _run_workers(
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    payloads: Dict[int, _Payload],
+    api_client: Optional[ApiClient],
+    num_workers: int,
+    offset_index: int,
+    rate: float = None,
+    num_offsets: int = 1,
+) -> _Recorder:
+    """
+    Run ``num_workers`` workers of model ``threads`` or ``asyncio`` in this process.
+
+    :param api_client: API client shared by the workers (if the transport is
+        thread-safe), or ``None`` for one to be created
+    :param offset_index: index of this process among ``num_offsets``, whose
+        schedules are interleaved
+    :param rate: rate of this process; if ``None``, ``config.rate``
+
+    """
+    if target.transport == 'requests':
+        shared_api_client = api_client or target.create_api_client(pool_maxsize=num_workers)
+
+        def get_api_client() -> ApiClient:
+            return shared_api_client
+    else:
+        # note: 'httplib2' (used by 'googleapiclient') is not thread-safe.
+        thread_local = threading.local()
+
+        def get_api_client() -> ApiClient:
+            if not hasattr(thread_local, 'api_client'):
+                thread_local.api_client = target.create_api_client()
+            return thread_local.api_client
+
+    rate = config.rate if rate is None else rate
+    start = time.monotonic()
+    measure_start = start + config.warmup
+    schedule = _Schedule(
+        start, measure_start + config.duration, rate,
+        offset=0.0 if rate is None else offset_index / (rate * num_offsets),
+    )
+    seed = None if config.seed is None else config.seed * 1000 + offset_index
+    recorders = [_Recorder(measure_start) for _ in range(num_workers)]
+
+    if config.model == MODEL_ASYNCIO:
+        asyncio.run(_run_asyncio_workers(
+            target, config, payloads, get_api_client, schedule, recorders, seed))
+    else:
+        threads = [
+            threading.Thread(
+                target=_run_worker,
+                args=(
+                    target, config, payloads, get_api_client, schedule, recorder,
+                    random.Random(None if seed is None else seed + worker_index),
+                ),
+                name='fd_gcp-loadgen-{}'.format(worker_index),
+                daemon=True,
+            )
+            for worker_index, recorder in enumerate(recorders)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    recorder = _Recorder(measure_start)
+    for worker_recorder in recorders:
+        recorder.merge(worker_recorder)
+    return recorder
+
+
+def _run_worker(
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    payloads: Dict[int, _Payload],
+    get_api_client: Callable[[], ApiClient],
+    schedule: _Schedule,
+    recorder: _Recorder,
+    rng: random.Random,
+) -> None:
+    choose = _create_chooser(config, rng)
+    while True:
+        start = schedule.next()
+        if start is None:
+            return
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if schedule.rate is None:
+            start = time.monotonic()
+
+        operation, size = choose()
+        exc = None
+        try:
+            _execute_operation(get_api_client(), target, config, operation, payloads[size])
+        except Exception as exc_:
+            exc = exc_
+        recorder.record(operation, start, time.monotonic() - start, exc)
+
+
+async def _run_asyncio_workers(
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    payloads: Dict[int, _Payload],
+    get_api_client: Callable[[], ApiClient],
+    schedule: _Schedule,
+    recorders: List[_Recorder],
+    seed: Optional[int],
+) -> None:
+    loop = asyncio.get_event_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(recorders), thread_name_prefix='fd_gcp-loadgen')
+
+    async def run_worker(recorder: _Recorder, rng: random.Random) -> None:
+        choose = _create_chooser(config, rng)
+        while True:
+            start = schedule.next()
+            if start is None:
+                return
+            delay = start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if schedule.rate is None:
+                start = time.monotonic()
+
+            operation, size = choose()
+            exc = None
+            try:
+                await loop.run_in_executor(
+                    executor,
+                    lambda: _execute_operation(
+                        get_api_client(), target, config, operation, payloads[size]),
+                )
+            except Exception as exc_:
+                exc = exc_
+            recorder.record(operation, start, time.monotonic() - start, exc)
+
+    try:
+        await asyncio.gather(*(
+            run_worker(recorder, random.Random(None if seed is None else seed + worker_index))
+            for worker_index, recorder in enumerate(recorders)
+        ))
+    finally:
+        executor.shutdown(wait=True)
+
+
+def _run_processes(
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    payloads: Dict[int, _Payload],
+) -> _Recorder:
+    num_processes = min(config.processes or os.cpu_count() or 1, config.concurrency)
+    # note: workers are split as evenly as possible.
+    num_workers_by_process = [
+        config.concurrency // num_processes + (1 if index < config.concurrency % num_processes
+                                               else 0)
+        for index in range(num_processes)
+    ]
+    rate = None if config.rate is None else config.rate / num_processes
+
+    with multiprocessing.Pool(num_processes) as pool:
+        recorders = pool.starmap(_run_process, [
+            (target, config, payloads, num_workers, index, rate, num_processes)
+            for index, num_workers in enumerate(num_workers_by_process)
+        ])
+
+    recorder = _Recorder()
+    for process_recorder in recorders:
+        recorder.merge(process_recorder)
+    return recorder
+
+
+def _run_process(
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    payloads: Dict[int, _Payload],
+    num_workers: int,
+    process_index: int,
+    rate: Optional[float],
+    num_processes: int,
+) -> _Recorder:
+    # note: the workers of each process run as threads, with API clients of their own.
+    return _run_workers(
+        target, config._replace(model=MODEL_THREADS), payloads, None, num_workers,
+        process_index, rate, num_processes)
+
+
+def _create_chooser(config: LoadgenConfig, rng: random.Random) -> Callable[[], Any]:
+    operations = list(config.operations)
+    operation_weights = list(itertools.accumulate(config.operations.values()))
+    sizes = list(config.payload_sizes)
+    size_weights = list(itertools.accumulate(config.payload_sizes.values()))
+
+    def choose() -> Any:
+        operation = rng.choices(operations, cum_weights=operation_weights)[0]
+        size = rng.choices(sizes, cum_weights=size_weights)[0]
+        return operation, size
+
+    return choose
+
+
+def _execute_operation(
+    api_client: ApiClient,
+    target: LoadgenTarget,
+    config: LoadgenConfig,
+    operation: str,
+    payload: _Payload,
+) -> None:
+    if operation == OPERATION_ENCRYPT:
+        gcp_kms.encrypt(
+            api_client, target.crypto_key_grn, payload.plain_data,
+            timeout=config.timeout, num_retries=config.num_retries)
+    else:
+        gcp_kms.decrypt(
+            api_client, target.crypto_key_grn, payload.encrypted_data,
+            timeout=config.timeout, num_retries=config.num_retries)
+
+
+def _parse_weights(value: str, convert: Callable[[str], Any]) -> Dict[Any, float]:
+    # e.g. 'encrypt=3,decrypt' -> {'encrypt': 3.0, 'decrypt': 1.0}
+    weights = {}
+    for item in value.split(','):
+        name, _, weight = item.strip().partition('=')
+        try:
+            weights[convert(name)] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError("Invalid item {!r}.".format(item)) from None
+    return weights
+
+
+def _parse_operations(value: str) -> Dict[str, float]:
+    def convert(name: str) -> str:
+        if name not in OPERATIONS:
+            raise ValueError
+        return name
+    return _parse_weights(value, convert)
+
+
+def _parse_payload_sizes(value: str) -> Dict[int, float]:
+    return _parse_weights(value, int)
+
+
+def _create_unauthorized_session(pool_maxsize: int) -> requests.Session:
+    import requests.adapters
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Rate limiter for GCP API requests.
+
+GCP APIs have per-project quotas of requests per second (e.g. KMS
+cryptographic requests). Bulk jobs should make requests at a rate below the
+quota instead of relying on retries of throttled (HTTP 429) requests.
+
+Usage example::
+
+    rate_limiter = RateLimiter(rate=500.0, burst=50)
+
+    for crypto_key_grn, plain_data in items:
+        rate_limiter.acquire()
+        gcp_kms.encrypt(kms_api_client, crypto_key_grn, plain_data)
+
+"""
+import threading
+import time
+from typing import Callable
+
+from . import exceptions
+from .deadline import Deadline
+
+
+class RateLimiter:
+
+    """
+    Token bucket rate limiter.
+
+    Tokens are added at ``rate`` per second, up to ``burst``; each request
+    takes one token, waiting for it if necessary.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Constructor.
+
+        :param rate: number of tokens per second
+        :param burst: max number of tokens that can be taken at once (or in
+            a short period of time) after the limiter has been idle
+        :param clock: monotonic clock (useful for testing)
+        :param sleep: function that blocks for some seconds (useful for testing)
+
+        """
+        if rate <= 0:
+            raise ValueError("Value of 'rate' must be positive.")
+        if burst < 1:
+            raise ValueError("Value of 'burst' must be positive.")
+
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated_at = clock()
+
+    def acquire(self, tokens: int = 1, deadline: Deadline = None) -> None:
+        """
+        Take ``tokens``, waiting until they are available.
+
+        :param deadline: if not ``None``, the wait must not go beyond it
+        :raises exceptions.DeadlineExceeded: if the tokens would not be
+            available before ``deadline``
+
+        """
+        wait = self._reserve(tokens, deadline)
+        if wait > 0:
+            self._sleep(wait)
+
+    def try_acquire(self, tokens: int = 1) -> bool:
+        """
+        Take ``tokens`` if they are available now.
+
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def _reserve(self, tokens: int, deadline: Deadline = None) -> float:
+        """
+        Take ``tokens``, possibly going into debt, and return the time to
+        wait until the debt is paid off.
+
+        """
+        if tokens > self.burst:
+            raise ValueError("Value of 'tokens' must not be greater than 'burst'.")
+
+        with self._lock:
+            self._refill()
+            wait = max(tokens - self._tokens, 0.0) / self.rate
+            if deadline is not None and wait > deadline.remaining():
+                raise exceptions.DeadlineExceeded('rate limiter')
+            self._tokens -= tokens
+        return wait
+
+    def _refill(self) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        now = self._clock()
+        self._tokens = min(self._tokens + (now - self._updated_at) * self.rate, self.burst)
+        self._updated_at = now
@@ -0,0 +1,410 @@
+"""
+Recording and replay of the requests made to GCP APIs.
+
+A :class:`RecordingTransport` wraps the transport (see :mod:`.transport`) of
+an API client and records every request attempt it makes, with its response
+(or error) and timing, in a :class:`Recording`. A :class:`ReplayTransport`
+then answers the same requests, without network access, with the recorded
+responses and errors, after waiting the recorded latencies (possibly
+scaled). Both sit below the retry, timeout and circuit breaker policies of
+:func:`._http.execute_with_policies`, so those are exercised on replay as
+they were when recording.
+
+Values that may be secret (e.g. the ``plaintext`` of KMS requests and
+responses) are scrubbed before they are recorded (see :func:`scrub_secrets`),
+including those of HTTP error responses and their request URIs.
+Credentials are never recorded: they are added by the underlying transport.
+
+Usage example::
+
+    recording = Recording()
+    kms_api_client = RecordingTransport(gcp_kms.create_api_client(credentials), recording)
+    # ... run the workload.
+    recording.save('kms-workload.jsonl.gz')
+
+    kms_api_client = ReplayTransport(Recording.load('kms-workload.jsonl.gz'), latency_scale=0.5)
+    # ... run the workload again, offline.
+
+Requests are answered, for each API method, in the order they were recorded
+(not by matching their params and body, which may have been scrubbed).
+
+"""
+from __future__ import annotations
+
+import base64
+import collections
+import copy
+import gzip
+import json
+import threading
+import time
+import urllib.parse
+import zlib
+from typing import Any, Callable, Deque, Dict, List, Mapping, NamedTuple, Optional, Type
+
+from . import exceptions
+from .deadline import Deadline
+from .transport import ApiClient, ApiMethod, Transport, get_transport
+
+
+# Names of the fields of requests and responses whose (base64-encoded) values are scrubbed by
+#   'scrub_secrets'.
+SECRET_FIELD_NAMES = frozenset({'plaintext', 'additionalAuthenticatedData', 'data'})
+
+_FORMAT_VERSION = 1
+
+
+class Interaction(NamedTuple):
+
+    """
+    A request attempt and its outcome.
+
+    """
+
+    method: ApiMethod
+    params: Dict[str, Any]
+    body: Optional[dict]
+    # decoded response, if the request succeeded
+    response: Optional[dict]
+    # encoded error (see '_encode_error'), if the request failed
+    error: Optional[dict]
+    # time (seconds) since the start of the recording when the request was made
+    started_at: float
+    # time (seconds) the request took
+    duration: float
+
+
+class Recording:
+
+    """
+    Sequence of :class:`Interaction`, which may be saved to a file.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(self, interactions: List[Interaction] = None) -> None:
+        self.interactions: List[Interaction] = list(interactions or [])
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    def add(self, interaction: Interaction) -> None:
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def save(self, filename: str) -> None:
+        """
+        Write the interactions to ``filename``, as gzip-compressed JSON lines.
+
+        """
+        with self._lock:
+            interactions = list(self.interactions)
+        with gzip.open(filename, 'wt', encoding='utf-8') as file:
+            file.write(_encode_json({'version': _FORMAT_VERSION}) + '\n')
+            for interaction in interactions:
+                file.write(_encode_json([
+                    list(interaction.method),
+                    interaction.params,
+                    interaction.body,
+                    interaction.response,
+                    interaction.error,
+                    round(interaction.started_at, 6),
+                    round(interaction.duration, 6),
+                ]) + '\n')
+
+    @classmethod
+    def load(cls, filename: str) -> Recording:
+        """
+        Read the interactions of a file written by :meth:`save`.
+
+        :raises ValueError: if the file is not valid
+
+        """
+        with open(filename, 'rb') as compressed_file:
+            try:
+                with gzip.open(compressed_file, 'rt', encoding='utf-8') as file:
+                    lines = iter(file)
+                    header = json.loads(next(lines, 'null'))
+                    if not isinstance(header, dict) or header.get('version') != _FORMAT_VERSION:
+                        raise ValueError("Unsupported version.")
+                    interactions = []
+                    for line in lines:
+                        method, params, body, response, error, started_at, duration = (
+                            json.loads(line))
+                        interactions.append(Interaction(
+                            ApiMethod(*method), params, body, response, error, started_at,
+                            duration))
+            # note: e.g. 'gzip.BadGzipFile' (an 'OSError') if it is not gzip-compressed, and
+            #   'EOFError' if it is truncated.
+            except (OSError, EOFError, zlib.error, ValueError, TypeError) as exc:
+                raise ValueError("Invalid or unsupported recording file.") from exc
+        return cls(interactions)
+
+
+class RecordingTransport(Transport):
+
+    """
+    Transport that makes requests with another one, and records them.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        api_client: ApiClient,
+        recording: Recording = None,
+        scrub: Optional[Callable[[Any], Any]] = None,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """Constructor.
+
+        :param api_client: API client (or transport) that makes the requests
+        :param recording: where the requests are recorded; if ``None``, a new one
+        :param scrub: function that returns a copy of a request's params or
+            body, or of a response, without secrets; if ``None``,
+            :func:`scrub_secrets`
+        :param clock: monotonic clock (useful for testing)
+
+        """
+        self.transport = get_transport(api_client)
+        self.recording = Recording() if recording is None else recording
+        self.scrub = scrub_secrets if scrub is None else scrub
+        self._clock = clock
+        self._started_at = clock()
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        start = self._clock()
+        try:
+            response = self.transport.execute(method, params, body, deadline)
+        except Exception as exc:
+            error = _encode_error(exc)
+            if error is not None:
+                self._record(method, params, body, None, error, start)
+            raise
+        self._record(method, params, body, response, None, start)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def _record(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: Optional[dict],
+        response: Optional[dict],
+        error: Optional[dict],
+        start: float,
+    ) -> None:
+        self.recording.add(Interaction(
+            method=method,
+            params=self.scrub(dict(params)),
+            body=None if body is None else self.scrub(body),
+            response=None if response is None else self.scrub(response),
+            error=None if error is None else _scrub_error(error, self.scrub),
+            started_at=start - self._started_at,
+            duration=self._clock() - start,
+        ))
+
+
+class ReplayTransport(Transport):
+
+    """
+    Transport that answers requests with the responses and errors of a
+    :class:`Recording`.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        recording: Recording,
+        latency_scale: float = 1.0,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Constructor.
+
+        :param latency_scale: ratio the recorded latencies are multiplied
+            by (e.g. ``0`` to answer immediately)
+        :param sleep: function that blocks for some seconds (useful for testing)
+
+        """
+        if latency_scale < 0:
+            raise ValueError("Value of 'latency_scale' must not be negative.")
+
+        self.recording = recording
+        self.latency_scale = latency_scale
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        # API method ID -> interactions not replayed yet
+        self._pending: Dict[str, Deque[Interaction]] = collections.defaultdict(collections.deque)
+        for interaction in recording.interactions:
+            self._pending[interaction.method.id].append(interaction)
+
+    @property
+    def num_pending(self) -> int:
+        """
+        Number of recorded interactions not replayed yet.
+
+        """
+        with self._lock:
+            return sum(len(interactions) for interactions in self._pending.values())
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        with self._lock:
+            interactions = self._pending.get(method.id)
+            if not interactions:
+                raise LookupError(
+                    "No recorded request left for API method '{}'.".format(method.id))
+            interaction = interactions.popleft()
+
+        latency = interaction.duration * self.latency_scale
+        if deadline is not None and latency > deadline.remaining():
+            self._sleep(max(deadline.remaining(), 0.0))
+            raise exceptions.DeadlineExceeded(method.id)
+        if latency > 0:
+            self._sleep(latency)
+
+        if interaction.error is not None:
+            raise _decode_error(interaction.error)
+        assert interaction.response is not None
+        return copy.deepcopy(interaction.response)
+
+
+def scrub_secrets(value: Any) -> Any:
+    """
+    Return a copy of ``value`` (decoded JSON) where the values of fields
+    named like :data:`SECRET_FIELD_NAMES` are replaced.
+
+    Base64-encoded values are replaced by the encoding of as many zero bytes,
+    so that sizes are kept (e.g. for replaying throughput tests).
+
+    """
+    if isinstance(value, dict):
+        return {
+            name: _scrub_value(field_value) if name in SECRET_FIELD_NAMES
+            else scrub_secrets(field_value)
+            for name, field_value in value.items()
+        }
+    if isinstance(value, list):
+        return [scrub_secrets(item) for item in value]
+    return value
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+# note: the output of this encoder is compact.
+_encode_json = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def _scrub_value(value: Any) -> Any:
+    if not isinstance(value, str):
+        return scrub_secrets(value)
+    try:
+        size = len(base64.b64decode(value.encode('ascii'), validate=True))
+    except ValueError:
+        return '*' * len(value)
+    return base64.b64encode(bytes(size)).decode('ascii')
+
+
+# Errors that are recorded with their constructor's arguments.
+_ERROR_CLASSES: Dict[str, Type[Exception]] = {
+    error_class.__name__: error_class
+    for error_class in (
+        exceptions.AuthError,
+        exceptions.ResourcePermissionDenied,
+        exceptions.ResourceNotFound,
+        exceptions.AlreadyExists,
+        exceptions.ConcurrentModification,
+        exceptions.DeadlineExceeded,
+        exceptions.UnrecognizedApiError,
+    )
+}
+_ERROR_ARG_NAMES = {
+    'ResourcePermissionDenied': ('resource', 'permission'),
+    'ResourceNotFound': ('resource',),
+    'AlreadyExists': ('what',),
+    'ConcurrentModification': ('resource',),
+    'DeadlineExceeded': ('operation',),
+}
+
+
+def _encode_error(exc: Exception) -> Optional[dict]:
+    """
+    Return a JSON-serializable description of ``exc``, or ``None`` if it is
+    not an error of a request (e.g. a bug of the caller).
+
+    """
+    if isinstance(exc, exceptions.UnrecognizedApiHttpError):
+        return {
+            'type': 'http',
+            'status': getattr(exc.response, 'status', None),
+            'reason': getattr(exc.response, 'reason', ''),
+            'content': base64.b64encode(exc.response_content or b'').decode('ascii'),
+            'uri': exc.request_uri,
+        }
+    error_class_name = type(exc).__name__
+    if _ERROR_CLASSES.get(error_class_name) is type(exc):
+        return {
+            'type': error_class_name,
+            'args': [getattr(exc, name) for name in _ERROR_ARG_NAMES.get(error_class_name, ())],
+        }
+    # note: e.g. connection errors and timeouts of 'socket', 'requests' or 'httplib2'.
+    from ._http import is_service_failure
+
+    if is_service_failure(exc):
+        return {'type': 'connection', 'message': str(exc)}
+    return None
+
+
+def _scrub_error(error: dict, scrub: Callable[[Any], Any]) -> dict:
+    """
+    Return a copy of an encoded error (see :func:`_encode_error`) whose HTTP
+    response content (if it is JSON) and request URI query were scrubbed.
+
+    """
+    if error['type'] != 'http':
+        return error
+    error = dict(error)
+
+    content = base64.b64decode(error['content'])
+    try:
+        decoded_content = json.loads(content.decode('utf-8'))
+    except ValueError:
+        pass
+    else:
+        content = _encode_json(scrub(decoded_content)).encode('utf-8')
+        error['content'] = base64.b64encode(content).decode('ascii')
+
+    if error['uri']:
+        uri = urllib.parse.urlsplit(error['uri'])
+        query = scrub(dict(urllib.parse.parse_qsl(uri.query, keep_blank_values=True)))
+        error['uri'] = uri._replace(query=urllib.parse.urlencode(query)).geturl()
+    return error
+
+
+def _decode_error(error: dict) -> Exception:
+    if error['type'] == 'http':
+        return exceptions.process_api_http_error(
+            error['status'], base64.b64decode(error['content']), error['uri'], error['reason'])
+    if error['type'] == 'connection':
+        return ConnectionError(error['message'])
+    return _ERROR_CLASSES[error['type']](*error['args'])
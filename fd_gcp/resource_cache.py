@@ -0,0 +1,132 @@
+"""
+Cache of GCP resources known to exist.
+
+Resources such as KMS key rings and crypto keys can not be deleted, so once a
+resource is known to exist it can be assumed to exist forever. The
+``ensure_*`` operations (e.g. :func:`.gcp_kms.ensure_key_ring`) use a
+:class:`ResourceCache` to skip the requests to the API for such resources.
+
+By default, the cache is process-wide and in-memory. It may be backed by a
+file, so that it is shared by the processes of a host and survives restarts::
+
+    resource_cache = ResourceCache(filename='/var/cache/my-app/gcp-resources.json')
+    key_ring_grn = gcp_kms.ensure_key_ring(
+        kms_api_client, location_grn, 'my-key-ring',
+        resource_cache=resource_cache)
+
+"""
+import json
+import logging
+import threading
+from typing import Iterable, Optional, Set
+
+from ._files import write_file_atomically
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceCache:
+
+    """
+    Set of GRNs of resources known to exist.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(self, filename: str = None) -> None:
+        """Constructor.
+
+        :param filename: path of a JSON file where the GRNs are persisted;
+            if ``None``, the cache is in-memory only
+
+        """
+        self.filename = filename
+        self._resource_grns: Set[str] = set()
+        self._loaded = filename is None
+        self._lock = threading.Lock()
+
+    def __contains__(self, resource_grn: object) -> bool:
+        if resource_grn in self._resource_grns:
+            return True
+        if self._loaded:
+            return False
+        with self._lock:
+            self._load()
+            return resource_grn in self._resource_grns
+
+    def add(self, resource_grn: str) -> None:
+        """
+        Record that the resource ``resource_grn`` exists.
+
+        """
+        with self._lock:
+            self._load()
+            if resource_grn in self._resource_grns:
+                return
+            self._resource_grns.add(resource_grn)
+            if self.filename is not None:
+                self._save()
+
+    def clear(self) -> None:
+        """
+        Forget all the resources (in memory; the file is left untouched).
+
+        """
+        with self._lock:
+            self._resource_grns.clear()
+            self._loaded = self.filename is None
+
+    def _load(self) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        if self._loaded:
+            return
+        self._resource_grns.update(self._read_file())
+        self._loaded = True
+
+    def _save(self) -> None:
+        # warning: must be called with 'self._lock' acquired.
+        # note: other processes may have added resources to the file in the meantime.
+        self._resource_grns.update(self._read_file())
+
+        assert self.filename is not None
+        data = json.dumps(sorted(self._resource_grns)).encode('utf-8')
+        try:
+            write_file_atomically(self.filename, data)
+        except OSError:
+            logger.warning(
+                "Could not write resource cache file '%s'.", self.filename, exc_info=True)
+
+    def _read_file(self) -> Iterable[str]:
+        assert self.filename is not None
+        try:
+            with open(self.filename) as file:
+                resource_grns = json.load(file)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError):
+            logger.warning(
+                "Could not read resource cache file '%s'.", self.filename, exc_info=True)
+            return []
+        if not isinstance(resource_grns, list):
+            logger.warning("Invalid resource cache file '%s'.", self.filename)
+            return []
+        return [grn for grn in resource_grns if isinstance(grn, str)]
+
+
+_default_resource_cache = ResourceCache()
+
+
+def get_default_resource_cache() -> ResourceCache:
+    """
+    Return the process-wide, in-memory, cache used when none is given.
+
+    """
+    return _default_resource_cache
+
+
+def resolve_resource_cache(resource_cache: Optional[ResourceCache]) -> ResourceCache:
+    if resource_cache is None:
+        return _default_resource_cache
+    return resource_cache
@@ -0,0 +1,267 @@
+"""
+Opt-in tracing of the phases of GCP API operations.
+
+Within a :func:`trace` context, the operations of this library record a tree
+of :class:`Span` objects, with the duration of each phase of their requests.
+Outside of it (the default), tracing costs next to nothing.
+
+Recorded spans:
+
+- ``api_request``: an operation's request, including retries (attribute:
+  ``endpoint``).
+- ``attempt``: an attempt of a request (attribute: ``attempt``), and
+  ``retry_backoff``: the wait before retrying it.
+- ``build_request``: building a ``googleapiclient`` request.
+- ``encode``: encoding a request body (transport ``requests``).
+- ``http``: making the HTTP request and reading the response, including
+  opening a connection (DNS and TLS handshake) if needed (attribute
+  ``new_connection``) and refreshing credentials, unless traced separately.
+  For transport ``requests``, attribute ``elapsed`` is the time until the
+  response headers were received.
+- ``decode``: decoding the response.
+- ``credentials_refresh``: refreshing credentials (see
+  :func:`.auth.trace_credentials_refresh`).
+- ``create_api_client``: :func:`.gcp_kms.create_api_client` (attribute
+  ``discovery_document_cached``).
+
+Spans of an operation that fails have attribute ``error``.
+
+Usage example::
+
+    with trace('encrypt') as span:
+        gcp_kms.encrypt(kms_api_client, crypto_key_grn, plain_data)
+    logger.info("Trace:\\n%s", span.format())
+
+Traces may also be exported when they end::
+
+    add_exporter(lambda span: exporter.export(span.to_dict()))
+
+The current span is stored in a context variable, so concurrent traces (in
+threads or ``asyncio`` tasks) do not mix, and the operations of this library
+that use the shared executor propagate it to its threads.
+
+"""
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+
+    """
+    A timed phase of an operation, with the spans of its sub-phases.
+
+    """
+
+    __slots__ = ('name', 'attributes', 'start', 'end', 'children')
+
+    def __init__(self, name: str, attributes: Dict[str, Any] = None) -> None:
+        self.name = name
+        self.attributes: Dict[str, Any] = attributes or {}
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List['Span'] = []
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        Duration (seconds) of the span, or ``None`` if it has not ended.
+
+        """
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def set_attribute(self, name: str, value: Any) -> None:
+        self.attributes[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Return the span tree as JSON-serializable data; times are relative to
+        the start of this span, in seconds.
+
+        """
+        return self._to_dict(self.start)
+
+    def format(self) -> str:
+        """
+        Return the span tree as text, one span per line e.g.::
+
+            api_request 85.112 ms endpoint=cloudkms.[..].encrypt
+              attempt 85.051 ms attempt=0
+                build_request 0.321 ms
+                http 84.502 ms new_connection=True
+
+        """
+        lines: List[str] = []
+        self._format(lines, 0)
+        return '\n'.join(lines)
+
+    def _to_dict(self, origin: float) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'start': self.start - origin,
+            'duration': self.duration,
+            'attributes': dict(self.attributes),
+            'children': [child._to_dict(origin) for child in list(self.children)],
+        }
+
+    def _format(self, lines: List[str], depth: int) -> None:
+        duration = self.duration
+        duration_str = 'unfinished' if duration is None else '{:.3f} ms'.format(duration * 1000)
+        attributes_str = ''.join(
+            ' {}={}'.format(name, value) for name, value in self.attributes.items())
+        lines.append('{}{} {}{}'.format('  ' * depth, self.name, duration_str, attributes_str))
+        for child in list(self.children):
+            child._format(lines, depth + 1)
+
+    def __repr__(self) -> str:
+        return 'Span({!r}, duration={!r})'.format(self.name, self.duration)
+
+
+Exporter = Callable[[Span], None]
+"""
+Callable invoked as ``exporter(span)`` with the root span of every trace
+that ends.
+"""
+
+_current_span: 'contextvars.ContextVar[Optional[Span]]' = contextvars.ContextVar(
+    'fd_gcp_current_span', default=None)
+
+_exporters: List[Exporter] = []
+_exporters_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def trace(name: str = 'trace', **attributes: Any) -> Iterator[Span]:
+    """
+    Trace the operations made within the context.
+
+    If a trace is already active, the span is added to it (and it is not
+    exported on its own).
+
+    """
+    parent = _current_span.get()
+    span = Span(name, attributes)
+    if parent is not None:
+        parent.children.append(span)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        span.end = time.perf_counter()
+        _current_span.reset(token)
+        if parent is None:
+            _export(span)
+
+
+def start_span(name: str, **attributes: Any) -> ContextManager[Optional[Span]]:
+    """
+    Return a context that records a span as a child of the current one.
+
+    If no trace is active, the context does nothing and its value is ``None``.
+
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP_SPAN_CONTEXT
+    return _SpanContext(parent, name, attributes)
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def is_tracing() -> bool:
+    return _current_span.get() is not None
+
+
+def add_exporter(exporter: Exporter) -> None:
+    """
+    Register a callable to be called with the root span of every trace
+    that ends.
+
+    Exporters are called synchronously, and exceptions raised by them are
+    logged and ignored.
+
+    """
+    with _exporters_lock:
+        _exporters.append(exporter)
+
+
+def remove_exporter(exporter: Exporter) -> None:
+    with _exporters_lock:
+        _exporters.remove(exporter)
+
+
+def create_log_exporter(
+    logger_: logging.Logger = logger,
+    level: int = logging.DEBUG,
+) -> Exporter:
+    """
+    Return an exporter that logs span trees as text (see :meth:`Span.format`).
+
+    """
+    def export(span: Span) -> None:
+        if logger_.isEnabledFor(level):
+            logger_.log(level, "Trace:\n%s", span.format())
+
+    return export
+
+
+###############################################################################
+# internal helpers
+###############################################################################
+
+class _SpanContext:
+
+    __slots__ = ('parent', 'span', 'token')
+
+    def __init__(self, parent: Span, name: str, attributes: Dict[str, Any]) -> None:
+        self.parent = parent
+        self.span = Span(name, attributes)
+        self.token: Optional[contextvars.Token] = None
+
+    def __enter__(self) -> Span:
+        self.span.start = time.perf_counter()
+        self.parent.children.append(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.span.end = time.perf_counter()
+        if exc_type is not None:
+            self.span.attributes['error'] = exc_type.__name__
+        assert self.token is not None
+        _current_span.reset(self.token)
+
+
+class _NoopSpanContext:
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        return None
+
+
+_NOOP_SPAN_CONTEXT = _NoopSpanContext()
+
+
+def _export(span: Span) -> None:
+    with _exporters_lock:
+        exporters = list(_exporters)
+    for exporter in exporters:
+        try:
+            exporter(span)
+        except Exception:
+            logger.exception("Trace exporter %r failed.", exporter)
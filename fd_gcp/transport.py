@@ -0,0 +1,421 @@
+"""
+Transports used by the services modules to make requests to GCP APIs.
+
+A transport makes a request to an :class:`ApiMethod` of a GCP API and returns
+the decoded JSON response, raising :mod:`.exceptions` errors otherwise.
+The operations of modules such as :mod:`.gcp_kms` accept, as their
+``api_client`` argument, either a ``googleapiclient`` discovery resource
+(e.g. the one returned by :func:`.gcp_kms.create_api_client`) or a
+:class:`Transport`, so the way requests are made can be chosen per deployment.
+
+Available transports:
+
+- :class:`GoogleApiClientTransport`: requests are built and made by
+  ``googleapiclient`` (and ``httplib2``). This is what is used when the
+  ``api_client`` is a discovery resource.
+- :class:`RequestsTransport`: requests are made by ``requests`` with a pool
+  of persistent connections, without using ``googleapiclient`` at all.
+- :class:`InMemoryTransport`: requests are handled by Python callables;
+  useful for testing.
+
+Usage example::
+
+    from fd_gcp.auth import get_gce_credentials
+
+    kms_api_client = RequestsTransport(
+        base_url=gcp_kms.KMS_API_BASE_URL,
+        credentials=get_gce_credentials(),
+    )
+    encrypted_data = gcp_kms.encrypt(kms_api_client, crypto_key_grn, plain_data)
+
+"""
+from __future__ import annotations
+
+import abc
+import copy
+import json
+import logging
+import re
+import threading
+import urllib.parse
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union,
+)
+
+from . import exceptions
+from .circuit_breaker import CircuitBreaker
+from .deadline import Deadline, Timeout
+from .tracing import start_span
+from ._http import (
+    _execute_google_api_client_request, execute_with_policies,
+)
+
+if TYPE_CHECKING:
+    import requests
+
+    from .common import GcpCredentials, GcpResource
+
+
+logger = logging.getLogger(__name__)
+
+
+class ApiMethod(NamedTuple):
+
+    """
+    A method of a GCP API.
+
+    Its values are those of the API's discovery document.
+
+    """
+
+    # e.g. 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt'
+    id: str
+    # e.g. 'POST'
+    http_method: str
+    # e.g. 'v1/{+name}:encrypt'
+    path: str
+
+
+class Transport(abc.ABC):
+
+    """
+    Interface of transports.
+
+    """
+
+    @abc.abstractmethod
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        """
+        Make a request to ``method`` and return the decoded response.
+
+        :param method: API method
+        :param params: path and query parameters
+        :param body: request body
+        :param deadline: if not ``None``, the request must not go beyond it
+        :raises exceptions.Error: see :mod:`.exceptions`
+        :raises exceptions.DeadlineExceeded: if ``deadline`` was reached
+
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """
+        Release the resources (e.g. connections) held by the transport.
+
+        """
+
+
+ApiClient = Union['GcpResource', Transport]
+"""
+Type of the ``api_client`` argument of the services modules' operations.
+"""
+
+
+###############################################################################
+# transports
+###############################################################################
+
+class GoogleApiClientTransport(Transport):
+
+    """
+    Transport that makes requests through a ``googleapiclient`` discovery
+    resource (e.g. one returned by :func:`.gcp_kms.create_api_client`).
+
+    Instances are thread-safe: although every request of a discovery
+    resource is built with its (not thread-safe) ``httplib2.Http``, each
+    thread executes them with its own copy of it, with its own connections
+    (see :func:`._http._get_thread_http`).
+
+    """
+
+    def __init__(self, api_client: GcpResource) -> None:
+        self.api_client = api_client
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        # e.g. 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt' is
+        #   'api_client.projects().locations().keyRings().cryptoKeys().encrypt(..)'.
+        with start_span('build_request'):
+            resource = self.api_client
+            *collection_names, method_name = method.id.split('.')[1:]
+            for collection_name in collection_names:
+                resource = getattr(resource, collection_name)()
+
+            kwargs = dict(params)
+            if body is not None:
+                kwargs['body'] = body
+            request = getattr(resource, method_name)(**kwargs)
+
+        response: dict = _execute_google_api_client_request(
+            request, None if deadline is None else deadline.remaining())
+        return response
+
+
+class RequestsTransport(Transport):
+
+    """
+    Transport that makes requests to a GCP API's REST endpoint with package
+    ``requests``, reusing a pool of persistent connections.
+
+    Instances are thread-safe.
+
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        credentials: GcpCredentials = None,
+        session: requests.Session = None,
+        pool_maxsize: int = 10,
+    ) -> None:
+        """Constructor.
+
+        :param base_url: the API's root URL e.g. ``https://cloudkms.googleapis.com/``
+        :param credentials: credentials used to authorize requests; ignored if
+            ``session`` is not ``None``
+        :param session: session used to make requests; if ``None``, an
+            authorized session is created for ``credentials``
+        :param pool_maxsize: max number of connections kept open
+
+        """
+        if session is None:
+            if credentials is None:
+                raise ValueError("Either 'credentials' or 'session' must be given.")
+            session = _create_authorized_session(credentials, pool_maxsize)
+
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.session = session
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        import google.auth.exceptions
+        import requests
+
+        with start_span('encode'):
+            url = self.build_url(method, params)
+            if body is None:
+                data, headers = None, None
+            else:
+                data, headers = _encode_json(body).encode('ascii'), _JSON_REQUEST_HEADERS
+        timeout = None if deadline is None else max(deadline.remaining(), 0.001)
+
+        try:
+            with start_span('http') as span:
+                response = self.session.request(
+                    method.http_method, url,
+                    data=data,
+                    headers=headers,
+                    timeout=timeout,
+                )
+                if span is not None:
+                    span.set_attribute('elapsed', response.elapsed.total_seconds())
+        except google.auth.exceptions.GoogleAuthError as exc:
+            raise exceptions.AuthError from exc
+        except requests.Timeout as exc:
+            if deadline is not None:
+                raise exceptions.DeadlineExceeded(method.id) from exc
+            raise
+
+        content = response.content
+        if response.status_code >= 400:
+            raise exceptions.process_api_http_error(
+                response.status_code, content, url, response.reason or '')
+        if not content:
+            return {}
+        try:
+            with start_span('decode'):
+                # note: unlike 'response.json()', this does not try to detect the encoding.
+                decoded_response: dict = json.loads(content)
+        except ValueError as exc:
+            raise exceptions.UnrecognizedApiError from exc
+        return decoded_response
+
+    def build_url(self, method: ApiMethod, params: Mapping[str, Any]) -> str:
+        """
+        Return the URL, including the query string, of a request to ``method``.
+
+        Subclasses may override it with faster, API-specific, implementations.
+
+        """
+        path, query_params = expand_path_template(method.path, params)
+        url = self.base_url + path
+        if query_params:
+            for name, value in query_params.items():
+                if isinstance(value, bool):
+                    query_params[name] = 'true' if value else 'false'
+            url += '?' + urllib.parse.urlencode(query_params)
+        return url
+
+    def close(self) -> None:
+        self.session.close()
+
+
+Handler = Callable[[Dict[str, Any], Optional[dict]], dict]
+"""
+Callable invoked as ``handler(params, body)`` that returns the response or
+raises :mod:`.exceptions` errors.
+"""
+
+
+class InMemoryTransport(Transport):
+
+    """
+    Transport that, instead of making requests, calls a handler registered
+    for each API method.
+
+    Params, bodies and responses are copied, as if they went through the
+    network. Every request is recorded in :attr:`requests`. Requests to API
+    methods without a handler raise :class:`LookupError`.
+
+    """
+
+    def __init__(self, handlers: Mapping[str, Handler] = None) -> None:
+        """Constructor.
+
+        :param handlers: mapping of API method ID to its handler
+
+        """
+        self.handlers: Dict[str, Handler] = dict(handlers or {})
+        self.requests: List[Tuple[ApiMethod, Dict[str, Any], Optional[dict]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, method_id: str, handler: Handler) -> None:
+        self.handlers[method_id] = handler
+
+    def execute(
+        self,
+        method: ApiMethod,
+        params: Mapping[str, Any],
+        body: dict = None,
+        deadline: Deadline = None,
+    ) -> dict:
+        try:
+            handler = self.handlers[method.id]
+        except KeyError:
+            raise LookupError(
+                "No handler registered for API method '{}'.".format(method.id)) from None
+
+        copied_params: Dict[str, Any] = copy.deepcopy(dict(params))
+        body = copy.deepcopy(body)
+        with self._lock:
+            self.requests.append((method, copied_params, body))
+
+        response = handler(copied_params, body)
+        return copy.deepcopy(response)
+
+
+###############################################################################
+# functions
+###############################################################################
+
+def get_transport(api_client: ApiClient) -> Transport:
+    """
+    Return the transport to use to make requests with ``api_client``.
+
+    """
+    if isinstance(api_client, Transport):
+        return api_client
+    return GoogleApiClientTransport(api_client)
+
+
+def execute_api_request(
+    api_client: ApiClient,
+    method: ApiMethod,
+    params: Mapping[str, Any],
+    body: dict = None,
+    circuit_breaker: CircuitBreaker = None,
+    timeout: Timeout = None,
+    num_retries: int = 0,
+) -> dict:
+    """
+    Make a request to ``method`` with ``api_client``'s transport.
+
+    See :func:`._http.execute_google_api_client_request` for the parameters
+    ``circuit_breaker``, ``timeout`` and ``num_retries``.
+
+    """
+    transport = get_transport(api_client)
+
+    def execute_attempt(deadline: Optional[Deadline]) -> dict:
+        return transport.execute(method, params, body, deadline)
+
+    return execute_with_policies(
+        method.id, execute_attempt,
+        circuit_breaker=circuit_breaker,
+        timeout=timeout,
+        num_retries=num_retries,
+    )
+
+
+_JSON_REQUEST_HEADERS = {'Content-Type': 'application/json'}
+
+# note: the output of this encoder is ASCII-only and compact.
+_encode_json = json.JSONEncoder(ensure_ascii=True, separators=(',', ':')).encode
+
+
+_PATH_TEMPLATE_VARIABLE_REGEX = re.compile(r'\{(?P<reserved>\+?)(?P<name>[a-zA-Z0-9_]+)\}')
+
+# RFC 6570 "reserved expansion" (e.g. '{+name}') does not escape reserved characters.
+_PATH_RESERVED_CHARS = ":/?#[]@!$&'()*+,;="
+
+
+def expand_path_template(
+    template: str,
+    params: Mapping[str, Any],
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Expand the variables of a discovery document's path ``template``.
+
+    >>> expand_path_template('v1/{+name}:encrypt', {'name': 'projects/p', 'x': 1})
+    ('v1/projects/p:encrypt', {'x': 1})
+
+    :return: the path, and the params that are not in the template (query params)
+
+    """
+    query_params = dict(params)
+
+    def replace(match: re.Match) -> str:
+        try:
+            value = query_params.pop(match.group('name'))
+        except KeyError:
+            raise ValueError(
+                "Missing path parameter {!r}.".format(match.group('name'))) from None
+        safe = _PATH_RESERVED_CHARS if match.group('reserved') else ''
+        return urllib.parse.quote(str(value), safe=safe)
+
+    path = _PATH_TEMPLATE_VARIABLE_REGEX.sub(replace, template)
+    return path, query_params
+
+
+def _create_authorized_session(
+    credentials: GcpCredentials,
+    pool_maxsize: int,
+) -> requests.Session:
+    import google.auth.transport.requests
+    import requests.adapters
+
+    session = google.auth.transport.requests.AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=pool_maxsize,
+        max_retries=0,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -24,14 +24,23 @@ with open('README.md') as readme_file:
 
 # TODO: add reasonable upper-bound per package.
 requirements = [
-    'cryptography>=2.7',
+    'cryptography>=3.1',
     'google-api-python-client>=1.7.9',
     'google-auth>=1.6.3',
     'requests>=2.22.0',
 ]
 
-# extras_requirements = {
-# }
+extras_requirements = {
+    'zstd': [
+        'zstandard>=0.13.0',
+    ],
+}
+
+entry_points = {
+    'console_scripts': [
+        'fd-gcp-loadgen = fd_gcp.loadgen:main',
+    ],
+}
 
 setup_requirements = [
 ]
@@ -67,7 +76,8 @@ setup(
         'Programming Language :: Python :: 3.8',
     ],
     description="Fyndata's Python library of Google Cloud Platform (GCP) utils.",
-    # extras_require=extras_requirements,
+    entry_points=entry_points,
+    extras_require=extras_requirements,
     install_requires=requirements,
     license="MIT",
     long_description=readme,
@@ -0,0 +1,20 @@
+from typing import List
+
+
+class FakeClock:
+
+    """
+    Monotonic clock that only advances when told to (or when "sleeping").
+
+    """
+
+    def __init__(self, now: float = 100.0) -> None:
+        self.now = now
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
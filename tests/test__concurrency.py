@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Iterator
+from unittest import TestCase
+
+from fd_gcp._concurrency import get_executor, iterate_in_background, map_concurrently
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_get_executor(self) -> None:
+        self.assertIs(get_executor(), get_executor())
+
+    def test_map_concurrently(self) -> None:
+        self.assertEqual(map_concurrently(lambda x: x * 2, range(10)), list(range(0, 20, 2)))
+        self.assertEqual(map_concurrently(lambda x: x * 2, []), [])
+
+    def test_map_concurrently_max_concurrency(self) -> None:
+        lock = threading.Lock()
+        running = [0]
+        max_running = [0]
+
+        def fn(x: int) -> int:
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return x
+
+        self.assertEqual(map_concurrently(fn, range(12), max_concurrency=3), list(range(12)))
+        self.assertLessEqual(max_running[0], 3)
+        self.assertGreater(max_running[0], 1)
+
+        with self.assertRaises(ValueError):
+            map_concurrently(fn, range(3), max_concurrency=0)
+
+    def test_map_concurrently_fail(self) -> None:
+        calls = []
+
+        def fn(x: int) -> int:
+            calls.append(x)
+            if x == 1:
+                raise KeyError(x)
+            time.sleep(0.01)
+            return x
+
+        with self.assertRaises(KeyError):
+            map_concurrently(fn, range(100), max_concurrency=2)
+        self.assertLess(len(calls), 100)
+
+    def test_iterate_in_background(self) -> None:
+        produced = []
+
+        def produce() -> Iterator[int]:
+            for x in range(10):
+                produced.append(x)
+                yield x
+
+        items = iterate_in_background(produce(), max_buffered=2)
+        time.sleep(0.05)
+        # The producer is ahead of the consumer by (at most) the buffered items and one more.
+        self.assertEqual(produced, [0, 1, 2])
+        self.assertEqual(list(items), list(range(10)))
+
+    def test_iterate_in_background_fail(self) -> None:
+        def produce() -> Iterator[int]:
+            yield 1
+            raise KeyError('x')
+
+        items = iterate_in_background(produce())
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(KeyError):
+            next(items)
+
+        with self.assertRaises(ValueError):
+            iterate_in_background([], max_buffered=0)
+
+    def test_iterate_in_background_close(self) -> None:
+        closed = threading.Event()
+
+        def produce() -> Iterator[int]:
+            try:
+                yield from range(1000)
+            finally:
+                closed.set()
+
+        items = iterate_in_background(produce())
+        self.assertEqual(next(items), 0)
+        items.close()
+        self.assertTrue(closed.is_set())
@@ -1,11 +1,201 @@
-from unittest import TestCase
+import socket
+import threading
+from unittest import TestCase, mock
 
-from fd_gcp._http import execute_google_api_client_request  # noqa: F401
+import google.auth.credentials
+import google_auth_httplib2
+import googleapiclient.errors
+import googleapiclient.http
+import httplib2
+
+from fd_gcp import exceptions
+from fd_gcp._http import (  # noqa: F401
+    _get_thread_http, execute_google_api_client_request, get_google_api_client_request_endpoint,
+    is_service_failure,
+)
+from fd_gcp.circuit_breaker import CircuitBreaker, CircuitState
+from fd_gcp.deadline import Deadline
+
+
+class FakeRequest:
+
+    methodId = 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt'
+    method = 'POST'
+    uri = 'https://cloudkms.googleapis.com/v1/projects/p/locations/global:encrypt?alt=json'
+
+    def __init__(self, exc: Exception = None, response: dict = None, failures: int = None) -> None:
+        self.exc = exc
+        self.response = response or {}
+        self.failures = failures
+        self.http = httplib2.Http(timeout=60)
+        self.execute_https: list = []
+        self.execute_timeouts: list = []
+
+    def execute(self, http: httplib2.Http = None) -> dict:
+        self.execute_https.append(http)
+        self.execute_timeouts.append((http or self.http).timeout)
+        if self.exc is not None and (self.failures is None or self.failures > 0):
+            if self.failures is not None:
+                self.failures -= 1
+            raise self.exc
+        return self.response
+
+
+def _create_http_error(status: int, message: str) -> googleapiclient.errors.HttpError:
+    content = '{{"error": {{"code": {}, "message": "{}"}}}}'.format(status, message)
+    return googleapiclient.errors.HttpError(
+        httplib2.Response({'status': status}), content.encode(), uri=FakeRequest.uri)
 
 
 class FunctionsTestCase(TestCase):
 
     def test_execute_google_api_client_request(self) -> None:
-        # TODO: implement test
-        # execute_google_api_client_request()
-        pass
+        self.assertEqual(
+            execute_google_api_client_request(FakeRequest(response={'a': 1})),  # type: ignore
+            {'a': 1})
+
+        with self.assertRaises(exceptions.ResourceNotFound):
+            execute_google_api_client_request(FakeRequest(  # type: ignore
+                exc=_create_http_error(404, "CryptoKey projects/p/cryptoKeys/k not found.")))
+
+    def test_execute_google_api_client_request_circuit_breaker(self) -> None:
+        circuit_breaker = CircuitBreaker(failure_threshold=2)
+        failing_request = FakeRequest(exc=_create_http_error(503, "Backend error."))
+        not_found_request = FakeRequest(
+            exc=_create_http_error(404, "CryptoKey projects/p/cryptoKeys/k not found."))
+
+        # Errors caused by the request itself do not open the circuit.
+        for _ in range(3):
+            with self.assertRaises(exceptions.ResourceNotFound):
+                execute_google_api_client_request(
+                    not_found_request, circuit_breaker)  # type: ignore
+        self.assertEqual(
+            circuit_breaker.get_state(FakeRequest.methodId), CircuitState.CLOSED)
+
+        for _ in range(2):
+            with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+                execute_google_api_client_request(
+                    failing_request, circuit_breaker)  # type: ignore
+        self.assertEqual(circuit_breaker.get_state(FakeRequest.methodId), CircuitState.OPEN)
+
+        with self.assertRaises(exceptions.CircuitBreakerOpen):
+            execute_google_api_client_request(FakeRequest(), circuit_breaker)  # type: ignore
+
+    @mock.patch('fd_gcp._http.time.sleep')
+    def test_execute_google_api_client_request_retries(self, sleep_mock: mock.Mock) -> None:
+        request = FakeRequest(
+            exc=_create_http_error(503, "Backend error."), response={'a': 1}, failures=2)
+        self.assertEqual(
+            execute_google_api_client_request(request, num_retries=2),  # type: ignore
+            {'a': 1})
+        self.assertEqual(len(request.execute_timeouts), 3)
+        self.assertEqual(sleep_mock.call_count, 2)
+
+        request = FakeRequest(exc=_create_http_error(503, "Backend error."), failures=2)
+        with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+            execute_google_api_client_request(request, num_retries=1)  # type: ignore
+
+        # Errors caused by the request itself are not retried.
+        request = FakeRequest(exc=_create_http_error(400, "Bad request."), failures=1)
+        with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+            execute_google_api_client_request(request, num_retries=3)  # type: ignore
+        self.assertEqual(len(request.execute_timeouts), 1)
+
+    def test_execute_google_api_client_request_timeout(self) -> None:
+        request = FakeRequest(response={'a': 1})
+        shared_connection = mock.Mock(timeout=60)
+        request.http.connections['https:cloudkms.googleapis.com'] = shared_connection
+        execute_google_api_client_request(request, timeout=5.0)  # type: ignore
+        execute_google_api_client_request(request)  # type: ignore
+        # The timeout is applied to the request only, not to the shared HTTP object.
+        self.assertLessEqual(request.execute_timeouts[0], 5.0)
+        self.assertEqual(request.execute_timeouts[1], 60)
+        self.assertEqual(request.http.timeout, 60)
+        self.assertEqual(shared_connection.timeout, 60)
+        shared_connection.sock.settimeout.assert_not_called()
+
+        request = FakeRequest(exc=socket.timeout('timed out'))
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            execute_google_api_client_request(request, timeout=5.0)  # type: ignore
+
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            execute_google_api_client_request(
+                FakeRequest(), timeout=Deadline.from_timeout(0.0))  # type: ignore
+
+    @mock.patch('fd_gcp._http.time.sleep')
+    def test_execute_google_api_client_request_timeout_retries(
+        self,
+        sleep_mock: mock.Mock,
+    ) -> None:
+        # The backoff before a retry would exceed the deadline.
+        request = FakeRequest(exc=_create_http_error(503, "Backend error."))
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            execute_google_api_client_request(
+                request, timeout=0.01, num_retries=5)  # type: ignore
+        sleep_mock.assert_not_called()
+
+    def test_execute_google_api_client_request_threads(self) -> None:
+        request = FakeRequest(response={'a': 1})
+        threads = [
+            threading.Thread(target=execute_google_api_client_request, args=(request,))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        execute_google_api_client_request(request)  # type: ignore
+        execute_google_api_client_request(request)  # type: ignore
+
+        # Each thread used its own copy of the request's HTTP object.
+        self.assertEqual(len(request.execute_https), 5)
+        self.assertEqual(len({id(http) for http in request.execute_https}), 4)
+        self.assertNotIn(request.http, request.execute_https)
+
+    def test__get_thread_http(self) -> None:
+        http = httplib2.Http(timeout=60)
+        http.connections['https:example.com'] = mock.Mock()
+        thread_http = _get_thread_http(http)
+        self.assertIsInstance(thread_http, httplib2.Http)
+        self.assertIsNot(thread_http, http)
+        self.assertIs(_get_thread_http(http), thread_http)
+        self.assertEqual(thread_http.timeout, 60)
+        self.assertEqual(thread_http.connections, {})
+
+        other_thread_https: list = []
+        thread = threading.Thread(target=lambda: other_thread_https.append(_get_thread_http(http)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_thread_https[0], thread_http)
+
+        credentials = mock.Mock(spec=google.auth.credentials.Credentials)
+        authorized_http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+        thread_authorized_http = _get_thread_http(authorized_http)
+        self.assertIsInstance(thread_authorized_http, google_auth_httplib2.AuthorizedHttp)
+        self.assertIs(thread_authorized_http.credentials, credentials)
+        self.assertIsNot(thread_authorized_http.http, http)
+
+        http_mock = googleapiclient.http.HttpMock()
+        self.assertIs(_get_thread_http(http_mock), http_mock)
+        self.assertIsNone(_get_thread_http(None))
+
+    def test_get_google_api_client_request_endpoint(self) -> None:
+        request = FakeRequest()
+        self.assertEqual(
+            get_google_api_client_request_endpoint(request),  # type: ignore
+            'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt')
+
+        request.methodId = None  # type: ignore
+        self.assertEqual(
+            get_google_api_client_request_endpoint(request),  # type: ignore
+            'POST https://cloudkms.googleapis.com/v1/projects/p/locations/global:encrypt')
+
+    def test_is_service_failure(self) -> None:
+        self.assertTrue(is_service_failure(
+            exceptions.UnrecognizedApiHttpError(_create_http_error(503, "Backend error."))))
+        self.assertTrue(is_service_failure(
+            exceptions.UnrecognizedApiHttpError(_create_http_error(429, "Quota exceeded."))))
+        self.assertFalse(is_service_failure(
+            exceptions.UnrecognizedApiHttpError(_create_http_error(400, "Bad request."))))
+        self.assertFalse(is_service_failure(exceptions.ResourceNotFound()))
+        self.assertTrue(is_service_failure(ConnectionResetError()))
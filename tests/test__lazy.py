@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import types
+import unittest
+from unittest import TestCase
+
+from fd_gcp._lazy import make_module_getattr
+
+
+# Packages that are slow to import and must not be imported by 'import fd_gcp.<module>'.
+HEAVY_PACKAGES = ('cryptography', 'google', 'googleapiclient', 'httplib2')
+
+# Benchmarks (which only report measurements) run if this environment variable is set.
+BENCHMARKS_ENABLED = bool(os.environ.get('FD_GCP_BENCHMARKS'))
+
+
+def _import_in_subprocess(code: str) -> str:
+    completed_process = subprocess.run(
+        [sys.executable, '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    return completed_process.stdout
+
+
+def _get_cumulative_import_time_us(module_name: str) -> int:
+    completed_process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module_name)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    # Lines look like: 'import time:       623 |       8270 | fd_gcp.auth'
+    for line in completed_process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = [field.strip() for field in line[len('import time:'):].split('|')]
+        if fields[2] == module_name:
+            return int(fields[1])
+    raise ValueError(module_name)
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_make_module_getattr(self) -> None:
+        module = types.ModuleType('fd_gcp_test_lazy_module')
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__)
+        module.__getattr__ = make_module_getattr(  # type: ignore
+            module.__name__, {'OrderedDict': ('collections', 'OrderedDict')})
+
+        import collections
+        self.assertIs(module.OrderedDict, collections.OrderedDict)  # type: ignore
+        self.assertIn('OrderedDict', vars(module))
+        with self.assertRaises(AttributeError):
+            module.xyz  # type: ignore
+
+
+class ImportTimeTestCase(TestCase):
+
+    def test_heavy_packages_are_not_imported(self) -> None:
+        for module_name in (
+            'fd_gcp.auth',
+            'fd_gcp.client_factory',
+            'fd_gcp.common',
+            'fd_gcp.exceptions',
+            'fd_gcp.gcp_kms',
+            'fd_gcp.gcp_kms_blind_index',
+            'fd_gcp.gcp_kms_ciphertext',
+            'fd_gcp.gcp_kms_columnar',
+            'fd_gcp.gcp_kms_data_keys',
+            'fd_gcp.gcp_kms_mock',
+            'fd_gcp.gcp_kms_reencryption',
+            'fd_gcp.gcp_kms_warm_up',
+            'fd_gcp.gcp_pubsub',
+            'fd_gcp.gcp_pubsub_mock',
+            'fd_gcp.gcp_secret_manager',
+            'fd_gcp.gcp_secret_manager_mock',
+            'fd_gcp.gcp_storage',
+            'fd_gcp.gcp_storage_mock',
+            'fd_gcp.loadgen',
+            'fd_gcp.recording',
+            'fd_gcp.tracing',
+            'fd_gcp.transport',
+        ):
+            with self.subTest(module_name=module_name):
+                output = _import_in_subprocess(
+                    'import sys, {module}; '
+                    'print(sorted(m for m in sys.modules if m.split(".")[0] in {heavy!r}))'
+                    .format(module=module_name, heavy=HEAVY_PACKAGES))
+                self.assertIn('[]', output.splitlines())
+
+    @unittest.skipUnless(BENCHMARKS_ENABLED, "Benchmarks are not enabled.")
+    def test_import_time_benchmark(self) -> None:
+        # Report the time it takes to import module 'gcp_kms' and that of importing the GCP
+        #   library it wraps. note: nothing is asserted, since timings depend on the machine's load.
+        gcp_kms_import_time = _get_cumulative_import_time_us('fd_gcp.gcp_kms')
+        googleapiclient_import_time = _get_cumulative_import_time_us('googleapiclient.discovery')
+        sys.stderr.write(
+            "\nImport time: fd_gcp.gcp_kms {} us, googleapiclient.discovery {} us.\n".format(
+                gcp_kms_import_time, googleapiclient_import_time))
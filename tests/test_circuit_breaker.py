@@ -0,0 +1,95 @@
+from unittest import TestCase
+
+from fd_gcp.circuit_breaker import CircuitBreaker, CircuitState
+from fd_gcp.exceptions import CircuitBreakerOpen
+
+from .fakes import FakeClock
+
+
+class CircuitBreakerTestCase(TestCase):
+
+    endpoint = 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt'
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.transitions: list = []
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=3,
+            slow_call_duration=1.0,
+            slow_call_threshold=2,
+            reset_timeout=10.0,
+            clock=self.clock,
+        )
+        self.circuit_breaker.add_listener(
+            lambda endpoint, old, new: self.transitions.append((endpoint, old, new)))
+
+    def _fail(self, times: int) -> None:
+        for _ in range(times):
+            self.circuit_breaker.before_call(self.endpoint)
+            self.circuit_breaker.record_failure(self.endpoint, 0.1)
+
+    def test_opens_after_consecutive_failures(self) -> None:
+        self._fail(2)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.CLOSED)
+
+        # A success resets the count of consecutive failures.
+        self.circuit_breaker.before_call(self.endpoint)
+        self.circuit_breaker.record_success(self.endpoint, 0.1)
+        self._fail(2)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.CLOSED)
+
+        self._fail(1)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.OPEN)
+        self.assertEqual(
+            self.transitions, [(self.endpoint, CircuitState.CLOSED, CircuitState.OPEN)])
+
+        with self.assertRaises(CircuitBreakerOpen) as cm:
+            self.circuit_breaker.before_call(self.endpoint)
+        self.assertEqual(cm.exception.endpoint, self.endpoint)
+        self.assertEqual(cm.exception.retry_after, 10.0)
+
+        # Other endpoints are not affected.
+        self.circuit_breaker.before_call('cloudkms.projects.locations.keyRings.create')
+
+    def test_opens_after_consecutive_slow_calls(self) -> None:
+        for _ in range(2):
+            self.circuit_breaker.before_call(self.endpoint)
+            self.circuit_breaker.record_success(self.endpoint, 1.5)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.OPEN)
+
+    def test_half_open_probe_success(self) -> None:
+        self._fail(3)
+        self.clock.now += 10.0
+
+        self.circuit_breaker.before_call(self.endpoint)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.HALF_OPEN)
+        # Only one probe at a time.
+        with self.assertRaises(CircuitBreakerOpen):
+            self.circuit_breaker.before_call(self.endpoint)
+
+        self.circuit_breaker.record_success(self.endpoint, 0.1)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.CLOSED)
+        self.assertEqual(
+            [new for _, _, new in self.transitions],
+            [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.CLOSED])
+
+    def test_half_open_probe_failure(self) -> None:
+        self._fail(3)
+        self.clock.now += 10.0
+
+        self._fail(1)
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.OPEN)
+        with self.assertRaises(CircuitBreakerOpen):
+            self.circuit_breaker.before_call(self.endpoint)
+
+    def test_reset(self) -> None:
+        self._fail(3)
+        self.circuit_breaker.reset()
+        self.assertEqual(self.circuit_breaker.get_state(self.endpoint), CircuitState.CLOSED)
+        self.assertEqual(self.circuit_breaker.get_states(), {})
+
+    def test_invalid_params(self) -> None:
+        with self.assertRaises(ValueError):
+            CircuitBreaker(failure_threshold=0)
+        with self.assertRaises(ValueError):
+            CircuitBreaker(reset_timeout=-1)
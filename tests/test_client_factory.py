@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import pickle
+from typing import Optional, Tuple
+from unittest import TestCase, mock
+
+from google.auth.credentials import AnonymousCredentials
+
+from fd_gcp import gcp_kms
+from fd_gcp.auth import CredentialsSpec
+from fd_gcp.client_factory import ProcessLocalApiClient
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.transport import InMemoryTransport
+
+
+CREDENTIALS_FILENAME = os.path.join(
+    os.path.dirname(__file__), 'data', 'service-account-credentials-1-key-1.json')
+
+
+def _create_api_client(credentials: object) -> InMemoryTransport:
+    return create_in_memory_api_client()
+
+
+_api_client: Optional[ProcessLocalApiClient] = None
+
+
+def _create_key_ring_in_child_process() -> Tuple[str, int]:
+    assert _api_client is not None
+    key_ring_grn = gcp_kms.create_key_ring(_api_client, 'projects/p/locations/global', 'test-1')
+    underlying_api_client = _api_client.get_api_client()
+    assert isinstance(underlying_api_client, InMemoryTransport)
+    return key_ring_grn, len(underlying_api_client.requests)
+
+
+class ProcessLocalApiClientTestCase(TestCase):
+
+    def test_get_api_client(self) -> None:
+        api_client = ProcessLocalApiClient(_create_api_client, AnonymousCredentials())
+
+        underlying_api_client = api_client.get_api_client()
+        self.assertIsInstance(underlying_api_client, InMemoryTransport)
+        self.assertIs(api_client.get_api_client(), underlying_api_client)
+
+        gcp_kms.create_key_ring(api_client, 'projects/p/locations/global', 'test-1')
+        self.assertEqual(len(underlying_api_client.requests), 1)
+
+        # After a fork, a new underlying API client is created.
+        with mock.patch('fd_gcp.client_factory.os.getpid', return_value=os.getpid() + 1):
+            child_underlying_api_client = api_client.get_api_client()
+            self.assertIsNot(child_underlying_api_client, underlying_api_client)
+            self.assertIs(api_client.get_api_client(), child_underlying_api_client)
+            gcp_kms.create_key_ring(api_client, 'projects/p/locations/global', 'test-1')
+        self.assertEqual(len(underlying_api_client.requests), 1)
+
+    def test_fork(self) -> None:
+        global _api_client
+
+        _api_client = ProcessLocalApiClient(_create_api_client, AnonymousCredentials())
+        self.addCleanup(globals().__setitem__, '_api_client', None)
+        underlying_api_client = _api_client.get_api_client()
+
+        # note: the child process inherits '_api_client' (it is not pickled).
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            key_ring_grn, num_requests = pool.apply(_create_key_ring_in_child_process)
+        self.assertEqual(key_ring_grn, 'projects/p/locations/global/keyRings/test-1')
+        self.assertEqual(num_requests, 1)
+        self.assertEqual(underlying_api_client.requests, [])
+
+    def test_pickle(self) -> None:
+        credentials_spec = CredentialsSpec.gce()
+        api_client = ProcessLocalApiClient(_create_api_client, credentials_spec)
+        api_client.get_api_client()
+
+        unpickled_api_client = pickle.loads(pickle.dumps(api_client))
+        self.assertEqual(unpickled_api_client.credentials, credentials_spec)
+        self.assertIsNot(unpickled_api_client.get_api_client(), api_client.get_api_client())
+
+        with self.assertRaises(TypeError):
+            pickle.dumps(ProcessLocalApiClient(_create_api_client, AnonymousCredentials()))
+
+
+class CredentialsSpecTestCase(TestCase):
+
+    def test_load(self) -> None:
+        credentials_spec = CredentialsSpec.from_file(CREDENTIALS_FILENAME)
+        self.assertEqual(credentials_spec, ('file', CREDENTIALS_FILENAME))
+        self.assertEqual(pickle.loads(pickle.dumps(credentials_spec)), credentials_spec)
+
+        credentials_spec = CredentialsSpec.gce('test-1@example.iam.gserviceaccount.com')
+        self.assertEqual(
+            credentials_spec.load().service_account_email,
+            'test-1@example.iam.gserviceaccount.com')
+
+        with self.assertRaises(ValueError):
+            CredentialsSpec('xyz').load()
@@ -0,0 +1,71 @@
+import importlib.util
+import json
+import os
+import unittest
+import zlib
+from unittest import TestCase
+
+from fd_gcp.compression import compress, decompress, is_compressed
+from fd_gcp.exceptions import DecompressionError
+
+
+JSON_DATA = json.dumps([
+    {'id': i, 'name': 'Jürgen', 'email': 'jurgen-{}@example.com'.format(i), 'active': True}
+    for i in range(1000)
+]).encode('utf-8')
+
+ZSTANDARD_AVAILABLE = importlib.util.find_spec('zstandard') is not None
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_compress_decompress(self) -> None:
+        compressed_data = compress(JSON_DATA)
+
+        self.assertTrue(compressed_data.startswith(b'\xfdZC\x01\x01'))
+        self.assertTrue(is_compressed(compressed_data))
+        self.assertLess(len(compressed_data), len(JSON_DATA) // 5)
+        self.assertEqual(decompress(compressed_data), JSON_DATA)
+
+        self.assertEqual(decompress(compress(b'')), b'')
+        self.assertEqual(decompress(compress(JSON_DATA, level=1)), JSON_DATA)
+
+    def test_compress_incompressible(self) -> None:
+        data = os.urandom(1000)
+        compressed_data = compress(data)
+
+        self.assertEqual(compressed_data, b'\xfdZC\x01\x00' + data)
+        self.assertEqual(decompress(compressed_data), data)
+
+    def test_compress_fail(self) -> None:
+        with self.assertRaises(TypeError):
+            compress('not bytes')  # type: ignore
+        with self.assertRaises(ValueError):
+            compress(JSON_DATA, 'lzma')
+
+    @unittest.skipUnless(ZSTANDARD_AVAILABLE, "Package 'zstandard' is not installed.")
+    def test_compress_decompress_zstd(self) -> None:
+        compressed_data = compress(JSON_DATA, 'zstd')
+
+        self.assertTrue(compressed_data.startswith(b'\xfdZC\x01\x02'))
+        self.assertEqual(decompress(compressed_data), JSON_DATA)
+        with self.assertRaises(DecompressionError):
+            decompress(compressed_data, max_size=len(JSON_DATA) - 1)
+
+    def test_decompress_fail(self) -> None:
+        with self.assertRaises(DecompressionError):
+            decompress(JSON_DATA)
+        with self.assertRaises(DecompressionError):
+            decompress(b'\xfdZC\x01\x09' + JSON_DATA)
+        with self.assertRaises(DecompressionError):
+            decompress(b'\xfdZC\x01\x01' + JSON_DATA)
+        with self.assertRaises(DecompressionError):
+            decompress(compress(JSON_DATA)[:-10])
+
+    def test_decompress_fail_max_size(self) -> None:
+        bomb = b'\xfdZC\x01\x01' + zlib.compress(b'\x00' * 10 * 1024 * 1024)
+
+        with self.assertRaises(DecompressionError):
+            decompress(bomb, max_size=1024 * 1024)
+        with self.assertRaises(DecompressionError):
+            decompress(compress(os.urandom(100)), max_size=99)
@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import threading
+import time
+from unittest import TestCase
+
+import googleapiclient.errors
+import httplib2
+
+from fd_gcp import exceptions
+from fd_gcp._concurrency import map_concurrently
+from fd_gcp.concurrency_limiter import ConcurrencyLimiter, get_current_limiter
+from fd_gcp.deadline import Deadline
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring, encrypt
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+
+from .fakes import FakeClock
+
+
+def _create_throttling_error() -> exceptions.UnrecognizedApiHttpError:
+    return exceptions.UnrecognizedApiHttpError(googleapiclient.errors.HttpError(
+        httplib2.Response({'status': 429}), b'{"error": {"code": 429, "message": "Quota"}}'))
+
+
+class ConcurrencyLimiterTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def _run_request(
+        self,
+        concurrency_limiter: ConcurrencyLimiter,
+        latency: float,
+        exc: Exception = None,
+    ) -> None:
+        try:
+            with concurrency_limiter.slot():
+                self.clock.now += latency
+                if exc is not None:
+                    raise exc
+        except type(exc) if exc is not None else ():
+            pass
+
+    def _run_concurrent_requests(
+        self,
+        concurrency_limiter: ConcurrencyLimiter,
+        latency: float,
+    ) -> None:
+        # As many requests as the limit lets through, that take the same time.
+        with contextlib.ExitStack() as exit_stack:
+            for _ in range(concurrency_limiter.limit):
+                exit_stack.enter_context(concurrency_limiter.slot())
+            self.clock.now += latency
+
+    def test_init_fail(self) -> None:
+        for kwargs in (
+            dict(min_limit=0),
+            dict(initial_limit=300),
+            dict(initial_limit=1, min_limit=2),
+            dict(tolerance=0.5),
+            dict(backoff_ratio=1.0),
+            dict(smoothing=0.0),
+            dict(latency_window=0),
+        ):
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaises(ValueError):
+                    ConcurrencyLimiter(**kwargs)  # type: ignore
+
+    def test_limit_latency(self) -> None:
+        concurrency_limiter = ConcurrencyLimiter(
+            initial_limit=2, max_limit=20, clock=self.clock)
+
+        # Steady latency: the limit grows, up to the max.
+        for _ in range(20):
+            self._run_concurrent_requests(concurrency_limiter, 0.1)
+        self.assertEqual(concurrency_limiter.limit, 20)
+        self.assertAlmostEqual(concurrency_limiter.average_latency, 0.1)
+
+        # Latency increases a lot: the limit shrinks.
+        for _ in range(2):
+            self._run_concurrent_requests(concurrency_limiter, 1.0)
+        self.assertLess(concurrency_limiter.limit, 10)
+        self.assertEqual(concurrency_limiter.in_flight, 0)
+
+    def test_limit_not_used(self) -> None:
+        concurrency_limiter = ConcurrencyLimiter(initial_limit=8, clock=self.clock)
+        # Only 1 request in flight at a time.
+        for _ in range(10):
+            self._run_request(concurrency_limiter, 0.1)
+        self.assertEqual(concurrency_limiter.limit, 8)
+
+    def test_limit_failures(self) -> None:
+        concurrency_limiter = ConcurrencyLimiter(
+            initial_limit=10, backoff_ratio=0.5, clock=self.clock)
+        self._run_request(concurrency_limiter, 1.0)
+
+        self._run_request(concurrency_limiter, 0.1, _create_throttling_error())
+        self.assertEqual(concurrency_limiter.limit, 5)
+        # Failures within (about) the same latency decrease the limit once.
+        self._run_request(concurrency_limiter, 0.1, _create_throttling_error())
+        self.assertEqual(concurrency_limiter.limit, 5)
+        self._run_request(concurrency_limiter, 1.0, exceptions.DeadlineExceeded())
+        self.assertEqual(concurrency_limiter.limit, 2)
+        # Not a failure of the service.
+        self._run_request(concurrency_limiter, 1.0, exceptions.ResourceNotFound())
+        self.assertEqual(concurrency_limiter.limit, 2)
+
+        for _ in range(5):
+            self.clock.now += 10.0
+            self._run_request(concurrency_limiter, 0.1, _create_throttling_error())
+        self.assertEqual(concurrency_limiter.limit, 1)
+
+    def test_slot_wait(self) -> None:
+        concurrency_limiter = ConcurrencyLimiter(initial_limit=1, max_limit=1)
+        entered = []
+
+        def run() -> None:
+            with concurrency_limiter.slot():
+                entered.append(time.monotonic())
+
+        with concurrency_limiter.slot():
+            with self.assertRaises(exceptions.DeadlineExceeded):
+                with concurrency_limiter.slot(Deadline.from_timeout(0.01)):
+                    pass
+            thread = threading.Thread(target=run)
+            thread.start()
+            time.sleep(0.05)
+            self.assertEqual(entered, [])
+        thread.join()
+        self.assertEqual(len(entered), 1)
+        self.assertEqual(concurrency_limiter.in_flight, 0)
+
+    def test_slot_async(self) -> None:
+        concurrency_limiter = ConcurrencyLimiter(initial_limit=2, max_limit=2)
+        max_in_flight = 0
+
+        async def run() -> None:
+            nonlocal max_in_flight
+            async with concurrency_limiter.slot_async():
+                max_in_flight = max(max_in_flight, concurrency_limiter.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def run_all() -> None:
+            # A thread takes a slot too.
+            with concurrency_limiter.slot():
+                tasks = [asyncio.ensure_future(run()) for _ in range(6)]
+                await asyncio.sleep(0.05)
+            await asyncio.gather(*tasks)
+
+            with concurrency_limiter.slot(), concurrency_limiter.slot():
+                with self.assertRaises(exceptions.DeadlineExceeded):
+                    async with concurrency_limiter.slot_async(Deadline.from_timeout(0.01)):
+                        pass
+
+        asyncio.get_event_loop().run_until_complete(run_all())
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual(concurrency_limiter.in_flight, 0)
+
+    def test_apply(self) -> None:
+        kms_api_client = create_in_memory_api_client()
+        method_id = 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt'
+        handler = kms_api_client.handlers[method_id]
+        concurrency_limiter = ConcurrencyLimiter(initial_limit=3, max_limit=3)
+        in_flight = []
+
+        def encrypt_handler(params: dict, body: dict) -> dict:
+            in_flight.append(concurrency_limiter.in_flight)
+            time.sleep(0.01)
+            return handler(params, body)
+
+        kms_api_client.handlers[method_id] = encrypt_handler
+        key_ring_grn = create_key_ring(
+            kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        crypto_key_grn = create_crypto_key(kms_api_client, key_ring_grn, 'key-1')
+
+        self.assertIsNone(get_current_limiter())
+        with concurrency_limiter.apply():
+            self.assertIs(get_current_limiter(), concurrency_limiter)
+            map_concurrently(
+                lambda data: encrypt(kms_api_client, crypto_key_grn, data), [b'x'] * 12)
+        self.assertIsNone(get_current_limiter())
+
+        self.assertEqual(len(in_flight), 12)
+        self.assertTrue(all(1 <= value <= 3 for value in in_flight))
+        self.assertIn(3, in_flight)
+        self.assertEqual(concurrency_limiter.in_flight, 0)
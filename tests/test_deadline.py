@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from fd_gcp.deadline import Deadline, to_deadline
+from fd_gcp.exceptions import DeadlineExceeded
+
+from .fakes import FakeClock
+
+
+class DeadlineTestCase(TestCase):
+
+    def test_deadline(self) -> None:
+        clock = FakeClock()
+        deadline = Deadline.from_timeout(2.0, clock=clock)
+
+        self.assertEqual(deadline.remaining(), 2.0)
+        self.assertFalse(deadline.expired())
+        deadline.check()
+
+        clock.now += 2.5
+        self.assertEqual(deadline.remaining(), 0.0)
+        self.assertTrue(deadline.expired())
+        with self.assertRaises(DeadlineExceeded) as cm:
+            deadline.check('encrypt')
+        self.assertEqual(str(cm.exception), "Deadline exceeded: encrypt.")
+
+    def test_from_timeout_negative(self) -> None:
+        with self.assertRaises(ValueError):
+            Deadline.from_timeout(-1.0)
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_to_deadline(self) -> None:
+        self.assertIsNone(to_deadline(None))
+
+        deadline = Deadline.from_timeout(5)
+        self.assertIs(to_deadline(deadline), deadline)
+
+        new_deadline = to_deadline(5)
+        assert new_deadline is not None
+        self.assertGreater(new_deadline.remaining(), 4.0)
+
+        with self.assertRaises(TypeError):
+            to_deadline('5')  # type: ignore
@@ -1,10 +1,13 @@
+import json
 from unittest import TestCase
 
 from fd_gcp.exceptions import (  # noqa: F401
-    AlreadyExists, AuthError, Error, ResourceNotFound, ResourcePermissionDenied,
+    AlreadyExists, AuthError, CircuitBreakerOpen, ConcurrentModification, DeadlineExceeded, Error,
+    ResourceNotFound, ResourcePermissionDenied,
     UnrecognizedApiError, UnrecognizedApiHttpError,
-    _detect_already_exists, _detect_resource_not_found, _detect_resource_permission_denied,
-    process_googleapiclient_http_error,
+    _detect_already_exists, _detect_concurrent_modification, _detect_resource_not_found,
+    _detect_resource_permission_denied,
+    process_api_http_error, process_googleapiclient_http_error,
 )
 
 
@@ -15,15 +18,65 @@ class FunctionsTestCase(TestCase):
         # _detect_already_exists()
         pass
 
+    def test__detect_concurrent_modification(self) -> None:
+        exc = process_api_http_error(
+            409,
+            b'{"error": {"code": 409, "message": "There were concurrent policy changes.", '
+            b'"status": "ABORTED"}}',
+            'https://cloudkms.googleapis.com/v1/projects/p:setIamPolicy',
+        )
+        self.assertIsInstance(exc, ConcurrentModification)
+
+        exc = process_api_http_error(
+            409,
+            b'{"error": {"code": 409, "message": "KeyRing projects/p already exists.", '
+            b'"status": "ALREADY_EXISTS"}}',
+            'https://cloudkms.googleapis.com/v1/projects/p/keyRings?keyRingId=k',
+        )
+        self.assertIsInstance(exc, AlreadyExists)
+
+        # Etag mismatch, without the error status.
+        exc = process_api_http_error(
+            409,
+            b'{"error": {"code": 409, "message": "There were concurrent policy changes. '
+            b'Please retry the whole read-modify-write with exponential backoff."}}',
+            'https://cloudkms.googleapis.com/v1/projects/p:setIamPolicy',
+        )
+        self.assertIsInstance(exc, ConcurrentModification)
+
+        # Other conflicts are not concurrent modifications.
+        for content in (
+            b'{"error": {"code": 409, "message": "Conflict.", "status": "FAILED_PRECONDITION"}}',
+            b'{"error": {"code": 409, "message": "Conflict."}}',
+            b'Conflict',
+        ):
+            with self.subTest(content=content):
+                exc = process_api_http_error(409, content, 'https://cloudkms.googleapis.com/v1/x')
+                self.assertIsInstance(exc, UnrecognizedApiHttpError)
+
     def test__detect_resource_permission_denied(self) -> None:
         # TODO: implement test
         # _detect_resource_permission_denied()
         pass
 
     def test__detect_resource_not_found(self) -> None:
-        # TODO: implement test
-        # _detect_resource_not_found()
-        pass
+        for message, resource in (
+            ('CryptoKey projects/p/locations/l/keyRings/k/cryptoKeys/c not found.',
+             'projects/p/locations/l/keyRings/k/cryptoKeys/c'),
+            ('Secret [projects/1/secrets/s] not found or has no versions.',
+             'projects/1/secrets/s'),
+            ('Secret Version [projects/1/secrets/s/versions/3] not found.',
+             'projects/1/secrets/s/versions/3'),
+            ('No such object: my-bucket/a/b.txt', 'my-bucket/a/b.txt'),
+        ):
+            with self.subTest(message=message):
+                exc = process_api_http_error(
+                    404,
+                    json.dumps({'error': {'code': 404, 'message': message}}).encode(),
+                    'https://x.googleapis.com/v1/x',
+                )
+                self.assertIsInstance(exc, ResourceNotFound)
+                self.assertEqual(exc.resource, resource)
 
     def test_process_googleapiclient_http_error(self) -> None:
         # TODO: implement test
@@ -58,6 +111,22 @@ class ExceptionsTestCase(TestCase):
         # raise ResourcePermissionDenied()
         pass
 
+    def test_circuit_breaker_open(self) -> None:
+        exc = CircuitBreakerOpen('cloudkms.projects.locations.keyRings.create', 1.5)
+        self.assertEqual(exc.retry_after, 1.5)
+        self.assertEqual(
+            str(exc),
+            "Circuit of endpoint 'cloudkms.projects.locations.keyRings.create' is open.")
+
+    def test_concurrent_modification(self) -> None:
+        self.assertEqual(
+            str(ConcurrentModification('projects/p')),
+            "Resource 'projects/p' was modified concurrently.")
+
+    def test_deadline_exceeded(self) -> None:
+        self.assertEqual(str(DeadlineExceeded()), "Deadline exceeded.")
+        self.assertEqual(str(DeadlineExceeded('encrypt')), "Deadline exceeded: encrypt.")
+
     def test_unrecognized_api_error(self) -> None:
         # TODO: implement test
         # raise UnrecognizedApiError()
@@ -1,13 +1,35 @@
-from unittest import TestCase
+import base64
+import hashlib
+import io
+import os
+import re
+from unittest import TestCase, mock
 
+from google.auth.credentials import AnonymousCredentials
+
+from fd_gcp.exceptions import (
+    AlreadyExists, ConcurrentModification, ResourceNotFound, UnrecognizedApiHttpError,
+)
+from fd_gcp import gcp_kms
 from fd_gcp.gcp_kms import (  # noqa: F401
+    KmsRestApiClient,
     add_member_to_crypto_key_iam_policy,
+    asymmetric_decrypt, asymmetric_sign, clear_public_key_cache, encrypt_to_public_key,
+    get_public_key, verify,
+    compute_digest, mac_sign, mac_sign_batch, mac_sign_stream, mac_verify, mac_verify_batch,
+    mac_verify_stream,
     compose_crypto_key_grn, compose_crypto_key_version_grn, compose_key_ring_grn,
     compose_location_grn, compose_project_grn,
     create_api_client, create_crypto_key, create_key_ring,
-    decrypt, encrypt,
-    get_key_ring_iam_policy,
+    decrypt, encrypt, ensure_crypto_key, ensure_key_ring,
+    get_crypto_key, get_key_ring_iam_policy,
+    IamPolicyChange, apply_iam_policy_changes, update_crypto_key_iam_policies,
+    IamPolicy, IamPolicyCache,
+    KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE,
 )
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.resource_cache import ResourceCache
+from fd_gcp.transport import ApiMethod, RequestsTransport
 
 
 class ResourceGrnFunctionsTestCase(TestCase):
@@ -76,57 +98,561 @@ class ResourceGrnFunctionsTestCase(TestCase):
 class OtherFunctionsTestCase(TestCase):
 
     def test_create_api_client(self) -> None:
-        # TODO: implement test
-        # create_api_client()
-        pass
+        credentials = AnonymousCredentials()
+
+        api_client = create_api_client(credentials, transport='requests')
+        self.assertIsInstance(api_client, KmsRestApiClient)
+
+        with self.assertRaises(ValueError):
+            create_api_client(credentials, transport='xyz')
+
+    def test_create_api_client_discovery_document(self) -> None:
+        discovery_document = {
+            'rootUrl': 'https://cloudkms.googleapis.com/',
+            'servicePath': '',
+            'batchPath': 'batch',
+            'resources': {'projects': {'methods': {}}},
+        }
+
+        # The discovery document is not fetched again.
+        with mock.patch.object(gcp_kms, '_discovery_document', discovery_document), \
+                mock.patch('googleapiclient.discovery.build') as mock_build:
+            api_client = create_api_client(AnonymousCredentials())
+        mock_build.assert_not_called()
+        self.assertTrue(hasattr(api_client, 'projects'))
+
+
+class KmsRestApiClientTestCase(TestCase):
+
+    def test_build_url(self) -> None:
+        api_client = KmsRestApiClient(session=object())  # type: ignore
+        generic_transport = RequestsTransport(
+            gcp_kms.KMS_API_BASE_URL, session=object())  # type: ignore
+        grn = 'projects/p/locations/global/keyRings/r'
+        query_params_by_path_suffix = {
+            '/keyRings': {'keyRingId': 'r-1'},
+            '/cryptoKeys': {'cryptoKeyId': 'k_1'},
+        }
+
+        methods = [value for value in vars(gcp_kms).values() if isinstance(value, ApiMethod)]
+        self.assertTrue(methods)
+        for method in methods:
+            with self.subTest(method=method.id):
+                params = {name: grn for name in re.findall(r'\{\+(\w+)\}', method.path)}
+                for path_suffix, query_params in query_params_by_path_suffix.items():
+                    if method.path.endswith(path_suffix):
+                        params.update(query_params)
+
+                # The hand-written URL builders are equivalent to the generic one.
+                self.assertEqual(
+                    api_client.build_url(method, params),
+                    generic_transport.build_url(method, params))
+
+
+class IamPolicyFunctionsTestCase(TestCase):
+
+    def test_apply_iam_policy_changes(self) -> None:
+        policy = {'etag': 'ACAB', 'bindings': [
+            {'role': 'roles/viewer', 'members': ['user:a@example.com']},
+            {
+                'role': 'roles/owner', 'members': ['user:a@example.com'],
+                'condition': {'expression': 'true'},
+            },
+        ]}
+
+        self.assertTrue(apply_iam_policy_changes(policy, [
+            IamPolicyChange('user:b@example.com', 'roles/viewer'),
+            IamPolicyChange('user:b@example.com', 'roles/viewer'),
+            IamPolicyChange('user:b@example.com', 'roles/owner'),
+            IamPolicyChange('user:a@example.com', 'roles/viewer', remove=True),
+        ]))
+        self.assertEqual(policy, {'etag': 'ACAB', 'bindings': [
+            {'role': 'roles/viewer', 'members': ['user:b@example.com']},
+            {
+                'role': 'roles/owner', 'members': ['user:a@example.com'],
+                'condition': {'expression': 'true'},
+            },
+            {'role': 'roles/owner', 'members': ['user:b@example.com']},
+        ]})
+
+        self.assertFalse(apply_iam_policy_changes(policy, [
+            IamPolicyChange('user:b@example.com', 'roles/viewer'),
+            IamPolicyChange('user:c@example.com', 'roles/viewer', remove=True),
+        ]))
+
+        policy = {'etag': 'ACAB'}
+        self.assertFalse(apply_iam_policy_changes(policy, []))
+        self.assertEqual(policy, {'etag': 'ACAB'})
 
 
 class ApiOperationsFunctionsTestCase(TestCase):
 
+    location_grn = 'projects/fd-secrets-manager-dev-2/locations/global'
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+
+    def _create_crypto_key(self) -> str:
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, self.location_grn, 'dd06b298-e408-43dd-a553-69ad046a9938')
+        return create_crypto_key(
+            self.kms_api_client, key_ring_grn, '004c9cd1-b4bf-4f9e-98e3-8aebcce6a5a0')
+
     def test_create_key_ring(self) -> None:
-        # TODO: implement test
-        # create_key_ring()
-        pass
+        key_ring_grn = create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
+        self.assertEqual(
+            key_ring_grn,
+            'projects/fd-secrets-manager-dev-2/locations/global/keyRings/test-1')
+
+        with self.assertRaises(AlreadyExists):
+            create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
 
     def test_create_crypto_key(self) -> None:
-        # TODO: implement test
-        # create_crypto_key()
-        pass
+        key_ring_grn = create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
+
+        self.assertEqual(
+            create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1'),
+            key_ring_grn + '/cryptoKeys/key-1')
+        self.assertRegex(
+            create_crypto_key(self.kms_api_client, key_ring_grn),
+            r'^' + key_ring_grn + r'/cryptoKeys/[a-z0-9]{32}$')
+
+        _, _, body = self.kms_api_client.requests[-1]
+        self.assertEqual(body, {'purpose': 'ENCRYPT_DECRYPT'})
+
+        with self.assertRaises(ResourceNotFound):
+            create_crypto_key(self.kms_api_client, self.location_grn + '/keyRings/xyz')
+
+    def test_ensure_key_ring(self) -> None:
+        resource_cache = ResourceCache()
+        key_ring_grn = self.location_grn + '/keyRings/test-1'
+
+        for _ in range(2):
+            self.assertEqual(
+                ensure_key_ring(
+                    self.kms_api_client, self.location_grn, 'test-1',
+                    resource_cache=resource_cache),
+                key_ring_grn)
+        self.assertEqual(
+            [method.id.rsplit('.', 1)[-1] for method, _, _ in self.kms_api_client.requests],
+            ['get', 'create'])
+        self.assertIn(key_ring_grn, resource_cache)
+
+        # It exists but it is not in the cache.
+        ensure_key_ring(
+            self.kms_api_client, self.location_grn, 'test-1', resource_cache=ResourceCache())
+        self.assertEqual(self.kms_api_client.requests[-1][0].id.rsplit('.', 1)[-1], 'get')
+        self.assertEqual(len(self.kms_api_client.requests), 3)
+
+    def test_ensure_key_ring_concurrently_created(self) -> None:
+        create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
+
+        def get_key_ring(params: dict, body: object) -> dict:
+            raise ResourceNotFound(params['name'])
+
+        self.kms_api_client.register('cloudkms.projects.locations.keyRings.get', get_key_ring)
+        self.assertEqual(
+            ensure_key_ring(
+                self.kms_api_client, self.location_grn, 'test-1',
+                resource_cache=ResourceCache()),
+            self.location_grn + '/keyRings/test-1')
+
+    def test_ensure_crypto_key(self) -> None:
+        resource_cache = ResourceCache()
+        key_ring_grn = ensure_key_ring(
+            self.kms_api_client, self.location_grn, 'test-1', resource_cache=resource_cache)
+
+        for _ in range(2):
+            self.assertEqual(
+                ensure_crypto_key(
+                    self.kms_api_client, key_ring_grn, 'key-1',
+                    purpose='MAC', algorithm='HMAC_SHA256',
+                    resource_cache=resource_cache),
+                key_ring_grn + '/cryptoKeys/key-1')
+        self.assertEqual(len(self.kms_api_client.requests), 4)
+
+        _, _, body = self.kms_api_client.requests[-1]
+        self.assertEqual(body, {'purpose': 'MAC', 'versionTemplate': {'algorithm': 'HMAC_SHA256'}})
+
+        with self.assertRaises(ResourceNotFound):
+            ensure_crypto_key(
+                self.kms_api_client, self.location_grn + '/keyRings/xyz', 'key-1',
+                resource_cache=resource_cache)
+
+    def test_get_crypto_key(self) -> None:
+        crypto_key_grn = self._create_crypto_key()
+
+        crypto_key = get_crypto_key(self.kms_api_client, crypto_key_grn)
+        self.assertEqual(crypto_key['name'], crypto_key_grn)
+        self.assertEqual(crypto_key['purpose'], 'ENCRYPT_DECRYPT')
+
+        with self.assertRaises(ResourceNotFound):
+            get_crypto_key(self.kms_api_client, crypto_key_grn + 'x')
 
     def test_encrypt(self) -> None:
-        # TODO: implement test
-        # encrypt()
-        pass
+        crypto_key_grn = self._create_crypto_key()
+        plain_data = b'J\xc3\xbcrgen loves \xce\xa9! \xe2\x9c\x94 \n\r\t 123'
+
+        encrypted_data = encrypt(self.kms_api_client, crypto_key_grn, plain_data)
+        self.assertIsInstance(encrypted_data, bytes)
+        self.assertNotEqual(encrypted_data, plain_data)
+
+        with self.assertRaises(TypeError):
+            encrypt(self.kms_api_client, crypto_key_grn, 'not bytes')  # type: ignore
+        with self.assertRaises(ValueError):
+            encrypt(
+                self.kms_api_client, crypto_key_grn,
+                b'1' * (KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE + 1))
+        with self.assertRaises(ResourceNotFound):
+            encrypt(self.kms_api_client, crypto_key_grn + 'x', plain_data)
+
+    def test_encrypt_decrypt_compression(self) -> None:
+        crypto_key_grn = self._create_crypto_key()
+        plain_data = b'{"name": "J\xc3\xbcrgen"}' * (KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE // 10)
+
+        encrypted_data = encrypt(
+            self.kms_api_client, crypto_key_grn, plain_data, compression='zlib')
+        self.assertEqual(
+            decrypt(self.kms_api_client, crypto_key_grn, encrypted_data, decompress=True),
+            plain_data)
+        self.assertNotEqual(
+            decrypt(self.kms_api_client, crypto_key_grn, encrypted_data), plain_data)
+
+        # Data that was not compressed is returned as is.
+        encrypted_data = encrypt(self.kms_api_client, crypto_key_grn, b'123')
+        self.assertEqual(
+            decrypt(self.kms_api_client, crypto_key_grn, encrypted_data, decompress=True),
+            b'123')
+
+        with self.assertRaises(ValueError):
+            encrypt(
+                self.kms_api_client, crypto_key_grn,
+                os.urandom(KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE), compression='zlib')
 
     def test_decrypt(self) -> None:
-        # TODO: implement test
-        # decrypt()
-        pass
+        crypto_key_grn = self._create_crypto_key()
+        plain_data = b'J\xc3\xbcrgen loves \xce\xa9! \xe2\x9c\x94 \n\r\t 123'
+
+        encrypted_data = encrypt(self.kms_api_client, crypto_key_grn, plain_data)
+        self.assertEqual(
+            decrypt(self.kms_api_client, crypto_key_grn, encrypted_data),
+            plain_data)
+
+        with self.assertRaises(UnrecognizedApiHttpError):
+            decrypt(self.kms_api_client, crypto_key_grn, b'invalid')
 
     def test_add_member_to_crypto_key_iam_policy(self) -> None:
-        # TODO: implement test
-        # add_member_to_crypto_key_iam_policy()
-        pass
+        crypto_key_grn = self._create_crypto_key()
+        member = 'serviceAccount:test-1@fd-secrets-manager-dev-2.iam.gserviceaccount.com'
+        role = 'roles/cloudkms.cryptoKeyEncrypterDecrypter'
+
+        add_member_to_crypto_key_iam_policy(self.kms_api_client, crypto_key_grn, member, role)
+
+        _, _, body = self.kms_api_client.requests[-1]
+        assert body is not None
+        self.assertEqual(body['policy']['bindings'], [{'role': role, 'members': [member]}])
+
+    def test_update_crypto_key_iam_policies(self) -> None:
+        key_ring_grn = create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
+        crypto_key_grns = [
+            create_crypto_key(self.kms_api_client, key_ring_grn, 'key-{}'.format(i))
+            for i in range(10)
+        ]
+        role = 'roles/cloudkms.cryptoKeyEncrypterDecrypter'
+        changes = [
+            IamPolicyChange('group:team-1@example.com', role),
+            IamPolicyChange('user:mike@example.com', role),
+            IamPolicyChange('user:mike@example.com', 'roles/viewer'),
+        ]
+        num_requests = len(self.kms_api_client.requests)
+
+        policies = update_crypto_key_iam_policies(
+            self.kms_api_client, {grn: changes for grn in crypto_key_grns}, max_concurrency=4)
+
+        self.assertEqual(list(policies), crypto_key_grns)
+        for policy in policies.values():
+            self.assertEqual(policy['bindings'], [
+                {'role': role, 'members': ['group:team-1@example.com', 'user:mike@example.com']},
+                {'role': 'roles/viewer', 'members': ['user:mike@example.com']},
+            ])
+        # One read-modify-write per crypto key.
+        self.assertEqual(len(self.kms_api_client.requests) - num_requests, 20)
+
+        # Nothing changes, so nothing is written.
+        update_crypto_key_iam_policies(self.kms_api_client, {crypto_key_grns[0]: changes})
+        self.assertEqual(len(self.kms_api_client.requests) - num_requests, 21)
+
+        policies = update_crypto_key_iam_policies(self.kms_api_client, {
+            crypto_key_grns[0]: [IamPolicyChange('user:mike@example.com', 'roles/viewer', True)],
+        })
+        self.assertEqual(policies[crypto_key_grns[0]]['bindings'], [
+            {'role': role, 'members': ['group:team-1@example.com', 'user:mike@example.com']},
+        ])
+
+    @mock.patch('fd_gcp.gcp_kms.time.sleep')
+    def test_update_crypto_key_iam_policies_conflict(self, mock_sleep: mock.Mock) -> None:
+        crypto_key_grn = self._create_crypto_key()
+        set_iam_policy = self.kms_api_client.handlers[
+            'cloudkms.projects.locations.keyRings.cryptoKeys.setIamPolicy']
+        num_conflicts = [2]
+
+        def set_iam_policy_with_conflicts(params: dict, body: dict) -> dict:
+            if num_conflicts[0]:
+                num_conflicts[0] -= 1
+                # Someone else changes the policy between our read and write.
+                set_iam_policy(params, {'policy': {'bindings': [
+                    {'role': 'roles/owner', 'members': ['user:other@example.com']},
+                ]}})
+            return set_iam_policy(params, body)
+
+        self.kms_api_client.register(
+            'cloudkms.projects.locations.keyRings.cryptoKeys.setIamPolicy',
+            set_iam_policy_with_conflicts)
+
+        policies = update_crypto_key_iam_policies(self.kms_api_client, {
+            crypto_key_grn: [IamPolicyChange('user:mike@example.com', 'roles/viewer')],
+        })
+        self.assertEqual(policies[crypto_key_grn]['bindings'], [
+            {'role': 'roles/owner', 'members': ['user:other@example.com']},
+            {'role': 'roles/viewer', 'members': ['user:mike@example.com']},
+        ])
+        self.assertEqual(mock_sleep.call_count, 2)
+
+        num_conflicts[0] = 100
+        with self.assertRaises(ConcurrentModification):
+            update_crypto_key_iam_policies(self.kms_api_client, {
+                crypto_key_grn: [IamPolicyChange('user:mike@example.com', 'roles/owner')],
+            })
 
     def test_get_key_ring_iam_policy(self) -> None:
-        # TODO: implement test
-        #
-        # service_account_email = 'serviceAccount:test-1@fd-secrets-manager-dev-2.iam.gserviceaccount.com'  # noqa: E501
-        # iam_role = 'roles/cloudkms.cryptoKeyEncrypterDecrypter'
-        #
-        # self.assertListEqual(
-        #     get_key_ring_iam_policy(kms_api_client, key_ring_grn),
-        #     []
-        # )
-        #
-        # # Add member to key ring IAM policy manually, and check:
-        # self.assertListEqual(
-        #     get_key_ring_iam_policy(kms_api_client, key_ring_grn),
-        #     [{
-        #         'role': 'roles/cloudkms.cryptoKeyEncrypterDecrypter',
-        #         'members': [
-        #             'serviceAccount:test-1@fd-secrets-manager-dev-2.iam.gserviceaccount.com',
-        #         ]
-        #     }]
-        # )
-        pass
+        key_ring_grn = create_key_ring(self.kms_api_client, self.location_grn, 'test-1')
+
+        self.assertListEqual(
+            get_key_ring_iam_policy(self.kms_api_client, key_ring_grn),
+            []
+        )
+
+
+class AsymmetricApiOperationsFunctionsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        self.key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        clear_public_key_cache()
+        self.addCleanup(clear_public_key_cache)
+
+    def _create_crypto_key_version(self, purpose: str, algorithm: str) -> str:
+        crypto_key_grn = create_crypto_key(
+            self.kms_api_client, self.key_ring_grn, purpose=purpose, algorithm=algorithm)
+        return crypto_key_grn + '/cryptoKeyVersions/1'
+
+    def test_create_crypto_key_fail_algorithm(self) -> None:
+        with self.assertRaises(ValueError):
+            create_crypto_key(self.kms_api_client, self.key_ring_grn, purpose='ASYMMETRIC_SIGN')
+
+    def test_asymmetric_sign_verify(self) -> None:
+        data = b'{"sub": "1234567890"}'
+
+        for algorithm in ('EC_SIGN_P256_SHA256', 'RSA_SIGN_PSS_2048_SHA256'):
+            with self.subTest(algorithm=algorithm):
+                crypto_key_version_grn = self._create_crypto_key_version(
+                    'ASYMMETRIC_SIGN', algorithm)
+
+                signature = asymmetric_sign(
+                    self.kms_api_client, crypto_key_version_grn, hashlib.sha256(data).digest())
+
+                self.assertTrue(
+                    verify(self.kms_api_client, crypto_key_version_grn, signature, data))
+                self.assertFalse(
+                    verify(self.kms_api_client, crypto_key_version_grn, signature, data + b' '))
+
+        with self.assertRaises(ValueError):
+            asymmetric_sign(self.kms_api_client, crypto_key_version_grn, b'1234')
+
+    def test_encrypt_to_public_key_asymmetric_decrypt(self) -> None:
+        crypto_key_version_grn = self._create_crypto_key_version(
+            'ASYMMETRIC_DECRYPT', 'RSA_DECRYPT_OAEP_2048_SHA256')
+        plain_data = b'J\xc3\xbcrgen loves \xce\xa9!'
+
+        encrypted_data = encrypt_to_public_key(
+            self.kms_api_client, crypto_key_version_grn, plain_data)
+        self.assertNotEqual(encrypted_data, plain_data)
+        self.assertEqual(
+            asymmetric_decrypt(self.kms_api_client, crypto_key_version_grn, encrypted_data),
+            plain_data)
+
+    def test_get_public_key_cache(self) -> None:
+        crypto_key_version_grn = self._create_crypto_key_version(
+            'ASYMMETRIC_SIGN', 'EC_SIGN_P256_SHA256')
+
+        public_key = get_public_key(self.kms_api_client, crypto_key_version_grn)
+        self.assertEqual(public_key.algorithm, 'EC_SIGN_P256_SHA256')
+        self.assertTrue(public_key.pem.startswith('-----BEGIN PUBLIC KEY-----'))
+
+        num_requests = len(self.kms_api_client.requests)
+        for _ in range(3):
+            self.assertIs(get_public_key(self.kms_api_client, crypto_key_version_grn), public_key)
+            verify(self.kms_api_client, crypto_key_version_grn, b'', b'')
+        self.assertEqual(len(self.kms_api_client.requests), num_requests)
+
+
+class MacApiOperationsFunctionsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        crypto_key_grn = create_crypto_key(
+            self.kms_api_client, key_ring_grn, purpose='MAC', algorithm='HMAC_SHA256')
+        self.crypto_key_version_grn = crypto_key_grn + '/cryptoKeyVersions/1'
+
+    def test_mac_sign_verify(self) -> None:
+        data = b'{"event": "invoice.created"}'
+
+        mac = mac_sign(self.kms_api_client, self.crypto_key_version_grn, data)
+        self.assertEqual(len(mac), 32)
+        self.assertTrue(mac_verify(self.kms_api_client, self.crypto_key_version_grn, data, mac))
+        self.assertFalse(
+            mac_verify(self.kms_api_client, self.crypto_key_version_grn, data + b' ', mac))
+
+    def test_mac_sign_fail(self) -> None:
+        with self.assertRaises(TypeError):
+            mac_sign(self.kms_api_client, self.crypto_key_version_grn, 'abc')  # type: ignore
+        with self.assertRaises(ValueError):
+            mac_sign(
+                self.kms_api_client, self.crypto_key_version_grn,
+                b'a' * (gcp_kms.KMS_MAC_DATA_MAX_SIZE + 1))
+        with self.assertRaises(ResourceNotFound):
+            mac_sign(self.kms_api_client, self.crypto_key_version_grn + '0', b'abc')
+
+    def test_mac_sign_verify_batch(self) -> None:
+        data_items = [str(i).encode('ascii') for i in range(20)]
+
+        macs = mac_sign_batch(
+            self.kms_api_client, self.crypto_key_version_grn, data_items, max_concurrency=4)
+        self.assertEqual(
+            macs,
+            [mac_sign(self.kms_api_client, self.crypto_key_version_grn, d) for d in data_items])
+
+        items = list(zip(data_items, macs))
+        items[3] = (b'x', macs[3])
+        self.assertEqual(
+            mac_verify_batch(self.kms_api_client, self.crypto_key_version_grn, items),
+            [i != 3 for i in range(20)])
+
+    def test_mac_sign_batch_fail(self) -> None:
+        with self.assertRaises(ResourceNotFound):
+            mac_sign_batch(
+                self.kms_api_client, self.crypto_key_version_grn + '0', [b'a', b'b', b'c'])
+
+    def test_compute_digest(self) -> None:
+        data = b'0123456789' * 20000
+        expected_digest = hashlib.sha256(data).digest()
+
+        self.assertEqual(compute_digest(data), expected_digest)
+        self.assertEqual(compute_digest(io.BytesIO(data)), expected_digest)
+        self.assertEqual(
+            compute_digest(data[i:i + 1000] for i in range(0, len(data), 1000)),
+            expected_digest)
+        self.assertEqual(compute_digest(data, 'sha512'), hashlib.sha512(data).digest())
+
+    def test_mac_sign_verify_stream(self) -> None:
+        data = b'0123456789' * 20000
+
+        mac = mac_sign_stream(self.kms_api_client, self.crypto_key_version_grn, io.BytesIO(data))
+        self.assertTrue(
+            mac_verify_stream(self.kms_api_client, self.crypto_key_version_grn, data, mac))
+        self.assertFalse(
+            mac_verify_stream(self.kms_api_client, self.crypto_key_version_grn, data[1:], mac))
+
+        # Only the digest is sent to KMS.
+        _, _, body = self.kms_api_client.requests[-1]
+        self.assertEqual(len(base64.b64decode(body['data'])), 32)
+
+
+class IamPolicyCacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        self.key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, self.key_ring_grn, 'key-1')
+        update_crypto_key_iam_policies(self.kms_api_client, {self.crypto_key_grn: [
+            IamPolicyChange('user:mike@example.com', 'roles/viewer'),
+            IamPolicyChange('user:mike@example.com', 'roles/owner'),
+        ]})
+
+        self.now = 0.0
+        self.iam_policy_cache = IamPolicyCache(
+            self.kms_api_client, ttl=60.0, clock=lambda: self.now)
+        self.changes: list = []
+        self.iam_policy_cache.add_listener(
+            lambda old_policy, new_policy: self.changes.append((old_policy, new_policy)))
+
+    def _count_get_iam_policy_requests(self) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests
+            if method.id.endswith('.getIamPolicy'))
+
+    def test_iam_policy(self) -> None:
+        policy = IamPolicy.from_response('projects/p', {'etag': 'ACAB', 'bindings': [
+            {'role': 'roles/viewer', 'members': ['user:a@example.com', 'user:b@example.com']},
+            {'role': 'roles/owner', 'members': ['user:a@example.com']},
+            {
+                'role': 'roles/admin', 'members': ['user:b@example.com'],
+                'condition': {'expression': 'true'},
+            },
+        ]})
+
+        self.assertEqual(policy.etag, 'ACAB')
+        self.assertEqual(policy.get_roles('user:a@example.com'), {'roles/viewer', 'roles/owner'})
+        self.assertEqual(policy.get_roles('user:b@example.com'), {'roles/viewer'})
+        self.assertEqual(policy.get_roles('user:c@example.com'), frozenset())
+        self.assertTrue(policy.has_role('user:a@example.com', 'roles/owner'))
+        self.assertFalse(policy.has_role('user:b@example.com', 'roles/admin'))
+
+    def test_get(self) -> None:
+        num_requests = self._count_get_iam_policy_requests()
+
+        for _ in range(3):
+            self.assertTrue(self.iam_policy_cache.has_role(
+                self.crypto_key_grn, 'user:mike@example.com', 'roles/owner'))
+            self.assertFalse(self.iam_policy_cache.has_role(
+                self.key_ring_grn, 'user:mike@example.com', 'roles/owner'))
+        self.assertEqual(self._count_get_iam_policy_requests() - num_requests, 2)
+        self.assertEqual(len(self.changes), 2)
+
+        # Expired but not changed: revalidated.
+        policy = self.iam_policy_cache.get(self.crypto_key_grn)
+        self.now += 61.0
+        self.assertIs(self.iam_policy_cache.get(self.crypto_key_grn), policy)
+        self.assertEqual(self._count_get_iam_policy_requests() - num_requests, 3)
+        self.assertEqual(len(self.changes), 2)
+
+        # Expired and changed.
+        update_crypto_key_iam_policies(self.kms_api_client, {self.crypto_key_grn: [
+            IamPolicyChange('user:mike@example.com', 'roles/owner', remove=True),
+        ]})
+        self.now += 61.0
+        self.assertFalse(self.iam_policy_cache.has_role(
+            self.crypto_key_grn, 'user:mike@example.com', 'roles/owner'))
+        self.assertEqual(self.changes[-1][0], policy)
+        self.assertEqual(len(self.changes), 3)
+
+    def test_prefetch_invalidate(self) -> None:
+        self.iam_policy_cache.prefetch([self.key_ring_grn, self.crypto_key_grn])
+        num_requests = self._count_get_iam_policy_requests()
+
+        self.iam_policy_cache.get(self.key_ring_grn)
+        self.iam_policy_cache.get(self.crypto_key_grn)
+        self.assertEqual(self._count_get_iam_policy_requests(), num_requests)
+
+        self.iam_policy_cache.invalidate(self.key_ring_grn)
+        self.iam_policy_cache.get(self.key_ring_grn)
+        self.iam_policy_cache.get(self.crypto_key_grn)
+        self.assertEqual(self._count_get_iam_policy_requests(), num_requests + 1)
+
+        self.iam_policy_cache.invalidate()
+        self.iam_policy_cache.get(self.crypto_key_grn)
+        self.assertEqual(self._count_get_iam_policy_requests(), num_requests + 2)
@@ -0,0 +1,103 @@
+import threading
+from unittest import TestCase
+
+from fd_gcp import gcp_kms
+from fd_gcp.gcp_kms_blind_index import (
+    BlindIndex, generate_index_key, normalize_text,
+)
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_normalize_text(self) -> None:
+        self.assertEqual(normalize_text('  Foo@Example.COM\n'), b'foo@example.com')
+        self.assertEqual(normalize_text('Jürgen \t MÜLLER'), 'jürgen müller'.encode('utf-8'))
+        # NFKC: e.g. the ligature 'ﬁ' is 'fi', and full-width digits are ASCII digits.
+        self.assertEqual(normalize_text('ﬁle １２'), b'file 12')
+        self.assertEqual(normalize_text(b' AB '), b' AB ')
+        with self.assertRaises(TypeError):
+            normalize_text(123)  # type: ignore
+
+
+class BlindIndexTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = gcp_kms.create_key_ring(
+            self.kms_api_client, 'projects/p/locations/global', 'r')
+        self.crypto_key_grn = gcp_kms.create_crypto_key(self.kms_api_client, key_ring_grn, 'k')
+        self.wrapped_index_key = generate_index_key(self.kms_api_client, self.crypto_key_grn)
+
+    def create_blind_index(self, **kwargs: object) -> BlindIndex:
+        return BlindIndex(
+            self.kms_api_client, self.crypto_key_grn, self.wrapped_index_key,
+            **kwargs)  # type: ignore
+
+    def test_compute(self) -> None:
+        blind_index = self.create_blind_index(context='users.email')
+
+        index = blind_index.compute('foo@example.com')
+        self.assertEqual(len(index), 32)
+        self.assertEqual(blind_index.compute('  Foo@Example.com'), index)
+        self.assertNotEqual(blind_index.compute('bar@example.com'), index)
+        self.assertTrue(blind_index.matches('FOO@example.com', index))
+        self.assertFalse(blind_index.matches('bar@example.com', index))
+
+        # Deterministic for the same index key and context.
+        self.assertEqual(self.create_blind_index(context='users.email').compute('foo@example.com'),
+                         index)
+        # Unrelated for other contexts or index keys.
+        self.assertNotEqual(
+            self.create_blind_index(context='users.name').compute('foo@example.com'), index)
+        other_blind_index = BlindIndex(
+            self.kms_api_client, self.crypto_key_grn,
+            generate_index_key(self.kms_api_client, self.crypto_key_grn),
+            context='users.email')
+        self.assertNotEqual(other_blind_index.compute('foo@example.com'), index)
+
+    def test_compute_batch(self) -> None:
+        blind_index = self.create_blind_index()
+        values = ['a', b'b', 'C ']
+        self.assertEqual(
+            blind_index.compute_batch(values), [blind_index.compute(value) for value in values])
+        self.assertEqual(blind_index.compute_batch([]), [])
+
+    def test_index_key_is_unwrapped_once(self) -> None:
+        blind_index = self.create_blind_index()
+        num_requests = len(self.kms_api_client.requests)
+
+        threads = [
+            threading.Thread(target=blind_index.compute_batch, args=(['a', 'b'],))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        blind_index.compute('c')
+
+        decrypt_requests = [
+            request for request in self.kms_api_client.requests[num_requests:]
+            if request[0].id.endswith('.decrypt')
+        ]
+        self.assertEqual(len(decrypt_requests), 1)
+
+    def test_size_and_normalizer(self) -> None:
+        blind_index = self.create_blind_index(size=8)
+        self.assertEqual(blind_index.compute('a'), self.create_blind_index().compute('a')[:8])
+
+        case_sensitive_blind_index = self.create_blind_index(
+            normalizer=lambda value: value.encode('utf-8'))
+        self.assertNotEqual(
+            case_sensitive_blind_index.compute('A'), case_sensitive_blind_index.compute('a'))
+
+        for size in (0, 3, 33):
+            with self.assertRaises(ValueError):
+                self.create_blind_index(size=size)
+
+    def test_invalid_index_key(self) -> None:
+        wrapped_index_key = gcp_kms.encrypt(self.kms_api_client, self.crypto_key_grn, b'short')
+        blind_index = BlindIndex(self.kms_api_client, self.crypto_key_grn, wrapped_index_key)
+        with self.assertRaises(ValueError):
+            blind_index.unwrap_index_key()
@@ -0,0 +1,116 @@
+from unittest import TestCase
+
+from fd_gcp import exceptions
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_ciphertext import (
+    ALGORITHM_AES_GCM, ALGORITHM_KMS, CiphertextRouter, KeyRegistry, decode_varint,
+    encode_header, encode_varint, parse_ciphertext,
+)
+from fd_gcp.gcp_kms_data_keys import generate_data_key
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+
+
+class KeyRegistryTestCase(TestCase):
+
+    def test_add(self) -> None:
+        key_registry = KeyRegistry({1: 'key-a'})
+        self.assertEqual(key_registry.add('key-b'), 0)
+        self.assertEqual(key_registry.add('key-c'), 2)
+        self.assertEqual(key_registry.add('key-a'), 1)
+        self.assertEqual(key_registry.add('key-d', 300), 300)
+        self.assertEqual(key_registry.get_crypto_key_grn(300), 'key-d')
+        self.assertEqual(key_registry.get_key_id('key-c'), 2)
+        self.assertEqual(
+            key_registry.to_dict(), {0: 'key-b', 1: 'key-a', 2: 'key-c', 300: 'key-d'})
+
+        with self.assertRaises(ValueError):
+            key_registry.add('key-e', 1)
+        with self.assertRaises(ValueError):
+            key_registry.add('key-a', 2)
+        with self.assertRaises(KeyError):
+            key_registry.get_key_id('key-e')
+
+
+class FormatTestCase(TestCase):
+
+    def test_varint(self) -> None:
+        for value in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 63):
+            with self.subTest(value=value):
+                encoded = encode_varint(value)
+                self.assertEqual(decode_varint(b'x' + encoded + b'y', 1), (value, len(encoded) + 1))
+        self.assertEqual(len(encode_varint(127)), 1)
+        with self.assertRaises(ValueError):
+            encode_varint(-1)
+        with self.assertRaises(exceptions.DecryptionError):
+            decode_varint(b'\x80\x80', 0)
+        with self.assertRaises(exceptions.DecryptionError):
+            decode_varint(b'\xff' * 11, 0)
+
+    def test_parse_ciphertext(self) -> None:
+        data = bytearray(encode_header(ALGORITHM_AES_GCM, 300, compressed=True) + b'payload')
+        self.assertEqual(len(data), 3 + 7)
+        ciphertext = parse_ciphertext(data)
+        self.assertEqual(
+            (ciphertext.algorithm, ciphertext.key_id, ciphertext.compressed),
+            (ALGORITHM_AES_GCM, 300, True))
+        self.assertEqual(ciphertext.payload, b'payload')
+        # Not copied.
+        data[-1:] = b'D'
+        self.assertEqual(ciphertext.payload, b'payloaD')
+
+        for invalid_data in (b'', b'\x00\x01', b'\x1e\x01', b'\x10\x80'):
+            with self.subTest(invalid_data=invalid_data):
+                with self.assertRaises(exceptions.DecryptionError):
+                    parse_ciphertext(invalid_data)
+
+
+class CiphertextRouterTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grns = [
+            create_crypto_key(self.kms_api_client, key_ring_grn, 'key-{}'.format(index))
+            for index in range(2)
+        ]
+        self.router = CiphertextRouter(
+            self.kms_api_client, KeyRegistry(dict(enumerate(self.crypto_key_grns))))
+
+    def test_encrypt_decrypt(self) -> None:
+        plain_data = b'{"name": "x"}' * 10
+        for crypto_key_grn in self.crypto_key_grns:
+            for compression in (None, 'zlib'):
+                with self.subTest(crypto_key_grn=crypto_key_grn, compression=compression):
+                    encrypted_data = self.router.encrypt(
+                        crypto_key_grn, plain_data, compression=compression)
+                    ciphertext = parse_ciphertext(encrypted_data)
+                    self.assertEqual(ciphertext.algorithm, ALGORITHM_KMS)
+                    self.assertEqual(len(ciphertext.header), 2)
+                    self.assertEqual(self.router.decrypt(encrypted_data), plain_data)
+
+        with self.assertRaises(KeyError):
+            self.router.encrypt(self.crypto_key_grns[0] + 'x', plain_data)
+
+    def test_encrypt_with_data_key(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grns[1])
+        encrypted_items = [
+            self.router.encrypt_with_data_key(data_key, b'abc' * index, compression='zlib')
+            for index in range(5)
+        ]
+        num_requests = len(self.kms_api_client.requests)
+        self.assertEqual(
+            [self.router.decrypt(encrypted_data) for encrypted_data in encrypted_items],
+            [b'abc' * index for index in range(5)])
+        # The data key was unwrapped once.
+        self.assertEqual(len(self.kms_api_client.requests), num_requests + 1)
+
+        # The header is authenticated.
+        tampered_data = bytearray(encrypted_items[1])
+        tampered_data[0] ^= 1
+        with self.assertRaises(exceptions.DecryptionError):
+            self.router.decrypt(tampered_data)
+        with self.assertRaises(exceptions.DecryptionError):
+            self.router.decrypt(encrypted_items[1][:-1])
+        with self.assertRaises(exceptions.DecryptionError):
+            self.router.decrypt(encrypted_items[1][:10])
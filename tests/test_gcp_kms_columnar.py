@@ -0,0 +1,101 @@
+import array
+from typing import List, Tuple
+from unittest import TestCase, mock
+
+from fd_gcp import exceptions
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_ciphertext import (
+    ALGORITHM_AES_GCM, CiphertextRouter, KeyRegistry, encode_header,
+)
+from fd_gcp.gcp_kms_columnar import decrypt_column
+from fd_gcp.gcp_kms_data_keys import generate_data_key
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+
+
+def _to_column(values: List[bytes]) -> Tuple[array.array, bytes]:
+    offsets = array.array('q', [0])
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(values)
+
+
+class DecryptColumnTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        crypto_key_grns = [
+            create_crypto_key(self.kms_api_client, key_ring_grn, 'key-{}'.format(index))
+            for index in range(2)
+        ]
+        self.router = CiphertextRouter(
+            self.kms_api_client, KeyRegistry(dict(enumerate(crypto_key_grns))))
+        self.data_keys = [
+            generate_data_key(self.kms_api_client, crypto_key_grn)
+            for crypto_key_grn in crypto_key_grns * 2
+        ]
+        self.plain_values = [
+            b'' if index % 7 == 3 else 'value {}'.format(index).encode('ascii')
+            for index in range(3000)
+        ]
+        self.encrypted_values = [
+            self.router.encrypt_with_data_key(self.data_keys[index % 4], plain_value)
+            if plain_value else b''
+            for index, plain_value in enumerate(self.plain_values)
+        ]
+
+    def test_decrypt_column(self) -> None:
+        offsets, data = _to_column(self.encrypted_values)
+        num_requests = len(self.kms_api_client.requests)
+        decrypted_column = decrypt_column(self.router, offsets, data, max_concurrency=4)
+
+        self.assertEqual(decrypted_column.offsets.typecode, 'q')
+        self.assertEqual(tuple(decrypted_column), _to_column(self.plain_values))
+        # Each distinct data key was unwrapped once.
+        self.assertEqual(len(self.kms_api_client.requests), num_requests + 4)
+
+        # 32-bit offsets (e.g. of Arrow 'binary' arrays), as a list.
+        decrypted_column = decrypt_column(
+            self.router, list(offsets[:11]), memoryview(data), offsets_typecode='i')
+        self.assertEqual(tuple(decrypted_column), _to_column(self.plain_values[:10]))
+        self.assertEqual(decrypted_column.offsets.typecode, 'i')
+        # The data keys were cached.
+        self.assertEqual(len(self.kms_api_client.requests), num_requests + 4)
+
+    def test_decrypt_column_empty(self) -> None:
+        decrypted_column = decrypt_column(self.router, [0], b'')
+        self.assertEqual(list(decrypted_column.offsets), [0])
+        self.assertEqual(decrypted_column.data, b'')
+        with self.assertRaises(ValueError):
+            decrypt_column(self.router, [], b'')
+
+    def test_decrypt_column_fail(self) -> None:
+        kms_encrypted_value = self.router.encrypt(self.data_keys[0].crypto_key_grn, b'abc')
+        compressed_value = self.router.encrypt_with_data_key(
+            self.data_keys[0], b'abc', compression='zlib')
+        tampered_value = bytearray(self.encrypted_values[1])
+        tampered_value[-1] ^= 1
+        for invalid_value in (
+            kms_encrypted_value,
+            compressed_value,
+            bytes(tampered_value),
+            self.encrypted_values[1][:30],
+        ):
+            with self.subTest(invalid_value=invalid_value):
+                offsets, data = _to_column(self.encrypted_values[:2] + [invalid_value])
+                with self.assertRaisesRegex(exceptions.DecryptionError, 'at index 2'):
+                    decrypt_column(self.router, offsets, data)
+
+        offsets, data = _to_column(
+            [encode_header(ALGORITHM_AES_GCM, 5) + self.encrypted_values[0][2:]])
+        with self.assertRaises(KeyError):
+            decrypt_column(self.router, offsets, data)
+
+    def test_decrypt_column_without_decrypt_into(self) -> None:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        offsets, data = _to_column(self.encrypted_values[:20])
+        with mock.patch.object(AESGCM, 'decrypt_into', None, create=True):
+            decrypted_column = decrypt_column(self.router, offsets, data)
+        self.assertEqual(tuple(decrypted_column), _to_column(self.plain_values[:20]))
@@ -0,0 +1,196 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from fd_gcp import exceptions
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_data_keys import (
+    DATA_KEY_SIZE, DataKeyCache, DataKeyCacheFile, generate_data_key,
+)
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+
+
+class DataKeysTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1')
+
+        self.now = 0.0
+        self.data_key_cache = DataKeyCache(
+            self.kms_api_client, max_size=2, ttl=60.0, clock=lambda: self.now)
+
+    def _count_decrypt_requests(self) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests
+            if method.id.endswith('.decrypt'))
+
+    def test_generate_data_key(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grn)
+        self.assertEqual(len(data_key.key), DATA_KEY_SIZE)
+        self.assertEqual(data_key.crypto_key_grn, self.crypto_key_grn)
+        self.assertNotEqual(data_key.key, generate_data_key(
+            self.kms_api_client, self.crypto_key_grn).key)
+
+    def test_unwrap(self) -> None:
+        data_keys = [generate_data_key(self.kms_api_client, self.crypto_key_grn) for _ in range(3)]
+
+        for _ in range(2):
+            self.assertEqual(
+                self.data_key_cache.unwrap(self.crypto_key_grn, data_keys[0].wrapped_key),
+                data_keys[0].key)
+        self.assertEqual(self._count_decrypt_requests(), 1)
+        self.assertEqual((self.data_key_cache.hits, self.data_key_cache.misses), (1, 1))
+
+        # The least recently used one is evicted.
+        self.data_key_cache.unwrap(self.crypto_key_grn, data_keys[1].wrapped_key)
+        self.data_key_cache.unwrap(self.crypto_key_grn, data_keys[2].wrapped_key)
+        self.assertEqual(len(self.data_key_cache), 2)
+        self.assertIsNone(
+            self.data_key_cache.get_cached(self.crypto_key_grn, data_keys[0].wrapped_key))
+
+        # Expired.
+        self.now += 61.0
+        self.data_key_cache.unwrap(self.crypto_key_grn, data_keys[2].wrapped_key)
+        self.assertEqual(self._count_decrypt_requests(), 4)
+
+        with self.assertRaises(exceptions.Error):
+            self.data_key_cache.unwrap(self.crypto_key_grn, b'invalid')
+
+    def test_unwrap_batch(self) -> None:
+        data_keys = [generate_data_key(self.kms_api_client, self.crypto_key_grn) for _ in range(2)]
+        self.data_key_cache.put(self.crypto_key_grn, data_keys[0].wrapped_key, data_keys[0].key)
+
+        wrapped_keys = [
+            (self.crypto_key_grn, data_keys[index].wrapped_key) for index in (0, 1, 1, 0)]
+        self.assertEqual(
+            self.data_key_cache.unwrap_batch(wrapped_keys),
+            [data_keys[index].key for index in (0, 1, 1, 0)])
+        self.assertEqual(self._count_decrypt_requests(), 1)
+
+    def test_concurrent_unwraps_are_coalesced(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grn)
+        event = threading.Event()
+        handler = self.kms_api_client.handlers[
+            'cloudkms.projects.locations.keyRings.cryptoKeys.decrypt']
+
+        def blocking_handler(params: dict, body: dict) -> dict:
+            event.wait(5.0)
+            return handler(params, body)
+
+        results = []
+        with mock.patch.dict(self.kms_api_client.handlers, {
+            'cloudkms.projects.locations.keyRings.cryptoKeys.decrypt': blocking_handler,
+        }):
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    self.data_key_cache.unwrap(self.crypto_key_grn, data_key.wrapped_key)))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            event.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [data_key.key] * 4)
+        self.assertEqual(self._count_decrypt_requests(), 1)
+
+
+class DataKeyCacheFileTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1')
+        self.host_crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'host')
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.filename = os.path.join(temp_dir.name, 'data-keys.bin')
+        self.now = 1_600_000_000.0
+
+        self.data_keys = [
+            generate_data_key(self.kms_api_client, self.crypto_key_grn) for _ in range(3)]
+        self.data_key_cache = DataKeyCache(self.kms_api_client)
+        for data_key in self.data_keys:
+            self.data_key_cache.put(self.crypto_key_grn, data_key.wrapped_key, data_key.key)
+
+    def _create_cache_file(self, **kwargs: object) -> DataKeyCacheFile:
+        return DataKeyCacheFile(
+            self.filename, self.kms_api_client, self.host_crypto_key_grn,
+            clock=lambda: self.now, **kwargs)  # type: ignore
+
+    def _count_requests(self, method_name: str) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests
+            if method.id.endswith('.' + method_name))
+
+    def test_save_load(self) -> None:
+        data_key_cache_file = self._create_cache_file()
+        self.assertEqual(data_key_cache_file.save(self.data_key_cache), 3)
+        self.assertEqual(data_key_cache_file.save(self.data_key_cache), 3)
+        # Only one host key was generated.
+        self.assertEqual(self._count_requests('encrypt'), 3 + 1)
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+        for data_key in self.data_keys:
+            self.assertNotIn(data_key.key, data)
+
+        # A restarted process.
+        data_key_cache = DataKeyCache(self.kms_api_client)
+        data_key_cache_file = self._create_cache_file()
+        self.assertEqual(data_key_cache_file.load(data_key_cache), 3)
+        self.assertEqual(self._count_requests('decrypt'), 1)
+        for data_key in self.data_keys:
+            self.assertEqual(
+                data_key_cache.unwrap(self.crypto_key_grn, data_key.wrapped_key), data_key.key)
+        self.assertEqual(self._count_requests('decrypt'), 1)
+
+        # The loaded host key is reused.
+        data_key_cache_file.save(data_key_cache)
+        self.assertEqual(self._count_requests('encrypt'), 3 + 1)
+
+    def test_load_ttl(self) -> None:
+        self._create_cache_file(ttl=60.0).save(self.data_key_cache)
+        data_key_cache = DataKeyCache(self.kms_api_client, ttl=3600.0, clock=lambda: self.now)
+
+        self.now += 50.0
+        self.assertEqual(self._create_cache_file().load(data_key_cache), 3)
+        # The remaining TTL is kept.
+        self.now += 20.0
+        self.assertEqual(data_key_cache.snapshot(), [])
+
+        self.assertEqual(self._create_cache_file().load(DataKeyCache(self.kms_api_client)), 0)
+
+    def test_load_invalid(self) -> None:
+        self.assertEqual(self._create_cache_file().load(self.data_key_cache), 0)
+
+        self._create_cache_file().save(self.data_key_cache)
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+
+        tampered_data = bytearray(data)
+        tampered_data[-20] ^= 1
+        for invalid_data in (b'', data[:10], data[:-1], bytes(tampered_data)):
+            with self.subTest(invalid_data=invalid_data[:20]):
+                with open(self.filename, 'wb') as file:
+                    file.write(invalid_data)
+                data_key_cache = DataKeyCache(self.kms_api_client)
+                with self.assertLogs('fd_gcp.gcp_kms_data_keys', 'WARNING'):
+                    self.assertEqual(self._create_cache_file().load(data_key_cache), 0)
+                self.assertEqual(len(data_key_cache), 0)
+
+        # Encrypted with another crypto key.
+        with open(self.filename, 'wb') as file:
+            file.write(data)
+        data_key_cache_file = DataKeyCacheFile(
+            self.filename, self.kms_api_client, self.crypto_key_grn)
+        with self.assertLogs('fd_gcp.gcp_kms_data_keys', 'WARNING'):
+            self.assertEqual(data_key_cache_file.load(DataKeyCache(self.kms_api_client)), 0)
@@ -1,8 +1,12 @@
 from unittest import TestCase
 
+import requests
+
+from fd_gcp import gcp_kms
+from fd_gcp.exceptions import AlreadyExists, ConcurrentModification, ResourceNotFound
 from fd_gcp.gcp_kms_mock import (
-    create_crypto_key, decrypt, encrypt, _generate_fernet_key,
-    KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE,
+    KmsHttpServer, create_crypto_key, create_in_memory_api_client, decrypt, encrypt,
+    _generate_fernet_key, KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE,
 )
 
 
@@ -100,3 +104,71 @@ class ApiOperationsFunctionsTestCase(TestCase):
         with self.assertRaises(TypeError) as cm:
             _generate_fernet_key('not bytes')  # type: ignore
         self.assertEqual(cm.exception.args, ())
+
+
+class InMemoryApiClientTestCase(TestCase):
+
+    def test_create_in_memory_api_client(self) -> None:
+        kms_api_client = create_in_memory_api_client()
+        location_grn = 'projects/fake-project/locations/global'
+
+        key_ring_grn = gcp_kms.create_key_ring(kms_api_client, location_grn, 'test-1')
+        crypto_key_grn = gcp_kms.create_crypto_key(kms_api_client, key_ring_grn)
+        encrypted_data = gcp_kms.encrypt(kms_api_client, crypto_key_grn, b'123')
+
+        # Same encryption as that of the mock's functions.
+        self.assertEqual(decrypt(object(), crypto_key_grn, encrypted_data), b'123')
+        self.assertEqual(gcp_kms.decrypt(kms_api_client, crypto_key_grn, encrypted_data), b'123')
+
+        # Each API client has its own state.
+        with self.assertRaises(ResourceNotFound):
+            gcp_kms.encrypt(create_in_memory_api_client(), crypto_key_grn, b'123')
+
+
+class KmsHttpServerTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.server = KmsHttpServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.kms_api_client = gcp_kms.KmsRestApiClient(
+            session=requests.Session(), base_url=self.server.base_url)
+        self.addCleanup(self.kms_api_client.close)
+
+    def test_operations(self) -> None:
+        location_grn = 'projects/fake-project/locations/global'
+
+        # note: key rings and crypto keys are told apart by the GRNs of 'get' requests.
+        key_ring_grn = gcp_kms.ensure_key_ring(self.kms_api_client, location_grn, 'test-1')
+        crypto_key_grn = gcp_kms.ensure_crypto_key(self.kms_api_client, key_ring_grn, 'k')
+        self.assertIn(crypto_key_grn, self.server.kms.crypto_keys)
+
+        encrypted_data = gcp_kms.encrypt(self.kms_api_client, crypto_key_grn, b'123')
+        self.assertEqual(
+            gcp_kms.decrypt(self.kms_api_client, crypto_key_grn, encrypted_data), b'123')
+
+        # 'getIamPolicy' must not be routed as a 'get' of a resource named '..:getIamPolicy'.
+        policy = gcp_kms.get_key_ring_iam_policy(self.kms_api_client, key_ring_grn)
+        self.assertIsNotNone(policy)
+
+    def test_errors(self) -> None:
+        location_grn = 'projects/fake-project/locations/global'
+        key_ring_grn = gcp_kms.create_key_ring(self.kms_api_client, location_grn, 'test-1')
+
+        with self.assertRaises(AlreadyExists):
+            gcp_kms.create_key_ring(self.kms_api_client, location_grn, 'test-1')
+        with self.assertRaises(ResourceNotFound) as cm:
+            gcp_kms.encrypt(self.kms_api_client, key_ring_grn + '/cryptoKeys/x', b'123')
+        self.assertEqual(cm.exception.resource, key_ring_grn + '/cryptoKeys/x')
+
+        crypto_key_grn = gcp_kms.create_crypto_key(self.kms_api_client, key_ring_grn, 'k')
+        with self.assertRaises(ConcurrentModification):
+            self.kms_api_client.execute(
+                gcp_kms._CRYPTO_KEYS_SET_IAM_POLICY,
+                {'resource': crypto_key_grn}, {'policy': {'etag': 'outdated'}})
+
+        status, content = self.server.handle_api_request('DELETE', '/v1/x', b'')
+        self.assertEqual(status, 404)
+        status, content = self.server.handle_api_request(
+            'POST', '/v1/{}/keyRings?keyRingId=x'.format(location_grn), b'{')
+        self.assertEqual(status, 400)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+from typing import Dict, Iterator
+from unittest import TestCase
+
+from fd_gcp.exceptions import ResourceNotFound, UnrecognizedApiHttpError
+from fd_gcp.gcp_kms import (
+    create_crypto_key, create_key_ring, decrypt, encrypt, rotate_crypto_key,
+)
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.gcp_kms_reencryption import ReencryptionCheckpoint, ReencryptionResult, reencrypt
+from fd_gcp.rate_limiter import RateLimiter
+
+
+class ReencryptTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(
+            self.kms_api_client, key_ring_grn, '004c9cd1-b4bf-4f9e-98e3-8aebcce6a5a0')
+
+        self.table: Dict[str, bytes] = {
+            'record-{:02}'.format(i): encrypt(
+                self.kms_api_client, self.crypto_key_grn, 'secret {}'.format(i).encode('ascii'))
+            for i in range(25)
+        }
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.checkpoint = ReencryptionCheckpoint(os.path.join(tmp_dir.name, 'checkpoint.json'))
+
+    def _read_records(self) -> Iterator:
+        return iter(sorted(self.table.items()))
+
+    def _write_record(self, record_id: str, encrypted_data: bytes) -> None:
+        self.table[record_id] = encrypted_data
+
+    def _count_requests(self, method_name: str) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests
+            if method.id.endswith('.' + method_name))
+
+    def test_rotate_crypto_key(self) -> None:
+        self.assertEqual(
+            rotate_crypto_key(self.kms_api_client, self.crypto_key_grn),
+            self.crypto_key_grn + '/cryptoKeyVersions/2')
+
+        encrypted_data = encrypt(self.kms_api_client, self.crypto_key_grn, b'123')
+        self.assertEqual(decrypt(self.kms_api_client, self.crypto_key_grn, encrypted_data), b'123')
+        self.assertEqual(
+            decrypt(self.kms_api_client, self.crypto_key_grn, self.table['record-00']),
+            b'secret 0')
+
+        with self.assertRaises(ResourceNotFound):
+            rotate_crypto_key(self.kms_api_client, self.crypto_key_grn + 'x')
+
+    def test_reencrypt(self) -> None:
+        old_table = dict(self.table)
+        rotate_crypto_key(self.kms_api_client, self.crypto_key_grn)
+
+        result = reencrypt(
+            self.kms_api_client, self.crypto_key_grn, self._read_records(), self._write_record,
+            checkpoint=self.checkpoint, batch_size=10, max_concurrency=4,
+            rate_limiter=RateLimiter(rate=1e6, burst=10))
+        self.assertEqual(result, ReencryptionResult(25, 25, 0, 25))
+        self.assertEqual(self.checkpoint.load(), 25)
+
+        for record_id, encrypted_data in self.table.items():
+            self.assertNotEqual(encrypted_data, old_table[record_id])
+            self.assertEqual(
+                decrypt(self.kms_api_client, self.crypto_key_grn, encrypted_data),
+                'secret {}'.format(int(record_id[-2:])).encode('ascii'))
+
+        # Records already encrypted with the primary version are not encrypted again.
+        self.checkpoint.clear()
+        num_encrypt_requests = self._count_requests('encrypt')
+        result = reencrypt(
+            self.kms_api_client, self.crypto_key_grn, self._read_records(), self._write_record,
+            checkpoint=self.checkpoint)
+        self.assertEqual(result, ReencryptionResult(25, 0, 25, 25))
+        self.assertEqual(self._count_requests('encrypt'), num_encrypt_requests)
+
+    def test_reencrypt_resume(self) -> None:
+        rotate_crypto_key(self.kms_api_client, self.crypto_key_grn)
+        self.table['record-13'] = b'invalid'
+        written_record_ids = []
+
+        def write_record(record_id: str, encrypted_data: bytes) -> None:
+            written_record_ids.append(record_id)
+            self._write_record(record_id, encrypted_data)
+
+        with self.assertRaises(UnrecognizedApiHttpError):
+            reencrypt(
+                self.kms_api_client, self.crypto_key_grn, self._read_records(), write_record,
+                checkpoint=self.checkpoint, batch_size=5)
+        self.assertEqual(self.checkpoint.load(), 10)
+        self.assertEqual(written_record_ids, ['record-{:02}'.format(i) for i in range(10)])
+
+        self.table['record-13'] = encrypt(self.kms_api_client, self.crypto_key_grn, b'13')
+        num_decrypt_requests = self._count_requests('decrypt')
+        result = reencrypt(
+            self.kms_api_client, self.crypto_key_grn, self._read_records(), write_record,
+            checkpoint=self.checkpoint, batch_size=5)
+        self.assertEqual(result, ReencryptionResult(15, 14, 1, 25))
+        self.assertEqual(self._count_requests('decrypt') - num_decrypt_requests, 15)
+
+    def test_checkpoint_load_invalid(self) -> None:
+        for content in (b'not json', b'[25]', b'{"pos": 25}', b'{"position": "25"}'):
+            with self.subTest(content=content):
+                with open(self.checkpoint.filename, 'wb') as file:
+                    file.write(content)
+                with self.assertRaisesRegex(ValueError, 'checkpoint file'):
+                    self.checkpoint.load()
+
+    def test_reencrypt_fail_batch_size(self) -> None:
+        with self.assertRaises(ValueError):
+            reencrypt(
+                self.kms_api_client, self.crypto_key_grn, [], self._write_record, batch_size=0)
@@ -0,0 +1,124 @@
+import threading
+import time
+from unittest import TestCase, mock
+
+import google.auth.exceptions
+
+from fd_gcp import exceptions
+from fd_gcp.client_factory import ProcessLocalApiClient
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.gcp_kms_warm_up import check_health, warm_up
+from fd_gcp.transport import GoogleApiClientTransport, RequestsTransport
+
+GET_METHOD_ID = 'cloudkms.projects.locations.keyRings.cryptoKeys.get'
+
+
+class WarmUpTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grns = [
+            create_crypto_key(self.kms_api_client, key_ring_grn, 'key-{}'.format(index))
+            for index in range(2)
+        ]
+        get_handler = self.kms_api_client.handlers[GET_METHOD_ID]
+        self.in_flight = 0
+        self.max_in_flight = 0
+        lock = threading.Lock()
+
+        def slow_get_handler(params: dict, body: dict) -> dict:
+            with lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                time.sleep(0.02)
+                return get_handler(params, body)
+            finally:
+                with lock:
+                    self.in_flight -= 1
+
+        self.kms_api_client.handlers[GET_METHOD_ID] = slow_get_handler
+
+    def _count_requests(self) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests if method.id == GET_METHOD_ID)
+
+    def test_warm_up(self) -> None:
+        create_api_client = mock.Mock(return_value=self.kms_api_client)
+        api_client = ProcessLocalApiClient(create_api_client, mock.Mock())
+
+        report = warm_up(api_client, self.crypto_key_grns, num_connections=5)
+        create_api_client.assert_called_once()
+        self.assertFalse(report.credentials_refreshed)
+        self.assertEqual(set(report.crypto_key_durations), set(self.crypto_key_grns))
+        self.assertGreaterEqual(min(report.crypto_key_durations.values()), 0.02)
+        self.assertGreaterEqual(report.duration, max(report.crypto_key_durations.values()))
+        # Concurrent requests.
+        self.assertEqual(self._count_requests(), 5)
+        self.assertEqual(self.max_in_flight, 5)
+
+        # One request per crypto key.
+        warm_up(api_client, self.crypto_key_grns)
+        self.assertEqual(self._count_requests(), 7)
+        # No requests.
+        report = warm_up(api_client)
+        self.assertEqual(report.crypto_key_durations, {})
+        self.assertEqual(self._count_requests(), 7)
+        create_api_client.assert_called_once()
+
+        with self.assertRaises(exceptions.ResourceNotFound):
+            warm_up(api_client, [self.crypto_key_grns[0] + 'x'])
+        with self.assertRaises(ValueError):
+            warm_up(api_client, self.crypto_key_grns, num_connections=-1)
+
+    def test_warm_up_discovery_resource(self) -> None:
+        # A discovery resource does not pool connections.
+        api_client = GoogleApiClientTransport(mock.Mock())
+        with mock.patch('fd_gcp.gcp_kms_warm_up.logger') as logger:
+            warm_up(api_client, num_connections=1)
+            warm_up(self.kms_api_client, num_connections=5)
+            logger.warning.assert_not_called()
+
+            warm_up(api_client, num_connections=5)
+            logger.warning.assert_called_once()
+
+    def test_warm_up_credentials(self) -> None:
+        credentials = mock.Mock(valid=False)
+        api_client = RequestsTransport(
+            'https://cloudkms.googleapis.com/', session=mock.Mock(credentials=credentials))
+
+        report = warm_up(api_client)
+        self.assertTrue(report.credentials_refreshed)
+        credentials.refresh.assert_called_once()
+
+        credentials.valid = True
+        self.assertFalse(warm_up(api_client).credentials_refreshed)
+        credentials.refresh.assert_called_once()
+
+        credentials.valid = False
+        credentials.refresh.side_effect = google.auth.exceptions.RefreshError('invalid_grant')
+        with self.assertRaises(exceptions.AuthError):
+            warm_up(api_client)
+
+    def test_check_health(self) -> None:
+        health_status = check_health(self.kms_api_client, self.crypto_key_grns[0])
+        self.assertTrue(health_status.healthy)
+        self.assertIsNone(health_status.error)
+        self.assertGreaterEqual(health_status.duration, 0.02)
+
+        health_status = check_health(self.kms_api_client, self.crypto_key_grns[0] + 'x')
+        self.assertFalse(health_status.healthy)
+        self.assertIsInstance(health_status.error, exceptions.ResourceNotFound)
+
+        def failing_get_handler(params: dict, body: dict) -> dict:
+            raise ConnectionResetError('reset')
+
+        self.kms_api_client.handlers[GET_METHOD_ID] = failing_get_handler
+        health_status = check_health(self.kms_api_client, self.crypto_key_grns[0])
+        self.assertFalse(health_status.healthy)
+        self.assertIsInstance(health_status.error, ConnectionError)
+        # Not retried.
+        self.assertEqual(self._count_requests(), 3)
@@ -0,0 +1,138 @@
+from unittest import TestCase
+
+from fd_gcp import exceptions
+from fd_gcp import gcp_pubsub_mock
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_data_keys import DataKeyCache, generate_data_key
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.gcp_pubsub import (
+    _TOPICS_PUBLISH, ENCRYPTION_WRAPPED_KEY_ATTRIBUTE, PUBSUB_PUBLISH_MAX_MESSAGES, Message,
+    _split_in_batches, acknowledge, compose_subscription_grn, compose_topic_grn,
+    create_subscription, create_topic, decrypt_message, encrypt_messages, publish_encrypted,
+    pull_decrypted,
+)
+from fd_gcp.transport import execute_api_request
+
+
+class PubsubTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1')
+        self.other_crypto_key_grn = create_crypto_key(
+            self.kms_api_client, key_ring_grn, 'key-2')
+
+        self.pubsub_api_client = gcp_pubsub_mock.create_in_memory_api_client()
+        self.topic_grn = create_topic(
+            self.pubsub_api_client, compose_topic_grn('fd-secrets-manager-dev-2', 'events'))
+        self.subscription_grn = create_subscription(
+            self.pubsub_api_client,
+            compose_subscription_grn('fd-secrets-manager-dev-2', 'events-worker'),
+            self.topic_grn)
+        self.data_key_cache = DataKeyCache(self.kms_api_client)
+
+    def _count_kms_requests(self, method_name: str) -> int:
+        return sum(
+            1 for method, _, _ in self.kms_api_client.requests
+            if method.id.endswith('.' + method_name))
+
+    def test_publish_pull(self) -> None:
+        messages = [Message(str(index).encode(), {'index': str(index)}) for index in range(1500)]
+        message_ids = publish_encrypted(
+            self.pubsub_api_client, self.kms_api_client, self.crypto_key_grn, self.topic_grn,
+            messages)
+        self.assertEqual(len(message_ids), 1500)
+        # One data key per batch.
+        self.assertEqual(self._count_kms_requests('encrypt'), 2)
+
+        received_messages = []
+        while True:
+            pulled_messages = pull_decrypted(
+                self.pubsub_api_client, self.data_key_cache, self.subscription_grn,
+                self.crypto_key_grn, max_messages=400)
+            if not pulled_messages:
+                break
+            received_messages.extend(pulled_messages)
+            acknowledge(
+                self.pubsub_api_client, self.subscription_grn,
+                [message.ack_id for message in pulled_messages])
+
+        # note: batches are published concurrently, so the order is not kept.
+        self.assertEqual(
+            {
+                message.message_id: (message.data, message.attributes)
+                for message in received_messages
+            },
+            {
+                message_id: (message.data, message.attributes)
+                for message_id, message in zip(message_ids, messages)
+            })
+        self.assertTrue(all(message.error is None for message in received_messages))
+        self.assertEqual(self._count_kms_requests('decrypt'), 2)
+
+    def test_pull_invalid_messages(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grn)
+        other_data_key = generate_data_key(self.kms_api_client, self.other_crypto_key_grn)
+        encrypted_messages = encrypt_messages(data_key, [Message(b'a', {'x': '1'})] * 3)
+        encrypted_messages += encrypt_messages(other_data_key, [Message(b'b')])
+        # Not encrypted.
+        encrypted_messages[0]['attributes'] = {}
+        # Attributes altered.
+        encrypted_messages[1]['attributes']['x'] = '2'
+        execute_api_request(
+            self.pubsub_api_client, _TOPICS_PUBLISH,
+            params={'topic': self.topic_grn}, body={'messages': encrypted_messages})
+
+        num_decrypt_requests = self._count_kms_requests('decrypt')
+        received_messages = pull_decrypted(
+            self.pubsub_api_client, self.data_key_cache, self.subscription_grn,
+            self.crypto_key_grn)
+        self.assertEqual(
+            [message.data for message in received_messages], [None, None, b'a', None])
+        self.assertIsInstance(received_messages[0].error, exceptions.DecryptionError)
+        self.assertIsInstance(received_messages[1].error, exceptions.DecryptionError)
+        # The data key of another crypto key was not unwrapped.
+        self.assertRegex(str(received_messages[3].error), 'expected crypto key')
+        self.assertEqual(self._count_kms_requests('decrypt'), num_decrypt_requests + 1)
+
+    def test_pull_unwrap_error(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grn)
+        encrypted_messages = encrypt_messages(data_key, [Message(b'a')] * 5)
+        # A data key that can not be unwrapped.
+        for encrypted_message in encrypted_messages[:4]:
+            encrypted_message['attributes'][ENCRYPTION_WRAPPED_KEY_ATTRIBUTE] = 'eHl6'
+        execute_api_request(
+            self.pubsub_api_client, _TOPICS_PUBLISH,
+            params={'topic': self.topic_grn}, body={'messages': encrypted_messages})
+
+        num_decrypt_requests = self._count_kms_requests('decrypt')
+        received_messages = pull_decrypted(
+            self.pubsub_api_client, self.data_key_cache, self.subscription_grn,
+            self.crypto_key_grn)
+        self.assertEqual([message.data for message in received_messages], [None] * 4 + [b'a'])
+        for message in received_messages[:4]:
+            self.assertIsInstance(message.error, exceptions.Error)
+        # Each distinct data key was unwrapped once, even if it failed.
+        self.assertEqual(self._count_kms_requests('decrypt'), num_decrypt_requests + 2)
+
+    def test_encrypt_decrypt_message(self) -> None:
+        data_key = generate_data_key(self.kms_api_client, self.crypto_key_grn)
+        [encrypted_message] = encrypt_messages(data_key, [Message(b'abc', {'x': '1'})])
+        self.assertIn(ENCRYPTION_WRAPPED_KEY_ATTRIBUTE, encrypted_message['attributes'])
+        self.assertEqual(decrypt_message(data_key.key, encrypted_message), (b'abc', {'x': '1'}))
+
+        with self.assertRaises(exceptions.DecryptionError):
+            decrypt_message(b'\x00' * 32, encrypted_message)
+        with self.assertRaises(ValueError):
+            encrypt_messages(data_key, [Message(b'abc', {ENCRYPTION_WRAPPED_KEY_ATTRIBUTE: ''})])
+        with self.assertRaises(TypeError):
+            encrypt_messages(data_key, [Message('abc')])  # type: ignore
+
+    def test__split_in_batches(self) -> None:
+        batches = _split_in_batches([Message(b'x')] * (PUBSUB_PUBLISH_MAX_MESSAGES + 1))
+        self.assertEqual([len(batch) for batch in batches], [PUBSUB_PUBLISH_MAX_MESSAGES, 1])
+
+        batches = _split_in_batches([Message(b'x' * 4_000_000)] * 3)
+        self.assertEqual([len(batch) for batch in batches], [1, 1, 1])
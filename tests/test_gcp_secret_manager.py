@@ -0,0 +1,217 @@
+import threading
+import time
+from unittest import TestCase, mock
+
+from fd_gcp import exceptions
+from fd_gcp.gcp_secret_manager import (
+    SecretCache, access_secret_version, access_secret_versions, add_secret_version,
+    compose_project_grn, compose_secret_grn, compose_secret_version_grn, create_secret,
+    is_pinned_secret_version_grn,
+)
+from fd_gcp.gcp_secret_manager_mock import create_in_memory_api_client
+
+
+PROJECT_GRN = compose_project_grn('fd-secrets-manager-dev-2')
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_compose_grns(self) -> None:
+        self.assertEqual(compose_secret_grn('p', 's'), 'projects/p/secrets/s')
+        self.assertEqual(
+            compose_secret_version_grn('p', 's'), 'projects/p/secrets/s/versions/latest')
+        self.assertEqual(
+            compose_secret_version_grn('p', 's', '3'), 'projects/p/secrets/s/versions/3')
+
+    def test_is_pinned_secret_version_grn(self) -> None:
+        self.assertTrue(is_pinned_secret_version_grn('projects/p/secrets/s/versions/3'))
+        self.assertFalse(is_pinned_secret_version_grn('projects/p/secrets/s/versions/latest'))
+
+
+class OperationsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.api_client = create_in_memory_api_client()
+
+    def test_secret_versions(self) -> None:
+        secret_grn = create_secret(self.api_client, PROJECT_GRN, 'db-password')
+        self.assertEqual(secret_grn, PROJECT_GRN + '/secrets/db-password')
+        with self.assertRaises(exceptions.AlreadyExists):
+            create_secret(self.api_client, PROJECT_GRN, 'db-password')
+        with self.assertRaises(ValueError):
+            create_secret(self.api_client, PROJECT_GRN, 'db/password')
+
+        # No versions yet.
+        with self.assertRaises(exceptions.ResourceNotFound):
+            access_secret_version(self.api_client, secret_grn + '/versions/latest')
+
+        version_1_grn = add_secret_version(self.api_client, secret_grn, b'abc')
+        version_2_grn = add_secret_version(self.api_client, secret_grn, b'\x00\xff')
+        self.assertEqual(version_2_grn, secret_grn + '/versions/2')
+
+        self.assertEqual(access_secret_version(self.api_client, version_1_grn), b'abc')
+        self.assertEqual(
+            access_secret_version(self.api_client, secret_grn + '/versions/latest'), b'\x00\xff')
+        with self.assertRaises(exceptions.ResourceNotFound):
+            access_secret_version(self.api_client, secret_grn + '/versions/3')
+
+    def test_access_secret_versions(self) -> None:
+        grns = []
+        for index in range(5):
+            secret_grn = create_secret(self.api_client, PROJECT_GRN, 'secret-{}'.format(index))
+            grns.append(add_secret_version(self.api_client, secret_grn, str(index).encode()))
+
+        self.assertEqual(
+            access_secret_versions(self.api_client, grns, max_concurrency=2),
+            [b'0', b'1', b'2', b'3', b'4'])
+
+        with self.assertRaises(exceptions.ResourceNotFound):
+            access_secret_versions(self.api_client, grns + [PROJECT_GRN + '/secrets/x/versions/1'])
+
+
+class SecretCacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.api_client = create_in_memory_api_client()
+        self.secret_grn = create_secret(self.api_client, PROJECT_GRN, 'db-password')
+        self.version_1_grn = add_secret_version(self.api_client, self.secret_grn, b'v1')
+        self.latest_grn = self.secret_grn + '/versions/latest'
+
+        self.now = 0.0
+        self.secret_cache = SecretCache(
+            self.api_client, ttl=100.0, refresh_ahead=0.8, max_stale=50.0,
+            clock=lambda: self.now)
+
+    def _count_access_requests(self) -> int:
+        return sum(
+            1 for method, _, _ in self.api_client.requests
+            if method.id.endswith('.versions.access'))
+
+    def _wait_for_refreshes(self) -> None:
+        for _ in range(500):
+            if not self.secret_cache._fetches:
+                return
+            time.sleep(0.01)
+        self.fail("Background refreshes did not finish.")
+
+    def test_get(self) -> None:
+        for _ in range(3):
+            self.assertEqual(self.secret_cache.get(self.latest_grn), b'v1')
+        self.assertEqual(self._count_access_requests(), 1)
+
+        add_secret_version(self.api_client, self.secret_grn, b'v2')
+
+        # Fresh.
+        self.now = 79.0
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v1')
+        self.assertEqual(self._count_access_requests(), 1)
+
+        # About to expire: returned, and refreshed in the background.
+        self.now = 81.0
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v1')
+        self._wait_for_refreshes()
+        self.assertEqual(self._count_access_requests(), 2)
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v2')
+
+        add_secret_version(self.api_client, self.secret_grn, b'v3')
+
+        # Stale: returned, and refreshed in the background.
+        self.now = 81.0 + 120.0
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v2')
+        self._wait_for_refreshes()
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v3')
+
+        add_secret_version(self.api_client, self.secret_grn, b'v4')
+
+        # Expired: fetched.
+        self.now += 151.0
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v4')
+        self.assertEqual(self._count_access_requests(), 4)
+
+    def test_get_pinned_version(self) -> None:
+        self.assertEqual(self.secret_cache.get(self.version_1_grn), b'v1')
+        self.now = 10_000.0
+        self.assertEqual(self.secret_cache.get(self.version_1_grn), b'v1')
+        self.assertEqual(self._count_access_requests(), 1)
+
+    def test_get_not_found(self) -> None:
+        with self.assertRaises(exceptions.ResourceNotFound):
+            self.secret_cache.get(self.secret_grn + '/versions/7')
+        # Errors are not cached.
+        with self.assertRaises(exceptions.ResourceNotFound):
+            self.secret_cache.get(self.secret_grn + '/versions/7')
+        self.assertEqual(self._count_access_requests(), 2)
+
+    def test_background_refresh_error(self) -> None:
+        self.secret_cache.get(self.latest_grn)
+
+        self.now = 120.0
+        with mock.patch.dict(self.api_client.handlers, {
+            'secretmanager.projects.secrets.versions.access': mock.Mock(
+                side_effect=exceptions.ResourcePermissionDenied()),
+        }):
+            with self.assertLogs('fd_gcp.gcp_secret_manager', 'WARNING'):
+                self.assertEqual(self.secret_cache.get(self.latest_grn), b'v1')
+                self._wait_for_refreshes()
+
+        # The stale data is still returned (and refreshed again).
+        self.assertEqual(self.secret_cache.get(self.latest_grn), b'v1')
+        self._wait_for_refreshes()
+
+    def test_concurrent_fetches_are_coalesced(self) -> None:
+        event = threading.Event()
+        handler = self.api_client.handlers['secretmanager.projects.secrets.versions.access']
+
+        def blocking_handler(params: dict, body: dict) -> dict:
+            event.wait(5.0)
+            return handler(params, body)
+
+        results = []
+        with mock.patch.dict(self.api_client.handlers, {
+            'secretmanager.projects.secrets.versions.access': blocking_handler,
+        }):
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    self.secret_cache.get(self.latest_grn)))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.05)
+            event.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [b'v1'] * 4)
+        self.assertEqual(self._count_access_requests(), 1)
+
+    def test_get_batch_and_prefetch(self) -> None:
+        other_secret_grn = create_secret(self.api_client, PROJECT_GRN, 'api-key')
+        other_version_grn = add_secret_version(self.api_client, other_secret_grn, b'k1')
+
+        self.secret_cache.prefetch([self.latest_grn])
+        self.assertEqual(self._count_access_requests(), 1)
+
+        self.assertEqual(
+            self.secret_cache.get_batch([self.latest_grn, other_version_grn]),
+            {self.latest_grn: b'v1', other_version_grn: b'k1'})
+        self.assertEqual(self._count_access_requests(), 2)
+
+    def test_invalidate(self) -> None:
+        self.secret_cache.get(self.latest_grn)
+        self.secret_cache.get(self.version_1_grn)
+
+        self.secret_cache.invalidate(self.latest_grn)
+        self.secret_cache.get(self.latest_grn)
+        self.secret_cache.get(self.version_1_grn)
+        self.assertEqual(self._count_access_requests(), 3)
+
+        self.secret_cache.invalidate()
+        self.secret_cache.get(self.version_1_grn)
+        self.assertEqual(self._count_access_requests(), 4)
+
+    def test_invalid_args(self) -> None:
+        with self.assertRaises(ValueError):
+            SecretCache(self.api_client, ttl=-1.0)
+        with self.assertRaises(ValueError):
+            SecretCache(self.api_client, refresh_ahead=1.5)
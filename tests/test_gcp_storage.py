@@ -0,0 +1,217 @@
+import io
+import os
+from unittest import TestCase
+
+import requests
+
+from fd_gcp import exceptions
+from fd_gcp.deadline import Deadline
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.gcp_storage import (
+    ENCRYPTION_SEGMENT_SIZE, UPLOAD_CHUNK_SIZE_MULTIPLE, DecryptionError, StorageRestApiClient,
+    _iter_chunks, _iter_object_media, decrypt_stream, download_decrypted_object, encrypt_stream,
+    iter_decrypted_object, upload_encrypted_object,
+)
+from fd_gcp.gcp_storage_mock import StorageHttpServer
+
+
+BUCKET_NAME = 'fd-test-bucket'
+
+
+class EnvelopeEncryptionTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1')
+
+    def _encrypt(self, data: bytes, segment_size: int = 16) -> bytes:
+        return b''.join(encrypt_stream(
+            self.kms_api_client, self.crypto_key_grn, io.BytesIO(data),
+            segment_size=segment_size))
+
+    def _decrypt(self, encrypted_data: bytes, chunk_size: int = 7) -> bytes:
+        chunks = [
+            encrypted_data[offset:offset + chunk_size]
+            for offset in range(0, len(encrypted_data), chunk_size)
+        ]
+        return b''.join(decrypt_stream(self.kms_api_client, chunks))
+
+    def test_encrypt_decrypt(self) -> None:
+        for size in (0, 1, 15, 16, 17, 32, 100):
+            with self.subTest(size=size):
+                data = os.urandom(size)
+                encrypted_data = self._encrypt(data)
+                self.assertEqual(self._decrypt(encrypted_data), data)
+                self.assertEqual(self._decrypt(encrypted_data, chunk_size=1000), data)
+
+        # Not deterministic.
+        self.assertNotEqual(self._encrypt(b'abc'), self._encrypt(b'abc'))
+
+    def test_decrypt_crypto_key_grn(self) -> None:
+        encrypted_data = self._encrypt(b'abc')
+        self.assertEqual(
+            b''.join(decrypt_stream(
+                self.kms_api_client, [encrypted_data], crypto_key_grn=self.crypto_key_grn)),
+            b'abc')
+        with self.assertRaises(DecryptionError):
+            list(decrypt_stream(
+                self.kms_api_client, [encrypted_data], crypto_key_grn=self.crypto_key_grn + 'x'))
+
+    def test_decrypt_invalid(self) -> None:
+        encrypted_data = self._encrypt(b'x' * 40)
+        encrypted_segment_size = 16 + 16
+
+        tampered_data = bytearray(encrypted_data)
+        tampered_data[-1] ^= 1
+        last_segment_start = len(encrypted_data) - (8 + 16)
+        for invalid_data in (
+            b'',
+            encrypted_data[:10],
+            b'XXXX' + encrypted_data[4:],
+            bytes(tampered_data),
+            # Truncated at a segment's boundary.
+            encrypted_data[:last_segment_start],
+            # Segments reordered.
+            encrypted_data[:last_segment_start - 2 * encrypted_segment_size]
+            + encrypted_data[last_segment_start - encrypted_segment_size:last_segment_start]
+            + encrypted_data[last_segment_start - 2 * encrypted_segment_size:
+                             last_segment_start - encrypted_segment_size]
+            + encrypted_data[last_segment_start:],
+        ):
+            with self.subTest(invalid_data=invalid_data):
+                with self.assertRaises(DecryptionError):
+                    self._decrypt(invalid_data)
+
+    def test__iter_chunks(self) -> None:
+        self.assertEqual(
+            list(_iter_chunks([b'ab', b'cde', b'f'], 3)),
+            [(b'abc', False), (b'def', True)])
+        self.assertEqual(list(_iter_chunks([b'ab'], 3)), [(b'ab', True)])
+
+
+class UploadDownloadTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = StorageHttpServer()
+        cls.server.start()
+        cls.server.create_bucket(BUCKET_NAME)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.stop()
+
+    def setUp(self) -> None:
+        self.kms_api_client = create_in_memory_api_client()
+        key_ring_grn = create_key_ring(
+            self.kms_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        self.crypto_key_grn = create_crypto_key(self.kms_api_client, key_ring_grn, 'key-1')
+        self.api_client = StorageRestApiClient(
+            session=requests.Session(), base_url=self.server.base_url)
+        self.addCleanup(self.api_client.close)
+        del self.server.requests[:]
+        self.server.error_statuses.clear()
+
+    def _upload(self, object_name: str, data: bytes, **kwargs: object) -> dict:
+        kwargs.setdefault('chunk_size', UPLOAD_CHUNK_SIZE_MULTIPLE)
+        return upload_encrypted_object(
+            self.api_client, self.kms_api_client, self.crypto_key_grn,
+            BUCKET_NAME, object_name, io.BytesIO(data), **kwargs)
+
+    def _download(self, object_name: str, **kwargs: object) -> bytes:
+        destination = io.BytesIO()
+        size = download_decrypted_object(
+            self.api_client, self.kms_api_client, BUCKET_NAME, object_name, destination,
+            **kwargs)
+        self.assertEqual(size, len(destination.getvalue()))
+        return destination.getvalue()
+
+    def test_upload_download(self) -> None:
+        data = os.urandom(3 * UPLOAD_CHUNK_SIZE_MULTIPLE + 1000)
+        resource = self._upload('a/b.bin', data, metadata={'owner': 'mike'})
+
+        self.assertEqual(resource['name'], 'a/b.bin')
+        self.assertEqual(resource['metadata'], {'owner': 'mike'})
+        stored_object = self.server.objects[(BUCKET_NAME, 'a/b.bin')]
+        self.assertNotIn(data[:100], stored_object.data)
+        self.assertEqual(int(resource['size']), len(stored_object.data))
+        # 1 request to start the upload, and 1 per chunk.
+        self.assertEqual(
+            [method for method, _ in self.server.requests], ['POST'] + ['PUT'] * 4)
+
+        self.assertEqual(self._download('a/b.bin', crypto_key_grn=self.crypto_key_grn), data)
+
+    def test_upload_empty(self) -> None:
+        self._upload('empty', b'')
+        self.assertEqual(self._download('empty'), b'')
+
+    def test_upload_retry(self) -> None:
+        data = os.urandom(2 * UPLOAD_CHUNK_SIZE_MULTIPLE)
+        self.server.error_statuses.update({'POST': [503], 'PUT': [503, 503]})
+        self._upload('retried', data, num_retries=2)
+
+        # The failed chunk was resumed after querying the offset (the first query failed too).
+        self.assertEqual(
+            [method for method, _ in self.server.requests],
+            ['POST', 'POST', 'PUT', 'PUT', 'PUT', 'PUT', 'PUT', 'PUT'])
+        self.assertEqual(self._download('retried'), data)
+
+    def test_upload_fail(self) -> None:
+        self.server.error_statuses['PUT'] = [503]
+        with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+            self._upload('failed', b'abc')
+
+        with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+            upload_encrypted_object(
+                self.api_client, self.kms_api_client, self.crypto_key_grn,
+                'no-such-bucket', 'x', io.BytesIO(b'abc'))
+
+        with self.assertRaises(ValueError):
+            self._upload('x', b'abc', chunk_size=1000)
+
+    def test_download_resume(self) -> None:
+        data = os.urandom(200_000)
+        self._upload('resumed', data)
+        self.server.download_truncations[:] = [70_000, 1000]
+
+        self.assertEqual(self._download('resumed', num_retries=2), data)
+        self.assertEqual([method for method, _ in self.server.requests][-3:], ['GET'] * 3)
+
+        self.server.download_truncations[:] = [70_000]
+        with self.assertRaises(exceptions.UnrecognizedApiError):
+            self._download('resumed')
+
+    def test_download_deadline(self) -> None:
+        data = os.urandom(200_000)
+        self._upload('slow', data)
+        now = 100.0
+
+        def clock() -> float:
+            # Each call takes 10 ms e.g. the chunks trickle in.
+            nonlocal now
+            now += 0.01
+            return now
+
+        chunks = _iter_object_media(
+            self.api_client, BUCKET_NAME, 'slow', 1000, None, Deadline(now + 0.5, clock=clock), 0)
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            for _ in chunks:
+                pass
+
+    def test_download_not_found(self) -> None:
+        with self.assertRaises(exceptions.ResourceNotFound):
+            self._download('no-such-object')
+
+    def test_iter_decrypted_object_close(self) -> None:
+        data = os.urandom(500_000)
+        self._upload('partial', data)
+
+        pieces = iter_decrypted_object(
+            self.api_client, self.kms_api_client, BUCKET_NAME, 'partial',
+            chunk_size=10_000, max_pending_chunks=1)
+        # The first segment.
+        self.assertEqual(next(pieces), data[:ENCRYPTION_SEGMENT_SIZE])
+        pieces.close()
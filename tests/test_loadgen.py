@@ -0,0 +1,177 @@
+import contextlib
+import io
+import json
+from unittest import TestCase
+
+import requests
+
+from fd_gcp import gcp_kms
+from fd_gcp.gcp_kms_mock import KmsHttpServer
+from fd_gcp.loadgen import (
+    DEFAULT_EMULATOR_CRYPTO_KEY_GRN, LatencyHistogram, LoadgenConfig, LoadgenTarget,
+    ensure_crypto_key, main, run_load,
+)
+
+
+class LatencyHistogramTestCase(TestCase):
+
+    def test_percentile(self) -> None:
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean)
+
+        # 1 ms .. 1000 ms
+        for value in range(1, 1001):
+            histogram.record(value / 1000)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        self.assertEqual(histogram.min, 0.001)
+        self.assertEqual(histogram.max, 1.0)
+        for percentile, expected in ((0, 0.001), (50, 0.5), (99, 0.99), (99.9, 0.999)):
+            with self.subTest(percentile=percentile):
+                actual = histogram.percentile(percentile)
+                # Never below the actual value, and within the relative error.
+                self.assertGreaterEqual(actual, expected)
+                self.assertLessEqual(actual, expected * (1 + 2 ** -7))
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+        with self.assertRaises(ValueError):
+            histogram.percentile(101)
+
+    def test_small_values_are_exact(self) -> None:
+        histogram = LatencyHistogram()
+        for value in (0, 1, 255):
+            histogram.record(value / 1_000_000)
+        self.assertEqual(histogram.percentile(34), 1 / 1_000_000)
+        self.assertEqual(histogram.percentile(100), 255 / 1_000_000)
+
+    def test_merge(self) -> None:
+        histogram_1 = LatencyHistogram()
+        histogram_2 = LatencyHistogram()
+        histogram_1.record(0.001)
+        histogram_2.record(0.003)
+        histogram_2.record(0.002)
+
+        histogram_1.merge(histogram_2)
+        self.assertEqual(histogram_1.count, 3)
+        self.assertEqual((histogram_1.min, histogram_1.max), (0.001, 0.003))
+        self.assertAlmostEqual(histogram_1.percentile(50), 0.002, places=4)
+
+        with self.assertRaises(ValueError):
+            histogram_1.merge(LatencyHistogram(sub_bucket_bits=4))
+
+
+class RunLoadTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = KmsHttpServer()
+        cls.server.start()
+        cls.target = LoadgenTarget(
+            crypto_key_grn=DEFAULT_EMULATOR_CRYPTO_KEY_GRN, base_url=cls.server.base_url)
+        ensure_crypto_key(cls.target.create_api_client(), DEFAULT_EMULATOR_CRYPTO_KEY_GRN)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.stop()
+
+    def test_closed_loop(self) -> None:
+        for model in ('threads', 'asyncio'):
+            with self.subTest(model=model):
+                report = run_load(self.target, LoadgenConfig(
+                    operations={'encrypt': 3.0, 'decrypt': 1.0},
+                    payload_sizes={16: 1.0, 4096: 1.0},
+                    duration=0.3,
+                    concurrency=4,
+                    model=model,
+                    seed=1,
+                ))
+
+                self.assertEqual(report.errors, {})
+                self.assertEqual(set(report.histograms), {'encrypt', 'decrypt'})
+                self.assertGreater(report.num_operations, 0)
+                self.assertGreater(
+                    report.histograms['encrypt'].count, report.histograms['decrypt'].count)
+                self.assertEqual(report.throughput, report.num_operations / 0.3)
+
+    def test_target_rate(self) -> None:
+        for model in ('threads', 'asyncio'):
+            with self.subTest(model=model):
+                report = run_load(self.target, LoadgenConfig(
+                    duration=0.5, warmup=0.1, concurrency=2, rate=40.0, model=model))
+
+                # note: operations scheduled during the warmup are not recorded.
+                self.assertEqual(report.num_operations, 20)
+
+    def test_processes(self) -> None:
+        report = run_load(self.target, LoadgenConfig(
+            duration=0.3, concurrency=3, rate=20.0, model='processes', processes=2))
+        self.assertEqual(report.errors, {})
+        self.assertEqual(report.num_operations, 6)
+
+    def test_errors(self) -> None:
+        target = self.target._replace(crypto_key_grn=DEFAULT_EMULATOR_CRYPTO_KEY_GRN + '-x')
+        report = run_load(target, LoadgenConfig(
+            operations={'encrypt': 1.0}, duration=0.1, concurrency=1, rate=20.0))
+
+        self.assertEqual(report.num_operations, 0)
+        self.assertEqual(report.errors, {'encrypt: ResourceNotFound': 2})
+        self.assertIn('encrypt: ResourceNotFound: 2', report.format())
+
+    def test_invalid_config(self) -> None:
+        for config in (
+            LoadgenConfig(operations={'sign': 1.0}),
+            LoadgenConfig(operations={'encrypt': 0.0}),
+            LoadgenConfig(payload_sizes={gcp_kms.KMS_ENCRYPTION_PLAIN_DATA_MAX_SIZE + 1: 1.0}),
+            LoadgenConfig(model='fibers'),
+            LoadgenConfig(concurrency=0),
+            LoadgenConfig(duration=0),
+            LoadgenConfig(rate=-1.0),
+        ):
+            with self.subTest(config=config):
+                with self.assertRaises(ValueError):
+                    run_load(self.target, config)
+
+
+class MainTestCase(TestCase):
+
+    def test_run_emulator(self) -> None:
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = main([
+                'run', '--emulator', '--duration', '0.2', '--concurrency', '2',
+                '--mix', 'encrypt=3,decrypt', '--payload-sizes', '64,1024=2', '--json',
+            ])
+
+        self.assertEqual(exit_code, 0)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['errors'], {})
+        self.assertEqual(set(report['latencies']), {'encrypt', 'decrypt'})
+        self.assertEqual(
+            set(report['total_latencies']['percentiles']), {'50.0', '90.0', '99.0', '99.9'})
+
+    def test_run_base_url(self) -> None:
+        server = KmsHttpServer()
+        server.start()
+        self.addCleanup(server.stop)
+        ensure_crypto_key(
+            gcp_kms.KmsRestApiClient(session=requests.Session(), base_url=server.base_url),
+            DEFAULT_EMULATOR_CRYPTO_KEY_GRN)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = main([
+                'run', '--base-url', server.base_url, '--duration', '0.2', '--rate', '20',
+            ])
+
+        self.assertEqual(exit_code, 0)
+        self.assertRegex(stdout.getvalue(), r'^Operations: 4 in 0\.20 s \(20\.0 ops/s\)')
+
+    def test_run_invalid_args(self) -> None:
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertEqual(main(['run', '--duration', '1']), 2)
+            self.assertEqual(main(['run', '--emulator', '--duration', '-1']), 2)
+            with self.assertRaises(SystemExit):
+                main(['run', '--emulator', '--mix', 'sign=1'])
@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+from fd_gcp.deadline import Deadline
+from fd_gcp.exceptions import DeadlineExceeded
+from fd_gcp.rate_limiter import RateLimiter
+
+from .fakes import FakeClock
+
+
+class RateLimiterTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.rate_limiter = RateLimiter(
+            rate=10.0, burst=2, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_init_fail(self) -> None:
+        with self.assertRaises(ValueError):
+            RateLimiter(rate=0)
+        with self.assertRaises(ValueError):
+            RateLimiter(rate=1.0, burst=0)
+
+    def test_acquire(self) -> None:
+        # The burst is available immediately.
+        self.rate_limiter.acquire()
+        self.rate_limiter.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+        self.rate_limiter.acquire()
+        self.rate_limiter.acquire()
+        self.assertEqual(len(self.clock.sleeps), 2)
+        for seconds in self.clock.sleeps:
+            self.assertAlmostEqual(seconds, 0.1)
+
+        # After being idle, tokens do not accumulate beyond the burst.
+        self.clock.now += 60.0
+        self.rate_limiter.acquire(2)
+        self.assertEqual(len(self.clock.sleeps), 2)
+
+        with self.assertRaises(ValueError):
+            self.rate_limiter.acquire(3)
+
+    def test_acquire_deadline(self) -> None:
+        self.rate_limiter.acquire(2)
+
+        with self.assertRaises(DeadlineExceeded):
+            self.rate_limiter.acquire(deadline=Deadline(self.clock.now + 0.05, clock=self.clock))
+        self.rate_limiter.acquire(deadline=Deadline(self.clock.now + 0.2, clock=self.clock))
+
+    def test_try_acquire(self) -> None:
+        self.assertTrue(self.rate_limiter.try_acquire(2))
+        self.assertFalse(self.rate_limiter.try_acquire())
+        self.clock.now += 0.11
+        self.assertTrue(self.rate_limiter.try_acquire())
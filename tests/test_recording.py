@@ -0,0 +1,201 @@
+import base64
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from fd_gcp import exceptions
+from fd_gcp.deadline import Deadline
+from fd_gcp.gcp_kms import create_crypto_key, create_key_ring, decrypt, encrypt
+from fd_gcp.gcp_kms_mock import create_in_memory_api_client
+from fd_gcp.recording import (
+    Recording, RecordingTransport, ReplayTransport, _decode_error, _encode_error, scrub_secrets,
+)
+
+from .fakes import FakeClock
+
+ENCRYPT_METHOD_ID = 'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt'
+
+
+class RecordingTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.kms_api_client = create_in_memory_api_client()
+        encrypt_handler = self.kms_api_client.handlers[ENCRYPT_METHOD_ID]
+
+        def slow_encrypt_handler(params: dict, body: dict) -> dict:
+            self.clock.now += 0.25
+            return encrypt_handler(params, body)
+
+        self.kms_api_client.handlers[ENCRYPT_METHOD_ID] = slow_encrypt_handler
+        self.recording = Recording()
+        self.recording_api_client = RecordingTransport(
+            self.kms_api_client, self.recording, clock=self.clock)
+
+        key_ring_grn = create_key_ring(
+            self.recording_api_client, 'projects/fd-secrets-manager-dev-2/locations/global',
+            'test-1')
+        self.crypto_key_grn = create_crypto_key(self.recording_api_client, key_ring_grn, 'key-1')
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.filename = os.path.join(temp_dir.name, 'recording.jsonl.gz')
+
+    def _run_workload(self, api_client: object) -> list:
+        encrypted_data = encrypt(api_client, self.crypto_key_grn, b'secret data')  # type: ignore
+        plain_data = decrypt(api_client, self.crypto_key_grn, encrypted_data)  # type: ignore
+        try:
+            decrypt(api_client, self.crypto_key_grn + 'x', encrypted_data)  # type: ignore
+        except exceptions.Error as exc:
+            return [encrypted_data, plain_data, exc]
+        raise AssertionError
+
+    def test_record_replay(self) -> None:
+        recorded_results = self._run_workload(self.recording_api_client)
+        self.assertEqual(len(self.recording), 5)
+        self.assertAlmostEqual(self.recording.interactions[2].duration, 0.25)
+        self.recording.save(self.filename)
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+        self.assertNotIn(b'secret data', data)
+        self.assertNotIn(base64.b64encode(b'secret data'), data)
+
+        recording = Recording.load(self.filename)
+        self.assertEqual(recording.interactions, self.recording.interactions)
+
+        replay_api_client = ReplayTransport(
+            recording, latency_scale=2.0, sleep=self.clock.sleep)
+        # The requests of 'setUp'.
+        create_key_ring(
+            replay_api_client, 'projects/fd-secrets-manager-dev-2/locations/global', 'test-1')
+        create_crypto_key(replay_api_client, 'x', 'key-1')
+
+        self.clock.sleeps.clear()
+        replayed_results = self._run_workload(replay_api_client)
+        self.assertEqual(replayed_results[0], recorded_results[0])
+        # Scrubbed.
+        self.assertEqual(replayed_results[1], bytes(len(b'secret data')))
+        self.assertIsInstance(replayed_results[2], type(recorded_results[2]))
+        self.assertEqual(str(replayed_results[2]), str(recorded_results[2]))
+        self.assertAlmostEqual(self.clock.sleeps[0], 0.5)
+        self.assertEqual(replay_api_client.num_pending, 0)
+
+        with self.assertRaises(LookupError):
+            encrypt(replay_api_client, self.crypto_key_grn, b'x')
+
+    def test_load_invalid(self) -> None:
+        self.recording.save(self.filename)
+        with open(self.filename, 'rb') as file:
+            data = file.read()
+
+        for invalid_data in (
+            b'',
+            b'not gzip',
+            data[:len(data) // 2],
+            gzip.compress(b'{"version": 0}\n'),
+            gzip.compress(b'{"version": 1}\n[1, 2]\n'),
+            gzip.compress(b'{"version": 1}\nnot json\n'),
+        ):
+            with self.subTest(invalid_data=invalid_data):
+                with open(self.filename, 'wb') as file:
+                    file.write(invalid_data)
+                with self.assertRaisesRegex(ValueError, 'recording file'):
+                    Recording.load(self.filename)
+
+        with self.assertRaises(FileNotFoundError):
+            Recording.load(self.filename + 'x')
+
+    def test_replay_retries(self) -> None:
+        error = exceptions.process_api_http_error(
+            503, b'{"error": {"code": 503, "message": "Unavailable"}}', 'https://x', 'Unavailable')
+        encrypt_handler = self.kms_api_client.handlers[ENCRYPT_METHOD_ID]
+        errors = [error, error]
+
+        def failing_encrypt_handler(params: dict, body: dict) -> dict:
+            if errors:
+                raise errors.pop()
+            return encrypt_handler(params, body)
+
+        self.kms_api_client.handlers[ENCRYPT_METHOD_ID] = failing_encrypt_handler
+        with mock.patch('fd_gcp._http._compute_retry_backoff', return_value=0.0):
+            encrypt(self.recording_api_client, self.crypto_key_grn, b'abc', num_retries=2)
+
+            replay_api_client = ReplayTransport(self.recording, latency_scale=0.0)
+            replay_api_client._pending.pop('cloudkms.projects.locations.keyRings.create')
+            replay_api_client._pending.pop('cloudkms.projects.locations.keyRings.cryptoKeys.create')
+            with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+                encrypt(replay_api_client, self.crypto_key_grn, b'abc', num_retries=1)
+            encrypt(replay_api_client, self.crypto_key_grn, b'abc')
+        self.assertEqual(replay_api_client.num_pending, 0)
+
+    def test_record_http_error_scrubbed(self) -> None:
+        secret = base64.b64encode(b'secret data').decode('ascii')
+        error = exceptions.process_api_http_error(
+            400,
+            json.dumps({'error': {'code': 400, 'message': 'Invalid', 'data': secret}}).encode(),
+            'https://x/v1/y?plaintext={}&alt=json'.format(secret),
+            'Bad Request',
+        )
+
+        def failing_encrypt_handler(params: dict, body: dict) -> dict:
+            raise error
+
+        self.kms_api_client.handlers[ENCRYPT_METHOD_ID] = failing_encrypt_handler
+        with self.assertRaises(exceptions.UnrecognizedApiHttpError):
+            encrypt(self.recording_api_client, self.crypto_key_grn, b'abc')
+
+        recorded_error = self.recording.interactions[-1].error
+        assert recorded_error is not None
+        self.assertNotIn(secret, json.dumps(recorded_error))
+        self.assertNotIn(
+            secret.encode('ascii'), base64.b64decode(recorded_error['content']))
+        self.assertEqual(
+            json.loads(base64.b64decode(recorded_error['content']))['error']['message'],
+            'Invalid')
+        self.assertIn('alt=json', recorded_error['uri'])
+
+    def test_replay_deadline(self) -> None:
+        encrypt(self.recording_api_client, self.crypto_key_grn, b'abc')
+        replay_api_client = ReplayTransport(self.recording, sleep=self.clock.sleep)
+        replay_api_client._pending.pop('cloudkms.projects.locations.keyRings.create')
+        replay_api_client._pending.pop('cloudkms.projects.locations.keyRings.cryptoKeys.create')
+
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            encrypt(
+                replay_api_client, self.crypto_key_grn, b'abc',
+                timeout=Deadline(self.clock.now + 0.1, clock=self.clock))
+        self.assertAlmostEqual(sum(self.clock.sleeps), 0.1)
+
+    def test_scrub_secrets(self) -> None:
+        self.assertEqual(
+            scrub_secrets({
+                'name': 'x',
+                'plaintext': base64.b64encode(b'abc').decode('ascii'),
+                'payload': {'data': 'not base64!'},
+                'items': [{'additionalAuthenticatedData': 'AAAA'}],
+            }),
+            {
+                'name': 'x',
+                'plaintext': 'AAAA',
+                'payload': {'data': '***********'},
+                'items': [{'additionalAuthenticatedData': 'AAAA'}],
+            })
+
+    def test__encode_error(self) -> None:
+        for exc in (
+            exceptions.ResourceNotFound('projects/p'),
+            exceptions.ResourcePermissionDenied('projects/p', 'x.y.z'),
+            exceptions.AlreadyExists('Key ring'),
+            exceptions.DeadlineExceeded('encrypt'),
+        ):
+            with self.subTest(exc=exc):
+                decoded_exc = _decode_error(_encode_error(exc))  # type: ignore
+                self.assertIs(type(decoded_exc), type(exc))
+                self.assertEqual(str(decoded_exc), str(exc))
+
+        self.assertIsInstance(
+            _decode_error(_encode_error(ConnectionResetError('reset'))),  # type: ignore
+            ConnectionError)
+        self.assertIsNone(_encode_error(ValueError()))
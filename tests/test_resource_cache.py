@@ -0,0 +1,63 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from fd_gcp.resource_cache import (
+    ResourceCache, get_default_resource_cache, resolve_resource_cache,
+)
+
+
+class ResourceCacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.filename = os.path.join(tmp_dir.name, 'resources.json')
+
+    def test_in_memory(self) -> None:
+        resource_cache = ResourceCache()
+
+        self.assertNotIn('projects/p/locations/l/keyRings/k', resource_cache)
+        resource_cache.add('projects/p/locations/l/keyRings/k')
+        self.assertIn('projects/p/locations/l/keyRings/k', resource_cache)
+
+        resource_cache.clear()
+        self.assertNotIn('projects/p/locations/l/keyRings/k', resource_cache)
+
+    def test_file_backed(self) -> None:
+        resource_cache_1 = ResourceCache(self.filename)
+        resource_cache_2 = ResourceCache(self.filename)
+
+        resource_cache_1.add('projects/p/locations/l/keyRings/k1')
+        self.assertIn('projects/p/locations/l/keyRings/k1', resource_cache_2)
+
+        # What others added to the file is kept.
+        resource_cache_2.add('projects/p/locations/l/keyRings/k2')
+        resource_cache_1.add('projects/p/locations/l/keyRings/k3')
+        with open(self.filename) as file:
+            self.assertEqual(json.load(file), [
+                'projects/p/locations/l/keyRings/k1',
+                'projects/p/locations/l/keyRings/k2',
+                'projects/p/locations/l/keyRings/k3',
+            ])
+        self.assertEqual(os.listdir(os.path.dirname(self.filename)), ['resources.json'])
+
+    def test_file_backed_invalid_file(self) -> None:
+        with open(self.filename, 'w') as file:
+            file.write('{')
+
+        resource_cache = ResourceCache(self.filename)
+        with self.assertLogs('fd_gcp.resource_cache', 'WARNING'):
+            self.assertNotIn('projects/p/locations/l/keyRings/k', resource_cache)
+        resource_cache.add('projects/p/locations/l/keyRings/k')
+        self.assertIn('projects/p/locations/l/keyRings/k', ResourceCache(self.filename))
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_resolve_resource_cache(self) -> None:
+        resource_cache = ResourceCache()
+
+        self.assertIs(resolve_resource_cache(resource_cache), resource_cache)
+        self.assertIs(resolve_resource_cache(None), get_default_resource_cache())
@@ -0,0 +1,204 @@
+import json
+import logging
+import types
+from typing import Any, List
+from unittest import TestCase, mock
+
+import googleapiclient.http
+import googleapiclient.model
+import httplib2
+
+from fd_gcp import tracing
+from fd_gcp._http import execute_google_api_client_request
+from fd_gcp._concurrency import map_concurrently
+from fd_gcp.auth import trace_credentials_refresh
+from fd_gcp.tracing import (
+    Span, add_exporter, create_log_exporter, get_current_span, is_tracing, remove_exporter,
+    start_span, trace,
+)
+from fd_gcp.transport import InMemoryTransport, RequestsTransport, execute_api_request
+
+from .test_transport import CRYPTO_KEY_GRN, ENCRYPT_METHOD, FakeSession
+
+
+class TraceTestCase(TestCase):
+
+    def test_trace(self) -> None:
+        with trace('root', x=1) as root:
+            self.assertIs(get_current_span(), root)
+            with start_span('a') as span_a:
+                assert span_a is not None
+                with start_span('b', y=2):
+                    pass
+            with start_span('c'):
+                pass
+
+        self.assertIsNone(get_current_span())
+        self.assertEqual(root.attributes, {'x': 1})
+        self.assertEqual([span.name for span in root.children], ['a', 'c'])
+        self.assertEqual(span_a.children[0].name, 'b')
+        self.assertEqual(span_a.children[0].attributes, {'y': 2})
+        self.assertGreaterEqual(root.duration, span_a.duration)
+
+    def test_start_span_not_tracing(self) -> None:
+        self.assertFalse(is_tracing())
+        with start_span('a') as span:
+            self.assertIsNone(span)
+            self.assertFalse(is_tracing())
+
+    def test_start_span_error(self) -> None:
+        with trace() as root:
+            with self.assertRaises(KeyError):
+                with start_span('a'):
+                    raise KeyError('x')
+
+        self.assertEqual(root.children[0].attributes, {'error': 'KeyError'})
+        self.assertIsNotNone(root.children[0].duration)
+
+    def test_nested_trace(self) -> None:
+        exported: List[Span] = []
+        add_exporter(exported.append)
+        self.addCleanup(remove_exporter, exported.append)
+
+        with trace('root') as root:
+            with trace('nested') as nested:
+                pass
+
+        self.assertEqual(root.children, [nested])
+        self.assertEqual(exported, [root])
+
+    def test_exporters(self) -> None:
+        def failing_exporter(span: Span) -> None:
+            raise ValueError()
+
+        exported: List[Span] = []
+        add_exporter(failing_exporter)
+        add_exporter(exported.append)
+        self.addCleanup(remove_exporter, failing_exporter)
+        self.addCleanup(remove_exporter, exported.append)
+
+        with self.assertLogs(tracing.logger, logging.ERROR):
+            with trace() as root:
+                pass
+        self.assertEqual(exported, [root])
+
+    def test_create_log_exporter(self) -> None:
+        logger = logging.getLogger('test_tracing')
+        exporter = create_log_exporter(logger, logging.INFO)
+        with trace('root') as root:
+            with start_span('a'):
+                pass
+
+        with self.assertLogs(logger, logging.INFO) as logs:
+            exporter(root)
+        self.assertIn('\n  a ', logs.output[0])
+
+    def test_to_dict_and_format(self) -> None:
+        with trace('root') as root:
+            with start_span('a', endpoint='x.y'):
+                pass
+            unfinished = Span('unfinished')
+            root.children.append(unfinished)
+
+        data = root.to_dict()
+        json.dumps(data)
+        self.assertEqual(data['name'], 'root')
+        self.assertEqual(data['start'], 0)
+        self.assertEqual(data['children'][0]['attributes'], {'endpoint': 'x.y'})
+        self.assertGreaterEqual(data['children'][0]['start'], 0)
+        self.assertIsNone(data['children'][1]['duration'])
+
+        lines = root.format().split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertRegex(lines[0], r'^root \d+\.\d{3} ms$')
+        self.assertRegex(lines[1], r'^  a \d+\.\d{3} ms endpoint=x\.y$')
+        self.assertEqual(lines[2], '  unfinished unfinished')
+
+    def test_map_concurrently(self) -> None:
+        def fn(item: int) -> int:
+            with start_span('item', item=item):
+                return item
+
+        with trace() as root:
+            map_concurrently(fn, range(4))
+
+        self.assertEqual(
+            sorted(span.attributes['item'] for span in root.children), [0, 1, 2, 3])
+
+
+class InstrumentationTestCase(TestCase):
+
+    def test_execute_api_request(self) -> None:
+        responses: List[Any] = [ConnectionResetError(), {'ciphertext': 'YWJj'}]
+
+        def handler(params: dict, body: dict) -> dict:
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        transport = InMemoryTransport({ENCRYPT_METHOD.id: handler})
+        with mock.patch('fd_gcp._http._compute_retry_backoff', return_value=0.0):
+            with trace() as root:
+                execute_api_request(
+                    transport, ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {}, num_retries=1)
+
+        self.assertEqual(
+            [line.split()[0] for line in root.format().split('\n')],
+            ['trace', 'api_request', 'attempt', 'retry_backoff', 'attempt'])
+        api_request_span = root.children[0]
+        self.assertEqual(api_request_span.attributes, {'endpoint': ENCRYPT_METHOD.id})
+        self.assertEqual(api_request_span.children[0].attributes, {
+            'attempt': 0, 'error': 'ConnectionResetError'})
+        self.assertEqual(api_request_span.children[2].attributes, {'attempt': 1})
+
+    def test_execute_google_api_client_request(self) -> None:
+        class FakeHttp(httplib2.Http):
+            def request(self, uri: str, method: str = 'GET', **kwargs: Any) -> Any:
+                # A connection is opened by the first request only.
+                self.connections.setdefault('https:x', types.SimpleNamespace(sock=object()))
+                return httplib2.Response({'status': 200}), b'{"a": 1}'
+
+        http = FakeHttp()
+        for new_connection in (True, False):
+            request = googleapiclient.http.HttpRequest(
+                http, googleapiclient.model.JsonModel().response, 'https://x/v1/a',
+                method='POST', methodId=ENCRYPT_METHOD.id)
+            with trace() as root:
+                response = execute_google_api_client_request(request)
+
+            self.assertEqual(response, {'a': 1})
+            self.assertEqual(
+                [line.split()[0] for line in root.format().split('\n')],
+                ['trace', 'api_request', 'attempt', 'http', 'decode'])
+            http_span = root.children[0].children[0].children[0]
+            self.assertEqual(http_span.attributes, {'new_connection': new_connection})
+
+    def test_requests_transport(self) -> None:
+        transport = RequestsTransport(
+            'https://cloudkms.googleapis.com/',
+            session=FakeSession(content=b'{"ciphertext": "YWJj"}'),  # type: ignore
+        )
+        with trace() as root:
+            transport.execute(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {'plaintext': 'x'})
+
+        self.assertEqual([span.name for span in root.children], ['encode', 'http', 'decode'])
+        self.assertEqual(root.children[1].attributes, {'elapsed': 0.0})
+
+    def test_trace_credentials_refresh(self) -> None:
+        class FakeCredentials:
+            def refresh(self, request: Any) -> None:
+                self.refreshed = True
+
+        credentials = FakeCredentials()
+        self.assertIs(trace_credentials_refresh(credentials), credentials)
+        # note: it is idempotent.
+        trace_credentials_refresh(credentials)
+
+        with trace() as root:
+            credentials.refresh(None)
+
+        self.assertTrue(credentials.refreshed)
+        self.assertEqual(len(root.children), 1)
+        self.assertEqual(root.children[0].name, 'credentials_refresh')
+        self.assertEqual(root.children[0].attributes, {'credentials': 'FakeCredentials'})
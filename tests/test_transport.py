@@ -0,0 +1,208 @@
+import json
+from typing import Any
+from unittest import TestCase
+
+import requests
+
+from fd_gcp import exceptions
+from fd_gcp.deadline import Deadline
+from fd_gcp.transport import (
+    ApiMethod, GoogleApiClientTransport, InMemoryTransport, RequestsTransport,
+    execute_api_request, expand_path_template, get_transport,
+)
+
+
+ENCRYPT_METHOD = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.encrypt', 'POST', 'v1/{+name}:encrypt')
+CREATE_METHOD = ApiMethod(
+    'cloudkms.projects.locations.keyRings.cryptoKeys.create', 'POST', 'v1/{+parent}/cryptoKeys')
+
+CRYPTO_KEY_GRN = 'projects/p/locations/global/keyRings/r/cryptoKeys/k'
+
+
+class FakeResource:
+
+    """
+    Fake of a 'googleapiclient' discovery resource.
+
+    """
+
+    def __init__(self) -> None:
+        self.calls: list = []
+
+    def __getattr__(self, name: str) -> Any:
+        def method(*args: Any, **kwargs: Any) -> Any:
+            self.calls.append((name, kwargs))
+            return self
+        return method
+
+    http = None
+
+    def execute(self, http: Any = None) -> dict:
+        return {'ciphertext': 'YWJj'}
+
+
+class FakeSession:
+
+    def __init__(self, status_code: int = 200, content: bytes = b'{}', exc: Exception = None):
+        self.status_code = status_code
+        self.content = content
+        self.exc = exc
+        self.calls: list = []
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        self.calls.append((method, url, kwargs))
+        if self.exc is not None:
+            raise self.exc
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = self.content
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+class GoogleApiClientTransportTestCase(TestCase):
+
+    def test_execute(self) -> None:
+        resource = FakeResource()
+        transport = GoogleApiClientTransport(resource)  # type: ignore
+
+        response = transport.execute(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {'plaintext': 'x'})
+
+        self.assertEqual(response, {'ciphertext': 'YWJj'})
+        self.assertEqual(resource.calls, [
+            ('projects', {}),
+            ('locations', {}),
+            ('keyRings', {}),
+            ('cryptoKeys', {}),
+            ('encrypt', {'name': CRYPTO_KEY_GRN, 'body': {'plaintext': 'x'}}),
+        ])
+
+
+class RequestsTransportTestCase(TestCase):
+
+    def test_execute(self) -> None:
+        session = FakeSession(content=b'{"name": "a"}')
+        transport = RequestsTransport(
+            'https://cloudkms.googleapis.com', session=session)  # type: ignore
+
+        response = transport.execute(
+            CREATE_METHOD,
+            {'parent': 'projects/p/locations/global/keyRings/r', 'cryptoKeyId': 'k'},
+            {'purpose': 'ENCRYPT_DECRYPT'},
+        )
+
+        self.assertEqual(response, {'name': 'a'})
+        self.assertEqual(session.calls, [(
+            'POST',
+            'https://cloudkms.googleapis.com/v1/projects/p/locations/global/keyRings/r/cryptoKeys'
+            '?cryptoKeyId=k',
+            {
+                'data': b'{"purpose":"ENCRYPT_DECRYPT"}',
+                'headers': {'Content-Type': 'application/json'},
+                'timeout': None,
+            },
+        )])
+
+    def test_execute_deadline(self) -> None:
+        session = FakeSession()
+        transport = RequestsTransport(
+            'https://cloudkms.googleapis.com/', session=session)  # type: ignore
+
+        transport.execute(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {}, Deadline.from_timeout(5))
+        self.assertLessEqual(session.calls[0][2]['timeout'], 5)
+
+        session.exc = requests.ReadTimeout()
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            transport.execute(
+                ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {}, Deadline.from_timeout(5))
+
+    def test_execute_http_error(self) -> None:
+        for status_code, message, exc_class in (
+            (404, "CryptoKey {} not found.".format(CRYPTO_KEY_GRN), exceptions.ResourceNotFound),
+            (
+                403,
+                "Permission 'cloudkms.cryptoKeyVersions.useToEncrypt' denied for resource "
+                "'{}'.".format(CRYPTO_KEY_GRN),
+                exceptions.ResourcePermissionDenied,
+            ),
+            (409, "CryptoKey {} already exists.".format(CRYPTO_KEY_GRN), exceptions.AlreadyExists),
+            (503, "The service is currently unavailable.", exceptions.UnrecognizedApiHttpError),
+        ):
+            with self.subTest(status_code=status_code):
+                content = json.dumps({'error': {'code': status_code, 'message': message}})
+                transport = RequestsTransport(
+                    'https://cloudkms.googleapis.com/',
+                    session=FakeSession(status_code, content.encode()),  # type: ignore
+                )
+                with self.assertRaises(exc_class):
+                    transport.execute(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {})
+
+    def test_build_url(self) -> None:
+        transport = RequestsTransport(
+            'https://cloudkms.googleapis.com/', session=FakeSession())  # type: ignore
+        self.assertEqual(
+            transport.build_url(
+                CREATE_METHOD,
+                {'parent': 'projects/p', 'cryptoKeyId': 'a b', 'skipInitialVersionCreation': True},
+            ),
+            'https://cloudkms.googleapis.com/v1/projects/p/cryptoKeys'
+            '?cryptoKeyId=a+b&skipInitialVersionCreation=true')
+
+    def test_init_fail(self) -> None:
+        with self.assertRaises(ValueError):
+            RequestsTransport('https://cloudkms.googleapis.com/')
+
+
+class InMemoryTransportTestCase(TestCase):
+
+    def test_execute(self) -> None:
+        transport = InMemoryTransport()
+        transport.register(ENCRYPT_METHOD.id, lambda params, body: {'ciphertext': params['name']})
+
+        body = {'plaintext': 'x'}
+        self.assertEqual(
+            transport.execute(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, body),
+            {'ciphertext': CRYPTO_KEY_GRN})
+        self.assertEqual(transport.requests, [(ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, body)])
+        self.assertIsNot(transport.requests[0][2], body)
+
+        with self.assertRaisesRegex(LookupError, CREATE_METHOD.id):
+            transport.execute(CREATE_METHOD, {}, {})
+
+
+class FunctionsTestCase(TestCase):
+
+    def test_get_transport(self) -> None:
+        transport = InMemoryTransport()
+        self.assertIs(get_transport(transport), transport)
+
+        resource = FakeResource()
+        google_api_client_transport = get_transport(resource)  # type: ignore
+        assert isinstance(google_api_client_transport, GoogleApiClientTransport)
+        self.assertIs(google_api_client_transport.api_client, resource)
+
+    def test_execute_api_request(self) -> None:
+        def handler(params: dict, body: dict) -> dict:
+            raise ConnectionResetError()
+
+        transport = InMemoryTransport({ENCRYPT_METHOD.id: handler})
+        with self.assertRaises(ConnectionResetError):
+            execute_api_request(transport, ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {})
+
+        with self.assertRaises(exceptions.DeadlineExceeded):
+            execute_api_request(
+                transport, ENCRYPT_METHOD, {'name': CRYPTO_KEY_GRN}, {},
+                timeout=Deadline.from_timeout(0))
+
+    def test_expand_path_template(self) -> None:
+        self.assertEqual(
+            expand_path_template('v1/{+name}:encrypt', {'name': CRYPTO_KEY_GRN}),
+            ('v1/' + CRYPTO_KEY_GRN + ':encrypt', {}))
+        self.assertEqual(
+            expand_path_template('v1/{name}', {'name': 'a/b c', 'x': True}),
+            ('v1/a%2Fb%20c', {'x': True}))
+        with self.assertRaises(ValueError):
+            expand_path_template('v1/{+name}:encrypt', {})